@@ -47,6 +47,16 @@ BLOCKSTACKD_PORT = 6264
 DHT_MIRROR_IP = '52.20.98.85'
 DHT_MIRROR_PORT = 6266
 
+# Upstream forwarding: servers are tried in order, failing over on errors
+BASE_API_URLS = [BASE_API_URL]
+SEARCH_NODE_URLS = [SEARCH_NODE_URL]
+UPSTREAM_POOL_SIZE = 10             # keep-alive connections per upstream
+UPSTREAM_CONNECT_TIMEOUT = 3        # seconds
+UPSTREAM_READ_TIMEOUT = 30          # seconds
+UPSTREAM_FAILURE_THRESHOLD = 3      # consecutive failures before an upstream is marked down
+UPSTREAM_RETRY_INTERVAL = 30        # seconds an upstream stays marked down
+UPSTREAM_STREAM_CHUNK_SIZE = 16384  # bytes per streamed response chunk
+
 RECENT_BLOCKS = 100
 VALID_BLOCKS = 36000
 REFRESH_BLOCKS = 25
@@ -60,6 +70,10 @@ CURRENT_DIR = os.path.abspath(os.path.dirname(__file__))
 NAMES_FILE = os.path.join(CURRENT_DIR, NAMES_FILENAME)
 NEW_NAMES_FILE = os.path.join(CURRENT_DIR, NEW_NAMES_FILENAME)
 
+# For the batch resolver endpoint
+BATCH_USERS_MAX = 100           # max names per batch request
+BATCH_PROFILE_WORKERS = 10      # concurrent profile fetches per batch request
+
 # For search endpoint
 SEARCH_API_ENDPOINT_ENABLED = True
 SEARCH_BLOCKCHAIN_DATA_FILE = "/var/blockstack-search/blockchain_data.json"
@@ -84,6 +98,14 @@ MEMCACHED_PORT = 11211
 MEMCACHED_SERVER = '127.0.0.1'
 MEMCACHED_SERVERS = ['127.0.0.1:11211']
 
+# Social proof verification settings
+PROOF_CACHE_TTL = 60 * 60           # seconds before a verdict is refreshed
+PROOF_CACHE_SIZE = 100000           # max number of cached verdicts
+PROOF_WORKERS = 8                   # concurrent proof fetches
+PROOF_HOST_CONCURRENCY = 2          # max in-flight fetches per proof host
+PROOF_HOST_MIN_INTERVAL = 0.1       # min seconds between fetches to one host
+PROOF_FETCH_TIMEOUT = 10            # max seconds a lookup waits for fresh verdicts
+
 if 'DYNO' in os.environ:
     DEBUG = False
     # heroku configs go here
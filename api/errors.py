@@ -172,6 +172,12 @@ class ResolverConnectionError(APIError):
                "this error to support@onename.com.")
 
 
+class UpstreamConnectionError(APIError):
+    status_code = 502
+    message = ("There was a problem processing the request. It seems that the "
+               "upstream Blockstack node could not be reached.")
+
+
 class DKIMPubkeyError(APIError):
     status_code = 404
     message = ("Public key record for domain not found")
@@ -0,0 +1,331 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack Core
+    ~~~~~
+
+    copyright: (c) 2014-2017 by Blockstack Inc.
+    copyright: (c) 2017 by Blockstack.org
+
+This file is part of Blockstack Core.
+
+    Blockstack Core is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack Core is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack Core. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import hashlib
+import logging
+import threading
+import Queue
+import urlparse
+
+from time import time, sleep
+from collections import OrderedDict
+
+from .config import DEBUG
+from .config import PROOF_CACHE_TTL, PROOF_CACHE_SIZE, PROOF_WORKERS
+from .config import PROOF_HOST_CONCURRENCY, PROOF_HOST_MIN_INTERVAL
+from .config import PROOF_FETCH_TIMEOUT
+
+logging.basicConfig()
+log = logging.getLogger('proofs')
+
+if DEBUG:
+    log.setLevel(level=logging.DEBUG)
+else:
+    log.setLevel(level=logging.INFO)
+
+
+def profile_hash(profile, fqa, address):
+    """
+    Hash the inputs a proof verdict depends on.
+    The verdict for a proof URL is only reusable while
+    the profile, name, and owner address stay the same.
+    """
+    data = json.dumps({'profile': profile, 'fqa': fqa, 'address': address},
+                      sort_keys=True)
+    return hashlib.sha256(data).hexdigest()
+
+
+def profile_to_proof_candidates(profile, fqa, profile_ver=2):
+    """
+    List the proofs a profile claims, without fetching any of them.
+    Mirrors blockstack_proofs.profile_to_proofs (v2) and
+    blockstack_proofs.profile_v3_to_proofs (v3).
+    Returns a list of {'service', 'proof_url', 'identifier'}
+    """
+    from blockstack_proofs.sites import SITES
+    from blockstack_proofs.proofs import site_data_to_identifier, site_data_to_proof_url
+
+    candidates = []
+    if not isinstance(profile, dict):
+        return candidates
+
+    if profile_ver == 3:
+        for account in profile.get('account', []):
+            if 'service' in account and account['service'].lower() not in SITES:
+                continue
+
+            if account.get('proofType', None) != 'http':
+                continue
+
+            try:
+                candidates.append({'service': account['service'],
+                                   'proof_url': account['proofUrl'],
+                                   'identifier': account['identifier']})
+            except (KeyError, TypeError):
+                continue
+
+    else:
+        for proof_site, site_data in profile.items():
+            if proof_site not in SITES or not isinstance(site_data, dict):
+                continue
+
+            identifier = site_data_to_identifier(site_data)
+            if not identifier:
+                continue
+
+            try:
+                proof_url = site_data_to_proof_url(site_data, identifier)
+            except Exception as e:
+                log.debug("Unparseable proof for {}: {}".format(proof_site, e))
+                continue
+
+            if proof_url:
+                candidates.append({'service': proof_site,
+                                   'proof_url': proof_url,
+                                   'identifier': identifier})
+
+    return candidates
+
+
+class HostRateLimiter(object):
+    """
+    Bound the number of in-flight fetches to a single host,
+    and space out the start of consecutive fetches.
+    """
+    def __init__(self, max_concurrency, min_interval):
+        self.sem = threading.Semaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.min_interval = min_interval
+        self.next_slot = 0
+
+    def __enter__(self):
+        self.sem.acquire()
+        with self.lock:
+            now = time()
+            delay = max(0, self.next_slot - now)
+            self.next_slot = max(now, self.next_slot) + self.min_interval
+
+        if delay > 0:
+            sleep(delay)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.sem.release()
+        return False
+
+
+class ProofVerifier(object):
+    """
+    Verifies social proofs concurrently, with per-host rate limits.
+    Verdicts are cached on (profile hash, proof URL) for a TTL.
+    Cached verdicts are served immediately; stale ones are served
+    and queued for a background refresh.
+    """
+    def __init__(self, check_proof=None, num_workers=PROOF_WORKERS,
+                 ttl=PROOF_CACHE_TTL, max_entries=PROOF_CACHE_SIZE,
+                 host_concurrency=PROOF_HOST_CONCURRENCY,
+                 host_min_interval=PROOF_HOST_MIN_INTERVAL):
+
+        if check_proof is None:
+            from blockstack_proofs.proofs import is_valid_proof
+            check_proof = is_valid_proof
+
+        self.check_proof = check_proof
+        self.num_workers = num_workers
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.host_concurrency = host_concurrency
+        self.host_min_interval = host_min_interval
+
+        self.lock = threading.Lock()
+        self.verdicts = OrderedDict()   # (profile hash, proof URL) => (valid, fetched_at)
+        self.pending = {}               # (profile hash, proof URL) => threading.Event
+        self.hosts = {}                 # hostname => HostRateLimiter
+        self.queue = Queue.Queue()
+        self.workers = []
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'fetches': 0, 'errors': 0}
+
+
+    def start(self):
+        """
+        Start the fetch worker threads.  Idempotent.
+        """
+        with self.lock:
+            if len(self.workers) > 0:
+                return
+
+            for i in xrange(0, self.num_workers):
+                t = threading.Thread(target=self._worker_main, name='proof-worker-{}'.format(i))
+                t.daemon = True
+                t.start()
+                self.workers.append(t)
+
+
+    def stop(self):
+        """
+        Stop the fetch worker threads once the queue drains.
+        """
+        with self.lock:
+            workers = self.workers
+            self.workers = []
+
+        for _ in workers:
+            self.queue.put(None)
+
+        for t in workers:
+            t.join()
+
+
+    def _host_limiter(self, url):
+        host = urlparse.urlparse(url).netloc.lower()
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostRateLimiter(self.host_concurrency, self.host_min_interval)
+
+            return self.hosts[host]
+
+
+    def _worker_main(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+
+            key, proof, fqa, address = task
+            valid = False
+            try:
+                with self._host_limiter(proof['proof_url']):
+                    valid = bool(self.check_proof(proof['service'], proof['identifier'],
+                                                  fqa, proof['proof_url'], address=address))
+
+                with self.lock:
+                    self.stats['fetches'] += 1
+
+            except Exception as e:
+                log.exception(e)
+                log.error("Failed to check proof {}".format(proof['proof_url']))
+                with self.lock:
+                    self.stats['errors'] += 1
+
+            self._put_verdict(key, valid)
+
+
+    def _put_verdict(self, key, valid):
+        with self.lock:
+            if key in self.verdicts:
+                del self.verdicts[key]
+
+            self.verdicts[key] = (valid, time())
+            while len(self.verdicts) > self.max_entries:
+                self.verdicts.popitem(last=False)
+
+            ev = self.pending.pop(key, None)
+
+        if ev is not None:
+            ev.set()
+
+
+    def _schedule(self, key, proof, fqa, address):
+        """
+        Queue a proof for (re)verification, unless it is already in flight.
+        Return the event that fires when its verdict is cached.
+        Must be called with self.lock held.
+        """
+        ev = self.pending.get(key, None)
+        if ev is None:
+            ev = threading.Event()
+            self.pending[key] = ev
+            self.queue.put((key, proof, fqa, address))
+
+        return ev
+
+
+    def get_proofs(self, candidates, fqa, address, prof_hash, timeout=PROOF_FETCH_TIMEOUT):
+        """
+        Get the verdicts for a list of proof candidates
+        (from profile_to_proof_candidates()).
+        Waits at most @timeout seconds for proofs that have no verdict yet;
+        proofs still unverified after that are reported as invalid.
+
+        Returns a list of {'service', 'proof_url', 'identifier', 'valid'},
+        in the same order as @candidates.
+        """
+        self.start()
+
+        waits = []
+        now = time()
+        with self.lock:
+            for proof in candidates:
+                key = (prof_hash, proof['proof_url'])
+                entry = self.verdicts.get(key, None)
+                if entry is None:
+                    self.stats['misses'] += 1
+                    waits.append(self._schedule(key, proof, fqa, address))
+                    continue
+
+                self.stats['hits'] += 1
+                if now - entry[1] > self.ttl:
+                    self.stats['stale'] += 1
+                    self._schedule(key, proof, fqa, address)
+
+        deadline = now + timeout
+        for ev in waits:
+            ev.wait(max(0, deadline - time()))
+
+        proofs = []
+        with self.lock:
+            for proof in candidates:
+                entry = self.verdicts.get((prof_hash, proof['proof_url']), None)
+                res = dict(proof)
+                res['valid'] = entry[0] if entry is not None else False
+                proofs.append(res)
+
+        return proofs
+
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['cached'] = len(self.verdicts)
+            stats['pending'] = len(self.pending)
+
+        return stats
+
+
+_PROOF_VERIFIER = None
+_PROOF_VERIFIER_LOCK = threading.Lock()
+
+def get_proof_verifier():
+    """
+    Get the process-wide proof verifier
+    """
+    global _PROOF_VERIFIER
+    with _PROOF_VERIFIER_LOCK:
+        if _PROOF_VERIFIER is None:
+            _PROOF_VERIFIER = ProofVerifier()
+
+        return _PROOF_VERIFIER
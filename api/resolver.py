@@ -31,17 +31,17 @@ import logging
 from flask import Flask, make_response, jsonify, abort, request
 from flask import Blueprint
 from flask_crossdomain import crossdomain
+from werkzeug.exceptions import HTTPException
 
 from time import time
 
-from blockstack_proofs import profile_to_proofs, profile_v3_to_proofs
-
 import blockstack_client.profile
 import blockstack_client.subdomains
 
 from blockstack_client.schemas import OP_NAME_PATTERN, OP_NAMESPACE_PATTERN
 
 from api.utils import cache_control, get_mc_client
+from api.proofs import get_proof_verifier, profile_to_proof_candidates, profile_hash
 
 from .config import DEBUG
 from .config import DEFAULT_HOST, MEMCACHED_TIMEOUT, MEMCACHED_ENABLED
@@ -51,6 +51,7 @@ from .config import BLOCKSTACKD_IP, BLOCKSTACKD_PORT
 from .config import DHT_MIRROR_IP, DHT_MIRROR_PORT
 from .config import DEFAULT_NAMESPACE
 from .config import NAMES_FILE
+from .config import BATCH_USERS_MAX, BATCH_PROFILE_WORKERS
 
 import requests
 requests.packages.urllib3.disable_warnings()
@@ -94,6 +95,8 @@ def fetch_proofs(profile, username, address, profile_ver=2, zonefile = None):
     """ Get proofs for a profile and:
         a) check cached entries
         b) check which version of profile we're using
+        Cached verdicts are returned immediately; the rest are
+        fetched concurrently by the proof verifier.
     """
 
     if 'account' not in profile:
@@ -104,10 +107,12 @@ def fetch_proofs(profile, username, address, profile_ver=2, zonefile = None):
             and 'proofUrl' not in account):
             site_data_to_fixed_proof_url(account, zonefile)
 
-    if profile_ver == 3:
-        proofs = profile_v3_to_proofs(profile, username, address = address)
-    else:
-        proofs = profile_to_proofs(profile, username, address = address)
+    candidates = profile_to_proof_candidates(profile, username, profile_ver=profile_ver)
+    if len(candidates) == 0:
+        return []
+
+    prof_hash = profile_hash(profile, username, address)
+    proofs = get_proof_verifier().get_proofs(candidates, username, address, prof_hash)
 
     return proofs
 
@@ -184,14 +189,75 @@ def is_valid_fqa(fqa):
         return False
     return (NS_PATTERN.match(ns) is not None)
 
+def get_cached_profile(fqa):
+    """ Get a resolver reply for fqa from memcached.
+        Return None on miss.
+    """
+    if not MEMCACHED_ENABLED:
+        return None
+
+    return mc.get(str('profile_cache_' + fqa))
+
+def cache_profile(fqa, data):
+    """ Store a successful resolver reply for fqa in memcached.
+    """
+    if not MEMCACHED_ENABLED or 'error' in data:
+        return
+
+    mc.set(str('profile_cache_' + fqa), data, int(time() + MEMCACHED_TIMEOUT))
+
+def format_profile_response(fqa, res):
+    """ Given the response from blockstack_client.profile.get_profile(),
+        build the resolver reply for fqa.
+    """
+
+    profile_expired_grace = False
+
+    if 'error' in res:
+        log.error('Error from profile.get_profile: {}'.format(res['error']))
+        if "no user record hash defined" in res['error']:
+            res['status_code'] = 404
+        if "Failed to load user profile" in res['error']:
+            res['status_code'] = 404
+        return res
+
+    try:
+        log.warn(json.dumps(res['name_record']))
+
+        profile = res['profile']
+        zonefile = res['zonefile']
+        public_key = res.get('public_key', None)
+        address = res['name_record']['address']
+
+        if 'expired' in res['name_record'] and res['name_record']['expired']:
+            profile_expired_grace = True
+
+    except Exception as e:
+        log.exception(e)
+        abort(500, json.dumps({'error': 'Server error fetching profile'}))
+
+    if profile is None or 'error' in zonefile:
+        log.error("{}".format(zonefile))
+        abort(404)
+
+    prof_data = {'response' : profile}
+
+    data = format_profile(prof_data['response'], fqa, zonefile, address, public_key)
+
+    if profile_expired_grace:
+        data['expired'] = (
+            'This name has expired! It is still in the renewal grace period, ' +
+            'but must be renewed or it will eventually expire and be available' +
+            ' for others to register.')
+
+    return data
+
 def get_profile(fqa):
     """ Given a fully-qualified username (username.namespace)
         get the data associated with that fqu.
         Return cached entries, if possible.
     """
 
-    profile_expired_grace = False
-
     fqa = fqa.lower()
     if not is_valid_fqa(fqa):
         fqa = str(fqa)
@@ -211,46 +277,68 @@ def get_profile(fqa):
 
         return {'error' : 'Malformed name {}'.format(fqa)}
 
+    data = get_cached_profile(fqa)
+    if data is not None:
+        return data
 
     try:
         res = blockstack_client.profile.get_profile(
             fqa, use_legacy = True, include_name_record = True)
-        if 'error' in res:
-            log.error('Error from profile.get_profile: {}'.format(res['error']))
-            if "no user record hash defined" in res['error']:
-                res['status_code'] = 404
-            if "Failed to load user profile" in res['error']:
-                res['status_code'] = 404
-            return res
-        log.warn(json.dumps(res['name_record']))
-
-        profile = res['profile']
-        zonefile = res['zonefile']
-        public_key = res.get('public_key', None)
-        address = res['name_record']['address']
-
-        if 'expired' in res['name_record'] and res['name_record']['expired']:
-            profile_expired_grace = True
-
     except Exception as e:
         log.exception(e)
         abort(500, json.dumps({'error': 'Server error fetching profile'}))
 
-    if profile is None or 'error' in zonefile:
-        log.error("{}".format(zonefile))
-        abort(404)
+    data = format_profile_response(fqa, res)
+    cache_profile(fqa, data)
+    return data
 
-    prof_data = {'response' : profile}
+def get_profiles(fqas):
+    """ Batch version of get_profile().
+        Name records, zonefiles and profiles for the names missing from
+        memcached are fetched in bulk by blockstack_client.profile.get_profiles().
+        Return {fqa: data}; failed lookups map to {'error': ..., 'status_code': ...}
+    """
 
-    data = format_profile(prof_data['response'], fqa, zonefile, address, public_key)
+    replies = {}
+    to_fetch = []
 
-    if profile_expired_grace:
-        data['expired'] = (
-            'This name has expired! It is still in the renewal grace period, ' +
-            'but must be renewed or it will eventually expire and be available' +
-            ' for others to register.')
+    for fqa in fqas:
+        if not is_valid_fqa(fqa):
+            # malformed names and subdomains
+            try:
+                replies[fqa] = get_profile(fqa)
+            except HTTPException as he:
+                replies[fqa] = {'error': 'Failed to resolve {}'.format(fqa), 'status_code': he.code}
 
-    return data
+            continue
+
+        data = get_cached_profile(fqa)
+        if data is not None:
+            replies[fqa] = data
+        else:
+            to_fetch.append(fqa)
+
+    if len(to_fetch) == 0:
+        return replies
+
+    try:
+        results = blockstack_client.profile.get_profiles(
+            to_fetch, max_workers = BATCH_PROFILE_WORKERS,
+            use_legacy = True, include_name_record = True)
+    except Exception as e:
+        log.exception(e)
+        abort(500, json.dumps({'error': 'Server error fetching profiles'}))
+
+    for fqa in to_fetch:
+        try:
+            data = format_profile_response(fqa, results[fqa])
+        except HTTPException as he:
+            data = {'error': 'Failed to resolve {}'.format(fqa), 'status_code': he.code}
+
+        cache_profile(fqa, data)
+        replies[fqa] = data
+
+    return replies
 
 
 @resolver.route('/v1/users/<username>', methods=['GET'], strict_slashes=False)
@@ -288,6 +376,40 @@ def get_users(username):
     else:
         return jsonify(reply), 200
 
+@resolver.route('/v1/users', methods=['GET'], strict_slashes=False)
+@crossdomain(origin='*')
+@cache_control(MEMCACHED_TIMEOUT)
+def get_users_batch():
+    """ Fetch data for a comma-separated list of usernames, given
+        as ?names=...  Usernames default to the .id namespace.
+        Each username maps to its profile data or to an error.
+    """
+    reply = {}
+
+    names = request.args.get('names')
+    if not names:
+        reply['error'] = "No usernames given"
+        return jsonify(reply), 400
+
+    usernames = list(set(filter(lambda u: len(u) > 0, names.split(','))))
+    if len(usernames) > BATCH_USERS_MAX:
+        reply['error'] = "Too many usernames (no more than {} allowed)".format(BATCH_USERS_MAX)
+        return jsonify(reply), 400
+
+    fqas = {}
+    for username in usernames:
+        if "." not in username:
+            fqas[username] = "{}.{}".format(username, 'id')
+        else:
+            fqas[username] = username
+
+    profiles = get_profiles([fqa.lower() for fqa in fqas.values()])
+
+    for username, fqa in fqas.items():
+        reply[username] = profiles[fqa.lower()]
+
+    return jsonify(reply), 200
+
 @resolver.route('/v2/users/<username>', methods=['GET'], strict_slashes=False)
 @crossdomain(origin='*')
 @cache_control(MEMCACHED_TIMEOUT)
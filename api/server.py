@@ -26,20 +26,22 @@ This file is part of Blockstack Core.
 import sys
 import re
 import os
-import requests
 import json
 from collections import OrderedDict
 
-from flask import Flask, jsonify, request, make_response
-from flask import render_template, send_from_directory
+from flask import Flask, jsonify, request, make_response, Response
+from flask import render_template, send_from_directory, stream_with_context
 
 from flask_https import RequireHTTPS
 from flask_crossdomain import crossdomain
 
 from .parameters import parameters_required
+from .errors import InternalProcessingError, UpstreamConnectionError
 from .utils import get_api_calls, cache_control
-from .config import PUBLIC_NODE, PUBLIC_NODE_URL, BASE_API_URL
-from .config import SEARCH_NODE_URL, SEARCH_API_ENDPOINT_ENABLED
+from .upstream import UpstreamGroup, UpstreamUnavailable
+from .config import PUBLIC_NODE, PUBLIC_NODE_URL, BASE_API_URLS
+from .config import SEARCH_NODE_URLS, SEARCH_API_ENDPOINT_ENABLED
+from .config import UPSTREAM_STREAM_CHUNK_SIZE
 
 # hack around absolute paths
 current_dir = os.path.abspath(os.path.dirname(__file__))
@@ -80,18 +82,33 @@ def default_cache_off(response):
         response.headers['Cache-Control'] = 'no-cache'
     return response
 
-def forwarded_get(url, params = None):
-    if params:
-        resp = requests.get(url, params = params)
-    else:
-        resp = requests.get(url)
-
+# pooled, keep-alive connections to the core API and search backends
+api_upstreams = UpstreamGroup(BASE_API_URLS)
+search_upstreams = UpstreamGroup(SEARCH_NODE_URLS)
+
+def stream_upstream_response(resp):
+    """ Re-emit an upstream response to the client chunk by chunk,
+        returning its connection to the pool once it is consumed.
+    """
+    def generate():
+        try:
+            for chunk in resp.iter_content(chunk_size=UPSTREAM_STREAM_CHUNK_SIZE):
+                yield chunk
+        finally:
+            resp.close()
+
+    log.debug("{} => {}".format(resp.url, resp.status_code))
+    return Response(stream_with_context(generate()), status=resp.status_code,
+                    content_type=resp.headers.get('Content-Type', 'application/json'))
+
+def forwarded_get(path, params = None):
     try:
-        log.debug("{} => {}".format(resp.url, resp.status_code))
-        return jsonify(resp.json()), resp.status_code
-    except:
-        log.error("Bad response from API URL: {} \n {}".format(resp.url, resp.text))
-        return jsonify({'error': 'Not found'}), resp.status_code
+        resp = api_upstreams.get(path, params = params)
+    except UpstreamUnavailable as e:
+        log.error("{}".format(e))
+        raise UpstreamConnectionError()
+
+    return stream_upstream_response(resp)
 
 @app.route('/v1/search', methods=['GET'])
 @parameters_required(parameters=['query'])
@@ -104,19 +121,24 @@ def search_people():
         return client.get('/search?query={}'.format(query), 
                           headers=list(request.headers))
 
-    search_url = SEARCH_NODE_URL + '/search'
-
     try:
-        resp = requests.get(url=search_url, params={'query': query})
-    except (RequestsConnectionError, RequestsTimeout) as e:
+        resp = search_upstreams.get('/search', params={'query': query})
+        data = resp.json()
+    except (UpstreamUnavailable, ValueError) as e:
+        log.error("Search backend error: {}".format(e))
         raise InternalProcessingError()
 
-    data = resp.json()
-    if not ('results' in data and isinstance(data['results'], list)):
+    if not (isinstance(data, dict) and 'results' in data and isinstance(data['results'], list)):
         data = {'results': []}
 
     return jsonify(data), 200
 
+@app.route('/v1/proxy/upstreams', methods=['GET'])
+def upstream_metrics():
+    """ Report per-upstream health, latency and connection reuse """
+    return jsonify({'api': api_upstreams.get_metrics(),
+                    'search': search_upstreams.get_metrics()}), 200
+
 CACHE_SPECIFIC = [ re.compile(regex) for regex in
                    [r'^/v1/node/ping/?$',
                     r'^/v1/blockchains/bitcoin/consensus/?$',
@@ -131,10 +153,9 @@ SPECIFIED = {
 @app.route('/<path:path>', methods=['GET'])
 @crossdomain(origin='*')
 def catch_all_get(path):
-    API_URL = BASE_API_URL + '/' + path
     params = dict(request.args)
 
-    inner_resp = forwarded_get(API_URL, params = params)
+    inner_resp = forwarded_get(path, params = params)
     resp = make_response(inner_resp)
 
     for ix, matcher in enumerate(CACHE_SPECIFIC):
@@ -152,11 +173,13 @@ def catch_all_post(path):
     if PUBLIC_NODE:
         return render_template('403.html'), 403
 
-    API_URL = BASE_API_URL + '/' + path
-
-    resp = requests.post(API_URL, data=requests.data)
+    try:
+        resp = api_upstreams.post(path, data=request.data)
+    except UpstreamUnavailable as e:
+        log.error("{}".format(e))
+        raise UpstreamConnectionError()
 
-    return jsonify(resp.json()), 200
+    return stream_upstream_response(resp)
 
 @app.route('/')
 @cache_control(5*60)
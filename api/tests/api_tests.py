@@ -35,7 +35,7 @@ import api
 
 import api.config
 
-from api.tests.resolver_tests import ResolverTestCase
+from api.tests.resolver_tests import ResolverTestCase, BatchResolverTestCase
 from api.tests.search_tests import SearchTestCase
 from blockstack_client import schemas
 import blockstack_client.storage
@@ -438,7 +438,7 @@ def test_main(args = []):
     test_classes = [PingTest, LookupUsersTest, NamespaceTest, BlockChains, TestAPILandingPageExamples,
                     Prices, NamesOwnedTest, NameHistoryTest, SearchAPITest,
                     AuthInternal, BlockChainsInternal, Zonefiles, WalletInternal, NodeInternal]
-    test_classes += [ResolverTestCase]
+    test_classes += [ResolverTestCase, BatchResolverTestCase]
     if api.config.SEARCH_API_ENDPOINT_ENABLED:
         test_classes += [SearchTestCase]
 
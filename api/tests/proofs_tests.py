@@ -0,0 +1,162 @@
+"""
+    Blockstack Core
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+This file is part of Blockstack Core.
+
+    Blockstack Core is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack Core is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Search. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import threading
+import unittest
+import urllib2
+import BaseHTTPServer
+import SocketServer
+
+from api.proofs import ProofVerifier
+
+# simulated round-trip time to a proof host
+FAKE_PROOF_HOST_LATENCY = 0.2
+NUM_PROOFS = 8
+
+class FakeProofHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves a proof statement for /valid/* and garbage otherwise
+    """
+    def do_GET(self):
+        time.sleep(FAKE_PROOF_HOST_LATENCY)
+        if self.path.startswith('/valid/'):
+            body = 'Verifying that "alice.id" is my Blockstack ID.'
+        else:
+            body = 'nothing to see here'
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args, **kw):
+        pass
+
+
+class FakeProofHost(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def fake_check_proof(service, identifier, fqa, proof_url, address=None):
+    text = urllib2.urlopen(proof_url).read()
+    return 'verifying that "{}" is my blockstack id'.format(fqa) in text.lower()
+
+
+class ProofVerifierTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # one fake host per 'service', so per-host limits don't serialize the run
+        self.hosts = []
+        for i in xrange(0, NUM_PROOFS):
+            srv = FakeProofHost(('127.0.0.1', 0), FakeProofHandler)
+            t = threading.Thread(target=srv.serve_forever, kwargs={'poll_interval': 0.05})
+            t.daemon = True
+            t.start()
+            self.hosts.append(srv)
+
+        self.candidates = []
+        for i, srv in enumerate(self.hosts):
+            path = 'valid' if i % 2 == 0 else 'invalid'
+            self.candidates.append({
+                'service': 'fake{}'.format(i),
+                'identifier': 'alice',
+                'proof_url': 'http://127.0.0.1:{}/{}/{}'.format(srv.server_address[1], path, i)})
+
+    def tearDown(self):
+        for srv in self.hosts:
+            srv.shutdown()
+            srv.server_close()
+
+    def test_concurrent_and_cached(self):
+        """ Benchmark serial vs concurrent vs cached proof verification
+        """
+        t0 = time.time()
+        serial = [fake_check_proof(c['service'], c['identifier'], 'alice.id', c['proof_url'])
+                  for c in self.candidates]
+        serial_time = time.time() - t0
+
+        verifier = ProofVerifier(check_proof=fake_check_proof, num_workers=NUM_PROOFS,
+                                 host_min_interval=0)
+        try:
+            t0 = time.time()
+            cold = verifier.get_proofs(self.candidates, 'alice.id', None, 'hash')
+            cold_time = time.time() - t0
+
+            t0 = time.time()
+            warm = verifier.get_proofs(self.candidates, 'alice.id', None, 'hash')
+            warm_time = time.time() - t0
+        finally:
+            verifier.stop()
+
+        print '\n{} proofs: serial {:.3f}s, concurrent {:.3f}s, cached {:.6f}s'.format(
+            NUM_PROOFS, serial_time, cold_time, warm_time)
+
+        self.assertEqual(serial, [p['valid'] for p in cold])
+        self.assertEqual(serial, [p['valid'] for p in warm])
+        self.assertLess(cold_time, serial_time / 2)
+        self.assertLess(warm_time, FAKE_PROOF_HOST_LATENCY)
+
+        stats = verifier.get_stats()
+        self.assertEqual(stats['fetches'], NUM_PROOFS)
+        self.assertEqual(stats['hits'], NUM_PROOFS)
+
+    def test_stale_refresh(self):
+        """ Stale verdicts are served immediately and refreshed in the background
+        """
+        verifier = ProofVerifier(check_proof=fake_check_proof, num_workers=NUM_PROOFS,
+                                 ttl=0, host_min_interval=0)
+        try:
+            verifier.get_proofs(self.candidates, 'alice.id', None, 'hash')
+
+            t0 = time.time()
+            verifier.get_proofs(self.candidates, 'alice.id', None, 'hash')
+            self.assertLess(time.time() - t0, FAKE_PROOF_HOST_LATENCY)
+            self.assertEqual(verifier.get_stats()['stale'], NUM_PROOFS)
+        finally:
+            verifier.stop()
+
+        self.assertEqual(verifier.get_stats()['fetches'], 2 * NUM_PROOFS)
+
+    def test_host_rate_limit(self):
+        """ Fetches to one host respect its concurrency bound
+        """
+        url = 'http://127.0.0.1:{}/valid/'.format(self.hosts[0].server_address[1])
+        candidates = [{'service': 'fake', 'identifier': 'alice', 'proof_url': url + str(i)}
+                      for i in xrange(0, 4)]
+
+        verifier = ProofVerifier(check_proof=fake_check_proof, num_workers=4,
+                                 host_concurrency=1, host_min_interval=0)
+        try:
+            t0 = time.time()
+            proofs = verifier.get_proofs(candidates, 'alice.id', None, 'hash')
+            elapsed = time.time() - t0
+        finally:
+            verifier.stop()
+
+        self.assertTrue(all(p['valid'] for p in proofs))
+        self.assertGreaterEqual(elapsed, 4 * FAKE_PROOF_HOST_LATENCY)
+
+
+if __name__ == "__main__":
+    unittest.main()
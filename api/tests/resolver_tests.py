@@ -24,11 +24,13 @@ import os
 import sys
 import requests
 import json
+import time
 import unittest
 
 import api
 
 PROFILE_URL = "/v1/users/{}"
+BATCH_PROFILE_URL = "/v1/users?names={}"
 
 class ResolverTestCase(unittest.TestCase):
 
@@ -73,5 +75,54 @@ class ResolverTestCase(unittest.TestCase):
             reply = self.get_profile(username)[username]
             self.assertIn('error', reply, msg="resolver didn't give error on unregistered profile: {}".format(reply))
 
+class BatchResolverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = api.app.test_client()
+
+    def get_profiles(self, usernames):
+        url = BATCH_PROFILE_URL.format(','.join(usernames))
+        r = self.client.get(url)
+        return r.status_code, json.loads(r.data)
+
+    def test_batch_matches_single(self):
+        """ Batch lookups return the same profiles as single lookups,
+            and report the latency of each
+        """
+        usernames = ['muneeb', 'fredwilson', 'davidlee', 'gfegef7ev79efv9ev23t4fv']
+
+        t0 = time.time()
+        single = {}
+        for username in usernames:
+            r = self.client.get(PROFILE_URL.format(username))
+            single[username] = json.loads(r.data)[username]
+        single_time = time.time() - t0
+
+        t0 = time.time()
+        status_code, batch = self.get_profiles(usernames)
+        batch_time = time.time() - t0
+
+        print '\n{} names: one-by-one {:.3f}s, batch {:.3f}s'.format(
+            len(usernames), single_time, batch_time)
+
+        self.assertEqual(status_code, 200)
+        for username in usernames:
+            self.assertIn(username, batch)
+            if 'error' in single[username]:
+                self.assertIn('error', batch[username])
+            else:
+                self.assertEqual(single[username]['profile'], batch[username]['profile'])
+                self.assertEqual(single[username]['zone_file'], batch[username]['zone_file'])
+
+    def test_batch_limits(self):
+        """ Check batch input validation
+        """
+        r = self.client.get('/v1/users')
+        self.assertEqual(r.status_code, 400)
+
+        status_code, reply = self.get_profiles(['user{}'.format(i) for i in range(0, 1000)])
+        self.assertEqual(status_code, 400)
+        self.assertIn('error', reply)
+
 if __name__ == "__main__":
     unittest.main()
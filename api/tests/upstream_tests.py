@@ -0,0 +1,180 @@
+"""
+    Blockstack Core
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+This file is part of Blockstack Core.
+
+    Blockstack Core is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack Core is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Search. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import time
+import socket
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+from api.upstream import UpstreamGroup, UpstreamUnavailable
+
+LARGE_BODY_SIZE = 4 * 1024 * 1024
+SLOW_REPLY_TIME = 1.0
+
+class FakeUpstreamHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Keep-alive server: /large returns a big body, everything else echoes the path
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/large':
+            body = 'x' * LARGE_BODY_SIZE
+        else:
+            body = json.dumps({'path': self.path})
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.posts.append(body)
+
+        if self.path == '/slow':
+            # the write happened, but the reply is late
+            time.sleep(SLOW_REPLY_TIME)
+
+        reply = json.dumps({'path': self.path})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args, **kw):
+        pass
+
+
+class FakeUpstream(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kw):
+        BaseHTTPServer.HTTPServer.__init__(self, *args, **kw)
+        self.posts = []
+
+    def handle_error(self, request, client_address):
+        # clients that time out hang up before we reply
+        pass
+
+
+def unused_url():
+    """
+    URL of a local port nothing listens on
+    """
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return 'http://127.0.0.1:{}'.format(port)
+
+
+class UpstreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.srv, self.url = self.start_upstream()
+
+    def tearDown(self):
+        self.srv.shutdown()
+        self.srv.server_close()
+
+    def start_upstream(self):
+        srv = FakeUpstream(('127.0.0.1', 0), FakeUpstreamHandler)
+        t = threading.Thread(target=srv.serve_forever, kwargs={'poll_interval': 0.05})
+        t.daemon = True
+        t.start()
+        return srv, 'http://127.0.0.1:{}'.format(srv.server_address[1])
+
+    def test_connection_reuse(self):
+        """ Sequential requests share one keep-alive connection
+        """
+        group = UpstreamGroup([self.url])
+        for i in xrange(0, 10):
+            resp = group.get('/v1/ping/{}'.format(i))
+            self.assertEqual(resp.json()['path'], '/v1/ping/{}'.format(i))
+
+        metrics = group.get_metrics()[0]
+        self.assertEqual(metrics['requests'], 10)
+        self.assertEqual(metrics['connections_opened'], 1)
+        self.assertEqual(metrics['connections_reused'], 9)
+
+    def test_streaming(self):
+        """ Large bodies can be read chunk by chunk
+        """
+        group = UpstreamGroup([self.url])
+        resp = group.get('/large')
+        total = 0
+        for chunk in resp.iter_content(chunk_size=65536):
+            self.assertLessEqual(len(chunk), 65536)
+            total += len(chunk)
+
+        self.assertEqual(total, LARGE_BODY_SIZE)
+
+    def test_failover(self):
+        """ A dead upstream is skipped, and marked down after repeated failures
+        """
+        group = UpstreamGroup([unused_url(), self.url], failure_threshold=2, retry_interval=60)
+        for i in xrange(0, 5):
+            resp = group.get('/v1/ping')
+            self.assertEqual(resp.status_code, 200)
+
+        dead, alive = group.get_metrics()
+        self.assertFalse(dead['healthy'])
+        self.assertEqual(dead['failures'], 2)
+        self.assertTrue(alive['healthy'])
+        self.assertEqual(alive['requests'], 5)
+
+    def test_post_failover(self):
+        """ POSTs fail over if they couldn't connect, but aren't replayed after a read timeout
+        """
+        group = UpstreamGroup([unused_url(), self.url])
+        resp = group.post('/v1/names', data='register')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.srv.posts, ['register'])
+
+        other_srv, other_url = self.start_upstream()
+        try:
+            group = UpstreamGroup([self.url, other_url], read_timeout=SLOW_REPLY_TIME / 4)
+            self.assertRaises(UpstreamUnavailable, group.post, '/slow', data='transfer')
+            time.sleep(SLOW_REPLY_TIME)
+
+            self.assertEqual(self.srv.posts, ['register', 'transfer'])
+            self.assertEqual(other_srv.posts, [])
+
+            # GETs still fail over on read timeouts
+            self.assertEqual(group.get('/v1/ping').status_code, 200)
+        finally:
+            other_srv.shutdown()
+            other_srv.server_close()
+
+    def test_all_down(self):
+        group = UpstreamGroup([unused_url()])
+        self.assertRaises(UpstreamUnavailable, group.get, '/v1/ping')
+
+
+if __name__ == "__main__":
+    unittest.main()
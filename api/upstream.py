@@ -0,0 +1,217 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack Core
+    ~~~~~
+
+    copyright: (c) 2014-2017 by Blockstack Inc.
+    copyright: (c) 2017 by Blockstack.org
+
+This file is part of Blockstack Core.
+
+    Blockstack Core is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack Core is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack Core. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ConnectTimeout as RequestsConnectTimeout
+from requests.exceptions import Timeout as RequestsTimeout
+from requests.packages.urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from time import time
+
+from .config import DEBUG
+from .config import UPSTREAM_POOL_SIZE, UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT
+from .config import UPSTREAM_FAILURE_THRESHOLD, UPSTREAM_RETRY_INTERVAL
+
+logging.basicConfig()
+log = logging.getLogger('upstream')
+
+if DEBUG:
+    log.setLevel(level=logging.DEBUG)
+else:
+    log.setLevel(level=logging.INFO)
+
+
+class UpstreamUnavailable(Exception):
+    """
+    None of an upstream group's servers could be reached
+    """
+    pass
+
+
+# requests that can be safely sent again to another upstream
+# if we don't know whether the first one got them
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS']
+
+
+def request_not_sent(e):
+    """
+    Did this connection error or timeout happen before the request
+    reached the server?  (i.e. we couldn't connect at all)
+    """
+    if isinstance(e, RequestsConnectTimeout):
+        return True
+
+    if isinstance(e, RequestsConnectionError) and len(e.args) > 0:
+        reason = e.args[0]
+        if isinstance(reason, MaxRetryError):
+            reason = reason.reason
+
+        return isinstance(reason, NewConnectionError)
+
+    return False
+
+
+class Upstream(object):
+    """
+    One upstream server, reached through a pooled keep-alive session.
+    Tracks its own health and latency.
+    """
+    def __init__(self, base_url, pool_size=UPSTREAM_POOL_SIZE,
+                 connect_timeout=UPSTREAM_CONNECT_TIMEOUT, read_timeout=UPSTREAM_READ_TIMEOUT,
+                 failure_threshold=UPSTREAM_FAILURE_THRESHOLD, retry_interval=UPSTREAM_RETRY_INTERVAL):
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.failure_threshold = failure_threshold
+        self.retry_interval = retry_interval
+
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.down_until = 0
+        self.stats = {'requests': 0, 'failures': 0, 'latency_total': 0.0, 'latency_max': 0.0}
+
+
+    def is_healthy(self):
+        with self.lock:
+            return time() >= self.down_until
+
+
+    def record_success(self, latency):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.down_until = 0
+            self.stats['requests'] += 1
+            self.stats['latency_total'] += latency
+            self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.stats['requests'] += 1
+            self.stats['failures'] += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                log.warning("Upstream {} is down; retrying in {} seconds".format(self.base_url, self.retry_interval))
+                self.down_until = time() + self.retry_interval
+
+
+    def request(self, method, path, **kw):
+        """
+        Send a request to this upstream.  The response body is streamed;
+        the caller must consume or close() it to return the connection to the pool.
+        Raises on connection errors and timeouts.
+        """
+        url = self.base_url + '/' + path.lstrip('/')
+        t0 = time()
+        try:
+            resp = self.session.request(method, url, stream=True, timeout=self.timeout, **kw)
+        except (RequestsConnectionError, RequestsTimeout):
+            self.record_failure()
+            raise
+
+        self.record_success(time() - t0)
+        return resp
+
+
+    def get_metrics(self):
+        """
+        Get health, latency and connection-reuse statistics
+        """
+        pool = self.adapter.poolmanager.connection_from_url(self.base_url)
+        num_connections = pool.num_connections
+        num_requests = pool.num_requests
+
+        with self.lock:
+            successes = self.stats['requests'] - self.stats['failures']
+            return {
+                'url': self.base_url,
+                'healthy': time() >= self.down_until,
+                'requests': self.stats['requests'],
+                'failures': self.stats['failures'],
+                'latency_avg': self.stats['latency_total'] / successes if successes > 0 else 0.0,
+                'latency_max': self.stats['latency_max'],
+                'connections_opened': num_connections,
+                'connections_reused': max(0, num_requests - num_connections),
+            }
+
+
+class UpstreamGroup(object):
+    """
+    An ordered list of interchangeable upstream servers.
+    Requests go to the first healthy one, and fail over to the next
+    on connection errors and timeouts.  Non-idempotent requests (e.g. POSTs)
+    only fail over if they never reached the server, so they don't get
+    submitted twice.
+    """
+    def __init__(self, base_urls, **upstream_kw):
+        self.upstreams = [Upstream(url, **upstream_kw) for url in base_urls]
+
+
+    def request(self, method, path, **kw):
+        """
+        Send a request to the first upstream that answers.
+        Upstreams marked down are only tried if every upstream is down.
+        Raises UpstreamUnavailable if none of them answer, or if a
+        non-idempotent request fails after it may have been sent.
+        """
+        candidates = filter(lambda u: u.is_healthy(), self.upstreams)
+        if len(candidates) == 0:
+            candidates = self.upstreams
+
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        for upstream in candidates:
+            try:
+                return upstream.request(method, path, **kw)
+            except (RequestsConnectionError, RequestsTimeout) as e:
+                log.error("Failed to reach upstream {}: {}".format(upstream.base_url, e))
+                if not idempotent and not request_not_sent(e):
+                    raise UpstreamUnavailable("Upstream {} failed after {} {} may have been sent; not retrying".format(upstream.base_url, method, path))
+
+                continue
+
+        raise UpstreamUnavailable("No upstream server reachable for {}".format(path))
+
+
+    def get(self, path, **kw):
+        return self.request('GET', path, **kw)
+
+
+    def post(self, path, **kw):
+        return self.request('POST', path, **kw)
+
+
+    def get_metrics(self):
+        return [u.get_metrics() for u in self.upstreams]
@@ -63,6 +63,8 @@ from lib import *
 from lib.storage import *
 from lib.atlas import *
 from lib.fast_sync import *
+from lib.blocknotify import BlockNotifier
+from lib.profiler import INDEX_PROFILE_MAX_TRACE_BLOCKS
 
 import lib.nameset.virtualchain_hooks as virtualchain_hooks
 import lib.config as config
@@ -73,10 +75,12 @@ bitcoind = None
 rpc_server = None
 storage_pusher = None
 gc_thread = None
+block_notifier = None
+name_pricer = NamePricer()
 has_indexer = True
 
 from blockstack_client.utils import url_to_host_port, atlas_inventory_to_string
-from blockstack_client import queue_findone, queue_findall, queue_removeall, queue_append
+from blockstack_client import queue_findone, queue_append
 
 GC_EVENT_THRESHOLD = 15
 
@@ -225,26 +229,11 @@ def get_name_cost( db, name ):
     Do so by finding the namespace it belongs to (even if the namespace is being imported).
     Return None if the namespace has not been declared
     """
-    lastblock = db.lastblock
-    namespace_id = get_namespace_from_name( name )
-    if namespace_id is None or len(namespace_id) == 0:
-        log.debug("No namespace '%s'" % namespace_id)
-        return None
-
-    namespace = db.get_namespace( namespace_id )
-    if namespace is None:
-        # maybe importing?
-        log.debug("Revealing namespace '%s'" % namespace_id)
-        namespace = db.get_namespace_reveal( namespace_id )
-
-    if namespace is None:
-        # no such namespace
-        log.debug("No namespace '%s'" % namespace_id)
+    name_fee = name_pricer.price_name( db, name )
+    if name_fee is None:
         return None
 
-    name_fee = price_name( get_name_from_fq_name( name ), namespace, lastblock )
-    log.debug("Cost of '%s' at %s is %s" % (name, lastblock, int(name_fee)))
-
+    log.debug("Cost of '%s' at %s is %s" % (name, db.lastblock, int(name_fee)))
     return name_fee
 
 
@@ -561,6 +550,44 @@ class BlockstackdRPC( SimpleXMLRPCServer):
         return reply
 
 
+    def get_name_record(self, db, name):
+        """
+        Look up a name's record, and annotate it with its expiration information.
+        Return the record on success
+        Return None if not found
+        """
+        name_record = db.get_name(str(name))
+        if name_record is None:
+            return None
+
+        namespace_id = get_namespace_from_name(name)
+        namespace_record = db.get_namespace(namespace_id)
+        if namespace_record is None:
+            namespace_record = db.get_namespace_reveal(namespace_id)
+
+        # when does this name expire (if it expires)?
+        if namespace_record['lifetime'] != NAMESPACE_LIFE_INFINITE:
+            deadlines = BlockstackDB.get_name_deadlines(name_record, namespace_record, db.lastblock)
+            if deadlines is not None:
+                name_record['expire_block'] = deadlines['expire_block']
+                name_record['renewal_deadline'] = deadlines['renewal_deadline']
+            else:
+                # only possible if namespace is not yet ready
+                name_record['expire_block'] = -1
+                name_record['renewal_deadline'] = -1
+
+        else:
+            name_record['expire_block'] = -1
+            name_record['renewal_deadline'] = -1
+
+        if name_record['expire_block'] > 0 and name_record['expire_block'] <= db.lastblock:
+            name_record['expired'] = True
+        else:
+            name_record['expired'] = False
+
+        return name_record
+
+
     def rpc_get_name_blockchain_record(self, name, **con_info):
         """
         Lookup the blockchain-derived whois info for a name.
@@ -582,41 +609,49 @@ class BlockstackdRPC( SimpleXMLRPCServer):
             db.close()
             return {"error": str(e)}
 
-        name_record = db.get_name(str(name))
+        name_record = self.get_name_record(db, name)
+        db.close()
 
         if name_record is None:
-            db.close()
             return {"error": "Not found."}
 
-        else:
+        return self.success_response( {'record': name_record} )
 
-            namespace_id = get_namespace_from_name(name)
-            namespace_record = db.get_namespace(namespace_id)
-            if namespace_record is None:
-                namespace_record = db.get_namespace_reveal(namespace_id)
-
-            # when does this name expire (if it expires)?
-            if namespace_record['lifetime'] != NAMESPACE_LIFE_INFINITE:
-                deadlines = BlockstackDB.get_name_deadlines(name_record, namespace_record, db.lastblock)
-                if deadlines is not None:
-                    name_record['expire_block'] = deadlines['expire_block']
-                    name_record['renewal_deadline'] = deadlines['renewal_deadline']
-                else:
-                    # only possible if namespace is not yet ready
-                    name_record['expire_block'] = -1
-                    name_record['renewal_deadline'] = -1
 
-            else:
-                name_record['expire_block'] = -1
-                name_record['renewal_deadline'] = -1
+    def rpc_get_name_blockchain_records(self, names, **con_info):
+        """
+        Lookup the blockchain-derived whois info for a list of names,
+        using one database session.  Only look up at most 100 names.
+        Return {'status': True, 'records': {name: rec or {'error': ...}}} on success
+        Return {'error': ...} on error
+        """
+
+        if not is_indexer():
+            return {'error': 'Method not supported'}
+
+        if type(names) != list:
+            return {'error': 'Invalid name list'}
 
-            if name_record['expire_block'] > 0 and name_record['expire_block'] <= db.lastblock:
-                name_record['expired'] = True
+        if len(names) > 100:
+            return {'error': 'Too many names (no more than 100 allowed)'}
+
+        for name in names:
+            if not self.check_name(name):
+                return {'error': 'invalid name'}
+
+        db = get_db_state()
+
+        records = {}
+        for name in names:
+            name = str(name)
+            name_record = self.get_name_record(db, name)
+            if name_record is None:
+                records[name] = {'error': 'Not found.'}
             else:
-                name_record['expired'] = False
+                records[name] = name_record
 
-            db.close()
-            return self.success_response( {'record': name_record} )
+        db.close()
+        return self.success_response( {'records': records} )
 
 
     def rpc_get_name_history_blocks( self, name, **con_info ):
@@ -841,9 +876,75 @@ class BlockstackdRPC( SimpleXMLRPCServer):
             # return zonefile inv length
             reply['zonefile_count'] = atlas_get_num_zonefiles()
 
+        if block_notifier is not None:
+            reply['block_notify'] = block_notifier.get_stats()
+
+        if conf.get('serve_zonefiles', False):
+            reply['zonefile_cache'] = zonefile_cache_get_stats()
+
+        block_prefetch_stats = virtualchain_hooks.get_block_prefetch_stats()
+        if block_prefetch_stats is not None:
+            reply['block_prefetch'] = block_prefetch_stats
+
         return reply
 
 
+    def rpc_get_indexing_profile(self, start_block=None, end_block=None, **con_info):
+        """
+        Get a report on where the indexer spent its time in the
+        recently-indexed blocks between start_block and end_block
+        (inclusive; defaults to all of them).  For the blocks overall,
+        each virtualchain hook, and each opcode, gives percentiles of the
+        wall-clock time, CPU time, and SQLite statements per block.
+        Return {'status': True, 'profile': {...}} on success
+        Return {'error': ...} on error
+        """
+        if not is_indexer():
+            return {'error': 'Method not supported'}
+
+        for block_id in [start_block, end_block]:
+            if block_id is not None and not self.check_block(block_id):
+                return {'error': 'Invalid block height'}
+
+        profile = virtualchain_hooks.indexing_profiler.get_report( start_block=start_block, end_block=end_block )
+        return self.success_response( {'profile': profile} )
+
+
+    def rpc_get_indexing_trace(self, start_block, end_block, **con_info):
+        """
+        Get a timeline of the virtualchain hooks the indexer ran
+        for the blocks between start_block and end_block (inclusive),
+        in Chrome's trace event format.
+        Return {'status': True, 'trace': {'traceEvents': [...], ...}} on success
+        Return {'error': ...} on error
+        """
+        if not is_indexer():
+            return {'error': 'Method not supported'}
+
+        if not self.check_block(start_block) or not self.check_block(end_block) or start_block > end_block:
+            return {'error': 'Invalid block range'}
+
+        if end_block - start_block + 1 > INDEX_PROFILE_MAX_TRACE_BLOCKS:
+            return {'error': 'Too many blocks (max {})'.format(INDEX_PROFILE_MAX_TRACE_BLOCKS)}
+
+        trace = virtualchain_hooks.indexing_profiler.get_trace( start_block, end_block )
+        return self.success_response( {'trace': trace} )
+
+
+    def rpc_get_storage_replication_status(self, **con_info):
+        """
+        Get the state of the storage replication queues:
+        queue depths and ages, throughput, and per-driver statistics.
+        Return {'status': True, 'replication': ...} on success
+        Return {'error': ...} on error
+        """
+        metrics = storage_get_metrics()
+        if metrics is None:
+            return {'error': 'Storage replication is not running'}
+
+        return self.success_response( {'replication': metrics} )
+
+
     def rpc_get_names_owned_by_address(self, address, **con_info):
         """
         Get the list of names owned by an address.
@@ -939,6 +1040,42 @@ class BlockstackdRPC( SimpleXMLRPCServer):
         return self.success_response( {"satoshis": int(math.ceil(ret))} )
 
 
+    def rpc_get_name_costs( self, names, **con_info ):
+        """
+        Return the costs of a list of names, including fees,
+        using one database session.  Only price at most 500 names.
+        Return {'status': True, 'costs': {name: {'satoshis': ...} or {'error': ...}}} on success
+        Return {'error': ...} on error
+        """
+
+        if not is_indexer():
+            return {'error': 'Method not supported'}
+
+        if type(names) != list:
+            return {'error': 'Invalid name list'}
+
+        if len(names) > 500:
+            return {'error': 'Too many names (no more than 500 allowed)'}
+
+        for name in names:
+            if not self.check_name(name):
+                return {'error': 'Invalid name or namespace'}
+
+        db = get_db_state()
+
+        costs = {}
+        for name in names:
+            name = str(name)
+            cost = name_pricer.price_name( db, name )
+            if cost is None:
+                costs[name] = {'error': 'Unknown/invalid namespace'}
+            else:
+                costs[name] = {'satoshis': int(math.ceil(cost))}
+
+        db.close()
+        return self.success_response( {'costs': costs} )
+
+
     def rpc_get_namespace_cost( self, namespace_id, **con_info ):
         """
         Return the cost of a given namespace, including fees.
@@ -1261,18 +1398,11 @@ class BlockstackdRPC( SimpleXMLRPCServer):
         Return None on error
         """
 
-        # check cache
+        # check cache (already verified against the hash)
         cached_zonefile_data = get_cached_zonefile_data( zonefile_hash, zonefile_dir=config.get('zonefiles', None))
         if cached_zonefile_data is not None:
-            # check hash
-            zfh = blockstack_client.get_zonefile_data_hash( cached_zonefile_data )
-            if zfh != zonefile_hash:
-                log.debug("Invalid cached zonefile %s" % zonefile_hash )
-                remove_cached_zonefile_data( zonefile_hash, zonefile_dir=config.get('zonefiles', None))
-
-            else:
-                log.debug("Zonefile %s is cached" % zonefile_hash)
-                return cached_zonefile_data
+            log.debug("Zonefile %s is cached" % zonefile_hash)
+            return cached_zonefile_data
 
         return None
 
@@ -1849,6 +1979,32 @@ class BlockstackdRPC( SimpleXMLRPCServer):
         return self.success_response( {'inv': base64.b64encode(zonefile_inv) } )
 
 
+    def rpc_get_zonefile_inventory_delta( self, inv_id, version, **con_info ):
+        """
+        Get the bits in our zonefile inventory that changed since
+        the given version of it, as run-length encoded lists of
+        [start, length, ...] for the bits set and cleared.
+        Pass inv_id=None or version=None to get the current ID and version.
+        Return {'status': True, 'inv_id': ..., 'version': ..., 'set': [...], 'clear': [...]} on success
+        Return {'status': True, 'inv_id': ..., 'version': ..., 'resync': True} if the caller must fetch the whole inventory instead
+        Return {'error': ...} on error
+        """
+        conf = get_blockstack_opts()
+        if not conf['atlas']:
+            return {'error': 'Not an atlas node'}
+
+        if inv_id is not None and type(inv_id) not in [str, unicode]:
+            return {'error': 'invalid inventory ID'}
+
+        if version is not None and not self.check_offset(version):
+            return {'error': 'invalid version'}
+
+        if inv_id is not None:
+            inv_id = str(inv_id)
+
+        return self.success_response( atlas_get_zonefile_inventory_delta( inv_id, version ) )
+
+
     def rpc_get_all_neighbor_info( self, **con_info ):
         """
         For network simulator purposes only!
@@ -1971,6 +2127,23 @@ class BlockstackStoragePusher( threading.Thread ):
             log.warn("Removing 'blockstack_server' from data storage write drivers")
             self.data_storage_drivers_write.remove('blockstack_server')
 
+        self.engine = ReplicationEngine( queue_path, num_workers=conf.get('storage_push_workers', 8),
+                                         driver_concurrency=conf.get('storage_push_driver_concurrency', 2),
+                                         batch_size=conf.get('storage_push_batch_size', 32),
+                                         max_inflight=conf.get('storage_push_max_inflight', 256),
+                                         max_retries=conf.get('storage_push_max_retries', 5) )
+
+        # these drivers are skipped when storing zonefiles, profiles, and data
+        zonefile_push_drivers = [d for d in self.zonefile_storage_drivers_write if d not in ['blockstack_resolver', 'dht']]
+        profile_push_drivers = [d for d in self.profile_storage_drivers if d not in ['blockstack_resolver']]
+        data_push_drivers = [d for d in self.data_storage_drivers if d not in ['blockstack_resolver']]
+
+        self.engine.add_queue( self.zonefile_queue_id, zonefile_push_drivers, self.zonefile_push, on_complete=self.zonefile_replicated )
+        self.engine.add_queue( self.profile_queue_id, profile_push_drivers, self.profile_or_datum_push,
+                               prepare=self.profile_or_datum_prepare, on_complete=self.profile_or_datum_replicated )
+        self.engine.add_queue( self.data_queue_id, data_push_drivers, self.profile_or_datum_push,
+                               prepare=self.profile_or_datum_prepare, on_complete=self.profile_or_datum_replicated )
+
 
     def enqueue_zonefile( self, txid, zonefile_hash, zonefile_data ):
         """
@@ -2004,6 +2177,7 @@ class BlockstackStoragePusher( threading.Thread ):
             # NOTE: we don't use or rely on the name here, but use the zonefile hash instead
             res = queue_append( self.zonefile_queue_id, zonefile_hash, txid, block_height=0, zonefile_hash=zonefile_hash, zonefile_data=zonefile_data, path=self.queue_path )
             assert res
+            self.engine.wakeup()
             return True
         except Exception as e:
             log.exception(e)
@@ -2034,6 +2208,7 @@ class BlockstackStoragePusher( threading.Thread ):
             log.debug("Queue {}-byte datum for {}".format(len(data), blockchain_id))
             res = queue_append( queue_id, blockchain_id, "00" * 32, block_height=0, profile=data, path=self.queue_path )
             assert res
+            self.engine.wakeup()
             return True
         except Exception as e:
             log.exception(e)
@@ -2059,45 +2234,41 @@ class BlockstackStoragePusher( threading.Thread ):
         return self.enqueue_profile_or_data(blockchain_id, self.data_queue_id, json.dumps(data_payload))
 
 
-    def store_one_zonefile(self):
+    def zonefile_push(self, driver, entry):
         """
-        Find and store one zonefile
+        Store a queued zonefile to one driver
         """
-        # find a zonefile
-        entries = queue_findall( self.zonefile_queue_id, limit=1, path=self.queue_path )
-        if entries is None or len(entries) == 0:
-            # empty
-            return False
-
-        entry = entries[0]
-        res = store_zonefile_data_to_storage( str(entry['zonefile']), entry['tx_hash'], required=self.zonefile_storage_drivers_write,
+        res = store_zonefile_data_to_storage( str(entry['zonefile']), entry['tx_hash'], required=[driver],
                                               skip=['blockstack_server','blockstack_resolver','dht'], cache=False, zonefile_dir=self.zonefile_dir, tx_required=False )
 
         if not res:
-            log.error("Failed to store zonefile {} ({} bytes)".format(entry['zonefile_hash'], len(entry['zonefile'])))
+            log.error("Failed to store zonefile {} ({} bytes) to {}".format(entry['zonefile_hash'], len(entry['zonefile']), driver))
             return False
 
+        return True
+
+
+    def zonefile_replicated(self, entry, succeeded, failed):
+        """
+        Called once a zonefile has been pushed to all of its drivers
+        """
+        if len(failed) > 0:
+            log.error("Failed to replicate zonefile {} to {}".format(entry['zonefile_hash'], ",".join(failed)))
+            return
+
         log.debug("Replicated zonefile {} ({} bytes)".format(entry['zonefile_hash'], len(entry['zonefile'])))
 
         if self.atlasdb_path is not None:
             # mark present in the atlas subsystem
             atlasdb_set_zonefile_present( str(entry['zonefile_hash']), True, path=self.atlasdb_path )
 
-        queue_removeall( entries, path=self.queue_path )
-        return res
-
 
-    def store_one_profile_or_datum(self, queue_id, storage_drivers):
+    def profile_or_datum_prepare(self, entry):
         """
-        Find and store one profile or datum
+        Decode a queued profile or mutable datum.
+        Return {'blockchain_id', 'fq_data_id', 'data_txt', 'profile'} on success
+        Return None if it is malformed
         """
-        entries = queue_findall( queue_id, limit=1, path=self.queue_path )
-        if entries is None or len(entries) == 0:
-            # empty
-            return False
-
-        entry = entries[0]
-
         blockchain_id = str(entry['fqu'])
         fq_data_id = None
         data_txt = None
@@ -2129,32 +2300,40 @@ class BlockstackStoragePusher( threading.Thread ):
             log.exception(e)
             log.debug("entry = {}".format(entry))
             log.debug("Abandoning data from {}".format(blockchain_id))
-            queue_removeall( entries, path=self.queue_path )
-            return False
+            return None
+
+        return {'blockchain_id': blockchain_id, 'fq_data_id': fq_data_id, 'data_txt': data_txt, 'profile': profile}
 
-        success = store_mutable_data_to_storage( blockchain_id, fq_data_id, data_txt, profile=profile, required=storage_drivers, skip=['blockstack_server','blockstack_resolver'])
+
+    def profile_or_datum_push(self, driver, datum):
+        """
+        Store a decoded profile or mutable datum to one driver
+        """
+        success = store_mutable_data_to_storage( datum['blockchain_id'], datum['fq_data_id'], datum['data_txt'], profile=datum['profile'],
+                                                 required=[driver], skip=['blockstack_server','blockstack_resolver'], required_exclusive=True )
         if not success:
-            log.error("Failed to store data for {} ({} bytes) (rc = {})".format(blockchain_id, len(data_txt), success))
-            queue_removeall( entries, path=self.queue_path )
+            log.error("Failed to store data for {} ({} bytes) to {} (rc = {})".format(datum['blockchain_id'], len(datum['data_txt']), driver, success))
             return False
 
-        log.debug("Replicated data for {} ({} bytes)".format(blockchain_id, len(data_txt)))
-        queue_removeall( entries, path=self.queue_path )
         return True
 
 
-    def store_one_profile(self):
+    def profile_or_datum_replicated(self, entry, succeeded, failed):
         """
-        Find and store one profile
+        Called once a profile or datum has been pushed to all of its drivers
         """
-        return self.store_one_profile_or_datum(self.profile_queue_id, self.profile_storage_drivers)
+        if len(failed) > 0:
+            log.error("Failed to replicate data for {} to {}".format(entry['fqu'], ",".join(failed)))
+            return
+
+        log.debug("Replicated data for {} ({} bytes)".format(entry['fqu'], len(entry['profile'])))
 
 
-    def store_one_datum(self):
+    def get_metrics(self):
         """
-        Find and store one mutable datum
+        Get replication queue and driver statistics
         """
-        return self.store_one_profile_or_datum(self.data_queue_id, self.data_storage_drivers)
+        return self.engine.get_metrics()
 
 
     def run(self):
@@ -2164,35 +2343,39 @@ class BlockstackStoragePusher( threading.Thread ):
         global gc_thread
 
         self.running = True
+        self.engine.start()
         while self.running:
 
-            res_zonefile = self.store_one_zonefile()
-            res_profile = self.store_one_profile()
-            res_data = self.store_one_datum()
-
-            if not res_zonefile and not res_profile and not res_data:
-                time.sleep(1.0)
-                gc_thread.gc_event()
-                continue
-
-            else:
+            count = self.engine.run_once()
+            if count > 0:
                 gc_thread.gc_event()
 
+        self.engine.stop()
         log.debug("StoragePusher thread exit")
         self.running = False
 
 
     def signal_stop(self):
         self.running = False
+        self.engine.wakeup()
         log.debug("StoragePusher signal stop")
 
 
-    def drain(self):
+    def drain(self, timeout=None):
         """
         Stop taking requests and wait for the queue to drain
         """
         self.accepting = False
-        return
+
+        deadline = time.time() + timeout if timeout is not None else None
+        while self.running and not self.engine.is_idle():
+            if deadline is not None and time.time() > deadline:
+                log.error("Timed out draining storage queue")
+                return False
+
+            time.sleep(0.1)
+
+        return True
 
 
 def rpc_start( port ):
@@ -2257,12 +2440,55 @@ def gc_stop():
     log.debug("GC thread joined")
 
 
+def block_notify_start( blockstack_opts ):
+    """
+    Start listening for new-block announcements, if configured.
+    Return True if we're listening
+    Return False if the indexer should just poll
+    """
+    global block_notifier
+
+    zmq_url = blockstack_opts.get('block_notify_zmq', None)
+    notify_port = blockstack_opts.get('block_notify_port', None)
+    if zmq_url is None and notify_port is None:
+        return False
+
+    notifier = BlockNotifier( zmq_url=zmq_url, notify_port=notify_port )
+    if not notifier.bind():
+        log.error("No block announcement sources available; polling every %s seconds" % REINDEX_FREQUENCY)
+        notifier.close()
+        return False
+
+    log.debug("Starting block notifier")
+    block_notifier = notifier
+    block_notifier.start()
+    return True
+
+
+def block_notify_stop():
+    """
+    Stop listening for new-block announcements
+    """
+    global block_notifier
+
+    if block_notifier is None:
+        return
+
+    log.debug("Shutting down block notifier")
+    block_notifier.signal_stop()
+    block_notifier.join()
+    block_notifier = None
+    log.debug("Block notifier joined")
+
+
 def storage_start( blockstack_opts ):
     """
     Start the global data-pusher thread
     """
     global storage_pusher
 
+    zonefile_cache_configure( blockstack_opts.get('zonefile_cache_size', ZONEFILE_CACHE_SIZE) )
+
     storage_queue = get_storage_queue_path()
     storage_pusher = BlockstackStoragePusher( blockstack_opts, storage_queue )
     log.debug("Starting storage pusher")
@@ -2310,6 +2536,18 @@ def storage_enqueue_data( blockchain_id, fq_data_id, datum ):
     return storage_pusher.enqueue_data( blockchain_id, fq_data_id, datum )
 
 
+def storage_get_metrics():
+    """
+    Get storage replication statistics
+    Return None if the data-pusher thread is not running
+    """
+    global storage_pusher
+    if storage_pusher is None:
+        return None
+
+    return storage_pusher.get_metrics()
+
+
 def atlas_start( blockstack_opts, db, port ):
     """
     Start up atlas functionality
@@ -2502,10 +2740,15 @@ def index_blockchain( expected_snapshots=GENESIS_SNAPSHOT ):
         db.close()
         return False
 
+    blockstack_opts = get_blockstack_opts()
+    prefetch_depth = blockstack_opts.get('index_prefetch_depth', INDEX_PREFETCH_DEPTH)
+    prefetch_workers = blockstack_opts.get('index_prefetch_workers', INDEX_PREFETCH_WORKERS)
+
     # bring the db up to the chain tip.
     log.debug("Begin indexing (up to %s)" % current_block)
     set_indexing( True )
-    rc = virtualchain_hooks.sync_blockchain( bt_opts, current_block, expected_snapshots=expected_snapshots, tx_filter=blockstack_tx_filter )
+    rc = virtualchain_hooks.sync_blockchain( bt_opts, current_block, expected_snapshots=expected_snapshots,
+                                             prefetch_depth=prefetch_depth, prefetch_workers=prefetch_workers, tx_filter=blockstack_tx_filter )
     set_indexing( False )
 
     db.close()
@@ -2633,6 +2876,9 @@ def run_server( foreground=False, expected_snapshots=GENESIS_SNAPSHOT, port=None
 
     db.close()
 
+    # profile indexing
+    virtualchain_hooks.indexing_profiler.configure( blockstack_opts.get('index_profile_blocks', INDEX_PROFILE_BLOCKS) )
+
     # start storage
     storage_start( blockstack_opts )
 
@@ -2640,6 +2886,9 @@ def run_server( foreground=False, expected_snapshots=GENESIS_SNAPSHOT, port=None
     rpc_start(port)
     set_running( True )
 
+    # listen for new blocks
+    block_notify_start( blockstack_opts )
+
     # clear any stale indexing state
     set_indexing( False )
     log.debug("Begin Indexing")
@@ -2647,6 +2896,10 @@ def run_server( foreground=False, expected_snapshots=GENESIS_SNAPSHOT, port=None
     running = True
     while is_running():
 
+        notified_at = None
+        if block_notifier is not None:
+            notified_at = block_notifier.begin_indexing()
+
         try:
            running = index_blockchain(expected_snapshots=expected_snapshots)
         except Exception, e:
@@ -2657,11 +2910,19 @@ def run_server( foreground=False, expected_snapshots=GENESIS_SNAPSHOT, port=None
         if not running:
             break
 
-        # wait for the next block
+        if block_notifier is not None:
+            block_notifier.end_indexing(notified_at)
+
+        # wait for the next block, or until it's announced
         deadline = time.time() + REINDEX_FREQUENCY
         while time.time() < deadline and is_running():
             try:
-                time.sleep(1.0)
+                if block_notifier is not None:
+                    if block_notifier.wait_for_block(min(1.0, deadline - time.time())):
+                        break
+
+                else:
+                    time.sleep(1.0)
             except:
                 # interrupt
                 break
@@ -2669,6 +2930,9 @@ def run_server( foreground=False, expected_snapshots=GENESIS_SNAPSHOT, port=None
     log.debug("End Indexing")
     set_running( False )
 
+    # stop listening for blocks
+    block_notify_stop()
+
     # stop API server
     log.debug("Stopping API server")
     rpc_stop()
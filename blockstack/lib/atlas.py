@@ -33,6 +33,8 @@ import hashlib
 import errno
 import socket
 import gc
+import bisect
+import binascii
 
 import virtualchain
 from nameset.virtualchain_hooks import get_last_block, get_snapshots
@@ -44,6 +46,7 @@ from blockstack_client.proxy import \
         ping as blockstack_ping, \
         getinfo as blockstack_getinfo, \
         get_zonefile_inventory as blockstack_get_zonefile_inventory, \
+        get_zonefile_inventory_delta as blockstack_get_zonefile_inventory_delta, \
         get_atlas_peers as blockstack_get_atlas_peers, \
         get_zonefiles as blockstack_get_zonefiles, \
         put_zonefiles as blockstack_put_zonefiles
@@ -80,6 +83,15 @@ NUM_NEIGHBORS = 80     # number of neighbors a peer can report
 ZONEFILE_INV = None      # this atlas peer's current zonefile inventory
 NUM_ZONEFILES = 0      # cache-coherent count of the number of zonefiles present
 
+ZONEFILE_INV_ID = None          # identifies this run's inventory change history (a peer that sees a new one must resync)
+ZONEFILE_INV_VERSION = 0        # change counter; bumped each time bits in ZONEFILE_INV flip
+ZONEFILE_INV_CHANGES = []       # [(version, bit_index, present)] in version order, for answering delta requests
+ZONEFILE_INV_MIN_VERSION = 0    # deltas since versions older than this are no longer available
+ZONEFILE_INV_LOCK = threading.Lock()
+
+MAX_INV_CHANGES = 65536         # maximum number of inventory changes to remember
+MAX_INV_DELTA_RUNS = 32768      # maximum number of runs in a delta before we tell the peer to resync
+
 MAX_QUEUED_ZONEFILES = 1000     # maximum number of queued zonefiles
 
 if os.environ.get("BLOCKSTACK_ATLAS_PEER_LIFETIME") is not None:
@@ -523,6 +535,146 @@ def atlas_inventory_test_zonefile_bits( inv_vec, bit_indexes ):
     return ret
 
 
+def atlas_inventory_encode_runs( bit_indexes ):
+    """
+    Run-length encode a list of bit indexes.
+    Return a flat list [start, length, start, length, ...] of
+    the runs of consecutive bits, in increasing order.
+    """
+    runs = []
+    for bit_index in sorted(set(bit_indexes)):
+        if len(runs) > 0 and runs[-2] + runs[-1] == bit_index:
+            runs[-1] += 1
+        else:
+            runs += [bit_index, 1]
+
+    return runs
+
+
+def atlas_inventory_decode_runs( runs ):
+    """
+    Given the output of atlas_inventory_encode_runs(),
+    get back the list of bit indexes.
+    """
+    bit_indexes = []
+    for i in xrange(0, len(runs) - 1, 2):
+        bit_indexes += range(runs[i], runs[i] + runs[i+1])
+
+    return bit_indexes
+
+
+def atlas_inventory_clip_runs( runs, max_bits ):
+    """
+    Clip a peer's run-length encoded bits to the bits in [0, max_bits),
+    so a peer can't make us decode more bits than our inventory has.
+    Return the clipped runs on success
+    Return None if the runs are malformed
+    """
+    if len(runs) % 2 != 0:
+        return None
+
+    clipped = []
+    for i in xrange(0, len(runs), 2):
+        start = runs[i]
+        length = runs[i+1]
+        if type(start) not in [int, long] or type(length) not in [int, long] or start < 0 or length < 0:
+            return None
+
+        length = min(length, max_bits - start)
+        if length > 0:
+            clipped += [start, length]
+
+    return clipped
+
+
+def atlas_inventory_apply_delta( inv_vec, set_runs, clear_runs ):
+    """
+    Apply an inventory delta (run-length encoded bits that
+    were set and cleared) to a peer's inventory vector.
+    Return the new inventory vector
+    """
+    set_bits = atlas_inventory_decode_runs( set_runs )
+    if len(set_bits) > 0:
+        inv_vec = atlas_inventory_set_zonefile_bits( inv_vec, set_bits )
+
+    clear_bits = atlas_inventory_decode_runs( clear_runs )
+    if len(clear_bits) > 0:
+        inv_vec = atlas_inventory_clear_zonefile_bits( inv_vec, clear_bits )
+
+    return inv_vec
+
+
+def atlas_zonefile_inv_update( bit_indexes, present ):
+    """
+    Set or clear bits in our in-RAM zonefile inventory,
+    and log the ones that changed so peers can fetch
+    just the changes.
+    Return True if all the bits were set beforehand
+    """
+    global ZONEFILE_INV, ZONEFILE_INV_VERSION, ZONEFILE_INV_CHANGES, ZONEFILE_INV_MIN_VERSION
+
+    with ZONEFILE_INV_LOCK:
+        inv_vec = ZONEFILE_INV if ZONEFILE_INV is not None else ""
+        was_present = atlas_inventory_test_zonefile_bits( inv_vec, bit_indexes )
+
+        changed = []
+        for bit_index in bit_indexes:
+            byte_index = bit_index / 8
+            is_set = byte_index < len(inv_vec) and (ord(inv_vec[byte_index]) & (1 << (7 - (bit_index % 8)))) != 0
+            if is_set != bool(present):
+                changed.append(bit_index)
+
+        ZONEFILE_INV = atlas_inventory_flip_zonefile_bits( inv_vec, bit_indexes, present )
+
+        if len(changed) > 0:
+            ZONEFILE_INV_VERSION += 1
+            ZONEFILE_INV_CHANGES += [(ZONEFILE_INV_VERSION, b, bool(present)) for b in changed]
+
+            if len(ZONEFILE_INV_CHANGES) > MAX_INV_CHANGES:
+                # forget the oldest quarter
+                num_dropped = len(ZONEFILE_INV_CHANGES) - (MAX_INV_CHANGES * 3) / 4
+                ZONEFILE_INV_MIN_VERSION = ZONEFILE_INV_CHANGES[num_dropped - 1][0]
+                ZONEFILE_INV_CHANGES = ZONEFILE_INV_CHANGES[num_dropped:]
+
+    return was_present
+
+
+def atlas_get_zonefile_inventory_delta( inv_id, version ):
+    """
+    Get the bits in our zonefile inventory that changed since
+    the given version of our inventory, run-length encoded.
+
+    Return {'inv_id': ..., 'version': ..., 'set': [runs], 'clear': [runs]}
+    Return {'inv_id': ..., 'version': ..., 'resync': True} if the caller
+    needs to fetch our whole inventory instead (e.g. we restarted,
+    or too much changed), and then ask for deltas since 'version'.
+    """
+    with ZONEFILE_INV_LOCK:
+        ret = {
+            'inv_id': ZONEFILE_INV_ID,
+            'version': ZONEFILE_INV_VERSION
+        }
+
+        if inv_id != ZONEFILE_INV_ID or version is None or version > ZONEFILE_INV_VERSION or version < ZONEFILE_INV_MIN_VERSION:
+            ret['resync'] = True
+            return ret
+
+        # final state of each bit changed after this version
+        bits = {}
+        for (_, bit_index, present) in ZONEFILE_INV_CHANGES[bisect.bisect_left( ZONEFILE_INV_CHANGES, (version + 1,) ):]:
+            bits[bit_index] = present
+
+    ret['set'] = atlas_inventory_encode_runs( [b for (b, present) in bits.items() if present] )
+    ret['clear'] = atlas_inventory_encode_runs( [b for (b, present) in bits.items() if not present] )
+
+    if len(ret['set']) + len(ret['clear']) > 2 * MAX_INV_DELTA_RUNS:
+        del ret['set']
+        del ret['clear']
+        ret['resync'] = True
+
+    return ret
+
+
 def atlasdb_row_factory( cursor, row ):
     """
     row factory
@@ -640,13 +792,7 @@ def atlasdb_add_zonefile_info( name, zonefile_hash, txid, present, tried_storage
         # keep in-RAM zonefile inv coherent
         zfbits = atlasdb_get_zonefile_bits( zonefile_hash, con=dbcon, path=path )
 
-        inv_vec = None
-        if ZONEFILE_INV is None:
-            inv_vec = ""
-        else:
-            inv_vec = ZONEFILE_INV[:]
-
-        ZONEFILE_INV = atlas_inventory_flip_zonefile_bits( inv_vec, zfbits, present )
+        atlas_zonefile_inv_update( zfbits, present )
 
         # keep in-RAM zonefile count coherent
         NUM_ZONEFILES = atlasdb_zonefile_inv_length( con=dbcon, path=path )
@@ -806,17 +952,9 @@ def atlasdb_set_zonefile_present( zonefile_hash, present, con=None, path=None ):
 
         zfbits = atlasdb_get_zonefile_bits( zonefile_hash, con=dbcon, path=path )
         
-        inv_vec = None
-        if ZONEFILE_INV is None:
-            inv_vec = ""
-        else:
-            inv_vec = ZONEFILE_INV[:]
-
         # did we know about this?
-        was_present = atlas_inventory_test_zonefile_bits( inv_vec, zfbits )
-
         # keep our inventory vector coherent.
-        ZONEFILE_INV = atlas_inventory_flip_zonefile_bits( inv_vec, zfbits, present )
+        was_present = atlas_zonefile_inv_update( zfbits, present )
 
     return was_present
 
@@ -870,13 +1008,21 @@ def atlasdb_cache_zonefile_info( con=None, path=None ):
     """
     Load up and cache our zonefile inventory
     """
-    global ZONEFILE_INV, NUM_ZONEFILES
+    global ZONEFILE_INV, NUM_ZONEFILES, ZONEFILE_INV_ID, ZONEFILE_INV_VERSION, ZONEFILE_INV_CHANGES, ZONEFILE_INV_MIN_VERSION
 
     inv_len = atlasdb_zonefile_inv_length( con=con, path=path )
     inv = atlas_make_zonefile_inventory( 0, inv_len, con=con, path=path )
 
-    ZONEFILE_INV = inv
-    NUM_ZONEFILES = inv_len
+    with ZONEFILE_INV_LOCK:
+        ZONEFILE_INV = inv
+        NUM_ZONEFILES = inv_len
+
+        # peers will need to resync from scratch
+        ZONEFILE_INV_ID = binascii.hexlify( os.urandom(16) )
+        ZONEFILE_INV_VERSION = 0
+        ZONEFILE_INV_CHANGES = []
+        ZONEFILE_INV_MIN_VERSION = 0
+
     return inv
 
 
@@ -1524,6 +1670,8 @@ def atlas_init_peer_info( peer_table, peer_hostport, blacklisted=False, whitelis
     peer_table[peer_hostport] = {
         "time": [],
         "zonefile_inv": "",
+        "zonefile_inv_id": None,
+        "zonefile_inv_version": None,
         "blacklisted": blacklisted,
         "whitelisted": whitelisted
     }
@@ -1925,6 +2073,52 @@ def atlas_peer_get_zonefile_inventory_range( my_hostport, peer_hostport, bit_off
         return zf_inv['inv']
 
 
+def atlas_peer_get_zonefile_inventory_delta( my_hostport, peer_hostport, inv_id, version, timeout=None, peer_table=None ):
+    """
+    Get the changes to a peer's zonefile inventory since
+    the given version of it.
+
+    Update peer health information if we got a delta.
+
+    Return {'inv_id': ..., 'version': ..., 'set': ..., 'clear': ...} on success
+    Return {'inv_id': ..., 'version': ..., 'resync': True} if we need to fetch the whole inventory
+    Return None if we couldn't get a delta (e.g. the peer doesn't support them).
+    """
+
+    if timeout is None:
+        timeout = atlas_inv_timeout()
+
+    host, port = url_to_host_port( peer_hostport )
+    RPC = get_rpc_client_class()
+    rpc = RPC( host, port, timeout=timeout, src=my_hostport )
+
+    assert not atlas_peer_table_is_locked_by_me()
+
+    zf_delta = None
+
+    log.debug("Get zonefile inventory delta since %s:%s from %s" % (inv_id, version, peer_hostport))
+    try:
+        zf_delta = blockstack_get_zonefile_inventory_delta( peer_hostport, inv_id, version, timeout=timeout, my_hostport=my_hostport, proxy=rpc )
+
+    except (socket.timeout, socket.gaierror, socket.herror, socket.error), se:
+        atlas_log_socket_error( "get_zonefile_inventory_delta(%s, %s, %s)" % (peer_hostport, inv_id, version), peer_hostport, se )
+        log.error("Failed to ask %s for zonefile inventory delta (socket-related error)" % peer_hostport)
+
+    except Exception, e:
+        if os.environ.get("BLOCKSTACK_DEBUG") == "1":
+            log.exception(e)
+
+        log.error("Failed to ask %s for zonefile inventory delta" % peer_hostport)
+
+    if zf_delta is None or 'error' in zf_delta:
+        # peer may predate deltas; the caller will fall back to fetching the whole inventory
+        log.debug("No zonefile inventory delta from %s: %s" % (peer_hostport, zf_delta.get('error') if zf_delta is not None else None))
+        return None
+
+    atlas_peer_update_health( peer_hostport, True, peer_table=peer_table )
+    return zf_delta
+
+
 def atlas_peer_download_zonefile_inventory( my_hostport, peer_hostport, maxlen, bit_offset=0, timeout=None, peer_table={} ):
     """
     Get the zonefile inventory from the remote peer
@@ -2011,9 +2205,15 @@ def atlas_peer_sync_zonefile_inventory( my_hostport, peer_hostport, maxlen, time
 
 def atlas_peer_refresh_zonefile_inventory( my_hostport, peer_hostport, byte_offset, timeout=None, peer_table=None, con=None, path=None, local_inv=None ):
     """
-    Refresh a peer's zonefile recent inventory vector entries,
-    by removing every bit after byte_offset and re-synchronizing them.
+    Refresh a peer's zonefile recent inventory vector entries.
 
+    If we know which version of the peer's inventory we have, then
+    just fetch and apply the bits that changed since then (clipped to
+    our inventory), plus the peer's bits for any zonefiles we learned
+    about since we last synced it.  A bogus delta fails the refresh,
+    and the next one re-synchronizes everything.
+
+    Otherwise, remove every bit after byte_offset and re-synchronize them.
     The intuition here is that recent zonefiles are much rarer than older
     zonefiles (which will have been near-100% replicated), meaning the tail
     of the peer's zonefile inventory is a lot less stable than the head (since
@@ -2035,10 +2235,84 @@ def atlas_peer_refresh_zonefile_inventory( my_hostport, peer_hostport, byte_offs
 
     maxlen = len(local_inv)
 
+    inv_id = None
+    inv_version = None
+    use_delta = True
+
     with AtlasPeerTableLocked(peer_table) as ptbl:
         if peer_hostport not in ptbl.keys():
             return False
 
+        inv_id = ptbl[peer_hostport].get('zonefile_inv_id', None)
+        inv_version = ptbl[peer_hostport].get('zonefile_inv_version', None)
+        use_delta = ptbl[peer_hostport].get('zonefile_inv_delta', True)
+
+    delta = None
+    if use_delta:
+        delta = atlas_peer_get_zonefile_inventory_delta( my_hostport, peer_hostport, inv_id, inv_version, timeout=timeout, peer_table=peer_table )
+
+    if delta is not None and not delta.get('resync', False):
+        # just the changes.
+        # the peer can't tell us about more bits than we have (a set bit and a cleared bit are distinct)
+        set_runs = atlas_inventory_clip_runs( delta['set'], maxlen * 8 )
+        clear_runs = atlas_inventory_clip_runs( delta['clear'], maxlen * 8 )
+        if set_runs is None or clear_runs is None or sum(set_runs[1::2]) + sum(clear_runs[1::2]) > maxlen * 8:
+            log.warning("%s: invalid zonefile inventory delta from %s" % (my_hostport, peer_hostport))
+            with AtlasPeerTableLocked(peer_table) as ptbl:
+                if peer_hostport in ptbl.keys():
+                    # fetch the whole inventory next time
+                    ptbl[peer_hostport]['zonefile_inv_id'] = None
+                    ptbl[peer_hostport]['zonefile_inv_version'] = None
+                    ptbl[peer_hostport]['zonefile_inventory_last_refresh'] = time_now()
+
+            return False
+
+        synced_len = None
+        with AtlasPeerTableLocked(peer_table) as ptbl:
+            if peer_hostport not in ptbl.keys():
+                return False
+
+            cur_inv = atlas_peer_get_zonefile_inventory( peer_hostport, peer_table=ptbl )
+            inv = atlas_inventory_apply_delta( cur_inv, set_runs, clear_runs )
+            atlas_peer_set_zonefile_inventory( peer_hostport, inv, peer_table=ptbl )
+
+            ptbl[peer_hostport]['zonefile_inv_version'] = delta['version']
+            ptbl[peer_hostport]['zonefile_inventory_last_refresh'] = time_now()
+
+            synced_len = ptbl[peer_hostport].get('zonefile_inv_synced_len', 0)
+
+        log.debug("%s: applied %s set and %s cleared runs from %s (version %s)" % (my_hostport, len(set_runs) / 2, len(clear_runs) / 2, peer_hostport, delta['version']))
+
+        if synced_len < maxlen:
+            # our inventory grew since we last synced this peer.
+            # get the peer's bits for the new zonefiles.
+            tail_inv = atlas_peer_get_zonefile_inventory_range( my_hostport, peer_hostport, synced_len * 8, (maxlen - synced_len) * 8, timeout=timeout, peer_table=peer_table )
+            if tail_inv is None:
+                return False
+
+            with AtlasPeerTableLocked(peer_table) as ptbl:
+                if peer_hostport not in ptbl.keys():
+                    return False
+
+                # the range supersedes any bits the delta set past synced_len
+                cur_inv = atlas_peer_get_zonefile_inventory( peer_hostport, peer_table=ptbl )[:synced_len]
+                cur_inv += '\0' * (synced_len - len(cur_inv))
+                atlas_peer_set_zonefile_inventory( peer_hostport, cur_inv + tail_inv, peer_table=ptbl )
+
+                ptbl[peer_hostport]['zonefile_inv_synced_len'] = maxlen
+
+            log.debug("%s: synced inventory bits %s-%s from %s" % (my_hostport, synced_len * 8, maxlen * 8, peer_hostport))
+
+        return True
+
+    with AtlasPeerTableLocked(peer_table) as ptbl:
+        if peer_hostport not in ptbl.keys():
+            return False
+
+        if delta is not None:
+            # re-download everything; changes from here on come as deltas
+            byte_offset = 0
+
         # reset the peer's zonefile inventory, back to offset
         cur_inv = atlas_peer_get_zonefile_inventory( peer_hostport, peer_table=ptbl )
         atlas_peer_set_zonefile_inventory( peer_hostport, cur_inv[:byte_offset], peer_table=ptbl )
@@ -2052,6 +2326,18 @@ def atlas_peer_refresh_zonefile_inventory( my_hostport, peer_hostport, byte_offs
         # Update refresh time (even if we fail)
         ptbl[peer_hostport]['zonefile_inventory_last_refresh'] = time_now()
 
+        if inv is not None:
+            ptbl[peer_hostport]['zonefile_inv_synced_len'] = maxlen
+
+            if delta is not None:
+                # this inventory includes every change up to this version
+                ptbl[peer_hostport]['zonefile_inv_id'] = delta['inv_id']
+                ptbl[peer_hostport]['zonefile_inv_version'] = delta['version']
+
+            elif use_delta:
+                # reachable, but doesn't serve deltas
+                ptbl[peer_hostport]['zonefile_inv_delta'] = False
+
     if inv is not None:
         inv_str = atlas_inventory_to_string(inv)
         if len(inv_str) > 40:
@@ -0,0 +1,296 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import socket
+import select
+import threading
+import time
+
+import virtualchain
+log = virtualchain.get_logger("blockstack-server")
+
+BLOCK_NOTIFY_HOST = '127.0.0.1'
+BLOCK_NOTIFY_LATENCY_SAMPLES = 144      # about a day's worth of blocks
+BLOCK_NOTIFY_POLL_INTERVAL = 1.0        # seconds between checks for shutdown
+
+class BlockNotifier( threading.Thread ):
+    """
+    Listen for new-block announcements from bitcoind, and
+    wake up the indexer as soon as one arrives.
+
+    Announcements come from either or both of:
+    * bitcoind's ZMQ `hashblock` feed (-zmqpubhashblock; needs pyzmq)
+    * datagrams sent to a local UDP port by bitcoind's -blocknotify
+      command, e.g. `blocknotify=echo %s | nc -u -w1 127.0.0.1 PORT`
+
+    The indexer still polls on its usual schedule, so a missed
+    announcement only costs latency.
+    """
+    def __init__(self, zmq_url=None, notify_port=None, host=BLOCK_NOTIFY_HOST):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.zmq_url = zmq_url
+        self.notify_port = notify_port
+        self.host = host
+
+        self.zmq_context = None
+        self.zmq_socket = None
+        self.udp_socket = None
+
+        self.running = True
+        self.new_block = threading.Event()
+        self.lock = threading.Lock()
+
+        # when the earliest not-yet-indexed announcement arrived
+        self.notified_at = None
+
+        self.num_notifications = 0
+        self.latencies = []
+
+
+    def bind(self):
+        """
+        Open our announcement sources.
+        Return True if at least one of them is open.
+        Return False if not (i.e. the indexer should just poll).
+        """
+        if self.zmq_url is not None:
+            try:
+                import zmq
+                self.zmq_context = zmq.Context()
+                self.zmq_socket = self.zmq_context.socket(zmq.SUB)
+                self.zmq_socket.setsockopt(zmq.SUBSCRIBE, 'hashblock')
+                self.zmq_socket.connect(self.zmq_url)
+                log.debug("Listening for blocks from {}".format(self.zmq_url))
+
+            except ImportError:
+                log.error("pyzmq is not installed; cannot listen to {}".format(self.zmq_url))
+                self.zmq_socket = None
+
+            except Exception as e:
+                log.exception(e)
+                log.error("Failed to subscribe to {}".format(self.zmq_url))
+                self.zmq_socket = None
+
+        if self.notify_port is not None:
+            try:
+                self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.udp_socket.bind((self.host, self.notify_port))
+                self.notify_port = self.udp_socket.getsockname()[1]
+                log.debug("Listening for blocknotify on {}:{}".format(self.host, self.notify_port))
+
+            except socket.error as se:
+                log.error("Failed to bind blocknotify socket {}:{}: {}".format(self.host, self.notify_port, se))
+                self.udp_socket = None
+
+        return self.zmq_socket is not None or self.udp_socket is not None
+
+
+    def get_sources(self):
+        """
+        Get the names of the announcement sources we're listening to
+        """
+        sources = []
+        if self.zmq_socket is not None:
+            sources.append('zmq')
+
+        if self.udp_socket is not None:
+            sources.append('blocknotify')
+
+        return sources
+
+
+    def recv_zmq(self):
+        """
+        Receive one hashblock message.
+        Return the block hash
+        """
+        msg = self.zmq_socket.recv_multipart()
+        if len(msg) < 2:
+            return None
+
+        return msg[1].encode('hex')
+
+
+    def recv_udp(self):
+        """
+        Receive one blocknotify datagram.
+        Return the block hash
+        """
+        data, _ = self.udp_socket.recvfrom(1024)
+        return data.strip()
+
+
+    def poll(self, timeout):
+        """
+        Wait up to @timeout seconds for announcements.
+        Return the list of block hashes received.
+        """
+        block_hashes = []
+        if self.zmq_socket is not None:
+            import zmq
+            poller = zmq.Poller()
+            poller.register(self.zmq_socket, zmq.POLLIN)
+            if self.udp_socket is not None:
+                poller.register(self.udp_socket, zmq.POLLIN)
+
+            for (sock, _) in poller.poll(timeout * 1000):
+                if sock is self.zmq_socket:
+                    block_hashes.append(self.recv_zmq())
+                else:
+                    block_hashes.append(self.recv_udp())
+
+        else:
+            readable, _, _ = select.select([self.udp_socket], [], [], timeout)
+            if len(readable) > 0:
+                block_hashes.append(self.recv_udp())
+
+        return block_hashes
+
+
+    def run(self):
+        while self.running:
+            try:
+                block_hashes = self.poll(BLOCK_NOTIFY_POLL_INTERVAL)
+            except Exception as e:
+                if not self.running:
+                    break
+
+                log.exception(e)
+                time.sleep(BLOCK_NOTIFY_POLL_INTERVAL)
+                continue
+
+            for block_hash in block_hashes:
+                self.notify(block_hash)
+
+        self.close()
+
+
+    def notify(self, block_hash):
+        """
+        A new block was announced.  Wake up the indexer.
+        """
+        log.debug("New block {}".format(block_hash))
+        with self.lock:
+            if self.notified_at is None:
+                self.notified_at = time.time()
+
+            self.num_notifications += 1
+            self.new_block.set()
+
+
+    def wait_for_block(self, timeout):
+        """
+        Wait up to @timeout seconds for a new block to be announced.
+        Return True if one was (including before we were called)
+        Return False on timeout
+        """
+        self.new_block.wait(timeout)
+        return self.new_block.is_set()
+
+
+    def begin_indexing(self):
+        """
+        The indexer is about to look for new blocks.
+        Return when the earliest block it will pick up was announced (or None).
+        """
+        with self.lock:
+            self.new_block.clear()
+            notified_at = self.notified_at
+            self.notified_at = None
+
+        return notified_at
+
+
+    def end_indexing(self, notified_at):
+        """
+        The indexer has made the blocks it picked up visible.
+        Record the latency from the announcement (given by begin_indexing()).
+        """
+        if notified_at is None:
+            return
+
+        latency = time.time() - notified_at
+        with self.lock:
+            self.latencies.append(latency)
+            if len(self.latencies) > BLOCK_NOTIFY_LATENCY_SAMPLES:
+                self.latencies.pop(0)
+
+        log.debug("Block visible {:.3f}s after it was announced".format(latency))
+
+
+    def get_stats(self):
+        """
+        Get the notification count and the block-to-visible
+        latencies (in seconds) over the last few blocks.
+        """
+        with self.lock:
+            latencies = self.latencies[:]
+            stats = {
+                'sources': self.get_sources(),
+                'notifications': self.num_notifications,
+                'latency_samples': len(latencies),
+            }
+
+        if len(latencies) > 0:
+            stats['latency_last'] = latencies[-1]
+            stats['latency_mean'] = sum(latencies) / len(latencies)
+            stats['latency_max'] = max(latencies)
+
+        return stats
+
+
+    def signal_stop(self):
+        self.running = False
+        self.new_block.set()
+
+
+    def close(self):
+        if self.zmq_socket is not None:
+            self.zmq_socket.close()
+            self.zmq_socket = None
+
+        if self.zmq_context is not None:
+            self.zmq_context.term()
+            self.zmq_context = None
+
+        if self.udp_socket is not None:
+            self.udp_socket.close()
+            self.udp_socket = None
+
+
+class FakeBlockPublisher( object ):
+    """
+    Stand-in for bitcoind's block announcements, for tests:
+    sends blocknotify datagrams to a BlockNotifier.
+    """
+    def __init__(self, notify_port, host=BLOCK_NOTIFY_HOST):
+        self.addr = (host, notify_port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+
+    def publish(self, block_hash):
+        self.sock.sendto(block_hash + '\n', self.addr)
+
+
+    def close(self):
+        self.sock.close()
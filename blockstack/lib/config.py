@@ -126,6 +126,7 @@ else:
 RPC_MAX_ZONEFILE_LEN = 4096     # 4KB
 RPC_MAX_PROFILE_LEN = 1024000   # 1MB
 RPC_MAX_DATA_LEN = 10240000     # 10MB
+ZONEFILE_CACHE_SIZE = 16 * 1024 * 1024    # 16MB of zonefiles served from RAM
 
 """ block indexing configs
 """
@@ -133,6 +134,10 @@ REINDEX_FREQUENCY = 300 # seconds
 if os.environ.get("BLOCKSTACK_TEST") == "1":
     REINDEX_FREQUENCY = 1
 
+INDEX_PROFILE_BLOCKS = 256      # number of recent blocks' indexing profiles to keep in RAM (0 disables profiling)
+INDEX_PREFETCH_DEPTH = 16       # number of blocks to fetch from bitcoind ahead of the one being indexed (0 disables prefetching)
+INDEX_PREFETCH_WORKERS = 4      # number of threads fetching blocks ahead
+
 FIRST_BLOCK_MAINNET = 373601
 
 if os.environ.get("BLOCKSTACK_TEST", None) == "1" and os.environ.get("BLOCKSTACK_TEST_FIRST_BLOCK", None) is not None:
@@ -1058,6 +1063,18 @@ def default_blockstack_opts( config_file=None, virtualchain_impl=None ):
    atlasdb_path = os.path.join( os.path.dirname(config_file), "atlas.db" )
    atlas_blacklist = ""
    atlas_hostname = socket.gethostname()
+   storage_push_workers = 8
+   storage_push_driver_concurrency = 2
+   storage_push_batch_size = 32
+   storage_push_max_inflight = 256
+   storage_push_max_retries = 5
+   block_atomic_writes = True
+   block_notify_zmq = None
+   block_notify_port = None
+   zonefile_cache_size = ZONEFILE_CACHE_SIZE
+   index_profile_blocks = INDEX_PROFILE_BLOCKS
+   index_prefetch_depth = INDEX_PREFETCH_DEPTH
+   index_prefetch_workers = INDEX_PREFETCH_WORKERS
 
    if parser.has_section('blockstack'):
 
@@ -1185,6 +1202,46 @@ def default_blockstack_opts( config_file=None, virtualchain_impl=None ):
 
       if parser.has_option('blockstack', 'atlas_hostname'):
          atlas_hostname = parser.get('blockstack', 'atlas_hostname')
+
+      if parser.has_option('blockstack', 'storage_push_workers'):
+         storage_push_workers = int(parser.get('blockstack', 'storage_push_workers'))
+
+      if parser.has_option('blockstack', 'storage_push_driver_concurrency'):
+         storage_push_driver_concurrency = int(parser.get('blockstack', 'storage_push_driver_concurrency'))
+
+      if parser.has_option('blockstack', 'storage_push_batch_size'):
+         storage_push_batch_size = int(parser.get('blockstack', 'storage_push_batch_size'))
+
+      if parser.has_option('blockstack', 'storage_push_max_inflight'):
+         storage_push_max_inflight = int(parser.get('blockstack', 'storage_push_max_inflight'))
+
+      if parser.has_option('blockstack', 'storage_push_max_retries'):
+         storage_push_max_retries = int(parser.get('blockstack', 'storage_push_max_retries'))
+
+      if parser.has_option('blockstack', 'block_atomic_writes'):
+         block_atomic_writes = parser.get('blockstack', 'block_atomic_writes')
+         if block_atomic_writes.lower() in ['1', 'yes', 'true', 'on']:
+            block_atomic_writes = True
+         else:
+            block_atomic_writes = False
+
+      if parser.has_option('blockstack', 'block_notify_zmq'):
+         block_notify_zmq = parser.get('blockstack', 'block_notify_zmq')
+
+      if parser.has_option('blockstack', 'block_notify_port'):
+         block_notify_port = int(parser.get('blockstack', 'block_notify_port'))
+
+      if parser.has_option('blockstack', 'zonefile_cache_size'):
+         zonefile_cache_size = int(parser.get('blockstack', 'zonefile_cache_size'))
+
+      if parser.has_option('blockstack', 'index_profile_blocks'):
+         index_profile_blocks = int(parser.get('blockstack', 'index_profile_blocks'))
+
+      if parser.has_option('blockstack', 'index_prefetch_depth'):
+         index_prefetch_depth = int(parser.get('blockstack', 'index_prefetch_depth'))
+
+      if parser.has_option('blockstack', 'index_prefetch_workers'):
+         index_prefetch_workers = int(parser.get('blockstack', 'index_prefetch_workers'))
         
 
    if os.path.exists( announce_path ):
@@ -1234,6 +1291,18 @@ def default_blockstack_opts( config_file=None, virtualchain_impl=None ):
        'atlas_blacklist': atlas_blacklist,
        'atlas_hostname': atlas_hostname,
        'zonefiles': zonefile_dir,
+       'storage_push_workers': storage_push_workers,
+       'storage_push_driver_concurrency': storage_push_driver_concurrency,
+       'storage_push_batch_size': storage_push_batch_size,
+       'storage_push_max_inflight': storage_push_max_inflight,
+       'storage_push_max_retries': storage_push_max_retries,
+       'block_atomic_writes': block_atomic_writes,
+       'block_notify_zmq': block_notify_zmq,
+       'block_notify_port': block_notify_port,
+       'zonefile_cache_size': zonefile_cache_size,
+       'index_profile_blocks': index_profile_blocks,
+       'index_prefetch_depth': index_prefetch_depth,
+       'index_prefetch_workers': index_prefetch_workers,
    }
 
    # strip Nones
@@ -115,6 +115,65 @@ def rec_restore_snv_consensus_fields( name_rec, block_id ):
     return merged_op
 
 
+class UntrustedBlockView( object ):
+    """
+    Read-only view of the untrusted db, used while
+    restoring the operations of a single block.
+
+    Names and namespaces that several of the block's
+    operations refer to are only loaded (and their
+    histories decoded) once.  Everything else is
+    passed through to the untrusted db.
+    """
+
+    def __init__( self, untrusted_db ):
+        self.untrusted_db = untrusted_db
+        self.names = {}
+        self.namespaces = {}
+
+
+    def get_name( self, name, include_expired=False ):
+        key = (name, include_expired)
+        if key not in self.names:
+            self.names[key] = self.untrusted_db.get_name( name, include_expired=include_expired )
+
+        return self.names[key]
+
+
+    def get_namespace( self, namespace_id ):
+        if namespace_id not in self.namespaces:
+            self.namespaces[namespace_id] = self.untrusted_db.get_namespace( namespace_id )
+
+        return self.namespaces[namespace_id]
+
+
+    def __getattr__( self, attr ):
+        return getattr( self.untrusted_db, attr )
+
+
+def block_history_indexes( prior_recs ):
+    """
+    Given a block's records in tx order, find each record's
+    history index: h such that the record is the hth change
+    to its name in this block (0 for records without a name).
+
+    Returns a list of history indexes, parallel to prior_recs.
+    """
+    counts = {}
+    history_indexes = []
+    for rec in prior_recs:
+        if 'name' not in rec:
+            history_indexes.append(0)
+            continue
+
+        name = str(rec['name'])
+        h = counts.get(name, 0)
+        counts[name] = h + 1
+        history_indexes.append(h)
+
+    return history_indexes
+
+
 def block_to_virtualchain_ops( block_id, working_db, untrusted_db ):
     """
     convert a block's name ops to virtualchain ops.
@@ -136,25 +195,12 @@ def block_to_virtualchain_ops( block_id, working_db, untrusted_db ):
     # each name record has its own history, and their interleaving in tx order
     # is what makes up prior_recs.  However, when restoring a name record to
     # a previous state, we need to know the *relative* order of operations
-    # that changed it during this block.  This is called the history index,
-    # and it maps names to a dict, which maps the the virtual tx index (vtxindex)
-    # to integer h such that prior_recs[name][vtxindex] is the hth update to the name
-    # record.
-
-    history_index = {}
-    for i in xrange(0, len(prior_recs)):
-        rec = prior_recs[i]
-
-        if 'name' not in rec.keys():
-            continue
-
-        name = str(rec['name'])
-        if name not in history_index.keys():
-            history_index[name] = { i: 0 }
-
-        else:
-            history_index[name][i] = max( history_index[name].values() ) + 1
+    # that changed it during this block.  This is called the history index:
+    # prior_recs[i] is the history_indexes[i]th update to its name record.
+    history_indexes = block_history_indexes( prior_recs )
 
+    # names updated several times in this block share one copy of their history
+    block_db = UntrustedBlockView( untrusted_db )
 
     for i in xrange(0, len(prior_recs)):
 
@@ -166,6 +212,8 @@ def block_to_virtualchain_ops( block_id, working_db, untrusted_db ):
         if consensus_fields is None:
             raise Exception("BUG: no consensus fields defined for '%s'" % opcode_name )
 
+        trusted_fields = set(consensus_fields + NAMEREC_INDIRECT_CONSENSUS_FIELDS)
+
         # coerce string, not unicode
         for k in prior_recs[i].keys():
             if type(prior_recs[i][k]) == unicode:
@@ -177,19 +225,14 @@ def block_to_virtualchain_ops( block_id, working_db, untrusted_db ):
         for field in prior_recs[i].keys():
 
             # remove untrusted fields, except for indirect consensus fields
-            if field not in consensus_fields and field not in NAMEREC_INDIRECT_CONSENSUS_FIELDS:
+            if field not in trusted_fields:
                 log.debug("OP '%s': Removing untrusted field '%s'" % (opcode_name, field))
                 del prior_recs[i][field]
 
         try:
             # recover virtualchain op from name record
-            h = 0
-            if 'name' in prior_recs[i]:
-                if prior_recs[i]['name'] in history_index:
-                    h = history_index[ prior_recs[i]['name'] ][i]
-
-            log.debug("Recover %s" % op_get_opcode_name( prior_recs[i]['op'] ))
-            virtualchain_op = rec_to_virtualchain_op( prior_recs[i], block_id, h, working_db, untrusted_db )
+            log.debug("Recover %s" % opcode_name)
+            virtualchain_op = rec_to_virtualchain_op( prior_recs[i], block_id, history_indexes[i], working_db, block_db )
         except:
             print json.dumps( prior_recs[i], indent=4, sort_keys=True )
             raise
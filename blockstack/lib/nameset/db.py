@@ -30,6 +30,7 @@ import sys
 import copy
 import time
 import random
+import threading
 
 # hack around absolute paths
 curr_dir = os.path.abspath( os.path.join( os.path.dirname(__file__), ".." ) )
@@ -45,6 +46,9 @@ import virtualchain
 
 log = virtualchain.get_logger("blockstack-server")
 
+# per-thread count of statements executed, for profiling the indexer
+NAMEDB_STATEMENTS = threading.local()
+
 BLOCKSTACK_DB_SCRIPT = ""
 
 BLOCKSTACK_DB_SCRIPT += """
@@ -162,6 +166,35 @@ BLOCKSTACK_DB_SCRIPT += """
 CREATE INDEX value_hash_names_index on name_records( value_hash, name );
 """
 
+# When each name stops being counted as unexpired, under one epoch's rules.
+# Derived from name_records and namespaces (see namedb_expiry_refresh()),
+# so it can be rebuilt at any time.  It is kept out of name_records itself
+# so it never shows up in name records or their history.
+BLOCKSTACK_DB_EXPIRY_SCRIPT = """
+-- a name is unexpired at block b if start_block <= b < grace_end_block
+CREATE TABLE IF NOT EXISTS name_expiry( name STRING NOT NULL PRIMARY KEY,
+                                        namespace_id STRING NOT NULL,
+                                        start_block INT NOT NULL,
+                                        expire_block INT NOT NULL,
+                                        grace_end_block INT NOT NULL );
+"""
+
+BLOCKSTACK_DB_EXPIRY_SCRIPT += """
+CREATE INDEX IF NOT EXISTS name_expiry_index ON name_expiry( grace_end_block, start_block );
+"""
+
+BLOCKSTACK_DB_EXPIRY_SCRIPT += """
+CREATE INDEX IF NOT EXISTS name_expiry_namespace_index ON name_expiry( namespace_id, grace_end_block, start_block );
+"""
+
+BLOCKSTACK_DB_EXPIRY_SCRIPT += """
+-- the epoch whose rules name_expiry follows, and a block height in it
+CREATE TABLE IF NOT EXISTS name_expiry_epoch( epoch INT NOT NULL,
+                                              block_height INT NOT NULL );
+"""
+
+BLOCKSTACK_DB_SCRIPT += BLOCKSTACK_DB_EXPIRY_SCRIPT
+
 BLOCKSTACK_DB_SCRIPT += """
 -- turn on foreign key constraints 
 PRAGMA foreign_keys = ON;
@@ -300,6 +333,34 @@ def namedb_open( path ):
     return con
 
 
+def namedb_begin_block( con ):
+    """
+    Start a transaction that stages all of a block's writes.
+    Takes the write lock up front, so readers on other
+    connections keep seeing the last committed block.
+    If we crash before namedb_commit_block(), sqlite
+    rolls the block back the next time the db is opened.
+    """
+    con.execute("BEGIN IMMEDIATE;")
+    return True
+
+
+def namedb_commit_block( con ):
+    """
+    Atomically commit a block started with namedb_begin_block()
+    """
+    con.execute("COMMIT;")
+    return True
+
+
+def namedb_rollback_block( con ):
+    """
+    Discard a partially-applied block started with namedb_begin_block()
+    """
+    con.execute("ROLLBACK;")
+    return True
+
+
 def namedb_row_factory( cursor, row ):
     """
     Row factor to enforce some additional types:
@@ -562,6 +623,14 @@ def namedb_format_query( query, values ):
     return "".join( ["%s %s" % (frag, "'%s'" % val if type(val) in [str, unicode] else val) for (frag, val) in zip(query.split("?"), values + ("",))] )
 
 
+def namedb_get_statement_count():
+    """
+    Get the number of statements this thread has
+    run through namedb_query_execute() (for profiling).
+    """
+    return getattr( NAMEDB_STATEMENTS, 'count', 0 )
+
+
 def namedb_query_execute( cur, query, values ):
     """
     Execute a query.  If it fails, exit.
@@ -569,6 +638,8 @@ def namedb_query_execute( cur, query, values ):
     DO NOT CALL THIS DIRECTLY.
     """
 
+    NAMEDB_STATEMENTS.count = getattr( NAMEDB_STATEMENTS, 'count', 0 ) + 1
+
     timeout = 1.0
     while True:
         try:
@@ -676,6 +747,7 @@ def namedb_name_insert( cur, input_name_rec ):
         os.abort()
 
     namedb_query_execute( cur, query, values )
+    namedb_expiry_refresh( cur, name=name_rec['name'] )
 
     return True
 
@@ -721,6 +793,7 @@ def namedb_name_update( cur, opcode, input_opdata, only_if={}, constraints_ignor
         log.error("Query: %s", "".join( ["%s %s" % (frag, "'%s'" % val if type(val) in [str, unicode] else val) for (frag, val) in zip(query.split("?"), values + ("",))] ))
         os.abort()
 
+    namedb_expiry_refresh( cur, name=opdata['name'] )
     return True
 
 
@@ -765,6 +838,7 @@ def namedb_namespace_insert( cur, input_namespace_rec ):
         os.abort()
 
     namedb_query_execute( cur, query, values )
+    namedb_expiry_refresh( cur, namespace_id=namespace_rec['namespace_id'] )
     return True
 
 
@@ -813,6 +887,7 @@ def namedb_namespace_update( cur, opcode, input_opdata, only_if={}, constraints_
         log.error("Query: %s", "".join( ["%s %s" % (frag, "'%s'" % val if type(val) in [str, unicode] else val) for (frag, val) in zip(query.split("?"), values + ("",))] ))
         os.abort()
 
+    namedb_expiry_refresh( cur, namespace_id=opdata['namespace_id'] )
     return True
     
 
@@ -1643,6 +1718,150 @@ def namedb_select_where_unexpired_names( current_block ):
     return (query_fragment, query_args)
 
 
+def namedb_expiry_columns( namespace_row, block_height ):
+    """
+    Get the SELECT expressions over name_records that compute a name's
+    (start_block, expire_block, grace_end_block) in the given namespace,
+    under the epoch rules at block_height.
+    Mirrors namedb_select_where_unexpired_names().
+    Returns (columns, args)
+    """
+    namespace_id = namespace_row['namespace_id']
+
+    if namespace_row['op'] == NAMESPACE_READY:
+        # unexpired while ready_block + lifetime > b or last_renewed + lifetime >= b
+        lifetime = namespace_row['lifetime'] * get_epoch_namespace_lifetime_multiplier( block_height, namespace_id )
+        grace_period = get_epoch_namespace_lifetime_grace_period( block_height, namespace_id )
+
+        columns = "first_registered, MAX(?, last_renewed + 1) + ?, MAX(?, last_renewed + 1) + ?"
+        args = (namespace_row['ready_block'], lifetime, namespace_row['ready_block'], lifetime + grace_period)
+
+    elif namespace_row['op'] == NAMESPACE_REVEAL:
+        # imported names live as long as the reveal does
+        reveal_end = namespace_row['reveal_block'] + NAMESPACE_REVEAL_EXPIRE
+
+        columns = "MAX(first_registered, ?), ?, ?"
+        args = (namespace_row['reveal_block'], reveal_end, reveal_end)
+
+    else:
+        # never unexpired
+        columns = "0, 0, 0"
+        args = ()
+
+    return (columns, args)
+
+
+def namedb_get_expiry_epoch( cur ):
+    """
+    Get the (epoch, block height) whose rules name_expiry follows.
+    Return (None, None) if name_expiry hasn't been built.
+    """
+    try:
+        rows = cur.execute( "SELECT epoch, block_height FROM name_expiry_epoch;" ).fetchall()
+    except sqlite3.OperationalError, oe:
+        if 'no such table' in str(oe):
+            # not upgraded yet
+            return (None, None)
+
+        raise
+
+    if len(rows) == 0:
+        return (None, None)
+
+    return (rows[0]['epoch'], rows[0]['block_height'])
+
+
+def namedb_expiry_refresh( cur, namespace_id=None, name=None ):
+    """
+    Recalculate the materialized expiry of a name, of all names
+    in a namespace, or (by default) of all names, under the
+    epoch rules name_expiry already follows.
+    Call after changing name_records or namespaces.
+    Does nothing if name_expiry hasn't been built.
+    """
+    cur = cur.connection.cursor()
+    epoch, block_height = namedb_get_expiry_epoch( cur )
+    if epoch is None:
+        return False
+
+    name_filter = ""
+    name_args = ()
+
+    if name is not None:
+        namespace_rows = namedb_query_execute( cur, "SELECT namespace_id FROM name_records WHERE name = ?;", (name,) ).fetchall()
+        if len(namespace_rows) == 0:
+            return False
+
+        namespace_id = namespace_rows[0]['namespace_id']
+        name_filter = " AND name = ?"
+        name_args = (name,)
+
+    if namespace_id is not None:
+        namespace_rows = namedb_query_execute( cur, "SELECT * FROM namespaces WHERE namespace_id = ?;", (namespace_id,) ).fetchall()
+    else:
+        namespace_rows = namedb_query_execute( cur, "SELECT * FROM namespaces;", () ).fetchall()
+
+    for namespace_row in namespace_rows:
+        columns, args = namedb_expiry_columns( namespace_row, block_height )
+        query = "INSERT OR REPLACE INTO name_expiry (name, namespace_id, start_block, expire_block, grace_end_block) " + \
+                "SELECT name, namespace_id, " + columns + " FROM name_records WHERE namespace_id = ?" + name_filter + ";"
+
+        namedb_query_execute( cur, query, args + (namespace_row['namespace_id'],) + name_args )
+
+    return True
+
+
+def namedb_expiry_refresh_epoch( con, block_height ):
+    """
+    Make sure name_expiry follows the epoch rules at block_height,
+    creating or rebuilding it if need be.
+    Return True if it was rebuilt
+    """
+    epoch = get_epoch_number( block_height )
+    cur = con.cursor()
+
+    prior_epoch, _ = namedb_get_expiry_epoch( cur )
+    if prior_epoch == epoch:
+        return False
+
+    log.debug("Materialize name expiry for epoch %s (block %s)" % (epoch, block_height))
+
+    # readers see the old rules or the new ones, never a mix
+    cur.execute( "SAVEPOINT name_expiry;" )
+    for line in BLOCKSTACK_DB_EXPIRY_SCRIPT.split(";"):
+        if len(line.strip()) > 0:
+            cur.execute( line + ";" )
+
+    cur.execute( "DELETE FROM name_expiry;" )
+    cur.execute( "DELETE FROM name_expiry_epoch;" )
+    cur.execute( "INSERT INTO name_expiry_epoch (epoch, block_height) VALUES (?,?);", (epoch, block_height) )
+
+    namedb_expiry_refresh( cur )
+    cur.execute( "RELEASE name_expiry;" )
+    return True
+
+
+def namedb_select_unexpired_names( cur, current_block ):
+    """
+    Generate the FROM clause and part of a WHERE clause that select
+    unexpired name records (see namedb_select_where_unexpired_names()).
+    Uses the materialized name_expiry table as an index when it follows
+    the epoch rules at current_block.
+    Returns (from_clause, where_fragment, args)
+    """
+    epoch, _ = namedb_get_expiry_epoch( cur )
+    if epoch is not None and epoch == get_epoch_number( current_block ):
+        # CROSS JOIN keeps name_records as the outer table, so its indexes
+        # are still used and unordered listings come back in the same order
+        from_clause = "name_records CROSS JOIN name_expiry ON name_records.name = name_expiry.name"
+        query_fragment = "(name_expiry.start_block <= ? AND name_expiry.grace_end_block > ?)"
+        return (from_clause, query_fragment, (current_block, current_block))
+
+    from_clause = "name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id"
+    query_fragment, query_args = namedb_select_where_unexpired_names( current_block )
+    return (from_clause, query_fragment, query_args)
+
+
 def namedb_get_name( cur, name, current_block, include_expired=False, include_history=True ):
     """
     Get a name and all of its history.
@@ -1652,9 +1871,9 @@ def namedb_get_name( cur, name, current_block, include_expired=False, include_hi
 
     if not include_expired:
 
-        unexpired_fragment, unexpired_args = namedb_select_where_unexpired_names( current_block )
-        select_query = "SELECT name_records.* FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id " + \
-                       "WHERE name = ? AND " + unexpired_fragment + ";"
+        unexpired_from, unexpired_fragment, unexpired_args = namedb_select_unexpired_names( cur, current_block )
+        select_query = "SELECT name_records.* FROM " + unexpired_from + " " + \
+                       "WHERE name_records.name = ? AND " + unexpired_fragment + ";"
         args = (name, ) + unexpired_args
 
     else:
@@ -1716,9 +1935,9 @@ def namedb_get_names_owned_by_address( cur, address, current_block ):
     Only works if there is a *singular* address for the name.
     """
 
-    unexpired_fragment, unexpired_args = namedb_select_where_unexpired_names( current_block )
+    unexpired_from, unexpired_fragment, unexpired_args = namedb_select_unexpired_names( cur, current_block )
 
-    select_query = "SELECT * FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id " + \
+    select_query = "SELECT name_records.name FROM " + unexpired_from + " " + \
                    "WHERE name_records.address = ? AND name_records.revoked = 0 AND " + unexpired_fragment + ";"
     args = (address,) + unexpired_args
 
@@ -2328,18 +2547,23 @@ def namedb_get_num_names( cur, current_block, include_expired=False ):
     """
     Get the number of names that exist at the current block
     """
+    unexpired_from = "name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id"
     unexpired_query = ""
     unexpired_args = ()
 
     if not include_expired:
         # count all names, including expired ones
-        unexpired_query, unexpired_args = namedb_select_where_unexpired_names( current_block )
+        unexpired_from, unexpired_query, unexpired_args = namedb_select_unexpired_names( cur, current_block )
         unexpired_query = 'WHERE {}'.format(unexpired_query)
 
-    query = "SELECT COUNT(name_records.name) FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id " + unexpired_query + ";"
+    if 'name_expiry' in unexpired_from:
+        # answer from the index alone
+        unexpired_from = 'name_expiry'
+
+    query = "SELECT COUNT(*) FROM " + unexpired_from + " " + unexpired_query + ";"
     args = unexpired_args
 
-    num_rows = namedb_select_count_rows( cur, query, args, count_column='COUNT(name_records.name)' )
+    num_rows = namedb_select_count_rows( cur, query, args )
     return num_rows
 
 
@@ -2349,15 +2573,16 @@ def namedb_get_all_names( cur, current_block, offset=None, count=None, include_e
     paginated with offset and count.  Exclude expired names.  Include revoked names.
     """
 
+    unexpired_from = "name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id"
     unexpired_query = ""
     unexpired_args = ()
 
     if not include_expired:
         # all names, including expired ones
-        unexpired_query, unexpired_args = namedb_select_where_unexpired_names( current_block )
+        unexpired_from, unexpired_query, unexpired_args = namedb_select_unexpired_names( cur, current_block )
         unexpired_query = 'WHERE {}'.format(unexpired_query)
 
-    query = "SELECT name FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id " + unexpired_query
+    query = "SELECT name_records.name FROM " + unexpired_from + " " + unexpired_query
     args = unexpired_args
 
     offset_count_query, offset_count_args = namedb_offset_count_predicate( offset=offset, count=count )
@@ -2378,12 +2603,17 @@ def namedb_get_num_names_in_namespace( cur, namespace_id, current_block ):
     """
     Get the number of names in a given namespace
     """
-    unexpired_query, unexpired_args = namedb_select_where_unexpired_names( current_block )
+    unexpired_from, unexpired_query, unexpired_args = namedb_select_unexpired_names( cur, current_block )
+
+    if 'name_expiry' in unexpired_from:
+        # answer from the index alone
+        query = "SELECT COUNT(*) FROM name_expiry WHERE name_expiry.namespace_id = ? AND " + unexpired_query + ";"
+    else:
+        query = "SELECT COUNT(*) FROM " + unexpired_from + " WHERE name_records.namespace_id = ? AND " + unexpired_query + ";"
 
-    query = "SELECT COUNT(name_records.name) FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id WHERE name_records.namespace_id = ? AND " + unexpired_query + " ORDER BY name;"
     args = (namespace_id,) + unexpired_args
 
-    num_rows = namedb_select_count_rows( cur, query, args, count_column='COUNT(name_records.name)' )
+    num_rows = namedb_select_count_rows( cur, query, args )
     return num_rows
 
 
@@ -2393,9 +2623,9 @@ def namedb_get_names_in_namespace( cur, namespace_id, current_block, offset=None
     paginated with offset and count.  Exclude expired names
     """
 
-    unexpired_query, unexpired_args = namedb_select_where_unexpired_names( current_block )
+    unexpired_from, unexpired_query, unexpired_args = namedb_select_unexpired_names( cur, current_block )
 
-    query = "SELECT name FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id WHERE name_records.namespace_id = ? AND " + unexpired_query + " ORDER BY name "
+    query = "SELECT name_records.name FROM " + unexpired_from + " WHERE name_records.namespace_id = ? AND " + unexpired_query + " ORDER BY name_records.name "
     args = (namespace_id,) + unexpired_args
 
     offset_count_query, offset_count_args = namedb_offset_count_predicate( offset=offset, count=count )
@@ -2482,9 +2712,9 @@ def namedb_get_names_by_sender( cur, sender, current_block ):
     Return None if the sender owns no names.
     """
 
-    unexpired_query, unexpired_args = namedb_select_where_unexpired_names( current_block )
+    unexpired_from, unexpired_query, unexpired_args = namedb_select_unexpired_names( cur, current_block )
 
-    query = "SELECT name_records.name FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id " + \
+    query = "SELECT name_records.name FROM " + unexpired_from + " " + \
             "WHERE name_records.sender = ? AND name_records.revoked = 0 AND " + unexpired_query + ";"
 
     args = (sender,) + unexpired_args
@@ -2520,11 +2750,11 @@ def namedb_get_name_preorder( db, preorder_hash, current_block ):
     preorder_rec = {}
     preorder_rec.update( preorder_row )
 
-    unexpired_query, unexpired_args = namedb_select_where_unexpired_names( current_block )
+    unexpired_from, unexpired_query, unexpired_args = namedb_select_unexpired_names( cur, current_block )
 
     # make sure that the name doesn't already exist 
     select_query = "SELECT name_records.preorder_hash " + \
-                   "FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id " + \
+                   "FROM " + unexpired_from + " " + \
                    "WHERE name_records.preorder_hash = ? AND " + \
                    unexpired_query + ";"
 
@@ -2641,9 +2871,9 @@ def namedb_get_name_from_name_hash128( cur, name_hash128, block_number ):
     Given the hexlified 128-bit hash of a name, get the name.
     """
 
-    unexpired_query, unexpired_args = namedb_select_where_unexpired_names( block_number )
+    unexpired_from, unexpired_query, unexpired_args = namedb_select_unexpired_names( cur, block_number )
 
-    select_query = "SELECT name FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id " + \
+    select_query = "SELECT name_records.name FROM " + unexpired_from + " " + \
                    "WHERE name_hash128 = ? AND revoked = 0 AND " + unexpired_query + ";"
 
     args = (name_hash128,) + unexpired_args
@@ -2663,8 +2893,8 @@ def namedb_get_names_with_value_hash( cur, value_hash, block_number ):
     Return None if there are no names.
     """
 
-    unexpired_query, unexpired_args = namedb_select_where_unexpired_names( block_number )
-    select_query = "SELECT name FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id " + \
+    unexpired_from, unexpired_query, unexpired_args = namedb_select_unexpired_names( cur, block_number )
+    select_query = "SELECT name_records.name FROM " + unexpired_from + " " + \
                    "WHERE value_hash = ? AND revoked = 0 AND " + unexpired_query + ";"
 
     args = (value_hash,) + unexpired_args
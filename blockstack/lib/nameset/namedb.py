@@ -70,6 +70,35 @@ def autofill( *autofill_fields ):
     return wrap
 
 
+class OpsHashAccumulator( object ):
+    """
+    Collects the serialized operations committed in a block,
+    so the block's ops hash can be calculated without
+    re-reading and restoring them from the db.
+    """
+
+    def __init__( self, block_id, opfields ):
+        self.block_id = block_id
+        self.opfields = opfields
+        self.ops = []
+
+
+    def append( self, op ):
+        """
+        Add a committed operation, with all of its consensus fields
+        """
+        serialized_op = virtualchain.StateEngine.serialize_op( str(op['op'][0]), op, self.opfields )
+        self.ops.append( (op['vtxindex'], serialized_op) )
+
+
+    def get_ops_hash( self ):
+        """
+        Get the hash of the operations, in block order
+        """
+        serialized_ops = [ serialized_op for (vtxindex, serialized_op) in sorted( self.ops, key=lambda op: op[0] ) ]
+        return virtualchain.StateEngine.make_ops_snapshot( serialized_ops )
+
+
 class BlockstackDB( virtualchain.StateEngine ):
     """
     State engine implementation for blockstack.
@@ -128,6 +157,19 @@ class BlockstackDB( virtualchain.StateEngine ):
         self.set_backup_frequency( blockstack_opts['backup_frequency'] )
         self.set_backup_max_age( blockstack_opts['backup_max_age'] )
 
+        # operations committed in the block being processed
+        self.ops_hash_accumulator = None
+
+        # stage each block's writes in one transaction?
+        # block_txn is the block whose transaction is open, if any
+        self.block_atomic_writes = blockstack_opts.get('block_atomic_writes', True)
+        self.block_txn = None
+
+        if disposition == DISPOSITION_RW:
+            # name queries use precomputed expiry heights under the next block's epoch rules
+            next_block = lastblock + 1 if lastblock is not None else first_block
+            namedb_expiry_refresh_epoch( self.db, next_block )
+
         # collision detection 
         # map block_id --> history_id_key --> list of history ID values
         self.collisions = {}
@@ -232,6 +274,11 @@ class BlockstackDB( virtualchain.StateEngine ):
         Close the db and release memory
         """
         if self.db is not None:
+            if self.block_txn is not None:
+                # never persist a partially-applied block
+                log.warning("Rolling back uncommitted block %s" % self.block_txn)
+                self.rollback_block()
+
             self.db.commit()
             self.db.close()
             self.db = None
@@ -246,7 +293,7 @@ class BlockstackDB( virtualchain.StateEngine ):
         (or whatever the working directory is)
         """
         if self.db is not None:
-            self.db.commit()
+            self.flush_writes()
             
         sqlite3_backup( self.get_db_path(), path )
 
@@ -375,12 +422,70 @@ class BlockstackDB( virtualchain.StateEngine ):
     def commit_finished( self, block_id ):
         """
         Called when the block is finished.
-        Commits all data.
+        Commits all data, unless it is staged
+        in a block transaction (see commit_block()).
         """
 
-        self.db.commit()
+        if self.disposition == DISPOSITION_RW:
+            # the next block may start a new epoch
+            namedb_expiry_refresh_epoch( self.db, block_id + 1 )
+
+        self.flush_writes()
         self.clear_collisions( block_id )
 
+
+    def begin_block( self, block_id ):
+        """
+        Start staging this block's writes in one transaction,
+        if block-atomic writes are enabled.  Idempotent.
+        """
+        if not self.block_atomic_writes or self.block_txn is not None:
+            return
+
+        namedb_begin_block( self.db )
+        self.block_txn = block_id
+
+
+    def flush_writes( self ):
+        """
+        Commit writes made so far, unless they are staged
+        in a block transaction.
+        """
+        if self.block_txn is None:
+            self.db.commit()
+
+
+    def commit_block( self, block_id ):
+        """
+        Atomically commit all of the block's writes.
+        Called from db_save, once the ops hash is stored.
+        """
+        if self.block_txn is None:
+            self.db.commit()
+            return
+
+        try:
+            assert self.block_txn == block_id, "BUG: committing block %s, but block %s is open" % (block_id, self.block_txn)
+        except Exception, e:
+            log.exception(e)
+            log.error("FATAL: block transaction mismatch")
+            os.abort()
+
+        namedb_commit_block( self.db )
+        self.block_txn = None
+
+
+    def rollback_block( self ):
+        """
+        Discard a partially-applied block.
+        """
+        if self.block_txn is None:
+            self.db.rollback()
+            return
+
+        namedb_rollback_block( self.db )
+        self.block_txn = None
+
     
     def log_accept( self, block_id, vtxindex, op, op_data ):
         """
@@ -1509,9 +1614,37 @@ class BlockstackDB( virtualchain.StateEngine ):
 
             self.log_commit( current_block_number, op_seq[i]['vtxindex'], op_seq[i]['op'], opcode, op_seq[i] )
     
+        self.accumulate_ops( current_block_number, op_seq )
         return op_seq
 
 
+    def accumulate_ops( self, block_id, op_seq ):
+        """
+        Remember committed operations for this block's ops hash.
+        """
+        if self.ops_hash_accumulator is None or self.ops_hash_accumulator.block_id != block_id:
+            self.ops_hash_accumulator = OpsHashAccumulator( block_id, BlockstackDB.make_opfields() )
+
+        for op in op_seq:
+            self.ops_hash_accumulator.append( op )
+
+
+    def get_accumulated_ops_hash( self, block_id ):
+        """
+        Get the hash of the operations committed in this block
+        (same as calculate_block_ops_hash(), but without any db reads),
+        and reset for the next block.
+        """
+        accumulator = self.ops_hash_accumulator
+        self.ops_hash_accumulator = None
+
+        if accumulator is None or accumulator.block_id != block_id:
+            # nothing committed in this block
+            accumulator = OpsHashAccumulator( block_id, None )
+
+        return accumulator.get_ops_hash()
+
+
     def commit_state_preorder( self, nameop, current_block_number ):
         """
         Commit a state preorder (works for namespace_preorder,
@@ -1526,6 +1659,7 @@ class BlockstackDB( virtualchain.StateEngine ):
             traceback.print_stack()
             os.abort()
 
+        self.begin_block( current_block_number )
         cur = self.db.cursor()
 
         # cannot have collided 
@@ -1542,7 +1676,7 @@ class BlockstackDB( virtualchain.StateEngine ):
             log.error("FATAL: failed to commit preorder '%s'" % commit_preorder['preorder_hash'] )
             os.abort()
 
-        self.db.commit()
+        self.flush_writes()
         return commit_preorder 
 
 
@@ -1560,6 +1694,7 @@ class BlockstackDB( virtualchain.StateEngine ):
             traceback.print_stack()
             os.abort()
 
+        self.begin_block( current_block_number )
         cur = self.db.cursor()
         opcode = nameop.get('opcode', None)
 
@@ -1622,7 +1757,7 @@ class BlockstackDB( virtualchain.StateEngine ):
                 self.db.rollback()
                 os.abort()
 
-            self.db.commit()
+            self.flush_writes()
             cur = self.db.cursor()
 
             # clear the associated preorder 
@@ -1631,7 +1766,7 @@ class BlockstackDB( virtualchain.StateEngine ):
                 log.error("FATAL: failed to remove preorder")
                 os.abort()
 
-            self.db.commit()
+            self.flush_writes()
 
 
         elif preorder is not None:
@@ -1645,7 +1780,7 @@ class BlockstackDB( virtualchain.StateEngine ):
                 self.db.rollback()
                 os.abort()
 
-            self.db.commit()
+            self.flush_writes()
 
 
         elif prior_history_rec is not None:
@@ -1678,7 +1813,7 @@ class BlockstackDB( virtualchain.StateEngine ):
                 self.db.rollback()
                 os.abort()
 
-            self.db.commit()
+            self.flush_writes()
 
         else:
             # must be an import, and must be the first such for this name
@@ -1698,7 +1833,7 @@ class BlockstackDB( virtualchain.StateEngine ):
                 self.db.rollback()
                 os.abort()
 
-            self.db.commit()
+            self.flush_writes()
 
         return initial_state
 
@@ -1716,6 +1851,7 @@ class BlockstackDB( virtualchain.StateEngine ):
             traceback.print_stack()
             os.abort()
 
+        self.begin_block( current_block_number )
         cur = self.db.cursor()
         opcode = nameop.get('opcode', None)
         constraints_ignored = state_transition_get_always_set( nameop )
@@ -1762,7 +1898,7 @@ class BlockstackDB( virtualchain.StateEngine ):
             self.db.rollback()
             os.abort()
 
-        self.db.commit()
+        self.flush_writes()
         cur = self.db.cursor()
 
         new_record = None 
@@ -1858,14 +1994,36 @@ class BlockstackDB( virtualchain.StateEngine ):
         return ops_hash
 
 
+    def verify_block_ops_hashes( self, start_block, end_block ):
+        """
+        Consistency check: recalculate the ops hash of each block in
+        [start_block, end_block) from its restored records, and compare it
+        to the stored one (which was accumulated at commit time).
+        Return the list of blocks whose ops hashes differ.
+        """
+        mismatches = []
+        for block_id in xrange(start_block, end_block):
+            stored_ops_hash = self.get_block_ops_hash( block_id )
+            if stored_ops_hash is None:
+                continue
+
+            restored_ops_hash = BlockstackDB.calculate_block_ops_hash( self, block_id )
+            if restored_ops_hash != stored_ops_hash:
+                log.error("Ops hash mismatch at %s: stored %s, restored %s" % (block_id, stored_ops_hash, restored_ops_hash))
+                mismatches.append( block_id )
+
+        return mismatches
+
+
     def store_block_ops_hash( self, block_id, ops_hash ):
         """
         Store the operation hash for a block ID, calculated from
-        @calculate_block_ops_hash.
+        @get_accumulated_ops_hash or @calculate_block_ops_hash.
         """
+        self.begin_block( block_id )
         cur = self.db.cursor()
         namedb_set_block_ops_hash( cur, block_id, ops_hash )
-        self.db.commit()
+        self.flush_writes()
             
         log.debug("ops hash at %s is %s" % (block_id, ops_hash))
         return True
@@ -30,10 +30,18 @@ from .namedb import *
 
 from ..config import *
 from ..scripts import *
+from ..profiler import IndexingProfiler
+from ..prefetch import virtualchain_block_prefetcher, sync_virtualchain_prefetched
 
 import virtualchain
 log = virtualchain.get_logger("blockstack-log")
 
+# where the indexer spends its time in each block
+indexing_profiler = IndexingProfiler( statement_count=namedb_get_statement_count )
+
+# how the last sync's block prefetching went
+block_prefetch_stats = None
+
 def get_virtual_chain_name():
    """
    (required by virtualchain state engine)
@@ -192,6 +200,7 @@ def get_db_state( disposition=DISPOSITION_RO ):
    return db_inst
 
 
+@indexing_profiler.hook( get_opcode=lambda block_id, txid, vtxindex, op, *args, **kw: op_get_opcode_name(op) )
 def db_parse( block_id, txid, vtxindex, op, data, senders, inputs, outputs, fee, db_state=None ):
    """
    (required by virtualchain state engine)
@@ -258,6 +267,7 @@ def check_mutate_fields( op, op_data ):
     return True
 
 
+@indexing_profiler.hook()
 def db_scan_block( block_id, op_list, db_state=None ):
     """
     (required by virtualchain state engine)
@@ -303,6 +313,7 @@ def db_scan_block( block_id, op_list, db_state=None ):
     
 
 
+@indexing_profiler.hook( get_opcode=lambda block_id, new_ops, op, op_data, *args, **kw: op_data.get('opcode', op_get_opcode_name(op)) )
 def db_check( block_id, new_ops, op, op_data, txid, vtxindex, checked_ops, db_state=None ):
     """
     (required by virtualchain state engine)
@@ -358,6 +369,7 @@ def db_check( block_id, new_ops, op, op_data, txid, vtxindex, checked_ops, db_st
     return accept
    
    
+@indexing_profiler.hook( get_opcode=lambda block_id, op, op_data, *args, **kw: op_data.get('opcode') if op_data is not None else None )
 def db_commit( block_id, op, op_data, txid, vtxindex, db_state=None ):
     """
     (required by virtualchain state engine)
@@ -418,6 +430,7 @@ def db_commit( block_id, op, op_data, txid, vtxindex, db_state=None ):
 
 
 
+@indexing_profiler.hook()
 def db_save( block_id, consensus_hash, pending_ops, filename, db_state=None ):
    """
    (required by virtualchain state engine)
@@ -433,23 +446,40 @@ def db_save( block_id, consensus_hash, pending_ops, filename, db_state=None ):
 
    if db_state is not None:
     
+        profile_token = indexing_profiler.begin( block_id )
         try:
-            # pre-calculate the ops hash for SNV
-            ops_hash = BlockstackDB.calculate_block_ops_hash( db_state, block_id )
+            # pre-calculate the ops hash for SNV,
+            # from the operations db_commit() gave us
+            ops_hash = db_state.get_accumulated_ops_hash( block_id )
+
+            if os.environ.get("BLOCKSTACK_TEST") == "1":
+                # consistency check against the records we'd restore for SNV
+                restored_ops_hash = BlockstackDB.calculate_block_ops_hash( db_state, block_id )
+                assert ops_hash == restored_ops_hash, "Accumulated ops hash %s != restored ops hash %s" % (ops_hash, restored_ops_hash)
+
             db_state.store_block_ops_hash( block_id, ops_hash )
         except Exception, e:
             log.exception(e)
             log.error("FATAL: failed to calculate ops hash at block %s" % block_id )
             os.abort()
 
+        indexing_profiler.end( 'ops_hash', profile_token )
+
+        profile_token = indexing_profiler.begin( block_id )
         try:
-            # flush the database
+            # flush the database.
+            # the block's records, history, preorders and ops hash
+            # all become visible at once.
             db_state.commit_finished( block_id )
+            db_state.commit_block( block_id )
         except Exception, e:
             log.exception(e)
             log.error("FATAL: failed to commit at block %s" % block_id )
             os.abort()
 
+        indexing_profiler.end( 'commit_block', profile_token )
+
+        profile_token = indexing_profiler.begin( block_id )
         try:
             # sync block data to atlas, if enabled
             blockstack_opts = get_blockstack_opts()
@@ -466,6 +496,7 @@ def db_save( block_id, consensus_hash, pending_ops, filename, db_state=None ):
             log.error("FATAL: failed to update Atlas db at %s" % block_id )
             os.abort()
 
+        indexing_profiler.end( 'atlas_sync', profile_token )
         return True
 
    else:
@@ -473,6 +504,7 @@ def db_save( block_id, consensus_hash, pending_ops, filename, db_state=None ):
        os.abort()
 
 
+@indexing_profiler.hook( finish_block=True )
 def db_continue( block_id, consensus_hash ):
     """
     (required by virtualchain state engine)
@@ -490,13 +522,24 @@ def db_continue( block_id, consensus_hash ):
     return is_running() or os.environ.get("BLOCKSTACK_TEST") == "1"
 
 
-def sync_blockchain( bt_opts, last_block, expected_snapshots={}, **virtualchain_args ):
+def get_block_prefetch_stats():
+    """
+    Get the block prefetcher's statistics from the last sync.
+    Return None if we haven't prefetched.
+    """
+    return block_prefetch_stats
+
+
+def sync_blockchain( bt_opts, last_block, expected_snapshots={}, prefetch_depth=0, prefetch_workers=INDEX_PREFETCH_WORKERS, **virtualchain_args ):
     """
     synchronize state with the blockchain.
+    If prefetch_depth > 0, fetch up to prefetch_depth blocks ahead
+    of the one being indexed with prefetch_workers threads.
     Return True on success
     Return False if we're supposed to stop indexing
     Abort on error
     """
+    global block_prefetch_stats
  
     # make this usable even if we haven't explicitly configured virtualchain 
     impl = sys.modules[__name__]
@@ -510,7 +553,29 @@ def sync_blockchain( bt_opts, last_block, expected_snapshots={}, **virtualchain_
     # NOTE: this is the only place where a read-write handle should be created,
     # since this is the only place where the db should be modified.
     new_db = BlockstackDB.borrow_readwrite_instance( db_filename, last_block, expected_snapshots=expected_snapshots )
-    rc = virtualchain.sync_virtualchain( bt_opts, last_block, new_db, expected_snapshots=expected_snapshots, **virtualchain_args )
+
+    prefetcher = None
+    if prefetch_depth > 0 and new_db.lastblock < last_block:
+        prefetcher = virtualchain_block_prefetcher( bt_opts, new_db.lastblock + 1, last_block, depth=prefetch_depth,
+                                                    num_workers=prefetch_workers, tx_filter=virtualchain_args.get('tx_filter') )
+
+    if prefetcher is None:
+        rc = virtualchain.sync_virtualchain( bt_opts, last_block, new_db, expected_snapshots=expected_snapshots, **virtualchain_args )
+
+    else:
+        # same as virtualchain.sync_virtualchain(), but with blocks from the prefetcher
+        prefetcher.start()
+        try:
+            rc = sync_virtualchain_prefetched( last_block, new_db, prefetcher, expected_snapshots=expected_snapshots )
+        except Exception, e:
+            log.exception(e)
+            log.error("Failed to synchronize chain; exiting to safety")
+            os.abort()
+        finally:
+            prefetcher.stop()
+            block_prefetch_stats = prefetcher.get_stats()
+            log.debug("Block prefetch: %s" % block_prefetch_stats)
+
     BlockstackDB.release_readwrite_instance( new_db, last_block )
 
     return rc
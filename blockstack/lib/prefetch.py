@@ -0,0 +1,374 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import time
+import threading
+
+import virtualchain
+log = virtualchain.get_logger("blockstack-server")
+
+from .config import INDEX_PREFETCH_DEPTH, INDEX_PREFETCH_WORKERS
+
+PREFETCH_POLL_INTERVAL = 1.0        # seconds between checks for shutdown
+PREFETCH_MAX_ATTEMPTS = 5           # tries to fetch a block the indexer is waiting on
+
+def virtualchain_fetch_block( bitcoind_opts, block_id, tx_filter=None ):
+    """
+    Fetch one block's virtualchain transactions with virtualchain's own
+    downloader, so they're parsed, filtered, and given senders and fees
+    exactly as virtualchain.sync_virtualchain() would do it.
+    The SPV headers must already be synchronized up to block_id.
+
+    Return {'block_id': ..., 'block_hash': ..., 'prev_block_hash': ..., 'txs': [...]}
+    Raises on error.
+    """
+    header = virtualchain.SPVClient.read_header( bitcoind_opts['bitcoind_spv_path'], block_id )
+    if header is None:
+        raise Exception("No SPV header for block %s" % block_id)
+
+    downloader = virtualchain.BlockchainDownloader( bitcoind_opts, bitcoind_opts['bitcoind_spv_path'], block_id, block_id,
+                                                    p2p_port=bitcoind_opts['bitcoind_p2p_port'], tx_filter=tx_filter )
+
+    if not downloader.run():
+        if not downloader.finished:
+            downloader.loop_exit()
+
+        raise Exception("Failed to fetch block %s" % block_id)
+
+    block_info = downloader.get_block_info()
+    if len(block_info) != 1 or block_info[0][0] != block_id:
+        raise Exception("Got the wrong block(s) for %s" % block_id)
+
+    return {
+        'block_id': block_id,
+        'block_hash': header['hash'],
+        'prev_block_hash': header['prev_block_hash'],
+        'txs': block_info[0][1]
+    }
+
+
+def virtualchain_block_prefetcher( bitcoind_opts, first_block, last_block, depth=INDEX_PREFETCH_DEPTH, num_workers=INDEX_PREFETCH_WORKERS, tx_filter=None ):
+    """
+    Make a BlockPrefetcher that fetches blocks with virtualchain's downloader.
+    Synchronizes the SPV headers up to last_block first.
+    Return the (unstarted) BlockPrefetcher on success
+    Return None if we couldn't synchronize the headers (virtualchain will retry them itself).
+    """
+    headers_path = bitcoind_opts['bitcoind_spv_path']
+    bitcoind_server = "%s:%s" % (bitcoind_opts['bitcoind_server'], bitcoind_opts['bitcoind_p2p_port'])
+
+    try:
+        virtualchain.SPVClient.init( headers_path )
+        rc = virtualchain.SPVClient.sync_header_chain( headers_path, bitcoind_server, last_block )
+    except Exception, e:
+        log.exception(e)
+        rc = False
+
+    if not rc:
+        log.error("Failed to synchronize SPV headers up to %s; not prefetching blocks" % last_block)
+        return None
+
+    fetch_block = lambda block_id: virtualchain_fetch_block( bitcoind_opts, block_id, tx_filter=tx_filter )
+    return BlockPrefetcher( fetch_block, first_block, last_block, depth=depth, num_workers=num_workers )
+
+
+def sync_virtualchain_prefetched( last_block, state_engine, prefetcher, expected_snapshots={} ):
+    """
+    Feed the blocks up to and including last_block from a started BlockPrefetcher
+    into the state engine, the way virtualchain's StateEngine.build() does with
+    the blocks it downloads itself.
+
+    Return True on success
+    Return False if we're supposed to stop indexing
+    Raise on error (including a chain reorganization below the blocks we've processed)
+    """
+    first_block_id = state_engine.lastblock + 1
+    if first_block_id > last_block:
+        log.debug("Up-to-date (%s > %s)" % (first_block_id, last_block))
+        return True
+
+    log.debug("Sync virtualchain state from %s to %s, prefetching up to %s blocks ahead" % (first_block_id, last_block, prefetcher.depth))
+
+    for block_id in xrange(first_block_id, last_block + 1):
+        block = prefetcher.get_block( block_id )
+
+        if state_engine.get_consensus_at( block_id ) is not None:
+            raise Exception("Already processed block %s (%s)" % (block_id, state_engine.get_consensus_at( block_id )))
+
+        ops = state_engine.parse_block( block_id, block['txs'] )
+        consensus_hash = state_engine.process_block( block_id, ops, expected_snapshots=expected_snapshots )
+
+        if consensus_hash is None:
+            # request to stop
+            log.debug("Stopped processing at block %s" % block_id)
+            return False
+
+        log.debug("CONSENSUS(%s): %s" % (block_id, consensus_hash))
+
+        # sanity check, if given
+        expected_consensus_hash = state_engine.get_expected_consensus_at( block_id )
+        if expected_consensus_hash is not None and str(consensus_hash) != str(expected_consensus_hash):
+            raise Exception("FATAL: DIVERGENCE DETECTED AT %s: %s != %s" % (block_id, consensus_hash, expected_consensus_hash))
+
+    log.debug("Last block is %s" % state_engine.lastblock)
+    return True
+
+
+class BlockPrefetcher( object ):
+    """
+    Fetch (and pre-filter) the blocks between first_block and last_block
+    with a pool of worker threads calling fetch_block(block_id), staying
+    at most `depth` blocks ahead of the block the indexer is working on,
+    so that network latency overlaps with applying blocks.
+
+    The indexer takes blocks in order with get_block().  If a block
+    doesn't build on the last one it took, the chain reorganized while
+    we were prefetching, so everything fetched ahead is thrown away and
+    fetched again.  If it still doesn't build on it, the chain reorganized
+    below blocks the indexer already has, and get_block() raises.
+    """
+    def __init__(self, fetch_block, first_block, last_block, depth=INDEX_PREFETCH_DEPTH, num_workers=INDEX_PREFETCH_WORKERS):
+        self.fetch_block = fetch_block
+        self.first_block = first_block
+        self.last_block = last_block
+        self.depth = max(depth, 1)
+        self.num_workers = max(num_workers, 1)
+
+        self.cond = threading.Condition()
+        self.running = False
+        self.workers = []
+
+        # next block the indexer will take, and next block to fetch
+        self.next_block = first_block
+        self.next_fetch = first_block
+
+        # bumped whenever prefetched blocks are thrown away, so in-flight fetches get dropped too
+        self.generation = 0
+
+        self.ready = {}
+        self.failed = set()
+        self.last_block_hash = None
+
+        self.stats = {
+            'blocks_fetched': 0,
+            'blocks_delivered': 0,
+            'blocks_invalidated': 0,
+            'reorgs': 0,
+            'fetch_errors': 0,
+            'fetch_time': 0.0,
+            'stalls': 0,
+            'stall_time': 0.0,
+            'max_stall_time': 0.0,
+            'max_ready': 0,
+        }
+        self.start_time = None
+
+
+    def start(self):
+        """
+        Start fetching
+        """
+        with self.cond:
+            self.running = True
+            self.start_time = time.time()
+
+        for i in xrange(0, self.num_workers):
+            worker = threading.Thread( target=self.fetch_blocks, name='block-prefetch-%s' % i )
+            worker.daemon = True
+            worker.start()
+            self.workers.append( worker )
+
+
+    def stop(self):
+        """
+        Stop fetching, and wait for the workers to exit.
+        """
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+        for worker in self.workers:
+            worker.join()
+
+        self.workers = []
+
+
+    def fetch_blocks(self):
+        """
+        Worker thread: fetch blocks in the window ahead of the indexer
+        """
+        while True:
+            with self.cond:
+                while self.running and (self.next_fetch > self.last_block or self.next_fetch >= self.next_block + self.depth):
+                    self.cond.wait( PREFETCH_POLL_INTERVAL )
+
+                if not self.running:
+                    return
+
+                block_id = self.next_fetch
+                generation = self.generation
+                self.next_fetch += 1
+
+            block = None
+            t0 = time.time()
+            try:
+                block = self.fetch_block( block_id )
+            except Exception, e:
+                log.exception(e)
+                log.error("Failed to prefetch block %s" % block_id)
+
+            fetch_time = time.time() - t0
+
+            with self.cond:
+                self.stats['fetch_time'] += fetch_time
+
+                if generation != self.generation or block_id < self.next_block:
+                    # thrown away while we were fetching it
+                    self.stats['blocks_invalidated'] += 1
+
+                elif block is None:
+                    self.stats['fetch_errors'] += 1
+                    self.failed.add( block_id )
+
+                else:
+                    self.stats['blocks_fetched'] += 1
+                    self.ready[block_id] = block
+                    self.stats['max_ready'] = max(self.stats['max_ready'], len(self.ready))
+
+                self.cond.notify_all()
+
+
+    def invalidate(self, block_id):
+        """
+        Throw away everything fetched for block_id and later,
+        and fetch it again.
+        """
+        with self.cond:
+            stale = [b for b in self.ready.keys() if b >= block_id]
+            for b in stale:
+                del self.ready[b]
+
+            self.stats['blocks_invalidated'] += len(stale)
+            self.failed = set([b for b in self.failed if b < block_id])
+            self.generation += 1
+            self.next_fetch = max(self.next_block, min(self.next_fetch, block_id))
+            self.cond.notify_all()
+
+
+    def take_block(self, block_id):
+        """
+        Wait for a block to be prefetched, and take it.
+        Return the block, or None if it has to be fetched by the caller.
+        """
+        with self.cond:
+            if block_id != self.next_block:
+                # the indexer skipped around; start over from here
+                self.next_block = block_id
+                self.last_block_hash = None
+                self.invalidate( block_id )
+
+            t0 = time.time()
+            waited = False
+            while self.running and block_id <= self.last_block and block_id not in self.ready and block_id not in self.failed:
+                waited = True
+                self.cond.wait( PREFETCH_POLL_INTERVAL )
+
+            if waited:
+                stall_time = time.time() - t0
+                self.stats['stalls'] += 1
+                self.stats['stall_time'] += stall_time
+                self.stats['max_stall_time'] = max(self.stats['max_stall_time'], stall_time)
+
+            block = self.ready.pop( block_id, None )
+            self.failed.discard( block_id )
+            self.next_block = block_id + 1
+            self.cond.notify_all()
+
+        return block
+
+
+    def fetch_block_now(self, block_id):
+        """
+        Fetch a block the indexer is waiting on, retrying a few times.
+        Raises if the block can't be fetched.
+        """
+        for i in xrange(0, PREFETCH_MAX_ATTEMPTS):
+            try:
+                return self.fetch_block( block_id )
+            except Exception, e:
+                if i + 1 >= PREFETCH_MAX_ATTEMPTS:
+                    raise
+
+                log.exception(e)
+                log.error("Failed to fetch block %s; trying again (%s of %s)" % (block_id, i + 1, PREFETCH_MAX_ATTEMPTS))
+                time.sleep( i + 1 )
+
+
+    def get_block(self, block_id):
+        """
+        Get the next block to index.
+        Return {'block_id': ..., 'block_hash': ..., 'prev_block_hash': ..., 'txs': [...]}
+        Raises if the block can't be fetched, or doesn't build on the last block we returned.
+        """
+        block = self.take_block( block_id )
+        if block is None:
+            # not prefetched (or failed); try ourselves so the indexer sees any error
+            block = self.fetch_block_now( block_id )
+
+        if self.last_block_hash is not None and block['prev_block_hash'] != self.last_block_hash:
+            # fetched from a fork that's since been abandoned
+            log.warning("Block %s (%s) does not build on %s; refetching blocks from %s" % (block_id, block['block_hash'], self.last_block_hash, block_id))
+            with self.cond:
+                self.stats['reorgs'] += 1
+
+            self.invalidate( block_id + 1 )
+            block = self.fetch_block_now( block_id )
+
+            if block['prev_block_hash'] != self.last_block_hash:
+                # the block we already gave the indexer is no longer on the chain
+                raise Exception("Block %s (%s) does not build on %s: the chain reorganized below it" % (block_id, block['block_hash'], self.last_block_hash))
+
+        with self.cond:
+            self.stats['blocks_delivered'] += 1
+            self.last_block_hash = block['block_hash']
+
+        return block
+
+
+    def get_stats(self):
+        """
+        Get throughput and stall statistics
+        """
+        with self.cond:
+            stats = dict(self.stats)
+            stats['depth'] = self.depth
+            stats['workers'] = self.num_workers
+            stats['ready'] = len(self.ready)
+            stats['next_block'] = self.next_block
+
+            elapsed = time.time() - self.start_time if self.start_time is not None else 0.0
+            stats['elapsed'] = elapsed
+            stats['blocks_per_second'] = stats['blocks_delivered'] / elapsed if elapsed > 0 else None
+            stats['mean_fetch_time'] = stats['fetch_time'] / stats['blocks_fetched'] if stats['blocks_fetched'] > 0 else None
+
+        return stats
@@ -0,0 +1,353 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import math
+import time
+import threading
+import functools
+import collections
+
+import virtualchain
+log = virtualchain.get_logger("blockstack-server")
+
+from .config import INDEX_PROFILE_BLOCKS
+
+INDEX_PROFILE_MAX_EVENTS = 1024         # timeline events kept per block; beyond this, only totals are kept
+INDEX_PROFILE_MAX_TRACE_BLOCKS = 100    # maximum number of blocks in one timeline
+INDEX_PROFILE_PERCENTILES = [50, 90, 99]
+
+def percentile( sorted_values, pct ):
+    """
+    Get the nearest-rank percentile of a sorted list of values.
+    Return None if there are no values.
+    """
+    if len(sorted_values) == 0:
+        return None
+
+    rank = int(math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def summarize( values ):
+    """
+    Get the percentiles, maximum, and total of a list of values.
+    """
+    values = sorted(values)
+    ret = {
+        'max': values[-1] if len(values) > 0 else None,
+        'total': sum(values)
+    }
+
+    for pct in INDEX_PROFILE_PERCENTILES:
+        ret['p%s' % pct] = percentile( values, pct )
+
+    return ret
+
+
+class IndexingProfiler( object ):
+    """
+    Record where the indexer spends its time.
+
+    For each of the last max_blocks blocks, record the wall-clock time,
+    CPU time, and number of SQLite statements spent in each virtualchain
+    hook (and in each named phase within a hook), both in total and per
+    opcode, as well as a timeline of each call.
+
+    Whatever is left of a block's wall-clock time between its first and
+    last hook is virtualchain's own work (e.g. snapshotting the block).
+
+    Hooks run in the indexer thread only.  Finished blocks can be
+    read from any thread.
+    """
+    def __init__(self, max_blocks=INDEX_PROFILE_BLOCKS, max_events=INDEX_PROFILE_MAX_EVENTS, statement_count=None):
+        self.max_blocks = max_blocks
+        self.max_events = max_events
+        self.statement_count = statement_count if statement_count is not None else (lambda: 0)
+        self.enabled = (max_blocks > 0)
+
+        self.lock = threading.Lock()
+        self.blocks = collections.deque( maxlen=max(max_blocks, 1) )
+
+        # block we're in the middle of
+        self.current = None
+        self.depth = 0
+
+
+    def configure(self, max_blocks):
+        """
+        Change how many blocks we keep.  0 disables profiling.
+        """
+        with self.lock:
+            self.max_blocks = max_blocks
+            self.enabled = (max_blocks > 0)
+            self.blocks = collections.deque( list(self.blocks)[-max_blocks:] if max_blocks > 0 else [], maxlen=max(max_blocks, 1) )
+
+        self.current = None
+        self.depth = 0
+
+
+    def begin(self, block_id):
+        """
+        Start timing a hook (or a phase within one) for the given block.
+        Return a token to pass to end().
+        Return None if we're not profiling.
+        """
+        if not self.enabled:
+            return None
+
+        token = (time.time(), time.clock(), self.statement_count())
+
+        if self.current is None or self.current['block_id'] != block_id:
+            # first hook for this block
+            self.finish_block()
+            self.current = {
+                'block_id': block_id,
+                'start': token,
+                'end': token,
+                'hook_wall': 0.0,
+                'hooks': {},
+                'opcodes': {},
+                'events': [],
+                'dropped_events': 0
+            }
+
+        self.depth += 1
+        return token
+
+
+    def end(self, name, token, opcode=None):
+        """
+        Finish timing a hook (or a phase within one).
+        """
+        if token is None or self.current is None:
+            return
+
+        now = (time.time(), time.clock(), self.statement_count())
+        self.depth -= 1
+
+        block = self.current
+        wall = now[0] - token[0]
+        cpu = now[1] - token[1]
+        statements = now[2] - token[2]
+
+        for (table, key) in [(block['hooks'], name), (block['opcodes'], opcode)]:
+            if key is None:
+                continue
+
+            totals = table.get(key)
+            if totals is None:
+                totals = [0, 0.0, 0.0, 0]
+                table[key] = totals
+
+            totals[0] += 1
+            totals[1] += wall
+            totals[2] += cpu
+            totals[3] += statements
+
+        if self.depth == 0:
+            block['hook_wall'] += wall
+
+        if len(block['events']) < self.max_events:
+            block['events'].append( (name, opcode, token[0], wall, cpu, statements) )
+        else:
+            block['dropped_events'] += 1
+
+        block['end'] = now
+
+
+    def finish_block(self):
+        """
+        Done with the current block.  Add it to the ring buffer.
+        """
+        block = self.current
+        if block is None:
+            return
+
+        self.current = None
+        self.depth = 0
+
+        def totals_dict( totals ):
+            return {'calls': totals[0], 'wall': totals[1], 'cpu': totals[2], 'statements': totals[3]}
+
+        wall = block['end'][0] - block['start'][0]
+        rec = {
+            'block_id': block['block_id'],
+            'start': block['start'][0],
+            'wall': wall,
+            'cpu': block['end'][1] - block['start'][1],
+            'statements': block['end'][2] - block['start'][2],
+            'virtualchain': max(wall - block['hook_wall'], 0.0),
+            'hooks': dict( [(name, totals_dict(totals)) for (name, totals) in block['hooks'].items()] ),
+            'opcodes': dict( [(opcode, totals_dict(totals)) for (opcode, totals) in block['opcodes'].items()] ),
+            'events': block['events'],
+            'dropped_events': block['dropped_events']
+        }
+
+        with self.lock:
+            if self.enabled:
+                self.blocks.append( rec )
+
+
+    def hook(self, get_opcode=None, finish_block=False):
+        """
+        Decorator for a virtualchain hook, whose first argument is the block ID.
+        get_opcode(*args, **kw) gets the name of the opcode a call is for, if any.
+        If finish_block is True, then this is the last hook called for a block.
+        """
+        def wrap( func ):
+            name = func.__name__
+
+            @functools.wraps(func)
+            def profiled( block_id, *args, **kw ):
+                if not self.enabled:
+                    return func( block_id, *args, **kw )
+
+                token = self.begin( block_id )
+                try:
+                    return func( block_id, *args, **kw )
+
+                finally:
+                    opcode = None
+                    if get_opcode is not None:
+                        try:
+                            opcode = get_opcode( block_id, *args, **kw )
+                        except Exception:
+                            pass
+
+                    self.end( name, token, opcode=opcode )
+                    if finish_block:
+                        self.finish_block()
+
+            return profiled
+
+        return wrap
+
+
+    def get_blocks(self, start_block=None, end_block=None):
+        """
+        Get the profiles of the blocks in [start_block, end_block] that we still have.
+        """
+        with self.lock:
+            blocks = list(self.blocks)
+
+        return [b for b in blocks if (start_block is None or b['block_id'] >= start_block) and (end_block is None or b['block_id'] <= end_block)]
+
+
+    def get_report(self, start_block=None, end_block=None):
+        """
+        Summarize the blocks in [start_block, end_block]:
+        percentiles of the wall-clock time, CPU time, and SQLite statements
+        each block spent overall, in each hook, and on each opcode.
+        Times are in seconds.
+        """
+        blocks = self.get_blocks( start_block=start_block, end_block=end_block )
+        report = {
+            'enabled': self.enabled,
+            'max_blocks': self.max_blocks,
+            'num_blocks': len(blocks),
+            'first_block': blocks[0]['block_id'] if len(blocks) > 0 else None,
+            'last_block': blocks[-1]['block_id'] if len(blocks) > 0 else None,
+            'block': {},
+            'hooks': {},
+            'opcodes': {}
+        }
+
+        for field in ['wall', 'cpu', 'statements', 'virtualchain']:
+            report['block'][field] = summarize( [b[field] for b in blocks] )
+
+        for table in ['hooks', 'opcodes']:
+            names = set()
+            for b in blocks:
+                names.update( b[table].keys() )
+
+            for name in names:
+                # per block, counting blocks that didn't call it
+                per_block = [b[table].get(name) for b in blocks]
+                calls = sum( [totals['calls'] for totals in per_block if totals is not None] )
+
+                summary = {'calls': calls}
+                for field in ['wall', 'cpu', 'statements']:
+                    summary[field] = summarize( [totals[field] if totals is not None else 0 for totals in per_block] )
+
+                summary['wall_per_call'] = summary['wall']['total'] / calls if calls > 0 else None
+                report[table][name] = summary
+
+        return report
+
+
+    def get_trace(self, start_block, end_block):
+        """
+        Get a timeline of the blocks in [start_block, end_block]
+        in Chrome's trace event format (i.e. for chrome://tracing).
+        Times are in microseconds.
+        """
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 1, 'args': {'name': 'indexer'}}]
+        blocks = self.get_blocks( start_block=start_block, end_block=end_block )
+
+        for b in blocks:
+            events.append({
+                'name': 'block %s' % b['block_id'],
+                'cat': 'block',
+                'ph': 'X',
+                'ts': int(b['start'] * 1e6),
+                'dur': int(b['wall'] * 1e6),
+                'pid': 1,
+                'tid': 1,
+                'args': {
+                    'block_id': b['block_id'],
+                    'cpu_us': int(b['cpu'] * 1e6),
+                    'statements': b['statements'],
+                    'virtualchain_us': int(b['virtualchain'] * 1e6),
+                    'dropped_events': b['dropped_events']
+                }
+            })
+
+            for (name, opcode, start, wall, cpu, statements) in b['events']:
+                args = {
+                    'block_id': b['block_id'],
+                    'cpu_us': int(cpu * 1e6),
+                    'statements': statements
+                }
+
+                if opcode is not None:
+                    args['opcode'] = opcode
+
+                events.append({
+                    'name': name if opcode is None else '%s %s' % (name, opcode),
+                    'cat': 'hook',
+                    'ph': 'X',
+                    'ts': int(start * 1e6),
+                    'dur': int(wall * 1e6),
+                    'pid': 1,
+                    'tid': 1,
+                    'args': args
+                })
+
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                'first_block': blocks[0]['block_id'] if len(blocks) > 0 else None,
+                'last_block': blocks[-1]['block_id'] if len(blocks) > 0 else None
+            }
+        }
@@ -147,6 +147,116 @@ def price_name( name, namespace, block_height ):
    return price * price_multiplier
 
 
+NAME_PRICE_VOWELS = frozenset("aeiouy")
+NAME_PRICE_NONALPHA = frozenset("0123456789-_")
+
+class NamespacePricing( object ):
+   """
+   A namespace's name prices at a given block height.
+   Gives the same prices as price_name(), but only works out
+   each (bucket, discount) price once.
+   """
+
+   def __init__( self, namespace, block_height ):
+      self.namespace_id = namespace['namespace_id']
+      self.base = namespace['base']
+      self.coeff = namespace['coeff']
+      self.buckets = namespace['buckets']
+      self.no_vowel_discount = namespace['no_vowel_discount']
+      self.nonalpha_discount = namespace['nonalpha_discount']
+      self.block_height = block_height
+      self.price_multiplier = get_epoch_price_multiplier( block_height, self.namespace_id )
+      self.prices = {}
+
+
+   def price_name( self, name ):
+      """
+      Calculate the price of a name (without its namespace ID)
+      """
+      if len(name) < len(self.buckets):
+          bucket_exponent = self.buckets[len(name)-1]
+      else:
+          bucket_exponent = self.buckets[-1]
+
+      chars = set(name.lower())
+      no_vowels = chars.isdisjoint( NAME_PRICE_VOWELS )
+      nonalpha = not chars.isdisjoint( NAME_PRICE_NONALPHA )
+
+      key = (bucket_exponent, no_vowels, nonalpha)
+      if key not in self.prices:
+          discount = 1.0
+          if no_vowels:
+              discount = max( discount, self.no_vowel_discount )
+
+          if nonalpha:
+              discount = max( discount, self.nonalpha_discount )
+
+          price = (float(self.coeff * (self.base ** bucket_exponent)) / float(discount)) * NAME_COST_UNIT
+          if price < NAME_COST_UNIT:
+              price = NAME_COST_UNIT
+
+          self.prices[key] = price * self.price_multiplier
+
+      return self.prices[key]
+
+
+class NamePricer( object ):
+   """
+   Prices fully-qualified names at a db's last block.
+   Each namespace's pricing is looked up once, and
+   kept until the db moves on to another block.
+   """
+
+   def __init__( self, max_namespaces=1024 ):
+      self.block_height = None
+      self.namespaces = {}
+      self.max_namespaces = max_namespaces
+
+
+   def get_namespace_pricing( self, db, namespace_id ):
+      """
+      Get a namespace's pricing at the db's last block,
+      even if the namespace is being imported.
+      Return None if the namespace has not been declared
+      """
+      if db.lastblock != self.block_height or len(self.namespaces) >= self.max_namespaces:
+          self.block_height = db.lastblock
+          self.namespaces = {}
+
+      if namespace_id not in self.namespaces:
+          namespace = db.get_namespace( namespace_id )
+          if namespace is None:
+              # maybe importing?
+              log.debug("Revealing namespace '%s'" % namespace_id)
+              namespace = db.get_namespace_reveal( namespace_id )
+
+          pricing = None
+          if namespace is not None:
+              pricing = NamespacePricing( namespace, self.block_height )
+
+          self.namespaces[namespace_id] = pricing
+
+      return self.namespaces[namespace_id]
+
+
+   def price_name( self, db, name ):
+      """
+      Get the cost of a name, given the fully-qualified name.
+      Return None if the namespace has not been declared
+      """
+      namespace_id = get_namespace_from_name( name )
+      if namespace_id is None or len(namespace_id) == 0:
+          log.debug("No namespace '%s'" % namespace_id)
+          return None
+
+      pricing = self.get_namespace_pricing( db, namespace_id )
+      if pricing is None:
+          log.debug("No namespace '%s'" % namespace_id)
+          return None
+
+      return pricing.price_name( get_name_from_fq_name( name ) )
+
+
 def price_namespace( namespace_id, block_height ):
    """
    Calculate the cost of a namespace.
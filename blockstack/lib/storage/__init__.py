@@ -23,3 +23,4 @@
 
 import crawl
 from crawl import *
+from replication import ReplicationEngine
@@ -22,6 +22,7 @@
 """
 
 import os
+import threading
 
 from ..config import *
 from ..nameset import *
@@ -31,12 +32,87 @@ from ..scripts import is_name_valid
 
 import blockstack_client
 from blockstack_client import get_zonefile_data_hash, verify_zonefile
+from blockstack_client.cache import LRUTTLCache
 
 import blockstack_zones
 
 import virtualchain
 log = virtualchain.get_logger("blockstack-server")
 
+ZONEFILE_CACHE_MAX_ENTRIES = 100000
+ZONEFILE_CACHE_TTL = 10 * 365 * 24 * 60 * 60        # zonefiles never go stale; they're only evicted for space
+
+class ZonefileCache( object ):
+    """
+    In-memory cache of zonefile data, bounded in bytes.
+    Zonefiles are verified against their hashes before they're
+    inserted, so they can be served from here without re-hashing.
+    """
+    def __init__(self, max_bytes):
+        self.cache = LRUTTLCache(ZONEFILE_CACHE_MAX_ENTRIES, max_bytes, sizeof=len)
+        self.lock = threading.Lock()
+        self.bytes_served = 0
+
+
+    def get(self, zonefile_dir, zonefile_hash):
+        """
+        Get cached zonefile data
+        Return None if not cached
+        """
+        data, _ = self.cache.get((zonefile_dir, zonefile_hash))
+        if data is not None:
+            with self.lock:
+                self.bytes_served += len(data)
+
+        return data
+
+
+    def put(self, zonefile_dir, zonefile_hash, zonefile_data):
+        """
+        Cache zonefile data that has already been verified against @zonefile_hash
+        """
+        self.cache.put((zonefile_dir, zonefile_hash), zonefile_data, ZONEFILE_CACHE_TTL)
+
+
+    def __contains__(self, key):
+        return key in self.cache
+
+
+    def evict(self, zonefile_dir, zonefile_hash):
+        self.cache.evict((zonefile_dir, zonefile_hash))
+
+
+    def get_stats(self):
+        """
+        Get hit rate, bytes served, and usage
+        """
+        stats = self.cache.get_stats()
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = float(stats['hits']) / lookups if lookups > 0 else 0.0
+
+        with self.lock:
+            stats['bytes_served'] = self.bytes_served
+
+        return stats
+
+
+zonefile_cache = ZonefileCache(ZONEFILE_CACHE_SIZE)
+
+def zonefile_cache_configure( max_bytes ):
+    """
+    Replace the zonefile cache with an empty one holding up to @max_bytes
+    """
+    global zonefile_cache
+    zonefile_cache = ZonefileCache(max_bytes)
+
+
+def zonefile_cache_get_stats():
+    """
+    Get the zonefile cache's hit rate, bytes served, and usage
+    """
+    return zonefile_cache.get_stats()
+
+
 def _read_cached_zonefile( zonefile_path, zonefile_hash ):
     """
     Read and verify a cached zone file
@@ -61,6 +137,10 @@ def get_cached_zonefile_data( zonefile_hash, zonefile_dir=None ):
     if zonefile_dir is None:
         zonefile_dir = get_zonefile_dir()
 
+    res = zonefile_cache.get(zonefile_dir, zonefile_hash)
+    if res is not None:
+        return res
+
     zonefile_path = cached_zonefile_path(zonefile_dir, zonefile_hash)
     zonefile_path_legacy = cached_zonefile_path_legacy(zonefile_dir, zonefile_hash)
 
@@ -71,6 +151,7 @@ def get_cached_zonefile_data( zonefile_hash, zonefile_dir=None ):
 
         res = _read_cached_zonefile(zfp, zonefile_hash)
         if res:
+            zonefile_cache.put(zonefile_dir, zonefile_hash, res)
             return res
 
     return None
@@ -160,6 +241,10 @@ def is_zonefile_cached( zonefile_hash, zonefile_dir=None, validate=False):
     """
     if zonefile_dir is None:
         zonefile_dir = get_zonefile_dir()
+
+    if (zonefile_dir, zonefile_hash) in zonefile_cache:
+        # already verified
+        return True
     
     zonefile_path = cached_zonefile_path(zonefile_dir, zonefile_hash)
     zonefile_path_legacy = cached_zonefile_path_legacy(zonefile_dir, zonefile_hash)
@@ -216,7 +301,8 @@ def store_cached_zonefile_data( zonefile_data, zonefile_dir=None ):
     except Exception, e:
         log.exception(e)
         return False
-        
+
+    zonefile_cache.put(zonefile_dir, zonefile_hash, zonefile_data)
     return True
 
 
@@ -247,21 +333,22 @@ def remove_cached_zonefile_data( zonefile_hash, zonefile_dir=None ):
     if zonefile_dir is None:
         zonefile_dir = get_zonefile_dir()
 
+    zonefile_cache.evict(zonefile_dir, zonefile_hash)
+
     if not os.path.exists(zonefile_dir):
         return True
 
-    zonefile_hash = get_zonefile_data_hash( zonefile_data )
     zonefile_path = cached_zonefile_path( zonefile_dir, zonefile_hash )
     zonefile_path_legacy = cached_zonefile_path_legacy( zonefile_dir, zonefile_hash )
 
     for zfp in [zonefile_path, zonefile_path_legacy]:
-        if not os.path.exists(zonefile_path):
+        if not os.path.exists(zfp):
             continue
 
         try:
-            os.unlink(zonefile_path)
+            os.unlink(zfp)
         except:
-            log.error("Failed to unlink zonefile %s (%s)" % (zonefile_hash, zonefile_path))
+            log.error("Failed to unlink zonefile %s (%s)" % (zonefile_hash, zfp))
             return False
 
     return True
@@ -312,10 +399,11 @@ def store_zonefile_to_storage( zonefile_dict, required=None, skip=None, cache=Fa
     return store_zonefile_data_to_storage( zonefile_data, required=required, skip=skip, cache=cache, zonefile_dir=zonefile_dir, name=name )
 
 
-def store_mutable_data_to_storage( blockchain_id, data_id, data_txt, profile=False, required=None, skip=None ):
+def store_mutable_data_to_storage( blockchain_id, data_id, data_txt, profile=False, required=None, skip=None, required_exclusive=False ):
     """
     Store the given mutable datum to storage providers.
     Used by the storage gateway logic.
+    If required_exclusive is True, then only the required drivers are tried.
     Return True on successful replication to all required drivers
     Return False on error
     """
@@ -327,7 +415,7 @@ def store_mutable_data_to_storage( blockchain_id, data_id, data_txt, profile=Fal
         nocollide_data_id = '{}-{}'.format(blockchain_id, data_id)
 
     log.debug("Store {} to drivers '{}', skipping '{}'".format('profile' if profile else 'mutable datum', ','.join(required if required is not None else []), ','.join(skip if skip is not None else [])))
-    res = blockstack_client.storage.put_mutable_data(nocollide_data_id, data_txt, sign=False, raw=True, required=required, skip=skip, blockchain_id=blockchain_id)
+    res = blockstack_client.storage.put_mutable_data(nocollide_data_id, data_txt, sign=False, raw=True, required=required, skip=skip, blockchain_id=blockchain_id, required_exclusive=required_exclusive)
     return res
 
 
@@ -0,0 +1,494 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import heapq
+import threading
+from collections import deque
+
+from blockstack_client.backend.queue import queuedb_findall, queuedb_remove_batch, queuedb_count, queuedb_oldest, extract_entry
+
+import virtualchain
+log = virtualchain.get_logger("blockstack-server")
+
+# how long the throughput window is, in seconds
+REPLICATION_RATE_WINDOW = 60
+
+
+class ReplicationEngine(object):
+    """
+    Replicates queued data to storage drivers.
+
+    Queued entries are dequeued in batches (in the order they were
+    queued, up to max_inflight of them per queue), and each one is pushed
+    to each of its queue's drivers as an independent task.  Tasks run on
+    a shared pool of worker threads, with a bound on the number of
+    in-flight pushes to any one driver, so a slow driver only holds up
+    its own tasks.  Failed pushes are retried with exponential backoff.
+
+    Once every driver has either accepted an entry or run out of retries,
+    the entry is removed from the queue (in batches).
+    """
+    def __init__(self, queue_path, num_workers=8, driver_concurrency=2, batch_size=32, max_inflight=256,
+                 max_retries=5, retry_delay=1.0, retry_delay_max=60.0, poll_interval=1.0):
+
+        self.queue_path = queue_path
+        self.num_workers = num_workers
+        self.driver_concurrency = driver_concurrency
+        self.batch_size = batch_size
+        self.max_inflight = max_inflight
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.retry_delay_max = retry_delay_max
+        self.poll_interval = poll_interval
+
+        self.lock = threading.Condition()
+        self.running = False
+        self.workers = []
+        self.wakeup_event = threading.Event()
+
+        self.queues = {}            # queue_id => {'drivers': [...], 'push': ..., 'prepare': ..., 'on_complete': ...}
+        self.entries = {}           # (queue_id, fqu, tx_hash) => in-flight entry state
+        self.completed = []         # keys of entries ready to be removed from the queue
+        self.cursors = {}           # queue_id => rowid of the last queued entry we dequeued
+        self.drivers = {}           # driver name => per-driver state
+        self.retry_seq = 0
+
+        self.stats = {
+            'dequeued': 0,
+            'replicated': 0,
+            'partial': 0,
+            'abandoned': 0,
+            'bytes': 0,
+        }
+        self.completion_times = deque()
+
+
+    def add_queue(self, queue_id, drivers, push, prepare=None, on_complete=None):
+        """
+        Replicate entries of the given queue to the given drivers.
+
+        @push(driver, payload) stores a payload to one driver, and returns True on success.
+        @prepare(entry) turns a queue entry into the payload to push, and returns None if the
+        entry cannot be replicated (in which case it is abandoned).  Defaults to the entry itself.
+        @on_complete(entry, succeeded_drivers, failed_drivers) is called once all drivers are done.
+        """
+        with self.lock:
+            self.queues[queue_id] = {
+                'drivers': list(drivers),
+                'push': push,
+                'prepare': prepare,
+                'on_complete': on_complete,
+            }
+
+            for driver in drivers:
+                if driver not in self.drivers:
+                    self.drivers[driver] = {
+                        'ready': deque(),
+                        'retry': [],
+                        'inflight': 0,
+                        'pushes': 0,
+                        'failures': 0,
+                        'retries': 0,
+                        'latency_total': 0.0,
+                        'latency_max': 0.0,
+                    }
+
+
+    def start(self):
+        """
+        Start the worker threads.  Idempotent.
+        """
+        with self.lock:
+            if self.running:
+                return
+
+            self.running = True
+            for i in xrange(0, self.num_workers):
+                t = threading.Thread(target=self._worker_main, name='replication-worker-{}'.format(i))
+                t.daemon = True
+                t.start()
+                self.workers.append(t)
+
+
+    def stop(self):
+        """
+        Stop the worker threads.  In-flight pushes are allowed to finish;
+        entries that are not done stay queued for the next start.
+        """
+        with self.lock:
+            self.running = False
+            workers = self.workers
+            self.workers = []
+            self.lock.notify_all()
+
+        self.wakeup_event.set()
+        for t in workers:
+            t.join()
+
+        # remove what finished, and forget the rest
+        # (it stays queued, and will be picked up on the next start)
+        self.flush_completed()
+        with self.lock:
+            self.entries = {}
+            self.cursors = {}
+            for state in self.drivers.values():
+                state['ready'].clear()
+                state['retry'] = []
+
+
+    def wakeup(self):
+        """
+        Tell the dispatcher there may be new queued entries
+        """
+        self.wakeup_event.set()
+
+
+    def _next_task(self):
+        """
+        Find a task whose driver has a free slot, and claim the slot.
+        Promotes retries that have come due.
+        Return (driver, task) on success, or (None, next retry time or None) if nothing is runnable.
+        Must be called with self.lock held.
+        """
+        now = time.time()
+        next_due = None
+        for driver, state in self.drivers.items():
+            while len(state['retry']) > 0 and state['retry'][0][0] <= now:
+                _, _, task = heapq.heappop(state['retry'])
+                state['ready'].append(task)
+
+            if len(state['retry']) > 0:
+                if next_due is None or state['retry'][0][0] < next_due:
+                    next_due = state['retry'][0][0]
+
+            if state['inflight'] < self.driver_concurrency and len(state['ready']) > 0:
+                state['inflight'] += 1
+                return driver, state['ready'].popleft()
+
+        return None, next_due
+
+
+    def _worker_main(self):
+        while True:
+            with self.lock:
+                while True:
+                    if not self.running:
+                        return
+
+                    driver, task = self._next_task()
+                    if driver is not None:
+                        break
+
+                    timeout = None
+                    if task is not None:
+                        timeout = max(0.0, task - time.time())
+
+                    self.lock.wait(timeout if timeout is not None else self.poll_interval)
+
+            self._run_task(driver, task)
+
+
+    def _run_task(self, driver, task):
+        """
+        Push one entry to one driver, and record the outcome
+        """
+        key = task['key']
+        success = False
+        t0 = time.time()
+        try:
+            success = bool(task['push'](driver, task['payload']))
+        except Exception as e:
+            log.exception(e)
+            log.error("Driver {} failed on {}".format(driver, key))
+
+        latency = time.time() - t0
+
+        with self.lock:
+            state = self.drivers[driver]
+            state['inflight'] -= 1
+            state['pushes'] += 1
+            state['latency_total'] += latency
+            state['latency_max'] = max(state['latency_max'], latency)
+
+            entry_state = self.entries[key]
+            if success:
+                entry_state['succeeded'].append(driver)
+                entry_state['remaining'].discard(driver)
+
+            else:
+                state['failures'] += 1
+                task['attempts'] += 1
+                if task['attempts'] <= self.max_retries and self.running:
+                    # back off and try again
+                    delay = min(self.retry_delay_max, self.retry_delay * (2 ** (task['attempts'] - 1)))
+                    log.debug("Retry {} on {} in {} seconds".format(key, driver, delay))
+                    state['retries'] += 1
+                    self.retry_seq += 1
+                    heapq.heappush(state['retry'], (time.time() + delay, self.retry_seq, task))
+
+                elif task['attempts'] <= self.max_retries:
+                    # shutting down; leave it queued for next time
+                    entry_state['interrupted'] = True
+                    entry_state['remaining'].discard(driver)
+
+                else:
+                    log.error("Giving up on replicating {} to {}".format(key, driver))
+                    entry_state['failed'].append(driver)
+                    entry_state['remaining'].discard(driver)
+
+            done = len(entry_state['remaining']) == 0
+            self.lock.notify_all()
+
+        if done:
+            self._finish_entry(key)
+
+
+    def _finish_entry(self, key):
+        """
+        All drivers are done with an entry.  Run its completion callback
+        and mark it for removal from the queue.
+        """
+        with self.lock:
+            entry_state = self.entries[key]
+            queue_info = self.queues[key[0]]
+
+        if entry_state.get('interrupted', False):
+            # will be picked up again on restart
+            with self.lock:
+                del self.entries[key]
+                self.lock.notify_all()
+
+            return
+
+        if queue_info['on_complete'] is not None:
+            try:
+                queue_info['on_complete'](entry_state['entry'], entry_state['succeeded'], entry_state['failed'])
+            except Exception as e:
+                log.exception(e)
+                log.error("Completion callback failed for {}".format(key))
+
+        with self.lock:
+            if len(entry_state['failed']) == 0:
+                self.stats['replicated'] += 1
+            elif len(entry_state['succeeded']) > 0:
+                self.stats['partial'] += 1
+            else:
+                self.stats['abandoned'] += 1
+
+            self.stats['bytes'] += entry_state['size']
+            self.completion_times.append(time.time())
+            self.completed.append(key)
+            self.lock.notify_all()
+
+        self.wakeup_event.set()
+
+
+    def _abandon_entry(self, key, rowid, entry):
+        """
+        An entry could not be prepared for replication; drop it
+        """
+        log.error("Abandoning queued entry {}".format(key))
+        with self.lock:
+            self.entries[key] = {'entry': entry, 'rowid': rowid, 'remaining': set(), 'succeeded': [], 'failed': [], 'size': 0}
+            self.stats['abandoned'] += 1
+            self.completed.append(key)
+
+
+    def dequeue_batch(self):
+        """
+        Pull up to batch_size new entries from each queue
+        (as long as it has fewer than max_inflight entries in flight)
+        and schedule their pushes.
+        Return the number of entries scheduled.
+        """
+        count = 0
+        for queue_id in self.queues.keys():
+            with self.lock:
+                queue_info = self.queues[queue_id]
+                inflight = len([k for k in self.entries.keys() if k[0] == queue_id])
+                cursor = self.cursors.get(queue_id, 0)
+
+            limit = min(self.batch_size, self.max_inflight - inflight)
+            if limit <= 0:
+                continue
+
+            # pick up where we left off
+            rows = queuedb_findall(queue_id, limit=limit, after_rowid=cursor, path=self.queue_path)
+            for row in rows:
+                key = (queue_id, row['fqu'], row['tx_hash'])
+                with self.lock:
+                    self.cursors[queue_id] = max(self.cursors.get(queue_id, 0), row['rowid'])
+                    if key in self.entries:
+                        continue
+
+                entry = extract_entry(row)
+
+                payload = entry
+                if queue_info['prepare'] is not None:
+                    try:
+                        payload = queue_info['prepare'](entry)
+                    except Exception as e:
+                        log.exception(e)
+                        payload = None
+
+                if payload is None:
+                    self._abandon_entry(key, row['rowid'], entry)
+                    continue
+
+                with self.lock:
+                    self.entries[key] = {
+                        'entry': entry,
+                        'rowid': row['rowid'],
+                        'remaining': set(queue_info['drivers']),
+                        'succeeded': [],
+                        'failed': [],
+                        'size': len(row['data']),
+                    }
+                    self.stats['dequeued'] += 1
+
+                    for driver in queue_info['drivers']:
+                        task = {'key': key, 'push': queue_info['push'], 'payload': payload, 'attempts': 0}
+                        self.drivers[driver]['ready'].append(task)
+
+                    self.lock.notify_all()
+
+                count += 1
+
+                if len(queue_info['drivers']) == 0:
+                    self._finish_entry(key)
+
+        return count
+
+
+    def flush_completed(self):
+        """
+        Remove all completed entries from their queues in one batch.
+        Return the number removed.
+        """
+        with self.lock:
+            keys = self.completed
+            self.completed = []
+
+        if len(keys) == 0:
+            return 0
+
+        try:
+            queuedb_remove_batch(keys, path=self.queue_path)
+        except Exception as e:
+            log.exception(e)
+            log.error("Failed to remove {} replicated entries".format(len(keys)))
+            with self.lock:
+                self.completed += keys
+
+            return 0
+
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+            # sqlite can hand a removed entry's rowid to the next queued entry,
+            # but only if it is above every rowid still in the table.
+            # so don't skip past the rows we still have in flight.
+            top_rowid = max([0] + [entry_state['rowid'] for entry_state in self.entries.values()])
+            for queue_id in self.cursors.keys():
+                self.cursors[queue_id] = min(self.cursors[queue_id], top_rowid)
+
+        return len(keys)
+
+
+    def run_once(self, timeout=None):
+        """
+        Do one round of dispatching: remove completed entries, pull new ones,
+        and wait (up to @timeout seconds, default poll_interval) for something to happen.
+        Return the number of entries removed and dequeued.
+        """
+        self.wakeup_event.clear()
+        count = self.flush_completed()
+        count += self.dequeue_batch()
+
+        if count == 0:
+            self.wakeup_event.wait(timeout if timeout is not None else self.poll_interval)
+
+        return count
+
+
+    def is_idle(self):
+        """
+        Are all queues empty, with nothing in flight?
+        """
+        with self.lock:
+            if len(self.entries) > 0:
+                return False
+
+        for queue_id in self.queues.keys():
+            if queuedb_count(queue_id, path=self.queue_path) > 0:
+                return False
+
+        return True
+
+
+    def get_metrics(self):
+        """
+        Get queue depth, queue age, throughput, and per-driver statistics
+        """
+        now = time.time()
+        queue_ids = self.queues.keys()
+        depths = dict([(queue_id, queuedb_count(queue_id, path=self.queue_path)) for queue_id in queue_ids])
+        oldest = dict([(queue_id, queuedb_oldest(queue_id, path=self.queue_path)) for queue_id in queue_ids])
+
+        with self.lock:
+            while len(self.completion_times) > 0 and self.completion_times[0] < now - REPLICATION_RATE_WINDOW:
+                self.completion_times.popleft()
+
+            queues = {}
+            for queue_id in queue_ids:
+                queued_at = now
+                if oldest[queue_id] is not None:
+                    queued_at = extract_entry(oldest[queue_id]).get('queued_at', now)
+
+                queues[queue_id] = {
+                    'depth': depths[queue_id],
+                    'inflight': len([k for k in self.entries.keys() if k[0] == queue_id]),
+                    'oldest_age': now - queued_at,
+                }
+
+            drivers = {}
+            for driver, state in self.drivers.items():
+                drivers[driver] = {
+                    'inflight': state['inflight'],
+                    'ready': len(state['ready']),
+                    'retrying': len(state['retry']),
+                    'pushes': state['pushes'],
+                    'failures': state['failures'],
+                    'retries': state['retries'],
+                    'latency_avg': state['latency_total'] / state['pushes'] if state['pushes'] > 0 else 0.0,
+                    'latency_max': state['latency_max'],
+                }
+
+            metrics = dict(self.stats)
+            metrics['queues'] = queues
+            metrics['drivers'] = drivers
+            metrics['entries_per_second'] = float(len(self.completion_times)) / REPLICATION_RATE_WINDOW
+
+        return metrics
@@ -35,7 +35,7 @@ import backend
 import zonefile
 
 from proxy import BlockstackRPCClient, get_default_proxy, set_default_proxy, json_traceback
-from proxy import getinfo, ping, get_name_cost, get_namespace_cost, get_all_names, get_names_in_namespace, \
+from proxy import getinfo, ping, get_name_cost, get_name_costs, get_namespace_cost, get_all_names, get_names_in_namespace, \
         get_names_owned_by_address, get_consensus_at, get_consensus_range, get_nameops_at, \
         get_nameops_hash_at, get_name_blockchain_record, get_namespace_blockchain_record, \
         get_name_blockchain_history, get_historic_names_by_address
@@ -75,7 +75,7 @@ from scripts import UTXOException, is_name_valid
 
 from utils import daemonize
 
-from backend.queue import in_queue, queue_append, queue_findone, queue_findall, queue_removeall
+from backend.queue import in_queue, queue_append, queue_findone, queue_findall, queue_removeall, queue_count
 
 # legacy compatibility
 import virtualchain
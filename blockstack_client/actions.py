@@ -97,7 +97,7 @@ from .constants import (
     CONFIG_PATH, CONFIG_DIR, WALLET_FILENAME,
     FIRST_BLOCK_MAINNET, NAME_UPDATE, NAME_IMPORT, NAME_REGISTRATION, NAME_RENEWAL,
     BLOCKSTACK_DEBUG, TX_MIN_CONFIRMATIONS, DEFAULT_SESSION_LIFETIME,
-    get_secret, set_secret, BLOCKSTACK_TEST, VERSION
+    get_secret, set_secret, BLOCKSTACK_TEST, VERSION, WALLET_AGENT_IDLE_TIMEOUT
 )
 
 from .storage import get_driver_urls, get_storage_handlers, sign_data_payload, \
@@ -144,12 +144,14 @@ from .wallet import (
     wallet_exists,
     unlock_wallet
 )
+from .wallet_agent import wallet_agent_connect, wallet_agent_start, wallet_agent_stop, wallet_agent_status
 
 from .keys import privkey_to_string, get_data_privkey
 from .proxy import (
     is_zonefile_current, get_default_proxy, json_is_error,
     get_name_blockchain_history, get_all_namespaces, getinfo,
-    storage, is_zonefile_data_current, get_num_names
+    storage, is_zonefile_data_current, get_num_names,
+    get_indexing_profile, get_indexing_trace
 )
 from .scripts import UTXOException, is_name_valid, is_valid_hash, is_namespace_valid
 from .user import make_empty_user_profile, user_zonefile_data_pubkey
@@ -511,7 +513,7 @@ def cli_withdraw(args, password=None, interactive=True, wallet_keys=None, config
 
         if wallet_keys is None:
             res = load_wallet(password=password, wallet_path=wallet_path,
-                              interactive=interactive, include_private=True)
+                              interactive=interactive, include_private=True, use_agent=True)
             if 'error' in res:
                 return res
             wallet_keys = res['wallet']
@@ -743,7 +745,7 @@ def cli_price(args, config_path=CONFIG_PATH, proxy=None, password=None, interact
     else:
         # unlock
         log.warning("API server is not running; unlocking wallet directly")
-        res = load_wallet(password=password, wallet_path=wallet_path, interactive=interactive, include_private=True)
+        res = load_wallet(password=password, wallet_path=wallet_path, interactive=interactive, include_private=True, use_agent=True)
         if 'error' in res:
             return res
         
@@ -1216,6 +1218,15 @@ def get_wallet_keys(config_path, password):
 
     status = local_api_status(config_dir=os.path.dirname(config_path))
     if not status:
+        # the wallet agent can serve the keys
+        agent = wallet_agent_connect(config_dir)
+        if agent is not None:
+            res = agent.get_wallet_keys()
+            if 'error' not in res:
+                return res['wallet_keys']
+
+            log.error("Wallet agent: {}".format(res['error']))
+
         return {'error': 'API endpoint not running. Please start it with `blockstack api start`'}
     
     if not is_wallet_unlocked(config_dir=config_dir):
@@ -2694,7 +2705,7 @@ def cli_wallet(args, config_path=CONFIG_PATH, interactive=True, password=None):
     
     else:
         log.debug("API endpoint does not appear to be running")
-        res = load_wallet(password=password, wallet_path=wallet_path, interactive=interactive, include_private=True)
+        res = load_wallet(password=password, wallet_path=wallet_path, interactive=interactive, include_private=True, use_agent=True)
         if 'error' in res:
             return res
     
@@ -2768,6 +2779,45 @@ def cli_consensus(args, config_path=CONFIG_PATH):
     return result
 
 
+def cli_indexing_profile(args, config_path=CONFIG_PATH):
+    """
+    command: indexing_profile advanced
+    help: Get percentiles of the time a node's indexer spent per block in each hook and opcode
+    opt: start_block (int) 'The first block to report on.  Defaults to the oldest block the node remembers.'
+    opt: end_block (int) 'The last block to report on.  Defaults to the last block indexed.'
+    opt: trace_path (str) 'If given, also write a timeline of (up to 100 of) these blocks to this path, for chrome://tracing.'
+    """
+    start_block = int(args.start_block) if getattr(args, 'start_block', None) is not None else None
+    end_block = int(args.end_block) if getattr(args, 'end_block', None) is not None else None
+    trace_path = getattr(args, 'trace_path', None)
+
+    resp = get_indexing_profile(start_block=start_block, end_block=end_block)
+    if 'error' in resp:
+        return resp
+
+    result = {'profile': resp['profile']}
+
+    if trace_path is not None:
+        if resp['profile']['num_blocks'] == 0:
+            return {'error': 'No blocks to trace'}
+
+        # the most recent blocks in the range
+        trace_end = resp['profile']['last_block']
+        trace_start = max(resp['profile']['first_block'], trace_end - 99)
+
+        trace = get_indexing_trace(trace_start, trace_end)
+        if 'error' in trace:
+            return trace
+
+        with open(trace_path, 'w') as f:
+            f.write(json.dumps(trace['trace']))
+
+        result['trace_path'] = trace_path
+        result['trace_blocks'] = [trace_start, trace_end]
+
+    return result
+
+
 def cli_api(args, password=None, interactive=True, config_path=CONFIG_PATH):
     """
     command: api 
@@ -2817,6 +2867,48 @@ def cli_api(args, password=None, interactive=True, config_path=CONFIG_PATH):
     return res
 
 
+def cli_wallet_agent(args, password=None, interactive=True, config_path=CONFIG_PATH):
+    """
+    command: wallet_agent advanced
+    help: Control the wallet agent, which keeps your wallet unlocked for other commands
+    arg: command (str) '"start", "start-foreground", "stop", or "status"'
+    opt: idle_timeout (int) 'Seconds without a request before the agent locks the wallet.'
+    opt: wallet_password (str) 'The wallet password. Will prompt if required.'
+    """
+
+    config_dir = CONFIG_DIR
+    if config_path is not None:
+        config_dir = os.path.dirname(config_path)
+
+    command = str(args.command)
+    if command == 'status':
+        return wallet_agent_status(config_dir=config_dir)
+
+    if command == 'stop':
+        return wallet_agent_stop(config_dir=config_dir)
+
+    if command not in ['start', 'start-foreground']:
+        return {'error': 'Invalid command "{}"'.format(command)}
+
+    password = get_default_password(password)
+    if password is None:
+        password = getattr(args, 'wallet_password', None)
+        if password is None:
+            if not interactive:
+                return {'error': 'No wallet password given, and not in interactive mode'}
+
+            password = prompt_wallet_password()
+
+    idle_timeout = getattr(args, 'idle_timeout', None)
+    if idle_timeout is None:
+        idle_timeout = WALLET_AGENT_IDLE_TIMEOUT
+
+    if not wallet_exists(config_path=config_path):
+        return {'error': 'Wallet does not exist.  Please create one with `blockstack setup`'}
+
+    return wallet_agent_start(config_dir=config_dir, password=password, idle_timeout=int(idle_timeout), foreground=(command == 'start-foreground'))
+
+
 def cli_name_import(args, interactive=True, config_path=CONFIG_PATH, proxy=None):
     """
     command: name_import advanced
@@ -5419,9 +5511,10 @@ def delete_datastore_by_type( datastore_type, blockchain_id, datastore_privkey,
     return {'status': True}
 
 
-def datastore_file_get(datastore_type, blockchain_id, datastore_id, path, data_pubkeys, extended=False, force=False, config_path=CONFIG_PATH ):
+def datastore_file_get(datastore_type, blockchain_id, datastore_id, path, data_pubkeys, extended=False, force=False, manifest=False, config_path=CONFIG_PATH ):
     """
     Get a file from a datastore or collection.
+    If manifest is True, then a chunked file's data is its chunk manifest.
     Return {'status': True, 'data': ...} on success
     Return {'error': ...} on error
     """
@@ -5442,7 +5535,7 @@ def datastore_file_get(datastore_type, blockchain_id, datastore_id, path, data_p
     if datastore['type'] != datastore_type:
         return {'error': '{} is a {}'.format(datastore_id, datastore['type'])}
 
-    res = datastore_getfile( rpc, blockchain_id, datastore, path, data_pubkeys, extended=extended, force=force, config_path=config_path )
+    res = datastore_getfile( rpc, blockchain_id, datastore, path, data_pubkeys, extended=extended, force=force, manifest=manifest, config_path=config_path )
     return res
 
 
@@ -5773,6 +5866,7 @@ def cli_datastore_getfile( args, config_path=CONFIG_PATH, interactive=False ):
     opt: force (str) 'If True, then tolerate stale data faults.'
     opt: device_ids (str) 'If given, a CSV of device IDs owned by the blockchain ID'
     opt: device_pubkeys (str) 'If given, a CSV of device public keys owned by the blockchain ID'
+    opt: manifest (str) 'If True, then return the chunk manifest of a chunked file instead of its data.'
     """
 
     blockchain_id = getattr(args, 'blockchain_id', '')
@@ -5785,6 +5879,7 @@ def cli_datastore_getfile( args, config_path=CONFIG_PATH, interactive=False ):
     path = str(args.path)
     extended = False
     force = False
+    manifest = False
     device_ids = None
 
     if hasattr(args, 'extended') and args.extended.lower() in ['1', 'true']:
@@ -5793,6 +5888,9 @@ def cli_datastore_getfile( args, config_path=CONFIG_PATH, interactive=False ):
     if hasattr(args, 'force') and args.force.lower() in ['1', 'true']:
         force = True
 
+    if hasattr(args, 'manifest') and args.manifest.lower() in ['1', 'true']:
+        manifest = True
+
     # get the list of device IDs to use 
     device_ids = getattr(args, 'device_ids', None)
     if device_ids:
@@ -5813,7 +5911,7 @@ def cli_datastore_getfile( args, config_path=CONFIG_PATH, interactive=False ):
         'public_key': pubkey
     } for (dev_id, pubkey) in zip(device_ids, device_pubkeys)]
 
-    res = datastore_file_get('datastore', blockchain_id, datastore_id, path, data_pubkeys, extended=extended, force=force, config_path=config_path)
+    res = datastore_file_get('datastore', blockchain_id, datastore_id, path, data_pubkeys, extended=extended, force=force, manifest=manifest, config_path=config_path)
     if json_is_error(res):
         return res
 
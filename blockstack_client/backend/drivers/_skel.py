@@ -268,7 +268,9 @@ def storage_init(conf, **kwargs):
    #        callable to delete a chunk of data via this driver (takes the driver config and chunk ID and returns True/False),
    #        driver_info={a dict of driver-specific information, like API keys},
    #        index_stem="the prefix for all index-related metadata, like "/blockstack/index' or similar",
-   #        compress=True/False
+   #        compress=True/False,
+   #        index_bucket_digits=how many hex digits of a name's hash pick its index page (16**digits pages; optional),
+   #        index_flush_interval=seconds to buffer index page writes for, or 0 to store them before returning (optional)
    # )
    # 
    # index_setup(dvconf, force=force_index)
@@ -35,6 +35,7 @@ import urllib
 import threading
 import time
 import tempfile
+import atexit
 
 from functools import wraps
 
@@ -64,6 +65,12 @@ INDEX_PAGE_SCHEMA = {
     },
 }
 
+# New indexes spread their entries across 16**INDEX_BUCKET_DIGITS pages,
+# each created on its first write.  Legacy indexes have 16 pages (one hex digit).
+INDEX_BUCKET_DIGITS = 2
+INDEX_LEGACY_BUCKET_DIGITS = 1
+INDEX_MAX_BUCKET_DIGITS = 4
+
 # map driver_name --> {index_page_url: index_data}
 INDEX_CACHE = {}
 
@@ -74,6 +81,12 @@ INDEX_CACHE_LOCKS = {}
 # map blockchain_id --> manifest URL
 INDEX_MANIFEST_URL_CACHE = {}
 
+# map driver_name --> {bucket ID: IndexPageBuffer} for our own index
+INDEX_WRITE_BUFFERS = {}
+
+# map driver_name --> (flusher thread, dvconf), for drivers that defer index writes
+INDEX_FLUSHERS = {}
+
 # operations in progress
 IN_PROGRESS = {}
 IN_PROGRESS_LOCK = threading.Lock()
@@ -228,26 +241,61 @@ def normpath(path):
     return path
 
 
-def index_get_page_bucket_id(name):
+def index_get_page_bucket_id(name, digits=INDEX_LEGACY_BUCKET_DIGITS):
     """
-    Which index bucket is this in?
+    Which index bucket is this in, if the index has 16**digits buckets?
     """
     h = hashlib.sha256(name).hexdigest()
-    bucket_id = h[0:1]
+    bucket_id = h[0:digits]
     return bucket_id
 
 
-def index_get_page_path(name, index_dir):
+def index_get_bucket_path(bucket_id, index_dir):
+    """
+    Get the path to an index bucket's page
+    """
+    return normpath('/{}/{}'.format(index_dir, bucket_id))
+
+
+def index_get_page_path(name, index_dir, digits=INDEX_LEGACY_BUCKET_DIGITS):
     """
     Get the path to an index page
     """
-    bucket_id = index_get_page_bucket_id(name)
+    bucket_id = index_get_page_bucket_id(name, digits=digits)
 
-    path = normpath('/{}/{}'.format(index_dir, bucket_id))
+    path = index_get_bucket_path(bucket_id, index_dir)
     log.debug("Index page for {} is {}".format(name, path))
     return path
 
 
+def index_find_page_path(name, index_dir, manifest_page):
+    """
+    Find the page that holds a name, given the index manifest.
+    Works for any bucket fan-out, including legacy 16-bucket indexes.
+    Return (bucket ID, path) on success
+    Return (None, None) if the manifest has no page for it
+    """
+    h = hashlib.sha256(name).hexdigest()
+    for digits in xrange(INDEX_MAX_BUCKET_DIGITS, 0, -1):
+        bucket_id = h[0:digits]
+        path = index_get_bucket_path(bucket_id, index_dir)
+        if path in manifest_page:
+            return bucket_id, path
+
+    return None, None
+
+
+def index_manifest_bucket_digits(manifest_page):
+    """
+    How many hex digits of a name's hash pick its bucket, in this index?
+    Return None if the index has no pages yet
+    """
+    for path in manifest_page.keys():
+        return len(posixpath.basename(path))
+
+    return None
+
+
 def index_get_manifest_page_path(index_stem='index'):
     """
     Get the path to the index manifest
@@ -293,14 +341,15 @@ def serialize_index_page(index_page_data):
     return str(json.dumps(index_page, sort_keys=True))
 
 
-def get_index_bucket_names():
+def get_index_bucket_names(digits=INDEX_LEGACY_BUCKET_DIGITS):
     """
     Get the list of index bucket names
     """
-    return ['{:1x}'.format(i) for i in xrange(0, 16)]
+    return ['{:0{}x}'.format(i, digits) for i in xrange(0, 16 ** digits)]
 
 
-def driver_config(driver_name, config_path, get_chunk, put_chunk, delete_chunk, driver_info=None, index_stem='index', compress=False):
+def driver_config(driver_name, config_path, get_chunk, put_chunk, delete_chunk, driver_info=None, index_stem='index', compress=False,
+                  index_bucket_digits=INDEX_BUCKET_DIGITS, index_flush_interval=0):
     """
     Set up the driver.
     @get_chunk is a callable that takes (dvconf, path) as an argument and returns data
@@ -309,6 +358,10 @@ def driver_config(driver_name, config_path, get_chunk, put_chunk, delete_chunk,
 
     Neither callable should call any of the indexing methods.
 
+    @index_bucket_digits is the fan-out of a new index (16**digits pages).  Existing indexes keep theirs.
+    @index_flush_interval, if positive, defers index page uploads and batches them every so many seconds.
+    Otherwise, index writes are stored before they return (concurrent writes to a page still share uploads).
+
     Return an object that will be passed to other index routines.
     """
     return {
@@ -319,7 +372,9 @@ def driver_config(driver_name, config_path, get_chunk, put_chunk, delete_chunk,
         'delete_chunk': delete_chunk,
         'index_stem': index_stem,
         'driver_info': driver_info,
-        'compress': compress
+        'compress': compress,
+        'index_bucket_digits': index_bucket_digits,
+        'index_flush_interval': index_flush_interval,
     }
 
 
@@ -503,21 +558,12 @@ def index_setup(dvconf, force=False):
         # already set up
         return index_manifest_url
 
-    index_bucket_names = get_index_bucket_names()
-
-    if index_stem is not None:
-        fq_index_bucket_names = [normpath('/' + os.path.join(index_stem.strip('/'), p)) for p in index_bucket_names]
-    else:
-        fq_index_bucket_names = index_bucket_names
+    # forget any buffered pages of the old index
+    with INDEX_CACHE_LOCK:
+        INDEX_WRITE_BUFFERS[driver_name] = {}
 
+    # buckets get created (and added to the manifest) on their first write
     index_manifest = {}
-    for b in fq_index_bucket_names:
-        bucket_url = index_make_bucket(dvconf, b)
-        if bucket_url is None:
-            log.error("Failed to create bucket {}".format(b))
-            return False
-
-        index_manifest[b] = bucket_url
 
     # save index manifest 
     index_manifest_data = serialize_index_page(index_manifest)
@@ -726,34 +772,304 @@ def index_page_get_lock(driver_name, bucket_id):
     """
     global INDEX_CACHE_LOCKS
     index_locks_setup(driver_name)
-    return INDEX_CACHE_LOCKS[driver_name][bucket_id]
+    with INDEX_CACHE_LOCK:
+        if not INDEX_CACHE_LOCKS[driver_name].has_key(bucket_id):
+            INDEX_CACHE_LOCKS[driver_name][bucket_id] = threading.Lock()
+
+        return INDEX_CACHE_LOCKS[driver_name][bucket_id]
+
+
+class IndexPageBuffer(object):
+    """
+    In-RAM copy of one page of our own index, with buffered writes.
+
+    Updates are applied to the buffer and uploaded by whichever writer
+    flushes first.  Updates that land while an upload is in progress are
+    uploaded together by the next one, so a burst of inserts into a page
+    costs a few page uploads instead of one per insert.
+    """
+    def __init__(self, bucket_id, path, page, exists):
+        self.bucket_id = bucket_id
+        self.path = path
+        self.page = page
+        self.exists = exists        # is this page listed in the manifest?
+        self.cond = threading.Condition()
+        self.dirty_seq = 0          # sequence number of the last update
+        self.flushed_seq = 0        # last update known to be stored
+        self.failed_seq = 0         # last update whose upload failed
+        self.flushing = False
+
+
+    def update(self, name, url):
+        """
+        Set an entry, or remove it if @url is None.
+        Return the sequence number to flush up to, or None if there is nothing to store.
+        """
+        with self.cond:
+            if self.page.get(name, None) == url:
+                # no change, but it may not have been stored yet
+                return self.dirty_seq if self.dirty_seq > self.flushed_seq else None
+
+            if url is None:
+                del self.page[name]
+            else:
+                self.page[name] = url
 
+            self.dirty_seq += 1
+            return self.dirty_seq
 
-def index_insert(dvconf, name, url):
+
+    def is_dirty(self):
+        with self.cond:
+            return self.dirty_seq > self.flushed_seq
+
+
+def index_flush_page(dvconf, buf, seq=None):
     """
-    Insert a url into the index.
+    Make sure a page buffer's updates up to @seq (default: all of them) are stored.
+    If another thread is already uploading the page, wait for it, and then
+    upload whatever it did not cover in one more put.
 
     Return True on success
-    Return False if not.
+    Return False on error
     """
-    assert index_check_setup(dvconf)
+    with buf.cond:
+        if seq is None:
+            seq = buf.dirty_seq
+
+        while True:
+            if buf.flushed_seq >= seq:
+                return True
+
+            if buf.failed_seq >= seq:
+                return False
+
+            if not buf.flushing:
+                break
 
+            buf.cond.wait()
+
+        buf.flushing = True
+        target = buf.dirty_seq
+        serialized_page = serialize_index_page(buf.page)
+        exists = buf.exists
+
+    log.debug("Set index page {}".format(buf.path))
+
+    rc = False
+    try:
+        url = dvconf['put_chunk'](dvconf, serialized_page, buf.path)
+        if not url:
+            log.error("Failed to store index page {}".format(buf.path))
+
+        elif not exists:
+            # new page; add it to the manifest
+            rc = index_manifest_add_page(dvconf, buf.path, url)
+
+        else:
+            rc = True
+
+    except Exception as e:
+        if DEBUG:
+            log.exception(e)
+
+        log.error("Failed to store index page {}".format(buf.path))
+
+    with buf.cond:
+        buf.flushing = False
+        if rc:
+            buf.exists = True
+            buf.flushed_seq = max(buf.flushed_seq, target)
+        else:
+            buf.failed_seq = max(buf.failed_seq, target)
+
+        buf.cond.notify_all()
+
+    return rc
+
+
+def index_get_write_buffer(dvconf, bucket_id, path, exists):
+    """
+    Get the write buffer for one of our index pages,
+    loading the page if we haven't already.
+    Return the IndexPageBuffer on success
+    Return None on error
+    """
+    global INDEX_WRITE_BUFFERS
     driver_name = dvconf['driver_name']
-    index_stem = dvconf['index_stem']
-    
-    bucket_id = index_get_page_bucket_id(name)
-    path = index_get_page_path(name, index_stem) 
 
     with index_page_get_lock(driver_name, bucket_id):
-        index_page = index_get_cached_page(driver_name, bucket_id)
-        if index_page is None: 
-            index_page = index_get_page( dvconf, path=path )
+        with INDEX_CACHE_LOCK:
+            buf = INDEX_WRITE_BUFFERS.get(driver_name, {}).get(bucket_id, None)
+
+        if buf is not None:
+            return buf
+
+        index_page = {}
+        if exists:
+            index_page = index_get_page(dvconf, path=path)
             if index_page is None:
-                index_page = {}
+                log.error("Failed to get index page {}".format(path))
+                return None
 
-        index_page[name] = url
-        index_set_cached_page(driver_name, bucket_id, index_page, locked=True)
-        return index_set_page(dvconf, bucket_id, path, index_page)
+        buf = IndexPageBuffer(bucket_id, path, index_page, exists)
+        with INDEX_CACHE_LOCK:
+            if not INDEX_WRITE_BUFFERS.has_key(driver_name):
+                INDEX_WRITE_BUFFERS[driver_name] = {}
+
+            INDEX_WRITE_BUFFERS[driver_name][bucket_id] = buf
+
+        return buf
+
+
+def index_get_manifest_buffer(dvconf):
+    """
+    Get the write buffer for our index manifest
+    """
+    index_manifest_path = index_get_manifest_page_path(dvconf['index_stem'])
+    return index_get_write_buffer(dvconf, 'manifest', index_manifest_path, True)
+
+
+def index_get_page_buffer(dvconf, name):
+    """
+    Get the write buffer for the index page that holds @name.
+    New indexes use the driver's configured fan-out;
+    existing ones keep the fan-out they were created with.
+    Return the IndexPageBuffer on success
+    Return None on error
+    """
+    index_stem = dvconf['index_stem']
+
+    manifest_buf = index_get_manifest_buffer(dvconf)
+    if manifest_buf is None:
+        return None
+
+    with manifest_buf.cond:
+        digits = index_manifest_bucket_digits(manifest_buf.page)
+        if digits is None:
+            digits = dvconf.get('index_bucket_digits', INDEX_BUCKET_DIGITS)
+
+        bucket_id = index_get_page_bucket_id(name, digits=digits)
+        path = index_get_bucket_path(bucket_id, index_stem)
+        exists = path in manifest_buf.page
+
+    return index_get_write_buffer(dvconf, bucket_id, path, exists)
+
+
+def index_manifest_add_page(dvconf, path, url):
+    """
+    Add a new page to our index manifest, and store the manifest
+    (or schedule it to be stored, if the driver defers index writes).
+    Return True on success
+    Return False on error
+    """
+    manifest_buf = index_get_manifest_buffer(dvconf)
+    if manifest_buf is None:
+        return False
+
+    seq = manifest_buf.update(path, url)
+    index_set_cached_page(dvconf['driver_name'], 'manifest', {path: url})
+    return index_commit(dvconf, manifest_buf, seq)
+
+
+def index_commit(dvconf, buf, seq):
+    """
+    Store an update to an index page buffer, or schedule it to be stored
+    if the driver defers index writes.
+    Return True on success
+    Return False on error
+    """
+    if seq is None:
+        return True
+
+    if dvconf.get('index_flush_interval', 0) > 0:
+        index_flusher_start(dvconf)
+        return True
+
+    return index_flush_page(dvconf, buf, seq)
+
+
+def index_flush(dvconf):
+    """
+    Store all of our buffered index pages.
+    Return True if they were all stored
+    Return False if not
+    """
+    driver_name = dvconf['driver_name']
+    with INDEX_CACHE_LOCK:
+        bufs = INDEX_WRITE_BUFFERS.get(driver_name, {}).values()
+
+    # pages first, since new pages also update the manifest
+    bufs.sort(key=lambda b: b.bucket_id == 'manifest')
+
+    rc = True
+    for buf in bufs:
+        if buf.is_dirty():
+            rc = index_flush_page(dvconf, buf) and rc
+
+    return rc
+
+
+def index_flusher_start(dvconf):
+    """
+    Start a thread that stores a driver's buffered
+    index pages every dvconf['index_flush_interval'] seconds.
+    Idempotent.
+    """
+    global INDEX_FLUSHERS
+    driver_name = dvconf['driver_name']
+
+    def _flush_loop():
+        while True:
+            time.sleep(dvconf['index_flush_interval'])
+            try:
+                index_flush(dvconf)
+            except Exception as e:
+                log.exception(e)
+                log.error("Failed to flush index for {}".format(driver_name))
+
+    with INDEX_CACHE_LOCK:
+        if INDEX_FLUSHERS.has_key(driver_name):
+            return
+
+        t = threading.Thread(target=_flush_loop, name='index-flusher-{}'.format(driver_name))
+        t.daemon = True
+        t.start()
+        INDEX_FLUSHERS[driver_name] = (t, dvconf)
+
+
+@atexit.register
+def index_flush_all():
+    """
+    Store the buffered index pages of all drivers that defer index writes
+    """
+    with INDEX_CACHE_LOCK:
+        flushers = INDEX_FLUSHERS.values()
+
+    for (_, dvconf) in flushers:
+        try:
+            index_flush(dvconf)
+        except Exception as e:
+            log.exception(e)
+
+
+def index_insert(dvconf, name, url):
+    """
+    Insert a url into the index.
+
+    Return True on success
+    Return False if not.
+    """
+    assert index_check_setup(dvconf)
+
+    buf = index_get_page_buffer(dvconf, name)
+    if buf is None:
+        log.error("Failed to load index page for {}".format(name))
+        return False
+
+    seq = buf.update(name, url)
+    index_set_cached_page(dvconf['driver_name'], buf.bucket_id, {name: url})
+    return index_commit(dvconf, buf, seq)
     
 
 def index_remove( dvconf, name ):
@@ -764,27 +1080,16 @@ def index_remove( dvconf, name ):
     """
     assert index_check_setup(dvconf)
 
-    index_stem = dvconf['index_stem']
-    driver_name = dvconf['driver_name']
-
-    bucket_id = index_get_page_bucket_id(name)
-    path = index_get_page_path(name, index_stem)
-
-    with index_page_get_lock(driver_name, bucket_id):
-        index_page = index_get_cached_page(driver_name, bucket_id)
-        if index_page is None: 
-            index_page = index_get_page( dvconf, path=path )
-            if index_page is None:
-                log.error("Failed to get index page {}".format(path))
-                return False
+    buf = index_get_page_buffer(dvconf, name)
+    if buf is None:
+        log.error("Failed to load index page for {}".format(name))
+        return False
 
-        if name not in index_page:
-            # already gone
-            return True
+    seq = buf.update(name, None)
+    with index_page_get_lock(dvconf['driver_name'], buf.bucket_id):
+        index_remove_cached_page(dvconf['driver_name'], buf.bucket_id, name)
 
-        del index_page[name]
-        index_set_cached_page(driver_name, bucket_id, index_page, locked=True)
-        return index_set_page(dvconf, bucket_id, path, index_page)
+    return index_commit(dvconf, buf, seq)
 
 
 def index_cached_lookup( driver_name, name, index_stem ):
@@ -796,14 +1101,13 @@ def index_cached_lookup( driver_name, name, index_stem ):
     log.debug("Index cached lookup on {} from {}".format(name, driver_name))
 
     # if this is cached, then use the cache 
-    path = index_get_page_path(name, index_stem)
-    bucket_id = index_get_page_bucket_id(name)
     manifest_page = index_get_cached_page(driver_name, 'manifest')
 
     if manifest_page is not None:
         # cached...
         log.debug("Cache HIT on manifest")
-        if path in manifest_page.keys():
+        bucket_id, path = index_find_page_path(name, index_stem, manifest_page)
+        if path is not None:
 
             index_page = index_get_cached_page(driver_name, bucket_id)
             if index_page is not None:
@@ -821,7 +1125,7 @@ def index_cached_lookup( driver_name, name, index_stem ):
                 log.debug("Cache MISS on ({}, {} (bucket {}))".format(driver_name, path, bucket_id))
 
         else:
-            log.debug("Missing {} on manifest (from {})".format(path, driver_name))
+            log.debug("Missing page for {} on manifest (from {})".format(name, driver_name))
 
     else:
         log.debug("Cache MISS on manifest (from {})".format(driver_name))
@@ -842,12 +1146,11 @@ def index_lookup( dvconf, index_manifest_url, blockchain_id, name, index_stem='i
     log.debug("Index lookup on {} from {} via {}".format(name, blockchain_id, index_manifest_url))
 
     index_manifest_path = index_get_manifest_page_path(index_stem)
-    path = index_get_page_path(name, index_stem)
 
     fetched = {}
     
-    if manifest_page is not None and path not in manifest_page.keys():
-        log.warning("Bucket {} not in manifest".format(path))
+    if manifest_page is not None and index_find_page_path(name, index_stem, manifest_page)[1] is None:
+        log.warning("No bucket for {} in manifest".format(name))
         manifest_page = None
 
     if manifest_page is None:
@@ -859,9 +1162,10 @@ def index_lookup( dvconf, index_manifest_url, blockchain_id, name, index_stem='i
     
     fetched['manifest'] = manifest_page
     
-    if path not in manifest_page.keys():
+    bucket_id, path = index_find_page_path(name, index_stem, manifest_page)
+    if path is None:
         # not present
-        log.error("Bucket {} not in fresh manifest".format(path))
+        log.error("No bucket for {} in fresh manifest".format(name))
         if os.environ.get("BLOCKSTACK_TEST") == '1':
             log.debug("Index manifest:\n{}".format(json.dumps(manifest_page, indent=4, sort_keys=True)))
 
@@ -875,6 +1179,7 @@ def index_lookup( dvconf, index_manifest_url, blockchain_id, name, index_stem='i
 
     url = index_page.get(name, None)
     fetched['page'] = index_page
+    fetched['bucket_id'] = bucket_id
     return url, fetched
 
 
@@ -1012,8 +1317,7 @@ def _get_indexed_data_impl( dvconf, blockchain_id, name, raw=False, index_manife
         index_set_cached_page(driver_name, 'manifest', index_pages['manifest'])
 
     if index_pages.has_key('page'):
-        bucket_id = index_get_page_bucket_id(name)
-        index_set_cached_page(driver_name, bucket_id, index_pages['page'])
+        index_set_cached_page(driver_name, index_pages['bucket_id'], index_pages['page'])
 
     return data, None
 
@@ -1027,7 +1331,6 @@ def get_indexed_data(dvconf, blockchain_id, name, raw=False, index_manifest_url=
     Return None on error
     """
     driver_name = dvconf['driver_name']
-    bucket_id = index_get_page_bucket_id(name)
 
     # try cache path first
     data, pages = _get_indexed_data_impl(dvconf, blockchain_id, name, raw=raw, index_manifest_url=index_manifest_url)
@@ -1037,6 +1340,7 @@ def get_indexed_data(dvconf, blockchain_id, name, raw=False, index_manifest_url=
             log.warning("Failed to load fresh cached data when fetching {} from {}".format(name, blockchain_id))
 
             # clear index caches for this data and try again
+            bucket_id = pages.get('bucket_id', index_get_page_bucket_id(name))
             for (url, _) in pages.items():
                 index_remove_cached_page(driver_name, bucket_id, url)
 
@@ -164,6 +164,11 @@ def test_get_chunk(dvconf, path):
 
     env_setup()
 
+    # simulate a remote storage provider
+    read_latency = os.environ.get('BLOCKSTACK_INTEGRATION_TEST_STORAGE_READ_LATENCY', None)
+    if read_latency is not None:
+        time.sleep(float(read_latency))
+
     parts = path.split('?')
     disk_root = None
 
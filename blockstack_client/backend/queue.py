@@ -39,8 +39,11 @@ CREATE TABLE entries( fqu STRING NOT NULL,
                       tx_hash TEXT NOT NULL,
                       data NOT NULL,
                       PRIMARY KEY(fqu,queue_id) );
+CREATE INDEX entries_queue_id ON entries(queue_id);
 """
 
+QUEUE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS entries_queue_id ON entries(queue_id);"
+
 ERROR_SQL = """
 CREATE TABLE entry_errs( fqu STRING NOT NULL,
                          queue_id STRING NOT NULL,
@@ -54,6 +57,44 @@ log = get_logger()
 
 DB_SERIALIZE_LOCK = threading.Lock()
 
+# callbacks to run when an entry is enqueued
+QUEUE_LISTENERS = []
+QUEUE_LISTENERS_LOCK = threading.Lock()
+
+
+def queue_add_listener( func ):
+    """
+    Call func(queue_id, fqu) whenever an entry is enqueued
+    """
+    with QUEUE_LISTENERS_LOCK:
+        if func not in QUEUE_LISTENERS:
+            QUEUE_LISTENERS.append(func)
+
+
+def queue_remove_listener( func ):
+    """
+    Stop calling func on enqueue
+    """
+    with QUEUE_LISTENERS_LOCK:
+        if func in QUEUE_LISTENERS:
+            QUEUE_LISTENERS.remove(func)
+
+
+def queue_notify_listeners( queue_id, fqu ):
+    """
+    Tell the listeners about a new entry.
+    Listener errors are logged, not raised.
+    """
+    with QUEUE_LISTENERS_LOCK:
+        listeners = QUEUE_LISTENERS[:]
+
+    for func in listeners:
+        try:
+            func(queue_id, fqu)
+        except Exception as e:
+            log.exception(e)
+
+
 def queuedb_create( path ):
     """
     Create a sqlite3 db at the given path.
@@ -90,6 +131,14 @@ def conditionally_create_err_table( sql_conn ):
     sql_conn.execute(lines[0])
 
 
+def conditionally_create_queue_index( sql_conn ):
+    """
+    Creates the index over queue IDs,
+    if it doesn't already exist.
+    """
+    sql_conn.execute(QUEUE_INDEX_SQL)
+
+
 def queuedb_open( path ):
     """
     Open a connection to our database 
@@ -101,6 +150,7 @@ def queuedb_open( path ):
         else:
             con = sqlite3.connect( path, isolation_level=None )
             conditionally_create_err_table( con )
+            conditionally_create_queue_index( con )
             con.row_factory = queuedb_row_factory
         return con
 
@@ -242,14 +292,26 @@ def queue_get_error_msgs( queue_id, fqu, path=DEFAULT_QUEUE_PATH ):
     return ret
 
 
-def queuedb_findall( queue_id, limit=None, path=DEFAULT_QUEUE_PATH ):
+def queuedb_findall( queue_id, limit=None, after_rowid=None, path=DEFAULT_QUEUE_PATH ):
     """
     Get all queued entries
+    If @after_rowid is given, only get the ones added after that row
+    (in insertion order, and with their 'rowid's).
     Return the rows on success (empty list if not found)
     Raise on error
     """
-    sql = "SELECT * FROM entries WHERE queue_id = ?;"
+    sql = "SELECT * FROM entries WHERE queue_id = ?"
     args = (queue_id,)
+
+    if after_rowid is not None:
+        sql = "SELECT rowid, * FROM entries WHERE queue_id = ? AND rowid > ? ORDER BY rowid"
+        args = (queue_id, after_rowid)
+
+    if limit is not None:
+        sql += " LIMIT ?"
+        args += (limit,)
+
+    sql += ";"
     
     db = queuedb_open(path)
     if db is None:
@@ -274,6 +336,33 @@ def queuedb_findall( queue_id, limit=None, path=DEFAULT_QUEUE_PATH ):
     return ret
 
 
+def queuedb_oldest( queue_id, path=DEFAULT_QUEUE_PATH ):
+    """
+    Get the earliest-added entry in a queue
+    Return the row on success
+    Return None if the queue is empty
+    Raise on error
+    """
+    sql = "SELECT * FROM entries WHERE queue_id = ? ORDER BY rowid LIMIT 1;"
+    args = (queue_id,)
+
+    db = queuedb_open(path)
+    if db is None:
+        raise Exception("Failed to open %s" % path)
+
+    cur = db.cursor()
+    rows = queuedb_query_execute( cur, sql, args )
+
+    ret = None
+    for row in rows:
+        ret = {}
+        ret.update(row)
+
+    db.commit()
+    db.close()
+    return ret
+
+
 def queuedb_insert( queue_id, fqu, tx_hash, data_json, path=DEFAULT_QUEUE_PATH ):
     """
     Insert an element into a queue
@@ -292,6 +381,8 @@ def queuedb_insert( queue_id, fqu, tx_hash, data_json, path=DEFAULT_QUEUE_PATH )
 
     db.commit()
     db.close()
+
+    queue_notify_listeners(queue_id, fqu)
     return True
 
 
@@ -316,6 +407,56 @@ def queuedb_remove( queue_id, fqu, tx_hash, path=DEFAULT_QUEUE_PATH ):
     return True
 
 
+def queuedb_remove_batch( rows, path=DEFAULT_QUEUE_PATH ):
+    """
+    Remove a batch of elements, and their error messages,
+    from their queues in a single transaction.
+    @rows is a list of (queue_id, fqu, tx_hash)
+    Return True on success
+    Raise on error
+    """
+    if len(rows) == 0:
+        return True
+
+    entry_sql = "DELETE FROM entries WHERE queue_id = ? AND fqu = ? AND tx_hash = ?;"
+    err_sql = "DELETE FROM entry_errs WHERE fqu = ? AND queue_id = ?;"
+
+    db = queuedb_open(path)
+    if db is None:
+        raise Exception("Failed to open %s" % path)
+
+    cur = db.cursor()
+    queuedb_query_execute( cur, "BEGIN;", () )
+    for (queue_id, fqu, tx_hash) in rows:
+        queuedb_query_execute( cur, entry_sql, (queue_id, fqu, tx_hash) )
+        queuedb_query_execute( cur, err_sql, (fqu, queue_id) )
+
+    queuedb_query_execute( cur, "COMMIT;", () )
+    db.close()
+    return True
+
+
+def queuedb_count( queue_id, path=DEFAULT_QUEUE_PATH ):
+    """
+    Count the entries in a queue
+    Raise on error
+    """
+    sql = "SELECT COUNT(*) AS count FROM entries WHERE queue_id = ?;"
+    args = (queue_id,)
+
+    db = queuedb_open(path)
+    if db is None:
+        raise Exception("Failed to open %s" % path)
+
+    cur = db.cursor()
+    rows = queuedb_query_execute( cur, sql, args )
+    count = rows.fetchone()['count']
+
+    db.commit()
+    db.close()
+    return count
+
+
 def in_queue( queue_id, fqu, path=DEFAULT_QUEUE_PATH ):
     """
     Is this name already in the given queue?
@@ -386,6 +527,7 @@ def queue_append(queue_id, fqu, tx_hash, payment_address=None,
         new_entry['zonefile_hash'] = zonefile_hash
 
     new_entry['replicated_zonefile'] = False
+    new_entry['queued_at'] = time.time()
 
     queuedb_insert( queue_id, fqu, tx_hash, new_entry, path=path )
     return True
@@ -522,14 +664,13 @@ def queue_findall( queue_id, limit=None, path=DEFAULT_QUEUE_PATH ):
 
 def queue_removeall( entries, path=DEFAULT_QUEUE_PATH ):
     """
-    Remove all given entries form their given queues
+    Remove all given entries form their given queues,
+    along with their error messages
     """
-    for entry in entries:
-        rc = queuedb_remove( entry['type'], entry['fqu'], entry['tx_hash'], path=path )
-        if not rc:
-            raise Exception("Failed to remove %s.%s.%s" % (entry['type'], entry['fqu'], entry['tx_hash']))
-        # also clear out information about errors
-        queue_clear_error_msg( entry['type'], entry['fqu'], path=path )
+    rows = [(entry['type'], entry['fqu'], entry['tx_hash']) for entry in entries]
+    rc = queuedb_remove_batch( rows, path=path )
+    if not rc:
+        raise Exception("Failed to remove %s" % ", ".join(".".join(r) for r in rows))
 
     return True
 
@@ -549,6 +690,13 @@ def queue_find_accepted( queue_id, path=DEFAULT_QUEUE_PATH, config_path=CONFIG_P
     return accepted
 
 
+def queue_count( queue_id, path=DEFAULT_QUEUE_PATH ):
+    """
+    Get the number of entries in a queue
+    """
+    return queuedb_count( queue_id, path=path )
+
+
 def queue_findone( queue_id, fqu, path=DEFAULT_QUEUE_PATH ):
     """
     Find one instance of a name
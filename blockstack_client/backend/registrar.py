@@ -22,7 +22,6 @@
 """
 
 import os
-import random
 import base64
 import copy
 
@@ -45,10 +44,13 @@ from virtualchain.lib.ecdsalib import ecdsa_private_key
 from .queue import get_queue_state, in_queue, cleanup_preorder_queue, queue_removeall
 from .queue import queue_find_accepted, queuedb_find
 from .queue import queue_add_error_msg, queue_set_data
+from .queue import queue_add_listener, queue_remove_listener
+from .scheduler import RegistrarScheduler
+from .blockchain import get_block_height
 
 from .nameops import async_preorder, async_register, async_update, async_transfer, async_renew, async_revoke
 
-from ..keys import get_data_privkey_info, is_singlesig_hex
+from ..keys import get_data_privkey_info, is_singlesig_hex, clear_derived_keys
 from ..proxy import is_name_registered, is_zonefile_hash_current, get_default_proxy, get_name_blockchain_record, get_atlas_peers, json_is_error
 from ..zonefile import zonefile_data_replicate
 from ..user import is_user_zonefile
@@ -57,6 +59,7 @@ from ..profile import set_profile_timestamp
 
 from ..constants import CONFIG_PATH, DEFAULT_QUEUE_PATH, BLOCKSTACK_DEBUG, BLOCKSTACK_TEST, TX_MIN_CONFIRMATIONS
 from ..constants import PREORDER_CONFIRMATIONS
+from ..constants import REGISTRAR_STAGE_CONCURRENCY, REGISTRAR_BLOCK_CHECK_INTERVAL
 from ..constants import get_secret
 
 from ..config import get_config
@@ -173,6 +176,12 @@ class RegistrarWorker(threading.Thread):
         self.api_port = api_port
         self.running = True
         self.lockfile_path = None
+        self.scheduler = None
+        self.atlas_servers = None
+
+        # stages that send transactions share the wallet's UTXOs, so they take turns
+        self.tx_lock = threading.Lock()
+
         self.required_storage_drivers = storage_drivers_required_write
         if self.required_storage_drivers is None:
             self.required_storage_drivers = storage_drivers.split(",")
@@ -306,32 +315,47 @@ class RegistrarWorker(threading.Thread):
         ret = {'status': True}
         registers = cls.get_confirmed_registers( config_path, queue_path )
         for register in registers:
+            res = cls.finish_register( register, proxy=proxy, config_path=config_path, queue_path=queue_path )
+            if 'error' in res:
+                ret = {'error': 'Failed to set up name profile'}
 
-            # already migrated?
-            if in_queue("update", register['fqu'], path=queue_path):
-                log.warn("Already initialized profile for name '%s'" % register['fqu'])
-                queue_removeall( [register], path=queue_path )
-                continue
+        return ret
 
-            # already sent zone file hash as part of a combined register/update?
-            if register.has_key('is_regup') and register['is_regup']:
-                log.warn("Skipping register/update on {}".format(register['fqu']))
-                continue
 
-            log.debug("Register for '%s' (%s) is confirmed!" % (register['fqu'], register['tx_hash']))
-            res = cls.set_zonefile( register, proxy=proxy, queue_path=queue_path, config_path=config_path )
-            if 'error' in res:
-                queue_add_error_msg('register', register['fqu'], res['error'], path=queue_path)
+    @classmethod
+    def finish_register( cls, register, proxy=None, config_path=CONFIG_PATH, queue_path=DEFAULT_QUEUE_PATH ):
+        """
+        Given a confirmed registration, create an empty zonefile for it and broadcast its hash to the blockchain.
+        Queue up the zonefile and profile for subsequent replication.
+        Return {'status': True} on success
+        Return {'error': ...} on failure
+        """
+        if proxy is None:
+            proxy = get_default_proxy(config_path=config_path)
 
-                log.error("Failed to make name profile for %s: %s" % (register['fqu'], res['error']))
-                ret = {'error': 'Failed to set up name profile'}
+        # already migrated?
+        if in_queue("update", register['fqu'], path=queue_path):
+            log.warn("Already initialized profile for name '%s'" % register['fqu'])
+            queue_removeall( [register], path=queue_path )
+            return {'status': True}
 
-            else:
-                # success!
-                log.debug("Sent update for '%s'" % register['fqu'])
-                queue_removeall( [register], path=queue_path )
+        # already sent zone file hash as part of a combined register/update?
+        if register.has_key('is_regup') and register['is_regup']:
+            log.warn("Skipping register/update on {}".format(register['fqu']))
+            return {'status': True}
 
-        return ret
+        log.debug("Register for '%s' (%s) is confirmed!" % (register['fqu'], register['tx_hash']))
+        res = cls.set_zonefile( register, proxy=proxy, queue_path=queue_path, config_path=config_path )
+        if 'error' in res:
+            queue_add_error_msg('register', register['fqu'], res['error'], path=queue_path)
+
+            log.error("Failed to make name profile for %s: %s" % (register['fqu'], res['error']))
+            return {'error': 'Failed to set up name profile'}
+
+        # success!
+        log.debug("Sent update for '%s'" % register['fqu'])
+        queue_removeall( [register], path=queue_path )
+        return {'status': True}
 
 
     @classmethod
@@ -408,32 +432,12 @@ class RegistrarWorker(threading.Thread):
         succeeded_names = []
 
         for preorder in preorders:
-
-            log.debug("Preorder for '%s' (%s) is confirmed!" % (preorder['fqu'], preorder['tx_hash']))
-
-            # did we already register?
-            if in_queue("register", preorder['fqu'], path=queue_path):
-                log.warn("Already queued name '%s' for registration" % preorder['fqu'])
-                queue_removeall( [preorder], path=queue_path )
-                continue
-
-            res = cls.register_preordered_name( preorder, wallet_data['payment_privkey'], wallet_data['owner_privkey'], proxy=proxy, config_path=config_path, queue_path=queue_path )
+            res = cls.register_preorder( preorder, wallet_data, proxy=proxy, config_path=config_path, queue_path=queue_path )
             if 'error' in res:
-                if res.get('already_registered'):
-                    # can clear out, this is a dup
-                    log.debug("%s is already registered!" % preorder['fqu'])
-                    queue_removeall( [preorder], path=queue_path )
-
-                else:
-                    log.error("Failed to register preordered name %s: %s" % (preorder['fqu'], res['error']))
-                    queue_add_error_msg('preorder', preorder['fqu'], res['error'], path=queue_path)
+                ret = {'error': 'Failed to preorder a name'} 
+                failed_names.append(preorder['fqu'])
 
-                    ret = {'error': 'Failed to preorder a name'} 
-                    failed_names.append(preorder['fqu'])
-            else:
-                # clear 
-                log.debug("Sent register for %s" % preorder['fqu'] )
-                queue_removeall( [preorder], path=queue_path )
+            elif res['registered']:
                 succeeded_names.append(preorder['fqu'])
 
         ret['names'] = succeeded_names
@@ -444,6 +448,42 @@ class RegistrarWorker(threading.Thread):
         return ret
 
 
+    @classmethod
+    def register_preorder( cls, preorder, wallet_data, proxy=None, config_path=CONFIG_PATH, queue_path=DEFAULT_QUEUE_PATH ):
+        """
+        Given a confirmed preorder, register it.
+        Return {'status': True, 'registered': True|False} on success.  'registered' is False if there was nothing to do.
+        Return {'error': ...} on error
+        """
+        if proxy is None:
+            proxy = get_default_proxy(config_path=config_path)
+
+        log.debug("Preorder for '%s' (%s) is confirmed!" % (preorder['fqu'], preorder['tx_hash']))
+
+        # did we already register?
+        if in_queue("register", preorder['fqu'], path=queue_path):
+            log.warn("Already queued name '%s' for registration" % preorder['fqu'])
+            queue_removeall( [preorder], path=queue_path )
+            return {'status': True, 'registered': False}
+
+        res = cls.register_preordered_name( preorder, wallet_data['payment_privkey'], wallet_data['owner_privkey'], proxy=proxy, config_path=config_path, queue_path=queue_path )
+        if 'error' in res:
+            if res.get('already_registered'):
+                # can clear out, this is a dup
+                log.debug("%s is already registered!" % preorder['fqu'])
+                queue_removeall( [preorder], path=queue_path )
+                return {'status': True, 'registered': False}
+
+            log.error("Failed to register preordered name %s: %s" % (preorder['fqu'], res['error']))
+            queue_add_error_msg('preorder', preorder['fqu'], res['error'], path=queue_path)
+            return {'error': 'Failed to preorder a name'}
+
+        # clear 
+        log.debug("Sent register for %s" % preorder['fqu'] )
+        queue_removeall( [preorder], path=queue_path )
+        return {'status': True, 'registered': True}
+
+
     @classmethod
     def clear_confirmed( cls, config_path, queue_path, proxy=None ):
         """
@@ -601,11 +641,8 @@ class RegistrarWorker(threading.Thread):
                 log.debug("Skipping name {}".format(update['fqu']))
                 continue
 
-            log.debug("Zone file update on '%s' (%s) is confirmed!  New hash is %s" % (update['fqu'], update['tx_hash'], update.get('zonefile_hash', None)))
-            res = cls.replicate_name_data( update, atlas_servers, wallet_data, storage_drivers, config_path, queue_path, proxy=proxy )
+            res = cls.replicate_queued_name( update, atlas_servers, wallet_data, storage_drivers, config_path=config_path, queue_path=queue_path, proxy=proxy )
             if 'error' in res:
-                log.error("Failed to replicate zone file and/or profile for %s: %s" % (update['fqu'], res['error']))
-                queue_add_error_msg(update['type'], update['fqu'], res['error'], path=queue_path)
                 ret = {'error': 'Failed to finish an update'}
                 failed_names.append( update['fqu'] )
 
@@ -615,6 +652,27 @@ class RegistrarWorker(threading.Thread):
         return ret
 
 
+    @classmethod
+    def replicate_queued_name( cls, update, atlas_servers, wallet_data, storage_drivers, config_path=CONFIG_PATH, queue_path=DEFAULT_QUEUE_PATH, proxy=None ):
+        """
+        Replicate the zonefile and profile for a confirmed update, registration, renewal, or name import.
+        Record the error in the queue on failure.
+
+        Do NOT remove the item from the queue.
+
+        Return {'status': True} on success
+        Return {'error': ...} on failure
+        """
+        log.debug("Zone file update on '%s' (%s) is confirmed!  New hash is %s" % (update['fqu'], update['tx_hash'], update.get('zonefile_hash', None)))
+        res = cls.replicate_name_data( update, atlas_servers, wallet_data, storage_drivers, config_path, queue_path, proxy=proxy )
+        if 'error' in res:
+            log.error("Failed to replicate zone file and/or profile for %s: %s" % (update['fqu'], res['error']))
+            queue_add_error_msg(update['type'], update['fqu'], res['error'], path=queue_path)
+            return {'error': 'Failed to finish an update'}
+
+        return {'status': True}
+
+
     @classmethod
     def replicate_update_data( cls, queue_path, wallet_data, storage_drivers, skip=[], config_path=CONFIG_PATH, proxy=None ):
         """
@@ -713,52 +771,72 @@ class RegistrarWorker(threading.Thread):
                 log.debug("Skipping {}".format(update['fqu']))
                 continue
 
-            if update.get("transfer_address") is not None:
-                # let's see if the name already got there!
-                name_rec = get_name_blockchain_record( update['fqu'], proxy=proxy )
-                if 'address' in name_rec:
-                    log.debug("{} updated, current owner : {}, transfer owner : {}".format(
-                        update['fqu'], name_rec['address'], update['transfer_address']))
+            res = cls.transfer_name( update, config_path=config_path, queue_path=queue_path, proxy=proxy )
+            if 'error' in res:
+                ret = {'error': 'Not all names transferred'}
+                failed.append(update['fqu'])
 
-                if 'address' in name_rec and update['transfer_address'] and virtualchain.address_reencode(str(name_rec['address'])) == virtualchain.address_reencode(str(update['transfer_address'])):
-                    log.debug("Requested Transfer {} to {} is owned by {} already. Declaring victory.".format(
-                        update['fqu'], update['transfer_address'], name_rec['address']))
+        if 'error' in ret:
+            ret['names'] = failed
 
-                    res = { 'success' : True }
+        return ret
 
-                else:
-                    log.debug("Transfer {} to {}".format(update['fqu'], update['transfer_address']))
 
-                    res = transfer( update['fqu'], update['transfer_address'], config_path=config_path, proxy=proxy )
+    @classmethod
+    def transfer_name( cls, update, config_path=CONFIG_PATH, queue_path=DEFAULT_QUEUE_PATH, proxy=None ):
+        """
+        Given a confirmed update or regup, transfer the name if it has a transfer address.
+        Otherwise, clear it from the queue if its zonefile has been replicated.
+
+        Return {'status': True} on success ('retry' is set if the zonefile has yet to be replicated)
+        Return {'error': ...} on failure
+        """
+        if proxy is None:
+            proxy = get_default_proxy(config_path=config_path)
 
-                assert 'success' in res
+        if update.get("transfer_address") is not None:
+            # let's see if the name already got there!
+            name_rec = get_name_blockchain_record( update['fqu'], proxy=proxy )
+            if 'address' in name_rec:
+                log.debug("{} updated, current owner : {}, transfer owner : {}".format(
+                    update['fqu'], name_rec['address'], update['transfer_address']))
 
-                if res['success']:
-                    # clear from update queue
-                    log.debug("Clearing successful transfer of {} to {} from update queue".format(update['fqu'], update['transfer_address']))
-                    queue_removeall( [update], path=queue_path )
+            if 'address' in name_rec and update['transfer_address'] and virtualchain.address_reencode(str(name_rec['address'])) == virtualchain.address_reencode(str(update['transfer_address'])):
+                log.debug("Requested Transfer {} to {} is owned by {} already. Declaring victory.".format(
+                    update['fqu'], update['transfer_address'], name_rec['address']))
 
-                else:
-                    # will try again
-                    log.error("Failed to transfer {} to {}: {}".format(update['fqu'], update['transfer_address'], res.get('error')))
-                    queue_add_error_msg('update', update['fqu'], res.get('error'), path=queue_path)
-                    ret = {'error': 'Not all names transferred'}
-                    failed.append(update['fqu'])
+                res = { 'success' : True }
 
             else:
-                # nothing more to do, unless we have a zonefile to replicate still 
-                if update.has_key('replicated_zonefile') and not update['replicated_zonefile'] and update.has_key('zonefile') and update['zonefile']:
-                    log.debug("Do not clear {} ({}) just yet--it still has a zonefile to replicate".format(update['fqu'], update['tx_hash']))
+                log.debug("Transfer {} to {}".format(update['fqu'], update['transfer_address']))
 
-                else:
-                    log.debug("Done working on {}".format(update['fqu']))
-                    log.debug("Final name output: {}".format(update))
-                    queue_removeall( [update], path=queue_path )
+                res = transfer( update['fqu'], update['transfer_address'], config_path=config_path, proxy=proxy )
 
-        if 'error' in ret:
-            ret['names'] = failed
+            assert 'success' in res
 
-        return ret
+            if res['success']:
+                # clear from update queue
+                log.debug("Clearing successful transfer of {} to {} from update queue".format(update['fqu'], update['transfer_address']))
+                queue_removeall( [update], path=queue_path )
+
+            else:
+                # will try again
+                log.error("Failed to transfer {} to {}: {}".format(update['fqu'], update['transfer_address'], res.get('error')))
+                queue_add_error_msg('update', update['fqu'], res.get('error'), path=queue_path)
+                return {'error': 'Failed to transfer {}'.format(update['fqu'])}
+
+        else:
+            # nothing more to do, unless we have a zonefile to replicate still 
+            if update.has_key('replicated_zonefile') and not update['replicated_zonefile'] and update.has_key('zonefile') and update['zonefile']:
+                log.debug("Do not clear {} ({}) just yet--it still has a zonefile to replicate".format(update['fqu'], update['tx_hash']))
+                return {'status': True, 'retry': True}
+
+            else:
+                log.debug("Done working on {}".format(update['fqu']))
+                log.debug("Final name output: {}".format(update))
+                queue_removeall( [update], path=queue_path )
+
+        return {'status': True}
 
 
     @classmethod
@@ -802,6 +880,139 @@ class RegistrarWorker(threading.Thread):
         return [url_to_host_port(hp) for hp in servers]
 
 
+    def get_wallet_data(self):
+        """
+        Get the wallet keys for a stage to use.
+        Return the wallet on success
+        Return {'error': ...} if the wallet is not set
+        """
+        wallet_data = get_wallet( config_path=self.config_path, proxy=get_default_proxy(config_path=self.config_path) )
+        if 'error' in wallet_data or wallet_data['owner_address'] is None:
+            return {'error': 'Wallet is not set'}
+
+        return wallet_data
+
+
+    def make_stage_finder(self, fault_injection_env, find_func, refresh_atlas_servers=False):
+        """
+        Make a function that finds the entries ready for a stage.
+        It finds nothing if the stage is disabled by fault injection.
+        """
+        def _find_entries():
+            if os.environ.get(fault_injection_env, '0') == '1':
+                log.debug("Skipping stage due to injected fault ({})".format(fault_injection_env))
+                return []
+
+            entries = find_func( self.config_path, self.queue_path )
+            if refresh_atlas_servers and len(entries) > 0:
+                # fetch once per scan, not once per name
+                self.atlas_servers = RegistrarWorker.get_atlas_server_list( self.config_path )
+
+            return entries
+
+        return _find_entries
+
+
+    def process_preorder(self, preorder):
+        """
+        Scheduler stage: send the register for a confirmed preorder
+        """
+        wallet_data = self.get_wallet_data()
+        if 'error' in wallet_data:
+            return wallet_data
+
+        with self.tx_lock:
+            return RegistrarWorker.register_preorder( preorder, wallet_data, config_path=self.config_path, queue_path=self.queue_path )
+
+
+    def process_register(self, register):
+        """
+        Scheduler stage: send the zonefile hash for a confirmed register
+        """
+        with self.tx_lock:
+            return RegistrarWorker.finish_register( register, config_path=self.config_path, queue_path=self.queue_path )
+
+
+    def process_replication(self, update):
+        """
+        Scheduler stage: replicate the zonefile and profile for a confirmed operation
+        """
+        atlas_servers = self.atlas_servers
+        if atlas_servers is None or 'error' in atlas_servers:
+            return {'error': 'Failed to get Atlas server list'}
+
+        wallet_data = self.get_wallet_data()
+        if 'error' in wallet_data:
+            return wallet_data
+
+        return RegistrarWorker.replicate_queued_name( update, atlas_servers, wallet_data, self.required_storage_drivers, config_path=self.config_path, queue_path=self.queue_path )
+
+
+    def process_transfer(self, update):
+        """
+        Scheduler stage: transfer or clear out a confirmed update
+        """
+        with self.tx_lock:
+            return RegistrarWorker.transfer_name( update, config_path=self.config_path, queue_path=self.queue_path )
+
+
+    def clear_confirmed_sweep(self):
+        """
+        Scheduler sweep: clear out finished operations
+        """
+        if os.environ.get("BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_CLEAR_CONFIRMED", '0') == '1':
+            log.debug("Skipping clear_confirmed due to injected fault")
+            return {'status': True}
+
+        return RegistrarWorker.clear_confirmed( self.config_path, self.queue_path )
+
+
+    def make_scheduler(self):
+        """
+        Set up the queue stages, in the order in which a name goes through them.
+        Stages that send transactions take turns on the wallet; replication runs in parallel.
+        """
+        def _find_registers(config_path, queue_path):
+            registers = RegistrarWorker.get_confirmed_registers(config_path, queue_path)
+            return filter(lambda reg: not reg.get('is_regup'), registers)
+
+        def _find_transfers(config_path, queue_path):
+            updates = RegistrarWorker.get_confirmed_updates(config_path, queue_path)
+            registers = RegistrarWorker.get_confirmed_registers(config_path, queue_path)
+            return updates + filter(lambda reg: reg.get('is_regup'), registers)
+
+        def _get_block_height():
+            return get_block_height(config_path=self.config_path)
+
+        scheduler = RegistrarScheduler(poll_interval=self.poll_interval, block_check_interval=REGISTRAR_BLOCK_CHECK_INTERVAL, get_block_height=_get_block_height)
+
+        stages = [
+            ('preorders', 'BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_PREORDERS', RegistrarWorker.get_confirmed_preorders, self.process_preorder, 1, False),
+            ('registers', 'BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_UPDATES', _find_registers, self.process_register, 1, False),
+            ('replicate_registers', 'BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_REGUP_REPLICATION', RegistrarWorker.get_confirmed_registers, self.process_replication, REGISTRAR_STAGE_CONCURRENCY, True),
+            ('replicate_updates', 'BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_UPDATE_REPLICATION', RegistrarWorker.get_confirmed_updates, self.process_replication, REGISTRAR_STAGE_CONCURRENCY, True),
+            ('replicate_renewals', 'BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_RENEWAL_REPLICATION', RegistrarWorker.get_confirmed_renewals, self.process_replication, REGISTRAR_STAGE_CONCURRENCY, True),
+            ('transfers', 'BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_TRANSFER_NAMES', _find_transfers, self.process_transfer, 1, False),
+            ('replicate_name_imports', 'BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_IMPORT_REPLICATION', RegistrarWorker.get_confirmed_name_imports, self.process_replication, REGISTRAR_STAGE_CONCURRENCY, True),
+        ]
+
+        for (stage_id, fault_injection_env, find_func, process_func, concurrency, refresh_atlas_servers) in stages:
+            scheduler.add_stage(stage_id, self.make_stage_finder(fault_injection_env, find_func, refresh_atlas_servers=refresh_atlas_servers), process_func, concurrency=concurrency)
+
+        scheduler.add_sweep('clear_confirmed', self.clear_confirmed_sweep)
+        return scheduler
+
+
+    def get_metrics(self):
+        """
+        Get the scheduler's per-stage backlog and latency metrics
+        """
+        if self.scheduler is None:
+            return {'error': 'Registrar is not running'}
+
+        return self.scheduler.get_metrics()
+
+
     def cleanup_lockfile(self, path):
         """
         Remove a lockfile (exit handler)
@@ -894,11 +1105,8 @@ class RegistrarWorker(threading.Thread):
         Watch the various queues:
         * if we find an accepted preorder, send the accompanying register
         * if we find an accepted update, replicate the accompanying zonefile
+        With @once, stop once there is nothing left to do.
         """
-        failed = False
-        poll_interval = self.poll_interval
-        failed_names = []
-
         log.info("Registrar worker entered")
 
         # set up a lockfile
@@ -940,202 +1148,38 @@ class RegistrarWorker(threading.Thread):
 
         log.debug("Registrar worker starting up")
 
-        is_backing_off = False
-        while self.running:
-
-            failed = False
-            wallet_data = None
+        try:
             proxy = get_default_proxy( config_path=self.config_path )
-            failed_names = []
+            wallet_data = get_wallet( config_path=self.config_path, proxy=proxy )
 
-            try:
+            # wait until the owner address is set
+            while ('error' in wallet_data or wallet_data['owner_address'] is None) and self.running:
+                log.debug("Owner address not set... (%s)" % wallet_data.get("error", ""))
                 wallet_data = get_wallet( config_path=self.config_path, proxy=proxy )
+                time.sleep(1.0)
 
-                # wait until the owner address is set
-                while ('error' in wallet_data or wallet_data['owner_address'] is None) and self.running:
-                    log.debug("Owner address not set... (%s)" % wallet_data.get("error", ""))
-                    wallet_data = get_wallet( config_path=self.config_path, proxy=proxy )
-                    time.sleep(1.0)
-
-                # preemption point
-                if not self.running:
-                    break
-
-            except Exception, e:
-                log.exception(e)
-                break
-                poll_interval = 1.0
-
-            if os.environ.get("BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_PREORDERS", '0') != '1':
-                try:
-                    # see if we can complete any registrations
-                    # clear out any confirmed preorders
-                    # log.debug("register all pending preorders in %s" % (self.queue_path))
-                    res = RegistrarWorker.register_preorders( self.queue_path, wallet_data, config_path=self.config_path, proxy=proxy )
-                    if 'error' in res:
-                        log.warn("Registration failed: %s" % res['error'])
-
-                        # try exponential backoff
-                        failed = True
-
-                except Exception, e:
-                    log.exception(e)
-                    failed = True
-
-            else:
-                log.debug("Skipping register_preorders step due to injected fault")
-
-            if os.environ.get("BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_UPDATES", '0') != '1':
-                try:
-                    # see if we can put any zonefiles via NAME_UPDATE
-                    # clear out any confirmed registers
-                    # log.debug("put zonefile hashes for registered names in %s" % (self.queue_path))
-                    res = RegistrarWorker.set_zonefiles( self.queue_path, config_path=self.config_path, proxy=proxy )
-                    if 'error' in res:
-                        log.warn('zonefile hash broadcast failed: %s' % res['error'])
-
-                        failed = True
-
-                except Exception, e:
-                    log.exception(e)
-                    failed = True
-            else:
-                log.debug("Skipping set_zonefiles step due to injected fault")
-
-            if os.environ.get("BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_REGUP_REPLICATION", '0') != '1':
-                try:
-                    # see if we can replicate any zonefiles and key files for confirmed NAME_REGISTERs with zone file hashes (post F-day 2017)
-                    # clear out any confirmed registers
-                    # log.debug("replicate all pending zone files and key files for register/updates %s" % (self.queue_path))
-                    res = RegistrarWorker.replicate_register_data( self.queue_path, wallet_data, self.required_storage_drivers, config_path=self.config_path, proxy=proxy )
-                    if 'error' in res:
-                        log.warn("Zone file/key file replication failed for register: %s" % res['error'])
-
-                        failed = True
-                        failed_names += res['names']
-
-                except Exception, e:
-                    log.exception(e)
-                    failed = True
-            else:
-                log.debug("Skipping replicate_register_data step due to injected fault")
-
-            if os.environ.get("BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_UPDATE_REPLICATION", '0') != '1':
-                try:
-                    # see if we can replicate any zonefiles and key files for confirmed NAME_UPDATEs
-                    # clear out any confirmed updates
-                    # log.debug("replicate all pending zone files and profiles for updates %s" % (self.queue_path))
-                    res = RegistrarWorker.replicate_update_data( self.queue_path, wallet_data, self.required_storage_drivers, config_path=self.config_path, proxy=proxy )
-                    if 'error' in res:
-                        log.warn("Zone file/profile replication failed for update: %s" % res['error'])
-
-                        failed = True
-                        failed_names += res['names']
-
-                except Exception, e:
-                    log.exception(e)
-                    failed = True
-            else:
-                log.debug("Skipping replicate_update_data step due to injected fault")
-
-            if os.environ.get("BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_RENEWAL_REPLICATION", '0') != '1':
-                try:
-                    # see if we can replicate any zonefiles and key files for confirmed NAME_RENEWs (post F-day 2017)
-                    # clear out any confirmed renewals
-                    # log.debug("replicate all pending zone files and key files for renewals %s" % (self.queue_path))
-                    res = RegistrarWorker.replicate_renewal_data( self.queue_path, wallet_data, self.required_storage_drivers, config_path=self.config_path, proxy=proxy )
-                    if 'error' in res:
-                        log.warn("Zone file/key file replication failed for renewal: %s" % res['error'])
-
-                        failed = True
-                        failed_names += res['names']
-
-                except Exception, e:
-                    log.exception(e)
-                    failed = True
-            else:
-                log.debug("Skipping replicate_renewal_data step due to injected fault")
-
-            if os.environ.get("BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_TRANSFER_NAMES", '0') != '1':
-                try:
-                    # see if we can transfer any names to their new owners
-                    # log.debug("transfer all names in {}".format(self.queue_path))
-                    res = RegistrarWorker.transfer_names( self.queue_path, skip=failed_names, config_path=self.config_path, proxy=proxy )
-                    if 'error' in res:
-                        log.warn("Transfer failed: {}".format(res['error']))
-
-                        failed = True
-                        failed_names += res['names']
-
-                except Exception as e:
-                    log.exception(e)
-                    failed = True
-            else:
-                log.debug("Skipping replicate_renewal_data step due to injected fault")
-
-            if os.environ.get("BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_IMPORT_REPLICATION", '0') != '1':
-                try:
-                    # see if we can replicate any zonefiles for name imports
-                    # clear out any confirmed imports
-                    # log.debug("replicate all pending zone files for name imports in {}".format(self.queue_path))
-                    res = RegistrarWorker.replicate_name_import_data( self.queue_path, wallet_data, self.required_storage_drivers, skip=failed_names, config_path=self.config_path, proxy=proxy )
-                    if 'error' in res:
-                        log.warn("Zone file replication failed: {}".format(res['error']))
-
-                        failed = True
-                        failed_names += res['names']
-
-                except Exception, e:
-                    log.exception(e)
-                    failed = True
-            else:
-                log.debug("Skipping replicate_name_import_data due to injected fault")
-
-            if os.environ.get("BLOCKSTACK_TEST_REGISTRAR_FAULT_INJECTION_SKIP_CLEAR_CONFIRMED", '0') != '1':
-                try:
-                    # see if we can remove any other confirmed operations, besides preorders, registers, and updates
-                    # log.debug("clean out other confirmed operations")
-                    res = RegistrarWorker.clear_confirmed( self.config_path, self.queue_path, proxy=proxy )
-                    if 'error' in res:
-                        log.warn("Failed to clear out some operations: %s" % res['error'])
-
-                        failed = True
-
-                except Exception, e:
-                    log.exception(e)
-                    failed = True
-            else:
-                log.debug("Skipping clear_confirmed due to injected fault")
+        except Exception, e:
+            log.exception(e)
+            self.running = False
 
-            # if we failed a step, then try again quickly with exponential backoff
-            if failed:
-                if is_backing_off:
-                    poll_interval = 2 * poll_interval + random.random() * poll_interval
-                    poll_interval = min( poll_interval, self.poll_interval )
-                else:
-                    poll_interval = 1.0
-                    is_backing_off = True
-            else:
-                # succeeded. resume normal polling 
-                poll_interval = self.poll_interval
-                is_backing_off = False
+        if self.running:
+            self.scheduler = self.make_scheduler()
+            queue_add_listener( self.scheduler.wakeup )
+            self.scheduler.start()
 
             try:
-                log.debug("Registrar sleeping for %s" % poll_interval)
-                for i in xrange(0, int(poll_interval)):
-                    time.sleep(1)
+                while self.running:
+                    # wakes up on new blocks, new queue entries, and finished stages
+                    self.scheduler.run_once(timeout=1.0)
 
-                    # preemption point
-                    if not self.running:
+                    if once and self.scheduler.is_idle():
                         break
 
-            except:
-                # interrupted
-                log.debug("Sleep interrupted")
-                break
+            except Exception, e:
+                log.exception(e)
 
-            if once:
-                break
+            queue_remove_listener( self.scheduler.wakeup )
+            self.scheduler.stop()
 
         log.info("Registrar worker exited")
         self.cleanup_lockfile( self.lockfile_path )
@@ -1192,6 +1236,15 @@ def state():
     return data
 
 
+# RPC method: backend_registrar_metrics
+def metrics():
+    """
+    Return the registrar's per-stage backlog, throughput, and latency
+    """
+    state, config_path, proxy = get_registrar_state()
+    return state.registrar_worker.get_metrics()
+
+
 # RPC method: backend_set_wallet
 def set_wallet(payment_keypair, owner_keypair, data_keypair, config_path=None, proxy=None):
     """
@@ -1232,6 +1285,9 @@ def set_wallet(payment_keypair, owner_keypair, data_keypair, config_path=None, p
     if not is_singlesig_hex( data_keypair[1] ):
         return {'error': 'Invalid data key info'}
 
+    # new wallet session; forget keys derived from the old wallet
+    clear_derived_keys()
+
     state.payment_address = payment_keypair[0]
     state.owner_address = owner_keypair[0]
     state.data_pubkey = ecdsa_private_key(data_keypair[1]).public_key().to_hex()
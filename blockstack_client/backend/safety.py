@@ -21,6 +21,7 @@
 """
 
 import os, json
+import copy
 import threading
 import functools
 import virtualchain
@@ -63,6 +64,7 @@ from ..config import get_utxo_provider_client
 from ..b40 import is_b40
 from ..logger import get_logger
 from ..utils import ScatterGather, ScatterGatherThread
+from ..utxo import get_unspents
 
 from .blockchain import (
     get_balance, is_address_usable, get_utxos,
@@ -75,6 +77,78 @@ from ..scripts import UTXOException, is_name_valid, is_namespace_valid
 
 log = get_logger('safety')
 
+# read-only RPCs that the checks for one operation may share
+SINGLE_FLIGHT_PROXY_METHODS = [
+    'getinfo',
+    'get_name_blockchain_record',
+    'get_namespace_blockchain_record',
+    'get_names_owned_by_address',
+    'get_num_names_in_namespace',
+    'get_name_cost',
+    'get_namespace_cost',
+]
+
+
+class SingleFlightProxy(object):
+    """
+    Wraps a Blockstack RPC proxy, so identical read-only
+    RPCs issued by a scatter/gather run's tasks are sent once.
+    Each caller gets its own copy of the reply.
+    """
+    def __init__(self, proxy, single_flight):
+        self.proxy = proxy
+        self.single_flight = single_flight
+
+
+    def __getattr__(self, name):
+        if name not in SINGLE_FLIGHT_PROXY_METHODS:
+            return getattr(self.proxy, name)
+
+        def _call(*args, **kw):
+            key = ('proxy', name, args, tuple(sorted(kw.items())))
+            res = self.single_flight.do(key, getattr(self.proxy, name), *args, **kw)
+            return copy.deepcopy(res)
+
+        return _call
+
+
+class SingleFlightUTXOClient(object):
+    """
+    Wraps a UTXO client, so the UTXOs of an address
+    are fetched once per scatter/gather run.
+    """
+    def __init__(self, utxo_client, single_flight):
+        self.utxo_client = utxo_client
+        self.single_flight = single_flight
+
+
+    def get_unspents(self, address):
+        key = ('utxos', address, getattr(self.utxo_client, 'min_confirmations', None))
+        res = self.single_flight.do(key, get_unspents, address, self.utxo_client)
+        return copy.deepcopy(res)
+
+
+    def __getattr__(self, name):
+        return getattr(self.utxo_client, name)
+
+
+def single_flight_proxy(proxy, scatter_gather):
+    """
+    Make a proxy whose lookups are shared by the tasks in @scatter_gather
+    """
+    if isinstance(proxy, SingleFlightProxy):
+        return proxy
+
+    return SingleFlightProxy(proxy, scatter_gather.single_flight)
+
+
+def single_flight_utxo_client(scatter_gather, config_path=CONFIG_PATH, min_confirmations=TX_MIN_CONFIRMATIONS):
+    """
+    Make a UTXO client whose lookups are shared by the tasks in @scatter_gather
+    """
+    utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_confirmations)
+    return SingleFlightUTXOClient(utxo_client, scatter_gather.single_flight)
+
 def check_valid_name(fqu):
     """
     Verify that a name is valid.
@@ -193,6 +267,9 @@ def operation_sanity_checks(fqu_or_ns, operations, scatter_gather, payment_privk
     if proxy is None:
         proxy = get_default_proxy(config_path)
 
+    # tasks share identical lookups
+    proxy = single_flight_proxy(proxy, scatter_gather)
+
     if owner_address is None:
         assert owner_privkey_info
         owner_address = virtualchain.get_privkey_address(owner_privkey_info)
@@ -235,7 +312,7 @@ def operation_sanity_checks(fqu_or_ns, operations, scatter_gather, payment_privk
         """
         does the given address have unconfirmed transactions? (scatter/gather worker)
         """
-        utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_confirmations)
+        utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_confirmations)
         if not is_address_usable(addr, utxo_client=utxo_client, config_path=config_path):
             msg = (
                 'Address {} has insufficiently confirmed transactions. '
@@ -307,7 +384,7 @@ def operation_sanity_checks(fqu_or_ns, operations, scatter_gather, payment_privk
         * must be a p2pkh address
         * must have no outstanding UTXOs
         """
-        utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_confirmations)
+        utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_confirmations)
         reveal_address = virtualchain.address_reencode(reveal_address)
         if not virtualchain.is_singlesig_address(reveal_address):
             return {'error': 'Invalid address; only p2pkh addresses are supported for namespace reveal'}
@@ -320,7 +397,7 @@ def operation_sanity_checks(fqu_or_ns, operations, scatter_gather, payment_privk
         """
         import blockstack
         if zonefile_hash is not None:
-            indexer_info = getinfo()
+            indexer_info = getinfo(proxy=proxy)
             if 'error' in indexer_info:
                 return {'error': 'Failed to contact indexer'}
             
@@ -340,7 +417,7 @@ def operation_sanity_checks(fqu_or_ns, operations, scatter_gather, payment_privk
         """
         import blockstack
         if zonefile_hash is not None:
-            indexer_info = getinfo()
+            indexer_info = getinfo(proxy=proxy)
             if 'error' in indexer_info:
                 return {'error': 'Failed to contact indexer'}
 
@@ -360,7 +437,7 @@ def operation_sanity_checks(fqu_or_ns, operations, scatter_gather, payment_privk
         """
         import blockstack
         if transfer_address is not None and transfer_address != owner_address:
-            indexer_info = getinfo()
+            indexer_info = getinfo(proxy=proxy)
             if 'error' in indexer_info:
                 return {'error': 'Failed to contact indexer'}
 
@@ -380,7 +457,7 @@ def operation_sanity_checks(fqu_or_ns, operations, scatter_gather, payment_privk
         """
         import blockstack
         if burn_addr is not None:
-            indexer_info = getinfo()
+            indexer_info = getinfo(proxy=proxy)
             if 'error' in indexer_info:
                 return {'error': 'Failed to contact indexer'}
 
@@ -393,7 +470,7 @@ def operation_sanity_checks(fqu_or_ns, operations, scatter_gather, payment_privk
 
             # what's the namespace burn address?
             nsid = blockstack.get_namespace_from_name(fqu)
-            ns_info = get_namespace_blockchain_record(nsid)
+            ns_info = get_namespace_blockchain_record(nsid, proxy=proxy)
             if 'error' in ns_info:
                 return {'error': 'Failed to get namespace info for {}'.format(nsid)}
 
@@ -427,7 +504,7 @@ def operation_sanity_checks(fqu_or_ns, operations, scatter_gather, payment_privk
         """
         import blockstack
 
-        indexer_info = getinfo()
+        indexer_info = getinfo(proxy=proxy)
         if 'error' in indexer_info:
             return {'error': 'Failed to contact indexer'}
 
@@ -435,12 +512,12 @@ def operation_sanity_checks(fqu_or_ns, operations, scatter_gather, payment_privk
         block_number = indexer_info['last_block_seen']+1
         nsid = blockstack.get_namespace_from_name(fqu)
 
-        name_rec = get_name_blockchain_record(fqu)
+        name_rec = get_name_blockchain_record(fqu, proxy=proxy)
         if 'error' in name_rec:
             log.error("Failed to get name record for {}".format(fqu))
             return {'error': 'Failed to get name blockchain record for {}'.format(fqu)}
             
-        namespace_rec = get_namespace_blockchain_record(nsid)
+        namespace_rec = get_namespace_blockchain_record(nsid, proxy=proxy)
         if 'error' in namespace_rec:
             log.error('Failed to get namespace record for {}'.format(nsid))
             return {'error': 'Failed to get namespace record for {}'.format(nsid)}
@@ -723,6 +800,12 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
     if owner_privkey_info is not None:
         owner_address = virtualchain.get_privkey_address(owner_privkey_info)
 
+    if proxy is None:
+        proxy = get_default_proxy(config_path)
+
+    # tasks share identical lookups
+    proxy = single_flight_proxy(proxy, scatter_gather)
+
     # fee estimation: cost of name_or_ns + cost of preorder transaction +
     # cost of registration transaction + cost of update transaction + cost of transfer transaction
 
@@ -747,7 +830,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
         return {'error': 'No duplicate operations allowed at this time'}
 
     # first things first: get UTXOs for owner and payment addresses
-    utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+    utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
 
     if not fake_utxos:
         log.debug("Getting UTXOs for {}".format(owner_address))
@@ -823,7 +906,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
             return {'error': 'Could not get name price'}
 
         try:
-            utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+            utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
 
             insufficient_funds = False
             preorder_tx_fee = estimate_preorder_tx_fee(
@@ -857,7 +940,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
         """
         
         try:
-            utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+            utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
 
             insufficient_funds = False
             register_tx_fee = estimate_register_tx_fee(
@@ -889,7 +972,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
         Return {'error': ...} on failure
         """
         try:
-            utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+            utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
 
             insufficient_funds = False
             estimate = False
@@ -931,7 +1014,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
         try:
 
             if transfer_address is not None:
-                utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+                utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
 
                 insufficient_funds = False
                 estimate = False
@@ -972,7 +1055,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
         Return {'error': ...} on failure
         """
         try:
-            utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+            utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
 
             insufficient_funds = False
             estimate = False
@@ -1018,7 +1101,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
             return {'error': 'Could not get name price'}
 
         try:
-            utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+            utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
 
             insufficient_funds = False
             estimate = False
@@ -1068,7 +1151,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
             return {'error': 'Could not get namespace price'}
 
         try:
-            utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+            utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
 
             log.debug("Estimate namespace preorder TX fee (from {})".format(payment_address))
             tx_fee = estimate_namespace_preorder_tx_fee( name_or_ns, namespace_cost, payment_privkey_info, tx_fee_per_byte, utxo_client, 
@@ -1104,7 +1187,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
         estimate = False
 
         try:
-            utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+            utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
 
             log.debug("Estimate namespace reveal TX fee (from {})".format(payment_address))
             tx_fee = estimate_namespace_reveal_tx_fee( name_or_ns, payment_privkey_info, tx_fee_per_byte, utxo_client, 
@@ -1140,7 +1223,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
         estimate = False
 
         try:
-            utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+            utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
 
             log.debug("Estimate namespace ready TX fee (from {})".format(payment_address))
             tx_fee = estimate_namespace_ready_tx_fee( name_or_ns, payment_privkey_info, tx_fee_per_byte, utxo_client,
@@ -1179,7 +1262,7 @@ def get_operation_fees(name_or_ns, operations, scatter_gather, payment_privkey_i
             return {'error': 'No recipient address given'}
 
         try:
-            utxo_client = get_utxo_provider_client(config_path=config_path, min_confirmations=min_payment_confs)
+            utxo_client = single_flight_utxo_client(scatter_gather, config_path=config_path, min_confirmations=min_payment_confs)
             tx_fee = estimate_name_import_tx_fee( name_or_ns, payment_privkey_info, transfer_address, tx_fee_per_byte, utxo_client, 
                                     importer_utxos=estimated_payment_inputs[operation_index],
                                     config_path=config_path, include_dust=True )
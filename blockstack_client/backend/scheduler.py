@@ -0,0 +1,491 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import threading
+from collections import deque
+
+from ..utils import LatencyHistogram
+from ..logger import get_logger
+
+log = get_logger()
+
+
+def entry_key(entry):
+    """
+    Identify a queue entry by its name and transaction
+    """
+    return (entry['fqu'], entry.get('tx_hash', None))
+
+
+class RegistrarScheduler(object):
+    """
+    Runs the registrar's queue stages concurrently.
+
+    A stage finds the queue entries that are ready for it (i.e. confirmed
+    preorders), and processes each one as an independent task.  Tasks run on
+    a shared pool of worker threads, with a bound on the number of in-flight
+    tasks per stage, so a slow stage only holds up its own entries.
+
+    Stages are given in pipeline order, and each name moves through them in
+    that order:
+    * a name is processed by at most one stage at a time, and
+    * a name that is waiting in or has failed a stage is not processed by any
+    later stage until it succeeds there.  Failed entries are retried with
+    exponential backoff.
+
+    An entry (name and transaction) that a stage finished is not processed by
+    that stage again, unless the stage asked to retry it ({'status': True,
+    'retry': True}), i.e. because it is still waiting on another stage.
+
+    Stages are re-scanned when a new block arrives, when an entry is enqueued
+    (see wakeup()), when an earlier stage finishes an entry, and every
+    @poll_interval seconds regardless.
+
+    Sweeps are whole-queue tasks (i.e. clearing out confirmed operations) that
+    run once after each scan.
+    """
+    def __init__(self, num_workers=None, poll_interval=300.0, block_check_interval=5.0, retry_delay=1.0, get_block_height=None):
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.block_check_interval = block_check_interval
+        self.retry_delay = retry_delay
+        self.get_block_height = get_block_height
+
+        self.lock = threading.Condition()
+        self.running = False
+        self.workers = []
+        self.wakeup_event = threading.Event()
+
+        self.stages = []            # in pipeline order
+        self.sweeps = []
+        self.tasks = deque()        # ready (kind, index, entry) tasks
+        self.busy = {}              # fqu => index of the stage processing it
+        self.failed = {}            # fqu => {stage index: {'retry_at': ..., 'delay': ..., 'rescan': ...}}
+        self.rescan = set()         # indexes of stages to re-scan
+
+        self.last_poll = 0
+        self.last_block_check = 0
+        self.last_block_height = None
+
+        self.stats = {
+            'scans': 0,
+            'blocks': 0,
+            'wakeups': 0,
+        }
+
+
+    def add_stage(self, stage_id, find_entries, process_entry, concurrency=2):
+        """
+        Add the next stage of the pipeline.
+
+        @find_entries() returns the list of queue entries ready for this stage.
+        @process_entry(entry) processes one, and returns {'status': True} on success or {'error': ...} on failure.
+        Entries are dicts with 'fqu' and 'tx_hash'.
+        At most @concurrency entries are processed at once.
+        """
+        with self.lock:
+            self.stages.append({
+                'id': stage_id,
+                'find': find_entries,
+                'process': process_entry,
+                'concurrency': concurrency,
+                'pending': [],
+                'inflight': set(),
+                'done': set(),          # (fqu, tx_hash) of finished entries
+                'processed': 0,
+                'failed': 0,
+                'scan_errors': 0,
+                'latency': LatencyHistogram(),
+            })
+
+            self.rescan.add(len(self.stages) - 1)
+
+
+    def add_sweep(self, sweep_id, func):
+        """
+        Add a task that runs once after each scan.
+        @func() returns {'status': True} on success or {'error': ...} on failure.
+        """
+        with self.lock:
+            self.sweeps.append({
+                'id': sweep_id,
+                'func': func,
+                'due': True,
+                'inflight': False,
+                'runs': 0,
+                'failed': 0,
+                'latency': LatencyHistogram(),
+            })
+
+
+    def start(self):
+        """
+        Start the worker threads.  Idempotent.
+        """
+        with self.lock:
+            if self.running:
+                return
+
+            self.running = True
+            num_workers = self.num_workers
+            if num_workers is None:
+                num_workers = sum([stage['concurrency'] for stage in self.stages]) + len(self.sweeps)
+
+            for i in xrange(0, max(num_workers, 1)):
+                worker = threading.Thread(target=self._worker_main)
+                worker.daemon = True
+                self.workers.append(worker)
+                worker.start()
+
+
+    def stop(self):
+        """
+        Stop the worker threads, and wait for in-flight tasks to finish
+        """
+        with self.lock:
+            self.running = False
+            self.lock.notify_all()
+
+        self.wakeup_event.set()
+        for worker in self.workers:
+            worker.join()
+
+        self.workers = []
+
+
+    def wakeup(self, *args, **kw):
+        """
+        Re-scan all stages soon (i.e. an entry was enqueued).
+        Takes any arguments, so it can be used as a callback.
+        """
+        with self.lock:
+            self.rescan.update(range(0, len(self.stages)))
+            self.stats['wakeups'] += 1
+
+        self.wakeup_event.set()
+
+
+    def _eligible(self, index, fqu, now, earlier):
+        """
+        Can a stage process a name?
+        @earlier is the set of names still waiting on earlier stages.
+        Must be called with self.lock held.
+        """
+        if fqu in self.busy or fqu in earlier:
+            return False
+
+        for (failed_index, failure) in self.failed.get(fqu, {}).items():
+            if failed_index < index:
+                # still stuck in an earlier stage
+                return False
+
+            if failed_index == index and failure['retry_at'] > now:
+                # backing off
+                return False
+
+        return True
+
+
+    def _scan(self, indexes):
+        """
+        Find the entries that are ready for the given stages.
+        Later stages are scanned first, so an entry that is confirmed
+        by the time a later stage sees it is seen by the earlier ones too.
+        """
+        for index in sorted(indexes, reverse=True):
+            stage = self.stages[index]
+            try:
+                entries = stage['find']()
+            except Exception as e:
+                log.exception(e)
+                with self.lock:
+                    stage['scan_errors'] += 1
+
+                continue
+
+            with self.lock:
+                stage['pending'] = [entry for entry in entries if entry['fqu'] not in stage['inflight'] and entry_key(entry) not in stage['done']]
+                stage['done'] &= set([entry_key(entry) for entry in entries])
+                self.stats['scans'] += 1
+
+                # forget failures of names that are no longer in this stage
+                found = set([entry['fqu'] for entry in entries]) | stage['inflight']
+                for fqu in self.failed.keys():
+                    if index in self.failed[fqu] and fqu not in found:
+                        del self.failed[fqu][index]
+                        if len(self.failed[fqu]) == 0:
+                            del self.failed[fqu]
+
+        with self.lock:
+            for sweep in self.sweeps:
+                sweep['due'] = True
+
+
+    def _dispatch(self, now):
+        """
+        Hand ready entries to the workers
+        """
+        with self.lock:
+            earlier = set()
+            for (index, stage) in enumerate(self.stages):
+                remaining = []
+                for entry in stage['pending']:
+                    if len(stage['inflight']) < stage['concurrency'] and self._eligible(index, entry['fqu'], now, earlier):
+                        stage['inflight'].add(entry['fqu'])
+                        self.busy[entry['fqu']] = index
+                        self.tasks.append(('stage', index, entry))
+
+                    else:
+                        remaining.append(entry)
+
+                stage['pending'] = remaining
+                earlier.update([entry['fqu'] for entry in remaining])
+
+            for (index, sweep) in enumerate(self.sweeps):
+                if sweep['due'] and not sweep['inflight']:
+                    sweep['due'] = False
+                    sweep['inflight'] = True
+                    self.tasks.append(('sweep', index, None))
+
+            if len(self.tasks) > 0:
+                self.lock.notify_all()
+
+
+    def _worker_main(self):
+        """
+        Worker thread: run tasks until stopped
+        """
+        while True:
+            with self.lock:
+                while self.running and len(self.tasks) == 0:
+                    self.lock.wait(1.0)
+
+                if not self.running:
+                    return
+
+                kind, index, entry = self.tasks.popleft()
+
+            if kind == 'stage':
+                self._run_stage_task(index, entry)
+            else:
+                self._run_sweep_task(index)
+
+            # more work may be ready
+            self.wakeup_event.set()
+
+
+    def _run_stage_task(self, index, entry):
+        """
+        Process one entry in one stage
+        """
+        stage = self.stages[index]
+        fqu = entry['fqu']
+
+        t0 = time.time()
+        try:
+            res = stage['process'](entry)
+        except Exception as e:
+            log.exception(e)
+            res = {'error': 'Stage {} failed on {}'.format(stage['id'], fqu)}
+
+        now = time.time()
+        stage['latency'].record(now - t0)
+
+        with self.lock:
+            stage['inflight'].discard(fqu)
+            if self.busy.get(fqu) == index:
+                del self.busy[fqu]
+
+            if 'error' in res:
+                log.warn("Stage {} failed on {}: {}".format(stage['id'], fqu, res['error']))
+                stage['failed'] += 1
+
+                failure = self.failed.setdefault(fqu, {}).get(index, None)
+                delay = self.retry_delay if failure is None else min(2 * failure['delay'], self.poll_interval)
+                self.failed[fqu][index] = {'retry_at': now + delay, 'delay': delay, 'rescan': True}
+
+            else:
+                stage['processed'] += 1
+                if not res.get('retry', False):
+                    stage['done'].add(entry_key(entry))
+
+                if fqu in self.failed:
+                    self.failed[fqu].pop(index, None)
+                    if len(self.failed[fqu]) == 0:
+                        del self.failed[fqu]
+
+                # the name may be ready for a later stage
+                self.rescan.update(range(index + 1, len(self.stages)))
+
+
+    def _run_sweep_task(self, index):
+        """
+        Run one sweep
+        """
+        sweep = self.sweeps[index]
+
+        t0 = time.time()
+        try:
+            res = sweep['func']()
+        except Exception as e:
+            log.exception(e)
+            res = {'error': 'Sweep {} failed'.format(sweep['id'])}
+
+        sweep['latency'].record(time.time() - t0)
+
+        with self.lock:
+            sweep['inflight'] = False
+            sweep['runs'] += 1
+            if 'error' in res:
+                log.warn("Sweep {} failed: {}".format(sweep['id'], res['error']))
+                sweep['failed'] += 1
+
+
+    def _check_block(self, now):
+        """
+        Re-scan all stages if there is a new block
+        """
+        if self.get_block_height is None or now - self.last_block_check < self.block_check_interval:
+            return
+
+        self.last_block_check = now
+        try:
+            block_height = self.get_block_height()
+        except Exception as e:
+            log.exception(e)
+            return
+
+        if block_height is not None and block_height != self.last_block_height:
+            log.debug("New block {}; re-scanning registrar queues".format(block_height))
+            with self.lock:
+                self.last_block_height = block_height
+                self.rescan.update(range(0, len(self.stages)))
+                self.stats['blocks'] += 1
+
+
+    def _next_deadline(self, now):
+        """
+        When do we next need to wake up, absent any events?
+        """
+        deadline = self.last_poll + self.poll_interval
+        if self.get_block_height is not None:
+            deadline = min(deadline, self.last_block_check + self.block_check_interval)
+
+        with self.lock:
+            for failures in self.failed.values():
+                for failure in failures.values():
+                    if failure['rescan']:
+                        deadline = min(deadline, failure['retry_at'])
+
+        return deadline
+
+
+    def run_once(self, timeout=None):
+        """
+        Wait (up to @timeout seconds) for something to do, then
+        re-scan whichever stages need it and dispatch ready entries.
+        """
+        now = time.time()
+        wait_time = max(self._next_deadline(now) - now, 0)
+        if timeout is not None:
+            wait_time = min(wait_time, timeout)
+
+        self.wakeup_event.wait(wait_time)
+        self.wakeup_event.clear()
+
+        now = time.time()
+        if now - self.last_poll >= self.poll_interval:
+            self.last_poll = now
+            with self.lock:
+                self.rescan.update(range(0, len(self.stages)))
+
+        self._check_block(now)
+
+        with self.lock:
+            # retry failed entries whose backoff has passed
+            for failures in self.failed.values():
+                for (index, failure) in failures.items():
+                    if failure['rescan'] and failure['retry_at'] <= now:
+                        failure['rescan'] = False
+                        self.rescan.add(index)
+
+            rescan = self.rescan
+            self.rescan = set()
+
+        if len(rescan) > 0:
+            # a later stage must not see a name before the earlier stages do
+            self._scan(range(0, max(rescan) + 1))
+
+        self._dispatch(now)
+
+
+    def is_idle(self):
+        """
+        Is there nothing pending or in flight?
+        """
+        with self.lock:
+            if len(self.tasks) > 0 or len(self.rescan) > 0:
+                return False
+
+            for stage in self.stages:
+                if len(stage['pending']) > 0 or len(stage['inflight']) > 0:
+                    return False
+
+            for sweep in self.sweeps:
+                if sweep['inflight']:
+                    return False
+
+            return True
+
+
+    def get_metrics(self):
+        """
+        Get per-stage backlogs, throughput, and latencies
+        """
+        with self.lock:
+            metrics = dict(self.stats)
+            metrics['last_block_height'] = self.last_block_height
+            metrics['backing_off'] = len(self.failed)
+            metrics['stages'] = {}
+            metrics['sweeps'] = {}
+
+            for stage in self.stages:
+                metrics['stages'][stage['id']] = {
+                    'backlog': len(stage['pending']) + len(stage['inflight']),
+                    'inflight': len(stage['inflight']),
+                    'concurrency': stage['concurrency'],
+                    'processed': stage['processed'],
+                    'failed': stage['failed'],
+                    'scan_errors': stage['scan_errors'],
+                    'latency': stage['latency'].get_stats(),
+                }
+
+            for sweep in self.sweeps:
+                metrics['sweeps'][sweep['id']] = {
+                    'runs': sweep['runs'],
+                    'failed': sweep['failed'],
+                    'latency': sweep['latency'].get_stats(),
+                }
+
+        return metrics
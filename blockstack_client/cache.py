@@ -0,0 +1,210 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import time
+import heapq
+import threading
+from collections import OrderedDict
+
+
+def json_size(value):
+    """
+    Estimate how much RAM a value takes, by its serialized length
+    """
+    try:
+        return len(json.dumps(value))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+
+class LRUTTLCache(object):
+    """
+    Thread-safe key/value cache, bounded in both entries and bytes.
+
+    Entries expire after a per-entry TTL, and the least-recently-used
+    entries are evicted when either bound is exceeded.  Gets, puts and
+    evictions take O(1) time (O(log n) for the expiry heap), and every
+    key belongs to a group (e.g. a datastore ID) that can be
+    invalidated at once.
+
+    @on_evict(key, value), if given, is called (with the cache lock held)
+    whenever an entry leaves the cache for any reason.  Pass the
+    (reentrant) lock that guards the callback's state as @lock.
+    """
+    def __init__(self, max_entries, max_bytes, sizeof=json_size, on_evict=None, lock=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+
+        self.lock = lock if lock is not None else threading.RLock()
+        self.entries = OrderedDict()    # key => (value, deadline, size, group), least-recently-used first
+        self.groups = {}                # group => set of keys
+        self.expiry = []                # heap of (deadline, key); may hold stale items
+        self.total_bytes = 0
+
+        self.stats = {'hits': 0, 'misses': 0, 'puts': 0, 'expired': 0, 'evicted': 0, 'invalidated': 0}
+
+
+    def _remove(self, key):
+        """
+        Remove an entry.
+        Must be called with self.lock held.
+        """
+        value, deadline, size, group = self.entries.pop(key)
+        self.total_bytes -= size
+
+        group_keys = self.groups.get(group, None)
+        if group_keys is not None:
+            group_keys.discard(key)
+            if len(group_keys) == 0:
+                del self.groups[group]
+
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+        return value
+
+
+    def _expire(self, now):
+        """
+        Drop entries whose deadline has passed.
+        Must be called with self.lock held.
+        """
+        while len(self.expiry) > 0 and self.expiry[0][0] <= now:
+            deadline, key = heapq.heappop(self.expiry)
+            entry = self.entries.get(key, None)
+            if entry is not None and entry[1] == deadline:
+                self._remove(key)
+                self.stats['expired'] += 1
+
+        # stale heap items pile up when keys are overwritten or evicted
+        if len(self.expiry) > 2 * len(self.entries) + 64:
+            self.expiry = [(entry[1], key) for (key, entry) in self.entries.items()]
+            heapq.heapify(self.expiry)
+
+
+    def put(self, key, value, ttl, group=None):
+        """
+        Cache a value for @ttl seconds.
+        Values bigger than max_bytes are not cached.
+        """
+        size = self.sizeof(value)
+        now = time.time()
+        deadline = now + ttl
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+            self._expire(now)
+
+            if size > self.max_bytes:
+                return
+
+            self.entries[key] = (value, deadline, size, group)
+            self.total_bytes += size
+            self.groups.setdefault(group, set()).add(key)
+            heapq.heappush(self.expiry, (deadline, key))
+            self.stats['puts'] += 1
+
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                lru_key = next(iter(self.entries))
+                self._remove(lru_key)
+                self.stats['evicted'] += 1
+
+
+    def get(self, key):
+        """
+        Get a cached value and its deadline.
+        Return (value, deadline) on hit
+        Return (None, None) if stale or absent
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None, None
+
+            if entry[1] <= now:
+                self._expire(now)
+                self.stats['misses'] += 1
+                return None, None
+
+            # mark most-recently-used
+            del self.entries[key]
+            self.entries[key] = entry
+            self.stats['hits'] += 1
+            return entry[0], entry[1]
+
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+
+    def evict(self, key):
+        """
+        Remove a key, if present
+        """
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+                self.stats['invalidated'] += 1
+
+
+    def evict_group(self, group):
+        """
+        Remove every key in a group
+        """
+        with self.lock:
+            for key in list(self.groups.get(group, [])):
+                self._remove(key)
+                self.stats['invalidated'] += 1
+
+
+    def clear(self):
+        """
+        Remove everything
+        """
+        with self.lock:
+            for key in self.entries.keys():
+                self._remove(key)
+
+            self.expiry = []
+
+
+    def get_stats(self):
+        """
+        Get hit, miss, and eviction counts, and current usage
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+            stats['bytes'] = self.total_bytes
+            stats['max_entries'] = self.max_entries
+            stats['max_bytes'] = self.max_bytes
+
+        return stats
@@ -32,29 +32,32 @@ Instead, define the appropriate method in the `actions.py` file
 in this module.
 
 This module will load and register each appropriate method from `actions.py`
-as a command-line option.
+as a command-line option.  The commands are described by `cli_commands.json`,
+which is rebuilt from `actions.py` whenever it changes, so that `actions.py` is
+only imported when a command runs.
 """
 
 import argparse
 import sys, os
-import requests
 import traceback
-requests.packages.urllib3.disable_warnings()
 
 import logging
 logging.disable(logging.CRITICAL)
 
 from blockstack_client import config
-from blockstack_client.client import session
 from blockstack_client.constants import WALLET_FILENAME, set_secret, serialize_secrets, write_secrets, load_secrets, CONFIG_PATH
 from blockstack_client.config import CONFIG_PATH, VERSION, client_uuid_path, get_or_set_uuid
-from blockstack_client.method_parser import parse_methods, build_method_subparsers
+from blockstack_client.method_parser import build_method_subparsers, load_method_manifest
 
-from .wallet import inspect_wallet
 from utils import exit_with_error, print_result
 
 log = config.get_logger()
 
+# built-in CLI methods, and the manifest of their commands
+CLI_METHODS_MODULE = 'blockstack_client.actions'
+CLI_METHODS_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'actions.py')
+CLI_METHODS_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli_commands.json')
+
 # a less-verbose argument parser
 class BlockstackArgumentParser(argparse.ArgumentParser):
     def print_usage(self, *args, **kw):
@@ -105,6 +108,32 @@ def get_cli_methods():
     return all_methods
 
 
+def get_cli_method_infos():
+    """
+    Get parsed information for the built-in CLI methods
+    from the command manifest, without importing them.
+    """
+    return load_method_manifest(CLI_METHODS_MANIFEST, CLI_METHODS_MODULE, CLI_METHODS_SOURCE, 'cli_')
+
+
+def find_directive(argv, method_infos):
+    """
+    Find the parsed information for the command named in argv.
+    Return None if the first non-option argument is not a command.
+    """
+    for arg in argv[1:]:
+        if arg.startswith('-'):
+            continue
+
+        for method_info in method_infos:
+            if method_info['command'] == arg:
+                return method_info
+
+        break
+
+    return None
+
+
 def prompt_args(arginfolist, prompt_func):
     """
     Prompt for args, using parsed method information
@@ -446,6 +475,8 @@ def run_cli(argv=None, config_path=CONFIG_PATH):
     # if the wallet exists, make sure that it's the latest version 
     wallet_path = os.path.join(os.path.dirname(config_path), WALLET_FILENAME)
     if os.path.exists(wallet_path):
+        from .wallet import inspect_wallet
+
         res = inspect_wallet(wallet_path=wallet_path)
         if 'error' in res:
             exit_with_error("Failed to inspect wallet at {}".format(wallet_path))
@@ -461,9 +492,14 @@ def run_cli(argv=None, config_path=CONFIG_PATH):
     all_methods = []
     subparsers = parser.add_subparsers(dest='action')
 
-    # add basic methods
-    all_method_names = get_cli_methods()
-    all_methods = parse_methods(all_method_names)
+    # add basic methods.
+    # only the named command needs a subparser, unless we're printing help
+    # (or the command doesn't exist, in which case argparse reports the choices).
+    all_methods = get_cli_method_infos()
+    directive_info = find_directive(argv, all_methods)
+    if directive_info is not None and '-h' not in argv and '--help' not in argv:
+        all_methods = [directive_info]
+
     build_method_subparsers(subparsers, all_methods)
 
     # Print default help message, if no argument is given
@@ -507,6 +543,11 @@ def run_cli(argv=None, config_path=CONFIG_PATH):
 
     result = {}
 
+    import requests
+    requests.packages.urllib3.disable_warnings()
+
+    from blockstack_client.client import session
+
     blockstack_server, blockstack_port = conf['blockstack-client']['server'], conf['blockstack-client']['port']
 
     # initialize blockstack connection
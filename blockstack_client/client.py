@@ -30,7 +30,7 @@ from virtualchain import SPVClient
 import storage
 
 from .constants import CONFIG_PATH, VERSION
-from .config import get_config, semver_match
+from .config import get_config, semver_match, config_add_listener
 from .logger import get_logger
 
 log = get_logger()
@@ -38,6 +38,9 @@ log = get_logger()
 # ancillary storage providers
 STORAGE_IMPL = None
 
+# config file of the global session's storage drivers
+STORAGE_CONFIG_PATH = None
+
 def session(conf=None, config_path=CONFIG_PATH, server_host=None, server_port=None,
             wallet_password=None, storage_drivers=None, metadata_dir=None,
             spv_headers_path=None, set_global=False, server_protocol = None):
@@ -116,9 +119,37 @@ def session(conf=None, config_path=CONFIG_PATH, server_host=None, server_port=No
     if set_global:
         set_default_proxy(proxy)
 
+        global STORAGE_CONFIG_PATH
+        STORAGE_CONFIG_PATH = conf.get('path', config_path)
+        config_add_listener(storage_config_changed)
+
     return proxy
 
 
+def storage_config_changed(config_path, snapshot):
+    """
+    Config listener: re-initialize the global session's
+    storage drivers when their config file changes.
+    """
+    if config_path != STORAGE_CONFIG_PATH:
+        return
+
+    conf = get_config(config_path)
+    if conf is None:
+        log.error("Failed to reload configuration file {}".format(config_path))
+        return
+
+    for storage_impl in storage.get_storage_handlers():
+        try:
+            rc = storage_impl.storage_init(conf)
+            if not rc:
+                log.error('Failed to re-initialize storage driver "{}"'.format(storage_impl.__name__))
+
+        except Exception as e:
+            log.exception(e)
+            log.error('Failed to re-initialize storage driver "{}"'.format(storage_impl.__name__))
+
+
 def load_storage(module_name):
     """
     Load a storage implementation, given its module name.
@@ -34,6 +34,7 @@ import urllib2
 import copy
 import time
 import shutil
+import threading
 import requests
 import keylib
 import json
@@ -60,6 +61,24 @@ from .logger import get_logger
 
 log = get_logger('blockstack-client')
 
+# parsed config files, by path (see load_config_snapshot())
+CONFIG_CACHE = {}
+CONFIG_CACHE_LOCK = threading.Lock()
+CONFIG_STATS = {
+    'loads': 0,
+    'hits': 0,
+    'reloads': 0,
+    'changes': 0,
+    'load_time_total': 0.0,
+    'load_time_max': 0.0,
+}
+
+# callbacks to invoke when a config file changes
+CONFIG_LISTENERS = []
+
+# environment variables that override config file fields
+CONFIG_ENV_OVERRIDES = ['BLOCKSTACK_CLI_SERVER_HOST', 'BLOCKSTACK_CLI_SERVER_PORT', 'BLOCKSTACK_CLI_SERVER_PROTOCOL']
+
 
 # NOTE: duplicated from blockstack-core and streamlined.
 def op_get_opcode_name(op_string):
@@ -263,7 +282,7 @@ def get_local_device_id(config_dir=CONFIG_DIR):
 
 
 
-def configure(config_file=CONFIG_PATH, force=False, interactive=True, set_migrate=False):
+def parse_config(config_file=CONFIG_PATH, force=False, interactive=True, set_migrate=False):
     """
     Configure blockstack-client:  find and store configuration parameters to the config file.
 
@@ -491,6 +510,161 @@ def configure(config_file=CONFIG_PATH, force=False, interactive=True, set_migrat
     return ret
 
 
+class ConfigSnapshot(dict):
+    """
+    Read-only parsed config (or config section).
+    Use thaw_config() to get a copy that can be modified.
+    """
+    def _read_only(self, *args, **kw):
+        raise TypeError('Config snapshots are read-only')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+
+def freeze_config(opts):
+    """
+    Make a read-only snapshot of a config dict
+    """
+    return ConfigSnapshot([(k, freeze_config(v) if isinstance(v, dict) else v) for (k, v) in opts.items()])
+
+
+def thaw_config(snapshot):
+    """
+    Make a modifiable copy of a config snapshot
+    """
+    return dict([(k, thaw_config(v) if isinstance(v, dict) else v) for (k, v) in snapshot.items()])
+
+
+def config_fingerprint(config_path):
+    """
+    Identify the current version of a config file and the
+    environment variables that override it.
+    Return None if the file does not exist.
+    """
+    try:
+        sb = os.stat(config_path)
+    except OSError:
+        return None
+
+    env = tuple([os.environ.get(envar) for envar in CONFIG_ENV_OVERRIDES])
+    return (sb.st_dev, sb.st_ino, sb.st_mtime, sb.st_size, env)
+
+
+def config_add_listener(callback):
+    """
+    Call callback(config_path, snapshot) whenever a config file
+    is reloaded with different contents.
+    """
+    if callback not in CONFIG_LISTENERS:
+        CONFIG_LISTENERS.append(callback)
+
+
+def config_remove_listener(callback):
+    """
+    Stop notifying a config listener
+    """
+    if callback in CONFIG_LISTENERS:
+        CONFIG_LISTENERS.remove(callback)
+
+
+def invalidate_config(config_path=CONFIG_PATH):
+    """
+    Make the next load of a config file re-parse it.
+    Called whenever we write the file ourselves, in case
+    the write does not change its mtime or size.
+    """
+    with CONFIG_CACHE_LOCK:
+        if CONFIG_CACHE.has_key(config_path):
+            CONFIG_CACHE[config_path]['fingerprint'] = None
+
+
+def load_config_snapshot(config_path=CONFIG_PATH, interactive=False):
+    """
+    Get a read-only snapshot of a parsed config file, as returned by parse_config()
+    (with 'migrated' set).  The file is only parsed again once its
+    inode, mtime, or size change (or the environment overrides do).
+    If the reloaded config differs from the last one, notify the config listeners.
+
+    Return the snapshot on success
+    Raise on error
+    """
+    fingerprint = config_fingerprint(config_path)
+    with CONFIG_CACHE_LOCK:
+        cached = CONFIG_CACHE.get(config_path)
+        if cached is not None and fingerprint is not None and cached['fingerprint'] == fingerprint:
+            CONFIG_STATS['hits'] += 1
+            return cached['snapshot']
+
+    t0 = time.time()
+    snapshot = freeze_config(parse_config(config_file=config_path, interactive=interactive, set_migrate=True))
+    load_time = time.time() - t0
+
+    if fingerprint is None:
+        # we just created it
+        fingerprint = config_fingerprint(config_path)
+
+    changed = False
+    with CONFIG_CACHE_LOCK:
+        CONFIG_STATS['loads'] += 1
+        CONFIG_STATS['load_time_total'] += load_time
+        CONFIG_STATS['load_time_max'] = max(CONFIG_STATS['load_time_max'], load_time)
+
+        prior = CONFIG_CACHE.get(config_path)
+        if prior is not None:
+            CONFIG_STATS['reloads'] += 1
+            if prior['snapshot'] != snapshot:
+                CONFIG_STATS['changes'] += 1
+                changed = True
+
+        CONFIG_CACHE[config_path] = {'fingerprint': fingerprint, 'snapshot': snapshot}
+
+    if changed:
+        log.debug('Config file {} changed'.format(config_path))
+        for callback in CONFIG_LISTENERS[:]:
+            try:
+                callback(config_path, snapshot)
+            except Exception as e:
+                log.exception(e)
+                log.error('Config listener {} failed'.format(callback))
+
+    return snapshot
+
+
+def get_config_stats():
+    """
+    Get config load statistics:
+    how often config files were parsed, and how long it took,
+    versus how often a cached snapshot was used.
+    """
+    with CONFIG_CACHE_LOCK:
+        stats = dict(CONFIG_STATS)
+        stats['cached'] = len(CONFIG_CACHE)
+
+    stats['listeners'] = len(CONFIG_LISTENERS)
+    stats['load_time_avg'] = stats['load_time_total'] / stats['loads'] if stats['loads'] > 0 else 0.0
+    return stats
+
+
+def configure(config_file=CONFIG_PATH, force=False, interactive=True, set_migrate=False):
+    """
+    Configure blockstack-client (see parse_config()).
+
+    Unless we're forcing a re-prompt, the config file is only parsed
+    when it changes (see load_config_snapshot()).
+
+    Return the config dict, which the caller may modify.
+    Raise on error
+    """
+    if force:
+        return parse_config(config_file=config_file, force=force, interactive=interactive, set_migrate=set_migrate)
+
+    ret = thaw_config(load_config_snapshot(config_path=config_file, interactive=interactive))
+    if not set_migrate:
+        del ret['migrated']
+
+    return ret
+
+
 def clear_runtime_fields(opts):
     """
     Remove runtime opts from a config dict.
@@ -541,6 +715,8 @@ def write_config_file(opts, config_file):
         os.fchmod(fout.fileno(), 0600)
         parser.write(fout)
 
+    invalidate_config(config_file)
+
     return True
 
 
@@ -567,6 +743,8 @@ def write_config_section(config_path, section_name, section_data ):
         os.fchmod(fout.fileno(), 0600)
         parser.write(fout)
 
+    invalidate_config(config_path)
+
     return True
 
 
@@ -590,6 +768,8 @@ def write_config_field(config_path, section_name, field_name, field_value):
         os.fchmod(fout.fileno(), 0600)
         parser.write(fout)
 
+    invalidate_config(config_path)
+
     return True
 
 
@@ -610,6 +790,8 @@ def delete_config_field(config_path, section_name, field_name ):
         os.fchmod(fout.fileno(), 0600)
         parser.write(fout)
 
+    invalidate_config(config_path)
+
     return True
 
 
@@ -630,6 +812,8 @@ def delete_config_section(config_path, section_name):
         os.fchmod(fout.fileno(), 0600)
         parser.write(fout)
 
+    invalidate_config(config_path)
+
     return True
 
 
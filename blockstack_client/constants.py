@@ -304,6 +304,9 @@ if os.environ.get("BLOCKSTACK_TEST_MAX_RPC_LEN"):
 
 CONFIG_FILENAME = 'client.ini'
 WALLET_FILENAME = 'wallet.json'
+WALLET_AGENT_SOCKET_FILENAME = 'wallet_agent.sock'
+WALLET_AGENT_TOKEN_FILENAME = 'wallet_agent.token'
+WALLET_AGENT_IDLE_TIMEOUT = 900     # seconds without a request before the wallet agent locks itself
 
 CONFIG_PATH = os.environ.get('BLOCKSTACK_CLIENT_CONFIG')
 
@@ -327,6 +330,21 @@ else:
 
 WALLET_PATH = os.path.join(CONFIG_DIR, 'wallet.json')
 DEFAULT_QUEUE_PATH = os.path.join(CONFIG_DIR, 'queues.db')
+SNV_DB_FILENAME = 'snv.db'   # consensus hashes and ops hashes proven by SNV
+
+# byte bounds on the datastore metadata cache
+DATA_CACHE_MAX_HEADER_BYTES = 4 * 1024 * 1024
+DATA_CACHE_MAX_DIR_BYTES = 32 * 1024 * 1024
+DATA_CACHE_MAX_DATASTORE_BYTES = 4 * 1024 * 1024
+
+# path resolution hints: the last-seen inode at each datastore path.
+# These are only predictions (every inode is re-verified), so they outlive the cache.
+DATA_CACHE_MAX_PATH_HINT_BYTES = 4 * 1024 * 1024
+DATA_CACHE_PATH_HINT_TTL = 86400
+
+# files bigger than one chunk are stored as a manifest of fixed-size chunks
+DATASTORE_CHUNK_SIZE = 1024 * 1024
+DATASTORE_CHUNK_CONCURRENCY = 8     # chunks in flight per file transfer
 
 METADATA_DIRNAME = 'metadata'
 
@@ -343,6 +361,9 @@ MAX_TX_CONFIRMATIONS = 130
 QUEUE_LENGTH_TO_MONITOR = 50
 MINIMUM_BALANCE = 0.002
 DEFAULT_POLL_INTERVAL = 300
+SCATTER_GATHER_MAX_WORKERS = 16         # threads shared by all scatter/gather runs
+REGISTRAR_STAGE_CONCURRENCY = 4         # names in flight per registrar replication stage
+REGISTRAR_BLOCK_CHECK_INTERVAL = 5      # seconds between checks for a new block
 
 # approximate transaction sizes, for when the user has no balance.
 # over-estimations, to avoid stalled registrations.
@@ -370,6 +391,18 @@ TX_MAX_FEE = int(5 * 1e5)
 ACCOUNT_SIGNING_KEY_INDEX = 0
 DATASTORE_SIGNING_KEY_INDEX = 0
 
+# hardened children indexes of name keys (same as blockstack.js):
+# master/888'/0'/name_index' is the name owner key, and
+# its children 0', 1', and 2' are the app root, signing, and encryption keys
+NAMES_PRIVKEY_NODE = 888
+NAMES_PRIVKEY_VERSION_NODE = 0
+APP_PRIVKEY_NODE = 0
+SIGNING_PRIVKEY_NODE = 1
+ENCRYPTION_PRIVKEY_NODE = 2
+
+# maximum number of derived keys to cache
+KEY_CACHE_MAX_ENTRIES = 10000
+
 # version of the storage protocol 
 BLOCKSTACK_STORAGE_PROTO_VERSION = 1
 
@@ -57,14 +57,17 @@ from .proxy import (
     getinfo, get_name_blockchain_history, get_default_proxy, json_is_error)
 from .storage import hash_zonefile
 from .zonefile import get_name_zonefile, load_name_zonefile, store_name_zonefile
-from .utils import ScatterGather
+from .utils import ScatterGather, LatencyHistogram
+from .cache import LRUTTLCache
 
 from .logger import get_logger
 from .config import get_config, get_local_device_id
 from .constants import (
     BLOCKSTACK_TEST, BLOCKSTACK_DEBUG, DATASTORE_SIGNING_KEY_INDEX,
     BLOCKSTACK_STORAGE_PROTO_VERSION, DEFAULT_DEVICE_ID,
-    CONFIG_PATH
+    CONFIG_PATH, DATA_CACHE_MAX_HEADER_BYTES, DATA_CACHE_MAX_DIR_BYTES,
+    DATA_CACHE_MAX_DATASTORE_BYTES, DATA_CACHE_MAX_PATH_HINT_BYTES, DATA_CACHE_PATH_HINT_TTL,
+    DATASTORE_CHUNK_SIZE, DATASTORE_CHUNK_CONCURRENCY
 )
 
 from .schemas import (
@@ -72,6 +75,7 @@ from .schemas import (
     DATASTORE_SCHEMA,
     MUTABLE_DATUM_DIR_SCHEMA,
     MUTABLE_DATUM_INODE_HEADER_SCHEMA,
+    MUTABLE_DATUM_FILE_CHUNKS_SCHEMA,
     MUTABLE_DATUM_DIR_TYPE,
     MUTABLE_DATUM_FILE_TYPE)
 
@@ -84,122 +88,36 @@ EREMOTEIO = 121
 
 class DataCache(object):
     """
-    Write-coherent inode and datastore data cache
+    Write-coherent inode and datastore data cache.
+    Each cache is bounded in entries and bytes, and evicts
+    least-recently-used data first.  Entries are grouped by
+    datastore, so a whole datastore can be invalidated at once.
     """
-    def __init__(self, max_headers=1024, max_dirs=1024, max_datastores=1024):
-        self.header_cache = {}
-        self.header_deadlines = {}
-        self.max_headers = max_headers
+    def __init__(self, max_headers=1024, max_dirs=1024, max_datastores=1024, max_path_hints=8192,
+                 max_header_bytes=DATA_CACHE_MAX_HEADER_BYTES, max_dir_bytes=DATA_CACHE_MAX_DIR_BYTES,
+                 max_datastore_bytes=DATA_CACHE_MAX_DATASTORE_BYTES, max_path_hint_bytes=DATA_CACHE_MAX_PATH_HINT_BYTES):
 
-        self.dir_cache = {}
-        self.dir_deadlines = {}
+        # map (datastore ID, child UUID) to its parent directory UUID, so we can properly evict
+        # the parent directory when we add/remove/update a file.  Only tracked for cached directories.
+        self.dir_lock = threading.RLock()
         self.dir_children = {}
-        self.max_dirs = max_dirs
+        self.dir_child_lists = {}   # (datastore ID, directory UUID) => child UUIDs
 
-        self.datastore_cache = {}
-        self.datastore_deadlines = {}
-        self.max_datastores = max_datastores
+        self.header_cache = LRUTTLCache(max_headers, max_header_bytes)
+        self.dir_cache = LRUTTLCache(max_dirs, max_dir_bytes, on_evict=self._forget_children, lock=self.dir_lock)
+        self.datastore_cache = LRUTTLCache(max_datastores, max_datastore_bytes)
+        self.path_hint_cache = LRUTTLCache(max_path_hints, max_path_hint_bytes)
 
-        self.header_lock = threading.Lock()
-        self.dir_lock = threading.Lock()
-        self.datastore_lock = threading.Lock()
 
-
-    def _put_data(self, lock, cache_obj, deadline_tbl, max_obj, key, value, ttl):
-        """
-        Save data to either the header cache or dir cache
-        """
-        deadline = int(time.time() + ttl)
-
-        if lock:
-            lock.acquire()
-
-        cache_obj[key] = {'value': value, 'deadline': deadline}
-
-        if not deadline_tbl.has_key(deadline):
-            deadline_tbl[deadline] = []
-
-        deadline_tbl[deadline].append(key)
-
-        if len(cache_obj.keys()) > max_obj:
-            # evict stuff
-            to_evict = []
-            evict_count = 0
-            for deadline in sorted(deadline_tbl.keys()):
-                to_evict.append(deadline)
-                evict_count += len(deadline_tbl[deadline])
-                if len(cache_obj.keys()) - evict_count <= max_obj:
-                    break
-
-            for deadline in to_evict:
-                evicted_keys = deadline_tbl[deadline]
-                del deadline_tbl[deadline]
-
-                for key in evicted_keys:
-                    del cache_obj[key]
-
-        if lock:
-            lock.release()
-
-
-    def _get_data(self, lock, cache_obj, deadline_tbl, key):
+    def _forget_children(self, key, inode_directory):
         """
-        Get data from either the header cache or dir cache
+        A directory left the cache; drop its child-to-parent links.
+        Called with self.dir_lock held.
         """
-        
-        with lock:
-            if not cache_obj.has_key(key):
-                return None, None
-
-            res = cache_obj[key]['value']
-            res_deadline = cache_obj[key]['deadline']
-
-            if time.time() < res_deadline:
-                # fresh 
-                return res, res_deadline
-
-            # expired
-            to_evict = []
-            for deadline in sorted(deadline_tbl.keys()):
-                if time.time() <= deadline:
-                    break
-                
-                to_evict.append(deadline)
-
-            for deadline in to_evict:
-                evicted_keys = deadline_tbl[deadline]
-                del deadline_tbl[deadline]
-
-                for key in evicted_keys:
-                    del cache_obj[key]
-
-            return None, None
-
-
-    def _evict_data(self, lock, cache_obj, deadline_tbl, key):
-        """
-        Remove data from a cache
-        """
-        with lock:
-            if not cache_obj.has_key(key):
-                return 
-
-            res = cache_obj[key]['value']
-            res_deadline = cache_obj[key]['deadline']
-
-            del cache_obj[key]
-
-            if not deadline_tbl.has_key(res_deadline):
-                return
-
-            if key not in deadline_tbl[res_deadline]:
-                return 
-
-            deadline_tbl[res_deadline].remove(key)
-            if len(deadline_tbl[res_deadline]) == 0:
-                del deadline_tbl[res_deadline]
-
-            return
+        datastore_id, dir_uuid = key
+        for child_uuid in self.dir_child_lists.pop(key, []):
+            if self.dir_children.get((datastore_id, child_uuid), None) == dir_uuid:
+                del self.dir_children[(datastore_id, child_uuid)]
 
 
     def put_inode_header(self, datastore_id, inode_header, ttl):
@@ -207,7 +125,7 @@ class DataCache(object):
         Save an inode header
         """
         log.debug("Cache inode header {}".format(inode_header['uuid']))
-        return self._put_data(self.header_lock, self.header_cache, self.header_deadlines, self.max_headers, '{}:{}'.format(datastore_id, inode_header['uuid']), inode_header, ttl)
+        return self.header_cache.put((datastore_id, inode_header['uuid']), inode_header, ttl, group=datastore_id)
 
 
     def put_inode_directory(self, datastore_id, inode_directory, ttl):
@@ -216,16 +134,19 @@ class DataCache(object):
         """
         log.debug("Cache directory {} (version {})".format(inode_directory['uuid'], inode_directory['version']))
 
+        key = (datastore_id, inode_directory['uuid'])
         with self.dir_lock:
             # stash directory
-            self._put_data(None, self.dir_cache, self.dir_deadlines, self.max_dirs, '{}:{}'.format(datastore_id, inode_directory['uuid']), inode_directory, ttl)
+            self.dir_cache.put(key, inode_directory, ttl, group=datastore_id)
+            if key not in self.dir_cache:
+                # too big to cache
+                return
+
+            child_uuids = [child_idata['uuid'] for child_idata in inode_directory['idata']['children'].values()]
+            for child_uuid in child_uuids:
+                self.dir_children[(datastore_id, child_uuid)] = inode_directory['uuid']
 
-            # also, map children UUID back to the parent directory so we can properly evict the parent directory
-            # when we add/remove/update a file.
-            for child_name in inode_directory['idata']['children'].keys():
-                child_idata = inode_directory['idata']['children'][child_name]
-                child_uuid = child_idata['uuid']
-                self.dir_children[child_uuid] = inode_directory['uuid']
+            self.dir_child_lists[key] = child_uuids
 
 
     def put_datastore_record(self, datastore_id, datastore_rec, ttl):
@@ -233,7 +154,14 @@ class DataCache(object):
         Save a datastore record
         """
         log.debug("Cache datastore {}".format(datastore_id))
-        return self._put_data(self.datastore_lock, self.datastore_cache, self.datastore_deadlines, self.max_datastores, datastore_id, datastore_rec, ttl)
+        return self.datastore_cache.put(datastore_id, datastore_rec, ttl, group=datastore_id)
+
+
+    def put_path_hint(self, datastore_id, path, path_hint, ttl=DATA_CACHE_PATH_HINT_TTL):
+        """
+        Remember which inode was last resolved at a path
+        """
+        return self.path_hint_cache.put((datastore_id, path), path_hint, ttl, group=datastore_id)
 
 
     def get_inode_header(self, datastore_id, inode_uuid):
@@ -241,7 +169,7 @@ class DataCache(object):
         Get a cached inode header
         Return None if stale or absent
         """
-        res, deadline = self._get_data(self.header_lock, self.header_cache, self.header_deadlines, '{}:{}'.format(datastore_id, inode_uuid))
+        res, deadline = self.header_cache.get((datastore_id, inode_uuid))
         if res:
             log.debug("Cache HIT header {}, expires at {} (now={})".format(inode_uuid, deadline, time.time()))
 
@@ -256,7 +184,7 @@ class DataCache(object):
         Get a cached directory header
         Return None if stale or absent
         """
-        res, deadline = self._get_data(self.dir_lock, self.dir_cache, self.dir_deadlines, '{}:{}'.format(datastore_id, inode_uuid))
+        res, deadline = self.dir_cache.get((datastore_id, inode_uuid))
         if res:
             log.debug("Cache HIT directory {}, version {}, expires at {} (now={})".format(inode_uuid, res['version'], deadline, time.time()))
 
@@ -271,7 +199,7 @@ class DataCache(object):
         Get a cached datastore record
         Return None if stale or absent
         """
-        res, deadline = self._get_data(self.datastore_lock, self.datastore_cache, self.datastore_deadlines, datastore_id)
+        res, deadline = self.datastore_cache.get(datastore_id)
         if res:
             log.debug("Cache HIT datastore {}, expires at {} (now={})".format(datastore_id, deadline, time.time()))
         
@@ -281,34 +209,43 @@ class DataCache(object):
         return res
 
 
+    def get_path_hint(self, datastore_id, path):
+        """
+        Get the inode last resolved at a path.
+        This is only a prediction; the caller must verify it.
+        Return None if stale or absent
+        """
+        res, _ = self.path_hint_cache.get((datastore_id, path))
+        return res
+
+
     def evict_inode_header(self, datastore_id, inode_uuid):
         """
         Evict a given inode header
         """
-        return self._evict_data(self.header_lock, self.header_cache, self.header_deadlines, '{}:{}'.format(datastore_id, inode_uuid))
+        return self.header_cache.evict((datastore_id, inode_uuid))
 
 
     def evict_inode_directory(self, datastore_id, inode_uuid):
         """
         Evict a given directory
         """
-        return self._evict_data(self.dir_lock, self.dir_cache, self.dir_deadlines, '{}:{}'.format(datastore_id, inode_uuid))
+        return self.dir_cache.evict((datastore_id, inode_uuid))
 
 
     def evict_datastore_record(self, datastore_id):
         """
         Evict a datastore record
         """
-        return self._evict_data(self.datastore_lock, self.datastore_cache, self.datastore_deadlines, datastore_id)
+        return self.datastore_cache.evict(datastore_id)
 
 
     def evict_inode(self, datastore_id, inode_uuid):
         """
-        Evict all inode state
+        Evict all inode state, and the parent directory's state
         """
-        parent_uuid = None
         with self.dir_lock:
-            parent_uuid = self.dir_children.get(inode_uuid, None)
+            parent_uuid = self.dir_children.get((datastore_id, inode_uuid), None)
 
         self.evict_inode_header(datastore_id, inode_uuid)
         self.evict_inode_directory(datastore_id, inode_uuid)
@@ -318,30 +255,38 @@ class DataCache(object):
             self.evict_inode_header(datastore_id, parent_uuid)
             self.evict_inode_directory(datastore_id, parent_uuid)
 
-            to_remove = []
-            for (cuuid, duuid) in self.dir_children.items():
-                if duuid == inode_uuid:
-                    to_remove.append(cuuid)
 
-            for cuuid in to_remove:
-                del self.dir_children[cuuid]
+    def evict_datastore(self, datastore_id):
+        """
+        Evict the datastore record and all cached inodes of a datastore
+        """
+        log.debug("Evict all cached state for datastore {}".format(datastore_id))
+        self.header_cache.evict_group(datastore_id)
+        self.dir_cache.evict_group(datastore_id)
+        self.datastore_cache.evict_group(datastore_id)
+        self.path_hint_cache.evict_group(datastore_id)
 
     
     def evict_all(self):
         """
         Clear the entire cache
         """
-        with self.header_lock:
-            self.header_cache = {}
-            self.header_deadlines = {}
+        self.header_cache.clear()
+        self.dir_cache.clear()
+        self.datastore_cache.clear()
+        self.path_hint_cache.clear()
 
-        with self.dir_lock:
-            self.dir_cache = {}
-            self.dir_deadlines = {}
 
-        with self.datastore_lock:
-            self.datastore_cache = {}
-            self.datastore_deadliens = {}
+    def get_stats(self):
+        """
+        Get hit, miss, and eviction statistics for each cache
+        """
+        return {
+            'inode_headers': self.header_cache.get_stats(),
+            'inode_directories': self.dir_cache.get_stats(),
+            'datastores': self.datastore_cache.get_stats(),
+            'path_hints': self.path_hint_cache.get_stats(),
+        }
 
 
 GLOBAL_CACHE = DataCache()
@@ -1949,7 +1894,7 @@ def delete_datastore_info( datastore_id, datastore_tombstones, root_tombstones,
         return {'error': 'Failed to delete root inode', 'errno': EREMOTEIO}
 
     # evict 
-    GLOBAL_CACHE.evict_datastore_record(datastore_id)
+    GLOBAL_CACHE.evict_datastore(datastore_id)
     return {'status': True}
 
 
@@ -2329,9 +2274,10 @@ def get_inode_header(blockchain_id, datastore_id, inode_uuid, drivers, data_pubk
     return {'status': True, 'inode': inode_hdr, 'version': max(inode_hdr_version, inode_version), 'drivers': inode_drivers}
 
 
-def make_inode_header_blob( datastore_id, inode_type, owner, inode_uuid, data_hash, device_ids, readers=[], min_version=None, config_path=CONFIG_PATH, create=False, include_raw=False ):
+def make_inode_header_blob( datastore_id, inode_type, owner, inode_uuid, data_hash, device_ids, readers=[], min_version=None, config_path=CONFIG_PATH, create=False, include_raw=False, chunked=False ):
     """
     Make an inode header structure for storage in mutable data.
+    If @chunked is True, then data_hash is the hash of the file's chunk manifest.
     Return {'status': True, 'header': serialized inode header} on success.  The caller should sign this, and replicate it and the signature.
     Return {'error': ...} on error
     """
@@ -2349,6 +2295,9 @@ def make_inode_header_blob( datastore_id, inode_type, owner, inode_uuid, data_ha
         'proto_version': BLOCKSTACK_STORAGE_PROTO_VERSION,
     }
 
+    if chunked:
+        res['chunked'] = True
+
     jsonschema.validate(res, MUTABLE_DATUM_INODE_HEADER_SCHEMA)
     
     data_id = '{}.{}.hdr'.format(datastore_id, inode_uuid)
@@ -2365,13 +2314,13 @@ def make_inode_header_blob( datastore_id, inode_type, owner, inode_uuid, data_ha
     return ret
 
 
-def make_file_inode_data( datastore_id, owner, inode_uuid, data_payload_hash, device_ids, readers=[], config_path=CONFIG_PATH, min_version=None, create=False ):
+def make_file_inode_data( datastore_id, owner, inode_uuid, data_payload_hash, device_ids, readers=[], config_path=CONFIG_PATH, min_version=None, create=False, chunked=False ):
     """
     Initialize an inode header and hash for file data
     Return {'status': True, 'header': serialized inode header} on success.  The caller should sign this, and replicate it and the signature.
     Return {'error': ...} on error
     """
-    header_blob = make_inode_header_blob( datastore_id, MUTABLE_DATUM_FILE_TYPE, owner, inode_uuid, data_payload_hash, device_ids, readers=readers, config_path=config_path, min_version=min_version, create=create )
+    header_blob = make_inode_header_blob( datastore_id, MUTABLE_DATUM_FILE_TYPE, owner, inode_uuid, data_payload_hash, device_ids, readers=readers, config_path=config_path, min_version=min_version, create=create, chunked=chunked )
     if 'error' in header_blob:
         return header_blob
 
@@ -2760,12 +2709,115 @@ def delete_inode_data( datastore, signed_tombstones, proxy=None, config_path=CON
 
 
 
+PATH_RESOLVE_LOCK = threading.Lock()
+PATH_RESOLVE_LATENCY = {}       # path depth => LatencyHistogram
+PATH_RESOLVE_SPECULATION = {'hits': 0, 'misses': 0}
+
+
+def get_path_resolve_stats():
+    """
+    Get path resolution latency histograms (by path depth),
+    and how often the speculatively-fetched inodes were usable.
+    """
+    with PATH_RESOLVE_LOCK:
+        return {
+            'latency': dict(('depth_{}'.format(depth), hist.get_stats()) for (depth, hist) in PATH_RESOLVE_LATENCY.items()),
+            'speculation': dict(PATH_RESOLVE_SPECULATION),
+        }
+
+
+def _path_resolve_record(depth, elapsed, spec_hits, spec_misses):
+    """
+    Record how long it took to resolve a path of the given depth
+    """
+    with PATH_RESOLVE_LOCK:
+        if depth not in PATH_RESOLVE_LATENCY:
+            PATH_RESOLVE_LATENCY[depth] = LatencyHistogram()
+
+        hist = PATH_RESOLVE_LATENCY[depth]
+        PATH_RESOLVE_SPECULATION['hits'] += spec_hits
+        PATH_RESOLVE_SPECULATION['misses'] += spec_misses
+
+    hist.record(elapsed)
+
+
+def _inode_prefetch_path( blockchain_id, datastore_id, root_uuid, path_parts, drivers, data_pubkeys, get_idata=True, force=False, config_path=CONFIG_PATH, proxy=None ):
+    """
+    Speculatively fetch the inodes along a path, all at once.
+
+    The inode at each level is predicted from the path hints left by earlier
+    resolutions, up to the first level we have no hint for.  Each predicted inode's
+    header is fetched, and if we also know its last-seen header, its payload
+    is fetched at the same time.  Nothing here is trusted until the caller
+    checks it against the fresh parent directories and headers.
+
+    This is a server-side method.
+
+    Return a list with one entry per predicted level (root first):
+    {'uuid': ..., 'type': ..., 'data_hash': last-seen data hash or None, 'header': get_inode_header() result, 'data': get_inode_data() result or None}
+    """
+    hints = []
+    for i in xrange(0, len(path_parts) + 1):
+        hint = GLOBAL_CACHE.get_path_hint(datastore_id, '/' + '/'.join(path_parts[:i]))
+        if i == 0 and (hint is None or hint['uuid'] != root_uuid):
+            hint = {'uuid': root_uuid, 'type': MUTABLE_DATUM_DIR_TYPE, 'version': None, 'header': None}
+
+        if hint is None:
+            break
+
+        hints.append(hint)
+        if hint['type'] != MUTABLE_DATUM_DIR_TYPE:
+            break
+
+    if len(hints) == 1 and hints[0]['header'] is None:
+        # nothing to speculate on
+        return []
+
+    sg = ScatterGather()
+    for i, hint in enumerate(hints):
+        get_header = functools.partial(get_inode_header, blockchain_id, datastore_id, hint['uuid'], drivers, data_pubkeys, force=force, config_path=config_path, proxy=proxy)
+        sg.add_task('header-{}'.format(i), get_header)
+
+        if hint['header'] is not None and (hint['type'] == MUTABLE_DATUM_DIR_TYPE or get_idata):
+            if hint['type'] == MUTABLE_DATUM_DIR_TYPE:
+                cached_dir = GLOBAL_CACHE.get_inode_directory(datastore_id, hint['uuid'])
+                if cached_dir is not None and cached_dir['version'] == hint['version']:
+                    # will be served from the cache once the header is verified
+                    continue
+
+            # don't let a guessed header touch the directory cache
+            header_info = {'status': True, 'inode': hint['header'], 'version': hint['version'], 'drivers': drivers}
+            get_data = functools.partial(get_inode_data, blockchain_id, datastore_id, hint['uuid'], hint['type'], drivers, data_pubkeys,
+                                         force=force, config_path=config_path, proxy=proxy, header_info=header_info, no_cache=True)
+
+            sg.add_task('data-{}'.format(i), get_data)
+
+    log.debug("Prefetch {} inode(s) along /{} in {}".format(len(hints), '/'.join(path_parts), datastore_id))
+    results = sg.run_tasks()
+
+    prefetched = []
+    for i, hint in enumerate(hints):
+        prefetched.append({
+            'uuid': hint['uuid'],
+            'type': hint['type'],
+            'data_hash': hint['header']['data_hash'] if hint['header'] is not None else None,
+            'header': results['header-{}'.format(i)],
+            'data': results.get('data-{}'.format(i), None),
+        })
+
+    return prefetched
+
+
 def inode_resolve_path( blockchain_id, datastore, path, data_pubkeys, get_idata=True, force=False, config_path=CONFIG_PATH, proxy=None ):
     """
     Given a fully-qualified data path, the user's datastore record, and a private key,
     go and traverse the directory heirarchy encoded
     in the data path and fetch the data at the leaf.
 
+    The inodes along the path are fetched speculatively in parallel (see _inode_prefetch_path),
+    and then verified level-by-level against each parent directory.  Any level we mispredicted
+    is fetched again the slow way.
+
     This is a server-side method.
 
     TODO: use data_pubkeys, not datastore_id, for identifying the data owner's device-specific written information (requires token file support)
@@ -2785,6 +2837,7 @@ def inode_resolve_path( blockchain_id, datastore, path, data_pubkeys, get_idata=
         proxy = get_default_proxy(config_path)
 
     log.debug("Resolve {}".format(path))
+    t_start = time.time()
 
     def _make_path_entry(  name, child_uuid, child_entry, prefix ):
         """
@@ -2802,36 +2855,83 @@ def inode_resolve_path( blockchain_id, datastore, path, data_pubkeys, get_idata=
         return path_ent
 
     path = posixpath.normpath(path).strip("/")
-    path_parts = path.split('/')
-    prefix = '/'
+    path_parts = path.split('/') if len(path) > 0 else []
 
     datastore_id = datastore_get_id(datastore['pubkey'])
     drivers = datastore['drivers']
-    device_ids = datastore['device_ids']
     root_uuid = datastore['root_uuid']
-   
-    # getting only the root?
-    root_inode = get_inode_data(blockchain_id, datastore_id, root_uuid, MUTABLE_DATUM_DIR_TYPE, drivers, data_pubkeys, force=force, config_path=CONFIG_PATH, proxy=proxy)
+
+    conf = get_config(config_path)
+    assert conf
+
+    cache_ttl = int(conf.get('cache_ttl', 3600))
+
+    prefetched = _inode_prefetch_path(blockchain_id, datastore_id, root_uuid, path_parts, drivers, data_pubkeys, get_idata=get_idata, force=force, config_path=config_path, proxy=proxy)
+    spec_stats = {'hits': 0, 'misses': 0}
+
+    def _get_inode( level, inode_uuid, inode_type, want_data ):
+        """
+        Get the header of the inode at the given path level, and its payload if @want_data.
+        Use the prefetched inode if we predicted this level correctly.
+        Return (header info, inode info) on success, where both are formatted like get_inode_data()'s return value
+        Return (None, {'error': ..., 'errno': ...}) on error
+        """
+        spec = None
+        if level < len(prefetched):
+            if prefetched[level]['uuid'] == inode_uuid:
+                spec = prefetched[level]
+                spec_stats['hits'] += 1
+            else:
+                spec_stats['misses'] += 1
+
+        if spec is not None:
+            header_info = spec['header']
+        else:
+            header_info = get_inode_header(blockchain_id, datastore_id, inode_uuid, drivers, data_pubkeys, force=force, config_path=config_path, proxy=proxy)
+
+        if 'error' in header_info:
+            return None, header_info
+
+        if not want_data:
+            return header_info, header_info
+
+        if spec is not None and spec['data'] is not None and 'error' not in spec['data'] and spec['data_hash'] == header_info['inode']['data_hash']:
+            # the fresh header vouches for the payload we fetched alongside it
+            inode = dict(spec['data']['inode'])
+            inode.update(dict((k, v) for (k, v) in header_info['inode'].items() if k != 'data_hash'))
+            inode['version'] = header_info['version']
+
+            if inode_type == MUTABLE_DATUM_DIR_TYPE:
+                GLOBAL_CACHE.put_inode_directory(datastore_id, inode, cache_ttl)
+
+            return header_info, {'status': True, 'inode': inode, 'version': header_info['version'], 'drivers': header_info['drivers']}
+
+        elif spec is not None and spec['data'] is not None:
+            spec_stats['misses'] += 1
+
+        inode_info = get_inode_data(blockchain_id, datastore_id, inode_uuid, inode_type, drivers, data_pubkeys, force=force, config_path=config_path, proxy=proxy, header_info=header_info)
+        return header_info, inode_info
+
+    def _remember( hint_path, inode_uuid, inode_type, header_info ):
+        """
+        Remember the inode at this path for next time
+        """
+        GLOBAL_CACHE.put_path_hint(datastore_id, hint_path, {'uuid': inode_uuid, 'type': inode_type, 'version': header_info['version'], 'header': header_info['inode']})
+
+    header_info, root_inode = _get_inode(0, root_uuid, MUTABLE_DATUM_DIR_TYPE, True)
     if 'error' in root_inode:
         log.error("Failed to get root inode: {}".format(root_inode['error']))
         return {'error': root_inode['error'], 'errno': root_inode['errno']}
 
+    _remember('/', root_uuid, MUTABLE_DATUM_DIR_TYPE, header_info)
+
     ret = {
         '/': {'uuid': root_uuid, 'name': '', 'parent': '', 'inode': root_inode['inode']}
     }
- 
-    if len(path) == 0:
-        # looked up /
-        return ret
-  
-    # walk 
-    i = 0
-    child_uuid = None
-    name = None
+
+    # walk
+    prefix = '/'
     cur_dir = root_inode['inode']
-    child_entry = None
-    child_type = None
-    last_header_info = None
 
     for i in xrange(0, len(path_parts)):
 
@@ -2846,70 +2946,33 @@ def inode_resolve_path( blockchain_id, datastore, path, data_pubkeys, get_idata=
                 log.debug('No child "{}" in "{}"'.format(name, prefix))
 
             return {'error': 'No such file or directory', 'errno': errno.ENOENT}
-       
+
         child_uuid = child_dirent['uuid']
         child_type = child_dirent['type']
 
-        if child_type == MUTABLE_DATUM_FILE_TYPE and not get_idata:
-            # done searching, and don't want data
-            break
-        
-        # get child, and only get the idata if it's a directory
-        log.debug("Get {} at '{}'".format(child_uuid, '/' + '/'.join(path_parts[:i+1])))
-        child_entry = get_inode_data(blockchain_id, datastore_id, child_uuid, child_type, drivers, data_pubkeys, force=force, config_path=CONFIG_PATH, proxy=proxy, file_idata=False)
+        if child_type != MUTABLE_DATUM_DIR_TYPE and i + 1 < len(path_parts):
+            log.debug('Out of path at "{}" (stopped at {} in {})'.format(prefix + name, i, path_parts))
+            return {'error': 'Not a directory', 'errno': errno.ENOTDIR}
+
+        # only get a file's data if the caller asked for it
+        log.debug("Get {} at '{}'".format(child_uuid, prefix + name))
+        header_info, child_entry = _get_inode(i + 1, child_uuid, child_type, child_type == MUTABLE_DATUM_DIR_TYPE or get_idata)
         if 'error' in child_entry:
             log.error("Failed to get inode {} at {}: {}".format(child_uuid, prefix + name, child_entry['error']))
             return {'error': child_entry['error'], 'errno': child_entry['errno']}
 
-        last_header_info = child_entry
         child_entry = child_entry['inode']
         assert child_entry['type'] == child_dirent['type'], "Corrupt inode {}".format(storage.make_fq_data_id(datastore_id,child_uuid))
 
-        path_ent = _make_path_entry(name, child_uuid, child_entry, prefix)
-        ret[prefix + name] = path_ent
-    
-        if child_type == MUTABLE_DATUM_FILE_TYPE or i == len(path_parts) - 1:
-            # only care if this is a file 
-            if child_type != MUTABLE_DATUM_FILE_TYPE:
-                last_header_info = None
-
-            break
+        _remember(prefix + name, child_uuid, child_type, header_info)
+        ret[prefix + name] = _make_path_entry(name, child_uuid, child_entry, prefix)
 
         # keep walking
         cur_dir = child_entry
         prefix += name + '/'
 
+    _path_resolve_record(len(path_parts), time.time() - t_start, spec_stats['hits'], spec_stats['misses'])
 
-    # did we reach the end?
-    if i+1 < len(path_parts):
-        log.debug('Out of path at "{}" (stopped at {} in {})'.format(prefix + name, i, path_parts))
-        return {'error': 'Not a directory', 'errno': errno.ENOTDIR}
-
-    if child_type == MUTABLE_DATUM_DIR_TYPE or (get_idata and child_type == MUTABLE_DATUM_FILE_TYPE):
-        # get file data too 
-        # NOTE: last_header_info will be the return value from the last call to get_inode_data()
-        assert ret.has_key(prefix + name), "BUG: missing {}".format(prefix + name)
-        child_entry = get_inode_data(blockchain_id, datastore_id, child_uuid, child_type, drivers, data_pubkeys, force=force, config_path=CONFIG_PATH, proxy=proxy, header_info=last_header_info )
-
-    else:
-        # get only inode header.
-        # didn't request idata, so add a path entry here
-        assert not ret.has_key(prefix + name), "BUG: already defined {}".format(prefix + name)
-
-        path_ent = _make_path_entry(name, child_uuid, child_entry, prefix)
-        ret[prefix + name] = path_ent
-
-        child_entry = get_inode_header(blockchain_id, datastore_id, child_uuid, drivers, data_pubkeys, force=force, config_path=config_path, proxy=proxy)
-
-    if 'error' in child_entry:
-        log.error("Failed to get file data for {} at {}: {}".format(child_uuid, prefix + name, child_entry['error']))
-        return {'error': child_entry['error'], 'errno': child_entry['errno']}
-    
-    child_entry = child_entry['inode']
-
-    # update ret
-    ret[prefix + name]['inode'] = child_entry
-    
     log.debug("Resolved /{}".format(path))
     return ret
 
@@ -3527,9 +3590,212 @@ def datastore_rmdir(api_client, datastore, data_path, data_privkey_hex, data_pub
     return {'status': True}
 
 
-def datastore_getfile(api_client, blockchain_id, datastore, data_path, data_pubkeys, extended=False, force=False, config_path=CONFIG_PATH ):
+def file_chunk_data_id( datastore_id, chunk_hash ):
+    """
+    Get the data ID of a file chunk.
+    Chunks are named by their hashes, so identical chunks
+    (i.e. in successive versions of a file) are stored once.
+    """
+    return '{}.chunk.{}'.format(datastore_id, chunk_hash)
+
+
+def iter_file_chunks( file_data, chunk_size=DATASTORE_CHUNK_SIZE ):
+    """
+    Iterate over the fixed-size chunks of a string or a file-like object.
+    File-like objects are read one chunk at a time.
+    """
+    if hasattr(file_data, 'read'):
+        while True:
+            chunk = file_data.read(chunk_size)
+            if not chunk:
+                break
+
+            yield chunk
+
+    else:
+        for i in xrange(0, len(file_data), chunk_size):
+            yield file_data[i:i+chunk_size]
+
+
+def make_file_chunk_manifest( file_data, chunk_size=DATASTORE_CHUNK_SIZE ):
+    """
+    Make the chunk manifest for a string or a file-like object.
+    The manifest becomes the file's payload; the file's inode header
+    covers its hash, so signing the header signs the chunk list.
+
+    Return {'status': True, 'manifest': manifest, 'manifest_str': serialized manifest, 'manifest_hash': payload hash of the serialized manifest}
+    """
+    chunk_hashes = []
+    size = 0
+    for chunk in iter_file_chunks(file_data, chunk_size=chunk_size):
+        chunk_hashes.append(storage.hash_data_payload(chunk))
+        size += len(chunk)
+
+    manifest = {
+        'size': size,
+        'chunk_size': chunk_size,
+        'chunks': chunk_hashes,
+    }
+
+    manifest_str = json.dumps(manifest, sort_keys=True)
+    return {'status': True, 'manifest': manifest, 'manifest_str': manifest_str, 'manifest_hash': storage.hash_data_payload(manifest_str)}
+
+
+def parse_file_chunk_manifest( manifest_str ):
+    """
+    Parse and validate a chunk manifest.
+    Return the manifest on success
+    Return None on error
+    """
+    try:
+        manifest = json.loads(manifest_str)
+        jsonschema.validate(manifest, MUTABLE_DATUM_FILE_CHUNKS_SCHEMA)
+
+        num_chunks = (manifest['size'] + manifest['chunk_size'] - 1) / manifest['chunk_size']
+        assert len(manifest['chunks']) == num_chunks, "Expected {} chunks, got {}".format(num_chunks, len(manifest['chunks']))
+        return manifest
+
+    except (ValueError, ValidationError, AssertionError) as e:
+        if BLOCKSTACK_DEBUG:
+            log.exception(e)
+
+        return None
+
+
+def _file_chunk_is_stored( datastore_id, chunk_hash, device_ids, config_path=CONFIG_PATH ):
+    """
+    Has this node already stored a chunk?
+    """
+    res = get_mutable_data_version(file_chunk_data_id(datastore_id, chunk_hash), device_ids, config_path=config_path)
+    return res['version'] > 0
+
+
+def put_file_chunks( datastore, chunks, config_path=CONFIG_PATH, proxy=None ):
+    """
+    Store a batch of file chunks to all of the datastore's drivers, in parallel.
+    Chunks this node has already stored are skipped.
+
+    This is a server-side method.
+
+    Return {'status': True, 'chunk_hashes': [...], 'stored': number of chunks uploaded, 'duplicates': number of chunks skipped} on success
+    Return {'error': ..., 'errno': ...} on failure
+    """
+    if proxy is None:
+        proxy = get_default_proxy(config_path)
+
+    datastore_id = datastore_get_id(datastore['pubkey'])
+    device_ids = datastore['device_ids']
+    drivers = datastore['drivers']
+
+    # write under this node's device ID, if it is one of the datastore's devices
+    device_id = get_local_device_id(os.path.dirname(config_path))
+    if device_id not in device_ids:
+        device_id = device_ids[0]
+
+    chunk_hashes = [storage.hash_data_payload(chunk) for chunk in chunks]
+    duplicates = 0
+
+    sg = ScatterGather()
+    for (chunk, chunk_hash) in zip(chunks, chunk_hashes):
+        if chunk_hash in sg.tasks or _file_chunk_is_stored(datastore_id, chunk_hash, device_ids, config_path=config_path):
+            duplicates += 1
+            continue
+
+        chunk_fqid = storage.make_fq_data_id(device_id, file_chunk_data_id(datastore_id, chunk_hash))
+        put_chunk = functools.partial(put_mutable, chunk_fqid, chunk, None, None, 1, raw=True, storage_drivers=drivers, storage_drivers_exclusive=True, config_path=config_path, proxy=proxy)
+        sg.add_task(chunk_hash, put_chunk)
+
+    log.debug("Store {} chunk(s) to {} ({} duplicate(s))".format(len(sg.tasks), ','.join(drivers), duplicates))
+
+    for (chunk_hash, res) in sg.run_tasks().items():
+        if 'error' in res:
+            log.error("Failed to replicate chunk {}: {}".format(chunk_hash, res['error']))
+            return {'error': 'Failed to replicate chunk {}'.format(chunk_hash), 'errno': EREMOTEIO}
+
+    return {'status': True, 'chunk_hashes': chunk_hashes, 'stored': len(sg.tasks), 'duplicates': duplicates}
+
+
+def get_file_chunks( datastore_id, chunk_hashes, drivers, data_pubkeys, config_path=CONFIG_PATH, proxy=None ):
+    """
+    Fetch a batch of file chunks in parallel.
+    Each chunk is verified against its hash.
+
+    This is a server-side method.
+
+    Return {'status': True, 'chunks': {chunk hash: chunk data}} on success
+    Return {'error': ..., 'errno': ...} on failure
+    """
+    if proxy is None:
+        proxy = get_default_proxy(config_path)
+
+    device_ids = [dk['device_id'] for dk in data_pubkeys]
+
+    sg = ScatterGather()
+    for chunk_hash in set(chunk_hashes):
+        # chunks never change, so there is no version to check
+        get_chunk = functools.partial(get_mutable, file_chunk_data_id(datastore_id, chunk_hash), device_ids, raw=True, data_hash=chunk_hash,
+                                      storage_drivers=drivers, force=True, proxy=proxy, config_path=config_path)
+
+        sg.add_task(chunk_hash, get_chunk)
+
+    chunks = {}
+    for (chunk_hash, res) in sg.run_tasks().items():
+        if 'error' in res:
+            log.error("Failed to fetch chunk {}: {}".format(chunk_hash, res['error']))
+            return {'error': 'Failed to fetch chunk {}'.format(chunk_hash), 'errno': EREMOTEIO}
+
+        chunks[chunk_hash] = res['data']
+
+    return {'status': True, 'chunks': chunks}
+
+
+def datastore_file_read( datastore_id, manifest, drivers, data_pubkeys, write_func, start=0, end=None, config_path=CONFIG_PATH, proxy=None ):
+    """
+    Read the bytes [start, end] (inclusive) of a chunked file, and pass them to write_func() in order.
+    Only the chunks in the range are fetched, DATASTORE_CHUNK_CONCURRENCY at a time,
+    so at most that many chunks are held in RAM.
+
+    This is a server-side method.
+
+    Return {'status': True, 'size': number of bytes written} on success
+    Return {'error': ..., 'errno': ...} on failure
+    """
+    size = manifest['size']
+    chunk_size = manifest['chunk_size']
+
+    if end is None or end >= size:
+        end = size - 1
+
+    if start > end:
+        return {'status': True, 'size': 0}
+
+    first_chunk = start / chunk_size
+    last_chunk = end / chunk_size
+    written = 0
+
+    for batch_start in xrange(first_chunk, last_chunk + 1, DATASTORE_CHUNK_CONCURRENCY):
+        batch = range(batch_start, min(batch_start + DATASTORE_CHUNK_CONCURRENCY, last_chunk + 1))
+        res = get_file_chunks(datastore_id, [manifest['chunks'][i] for i in batch], drivers, data_pubkeys, config_path=config_path, proxy=proxy)
+        if 'error' in res:
+            return res
+
+        for i in batch:
+            chunk = res['chunks'][manifest['chunks'][i]]
+            chunk_start = i * chunk_size
+            lo = max(start - chunk_start, 0)
+            hi = min(end - chunk_start + 1, len(chunk))
+
+            write_func(chunk[lo:hi])
+            written += hi - lo
+
+    return {'status': True, 'size': written}
+
+
+def datastore_getfile(api_client, blockchain_id, datastore, data_path, data_pubkeys, extended=False, force=False, manifest=False, config_path=CONFIG_PATH ):
     """
     Get a file identified by a path.
+    Chunked files are reassembled, unless @manifest is True, in which case
+    their inode data is left as the chunk manifest (for callers that stream the chunks themselves).
 
     TODO: rework datastore and datastore_id; we need to be sure that we're making inodes to write to this device's datastore and data_pubkeys corresponds to the owner's other devices
 
@@ -3555,18 +3821,33 @@ def datastore_getfile(api_client, blockchain_id, datastore, data_path, data_pubk
         log.error("Not a file: {}".format(data_path))
         return {'error': 'Not a file', 'errno': errno.EISDIR}
 
+    inode_info = file_info['inode_info']
+    if inode_info['inode'].get('chunked', False) and not manifest:
+        # reassemble the file from its chunks
+        chunk_manifest = parse_file_chunk_manifest(inode_info['inode']['idata'])
+        if chunk_manifest is None:
+            return {'error': 'Invalid chunk manifest', 'errno': errno.EIO}
+
+        data_parts = []
+        res = datastore_file_read(datastore_id, chunk_manifest, drivers, data_pubkeys, data_parts.append, config_path=config_path)
+        if 'error' in res:
+            log.error("Failed to read chunks of {}".format(data_path))
+            return res
+
+        inode_info['inode']['idata'] = ''.join(data_parts)
+
     ret = None
     if extended:
         ret = {
             'status': True,
-            'inode_info': file_info['inode_info'],
+            'inode_info': inode_info,
             'path_info': file_info['path_info'],
         }
 
     else:
         ret = {
             'status': True,
-            'data': file_info['inode_info']['inode']['idata']
+            'data': inode_info['inode']['idata']
         }
 
     return ret
@@ -3622,10 +3903,12 @@ def datastore_listdir(api_client, blockchain_id, datastore, data_path, data_pubk
     return ret
 
 
-def datastore_putfile_make_inodes(api_client, datastore, data_path, file_data_hash, data_pubkeys, readers=[], parent_dir=None, create=False, force=False, config_path=CONFIG_PATH ):
+def datastore_putfile_make_inodes(api_client, datastore, data_path, file_data_hash, data_pubkeys, readers=[], parent_dir=None, create=False, force=False, chunked=False, config_path=CONFIG_PATH ):
     """
     Store a file identified by a path.
     If @create is True, then will only succeed if created.
+    If @chunked is True, then file_data_hash is the hash of the file's chunk manifest (see make_file_chunk_manifest()),
+    and the chunks must be stored (see put_file_chunks()) before the inodes are.
 
     Does not actually upload data, but instead makes new inode blobs for the 
     parent directory and the new file inode.
@@ -3687,7 +3970,7 @@ def datastore_putfile_make_inodes(api_client, datastore, data_path, file_data_ha
     log.debug("Version of {} ({}) will be max({}, {}) = {}".format(data_path, child_uuid, parent_dir_inode['version'], child_dirent['version'], min_version))
 
     # make the new inode info
-    child_file_info = make_file_inode_data( datastore_id, datastore_id, child_uuid, file_data_hash, device_ids, readers=[], config_path=config_path, min_version=min_version, create=create )
+    child_file_info = make_file_inode_data( datastore_id, datastore_id, child_uuid, file_data_hash, device_ids, readers=[], config_path=config_path, min_version=min_version, create=create, chunked=chunked )
     if 'error' in child_file_info:
         log.error("Failed to create file {}: {}".format(data_path, child_file_info['error']))
         return {'error': 'Failed to create file', 'errno': errno.EIO}
@@ -3746,12 +4029,26 @@ def datastore_putfile_put_inodes( datastore, data_path, header_blobs, payloads,
         log.debug("Failed to check operation: {}".format(res['error']))
         return res
 
+    # a chunked file's payload is its chunk manifest, and its chunks must already be stored
+    file_header = data_blob_parse(data_blob_parse(header_blobs[0])['data'])
+    if file_header.get('chunked', False):
+        manifest = parse_file_chunk_manifest(payloads[0])
+        if manifest is None:
+            return {'error': 'Invalid chunk manifest', 'errno': errno.EINVAL}
+
+        datastore_id = datastore_get_id(data_pubkey)
+        for chunk_hash in set(manifest['chunks']):
+            if not _file_chunk_is_stored(datastore_id, chunk_hash, device_ids, config_path=config_path):
+                log.debug("Chunk {} of {} is not stored".format(chunk_hash, data_path))
+                return {'error': 'Chunk {} is not stored'.format(chunk_hash), 'errno': errno.EINVAL}
+
     return datastore_do_inode_operation( datastore, header_blobs, payloads, signatures, tombstones, config_path=config_path, proxy=proxy )
 
 
 def datastore_putfile(api_client, datastore, data_path, file_data_bin, data_privkey_hex, data_pubkeys, create=False, exist=False, force=False, config_path=CONFIG_PATH):
     """
     Client-side method to store a file.  MEANT FOR TESTING PURPOSES
+    * upload the file's chunks, if it is bigger than DATASTORE_CHUNK_SIZE
     * generate the directory inodes
     * sign them
     * replicate them.
@@ -3766,9 +4063,24 @@ def datastore_putfile(api_client, datastore, data_path, file_data_bin, data_priv
     device_ids = datastore['device_ids']
     drivers = datastore['drivers']
    
+    datastore_info = datastore_serialize_and_sign(datastore, data_privkey_hex)
+
+    chunked = (len(file_data_bin) > DATASTORE_CHUNK_SIZE)
+    if chunked:
+        # store the chunks, and make the manifest the file's payload
+        manifest_info = make_file_chunk_manifest(file_data_bin)
+        chunks = list(iter_file_chunks(file_data_bin))
+        for i in xrange(0, len(chunks), DATASTORE_CHUNK_CONCURRENCY):
+            res = api_client.backend_datastore_putchunks( datastore_info['str'], datastore_info['sig'], chunks[i:i+DATASTORE_CHUNK_CONCURRENCY] )
+            if 'error' in res:
+                log.debug("Failed to put chunks of {}".format(data_path))
+                return res
+
+        file_data_bin = manifest_info['manifest_str']
+
     file_hash = storage.hash_data_payload(file_data_bin)
 
-    inode_info = datastore_putfile_make_inodes( api_client, datastore, data_path, file_hash, data_pubkeys, create=create, force=force, config_path=config_path )
+    inode_info = datastore_putfile_make_inodes( api_client, datastore, data_path, file_hash, data_pubkeys, create=create, force=force, chunked=chunked, config_path=config_path )
     if 'error' in inode_info:
         return inode_info
 
@@ -3780,7 +4092,6 @@ def datastore_putfile(api_client, datastore, data_path, file_data_bin, data_priv
     assert inode_info['payloads'][0] is None
     inode_info['payloads'][0] = file_data_bin
 
-    datastore_info = datastore_serialize_and_sign(datastore, data_privkey_hex)
     res = api_client.backend_datastore_putfile( datastore_info['str'], datastore_info['sig'], data_path, inode_info['inodes'], inode_info['payloads'], inode_signatures, inode_info['tombstones'], create=create, exist=exist )
     if 'error' in res:
         log.debug("Failed to put putfile inodes")
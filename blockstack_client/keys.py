@@ -24,6 +24,7 @@
 import virtualchain
 from binascii import hexlify
 import re
+import threading
 
 import keylib
 
@@ -32,7 +33,11 @@ import jsonschema
 from jsonschema.exceptions import ValidationError
 
 from .logger import get_logger
-from .constants import CONFIG_PATH, BLOCKSTACK_DEBUG, BLOCKSTACK_TEST
+from .cache import LRUTTLCache
+from .constants import (
+    CONFIG_PATH, BLOCKSTACK_DEBUG, BLOCKSTACK_TEST, DEFAULT_SESSION_LIFETIME, KEY_CACHE_MAX_ENTRIES,
+    NAMES_PRIVKEY_NODE, NAMES_PRIVKEY_VERSION_NODE, APP_PRIVKEY_NODE, SIGNING_PRIVKEY_NODE, ENCRYPTION_PRIVKEY_NODE
+)
 
 import virtualchain
 from virtualchain.lib.ecdsalib import (
@@ -42,9 +47,35 @@ from virtualchain.lib.ecdsalib import (
 log = get_logger()
 
 # deriving hardened keys is expensive, so cache them once derived.
-# maps hex_privkey:chaincode --> {key_index: child_key}
-KEY_CACHE = {}
-KEYCHAIN_CACHE = {}
+# Entries last for at most a wallet session, and are dropped when the wallet changes.
+# KEY_CACHE maps (hex_privkey:chaincode, key_index) --> child key, grouped by hex_privkey:chaincode
+# KEYCHAIN_CACHE maps hex_privkey:chaincode --> PrivateKeychain
+# ADDRESS_INDEX_CACHE maps hex_privkey:chaincode --> {'scanned': number of children scanned, 'addresses': {child address: key_index}}
+KEY_CACHE = LRUTTLCache(KEY_CACHE_MAX_ENTRIES, KEY_CACHE_MAX_ENTRIES * 128)
+KEYCHAIN_CACHE = LRUTTLCache(KEY_CACHE_MAX_ENTRIES, KEY_CACHE_MAX_ENTRIES, sizeof=lambda keychain: 1)
+ADDRESS_INDEX_CACHE = LRUTTLCache(KEY_CACHE_MAX_ENTRIES, KEY_CACHE_MAX_ENTRIES * 128)
+ADDRESS_INDEX_LOCK = threading.Lock()
+
+
+def clear_derived_keys():
+    """
+    Forget all derived keys (i.e. when the wallet changes)
+    """
+    KEY_CACHE.clear()
+    KEYCHAIN_CACHE.clear()
+    ADDRESS_INDEX_CACHE.clear()
+
+
+def get_derived_key_stats():
+    """
+    Get hit and miss counts for the derived key caches
+    """
+    return {
+        'keys': KEY_CACHE.get_stats(),
+        'keychains': KEYCHAIN_CACHE.get_stats(),
+        'addresses': ADDRESS_INDEX_CACHE.get_stats(),
+    }
+
 
 class HDWallet(object):
     """
@@ -57,35 +88,21 @@ class HDWallet(object):
         If @hex_privkey is given, use that to derive keychain
         otherwise, use a new random seed
 
+        The keychain is only built when a child key that is not cached is needed.
+
         TODO: load chain state from config path
         """
-        global KEYCHAIN_CACHE
-
         assert hex_privkey
         assert len(chaincode) == 32
 
         self.hex_privkey = hex_privkey
+        self.chaincode = chaincode
         self.priv_keychain = None
         self.master_address = None
         self.child_addresses = None
 
         self.keychain_key = str(self.hex_privkey) + ":" + str(chaincode.encode('hex'))
 
-        if KEYCHAIN_CACHE.has_key(self.keychain_key):
-            if BLOCKSTACK_TEST:
-                log.debug("{} keychain is cached".format(self.keychain_key))
-            
-            self.priv_keychain = KEYCHAIN_CACHE[self.keychain_key]
-
-        else:
-            if BLOCKSTACK_TEST:
-                log.debug("{} keychain is NOT cached".format(self.keychain_key))
-
-            self.priv_keychain = self.get_priv_keychain(self.hex_privkey, chaincode)
-            KEYCHAIN_CACHE[self.keychain_key] = self.priv_keychain
-
-        self.master_address = self.get_master_address()
-
 
     def get_priv_keychain(self, hex_privkey, chaincode):
         if hex_privkey:
@@ -95,8 +112,29 @@ class HDWallet(object):
         return PrivateKeychain()
 
 
+    def _get_keychain(self):
+        """
+        Get (and cache) the keychain
+        """
+        global KEYCHAIN_CACHE
+
+        if self.priv_keychain is not None:
+            return self.priv_keychain
+
+        keychain, _ = KEYCHAIN_CACHE.get(self.keychain_key)
+        if keychain is None:
+            if BLOCKSTACK_TEST:
+                log.debug("{} keychain is NOT cached".format(self.keychain_key))
+
+            keychain = self.get_priv_keychain(self.hex_privkey, self.chaincode)
+            KEYCHAIN_CACHE.put(self.keychain_key, keychain, DEFAULT_SESSION_LIFETIME)
+
+        self.priv_keychain = keychain
+        return keychain
+
+
     def get_master_privkey(self):
-        return self.priv_keychain.private_key()
+        return self._get_keychain().private_key()
 
 
     def _encode_child_privkey(self, child_privkey, compressed=True):
@@ -115,22 +153,82 @@ class HDWallet(object):
         child privkey for given @index
         """
         global KEY_CACHE
-        if KEY_CACHE.has_key(self.keychain_key) and KEY_CACHE[self.keychain_key].has_key(index):
-            if BLOCKSTACK_TEST:
-                log.debug("Child {} of {} is cached".format(index, self.keychain_key))
 
-            return self._encode_child_privkey(KEY_CACHE[self.keychain_key][index], compressed=compressed)
+        child_privkey, _ = KEY_CACHE.get((self.keychain_key, index))
+        if child_privkey is not None:
+            return self._encode_child_privkey(child_privkey, compressed=compressed)
 
         # expensive...
-        child = self.priv_keychain.hardened_child(index)
+        child = self._get_keychain().hardened_child(index)
+        child_privkey = child.private_key()
 
-        if not KEY_CACHE.has_key(self.keychain_key):
-            KEY_CACHE[self.keychain_key] = {}
+        KEY_CACHE.put((self.keychain_key, index), child_privkey, DEFAULT_SESSION_LIFETIME, group=self.keychain_key)
+        return self._encode_child_privkey(child_privkey, compressed=compressed)
 
-        child_privkey = self._encode_child_privkey(child.private_key(), compressed=compressed)
-        
-        KEY_CACHE[self.keychain_key][index] = child_privkey
-        return child_privkey
+
+    def get_child_privkeys(self, start, count, compressed=True):
+        """
+        Get a range of hardened child private keys.
+        Returns the list of child private keys with indexes [start, start + count)
+        """
+        return [self.get_child_privkey(index=i, compressed=compressed) for i in xrange(start, start + count)]
+
+
+    def find_child_index(self, address, start=0, count=1):
+        """
+        Find the index of the child (in [start, start + count)) whose
+        compressed or uncompressed address is @address.
+
+        Each child's addresses are remembered, so later lookups
+        (for this or any other scanned child) do not derive keys.
+
+        Return the index on success
+        Return None if not found
+        """
+        global ADDRESS_INDEX_CACHE, ADDRESS_INDEX_LOCK
+
+        address = str(address)
+        with ADDRESS_INDEX_LOCK:
+            index_info, _ = ADDRESS_INDEX_CACHE.get(self.keychain_key)
+            if index_info is None:
+                index_info = {'scanned': 0, 'addresses': {}}
+
+            else:
+                index_info = {'scanned': index_info['scanned'], 'addresses': dict(index_info['addresses'])}
+
+        index = index_info['addresses'].get(address, None)
+        if index is not None:
+            return index if start <= index < start + count else None
+
+        if index_info['scanned'] >= start + count:
+            # already scanned
+            return None
+
+        # scan the children we have not yet seen
+        found = None
+        scan_start = max(index_info['scanned'], start)
+        scan_end = scan_start
+        for i in xrange(scan_start, start + count):
+            child_pubkey = get_pubkey_hex(self.get_child_privkey(index=i))
+            for child_address in [keylib.public_key_to_address(keylib.key_formatting.compress(child_pubkey)),
+                                  keylib.public_key_to_address(keylib.key_formatting.decompress(child_pubkey))]:
+
+                index_info['addresses'][child_address] = i
+                if child_address == address:
+                    found = i
+
+            scan_end = i + 1
+            if found is not None:
+                break
+
+        if scan_start == index_info['scanned']:
+            # the scanned children are contiguous
+            index_info['scanned'] = scan_end
+
+        with ADDRESS_INDEX_LOCK:
+            ADDRESS_INDEX_CACHE.put(self.keychain_key, index_info, DEFAULT_SESSION_LIFETIME)
+
+        return found
 
 
     def get_master_address(self):
@@ -139,7 +237,8 @@ class HDWallet(object):
 
         hex_privkey = self.get_master_privkey()
         hex_pubkey = get_pubkey_hex(hex_privkey)
-        return virtualchain.address_reencode(keylib.public_key_to_address(hex_pubkey))
+        self.master_address = virtualchain.address_reencode(keylib.public_key_to_address(hex_pubkey))
+        return self.master_address
 
 
     def get_child_address(self, index=0):
@@ -171,13 +270,15 @@ class HDWallet(object):
         """
 
         keypairs = []
+        hex_privkeys = []
+        if include_privkey:
+            hex_privkeys = self.get_child_privkeys(offset, count, compressed=compressed)
 
         for index in range(offset, offset + count):
             address = self.get_child_address(index)
 
             if include_privkey:
-                hex_privkey = self.get_child_privkey(index, compressed=compressed)
-                keypairs.append((address, hex_privkey))
+                keypairs.append((address, hex_privkeys[index - offset]))
             else:
                 keypairs.append(address)
 
@@ -590,21 +691,20 @@ def find_name_index(name_address, master_privkey_hex, max_tries=25, start=0):
     Return the index on success
     Return None on failure.
     """
-    
     hdwallet = HDWallet(master_privkey_hex)
-    for i in xrange(start, max_tries):
-        child_privkey = hdwallet.get_child_privkey(index=i)
-        child_pubkey = get_pubkey_hex(child_privkey)
+    return hdwallet.find_child_index(name_address, start=start, count=max(max_tries - start, 0))
 
-        child_addresses = [
-            keylib.public_key_to_address(keylib.key_formatting.compress(child_pubkey)),
-            keylib.public_key_to_address(keylib.key_formatting.decompress(child_pubkey))
-        ]
 
-        if str(name_address) in child_addresses:
-            return i
+def derive_privkey_path(root_privkey_hex, path):
+    """
+    Derive the (uncompressed) private key at the given path of hardened child indexes.
+    Each node along the path is cached, so paths with a common prefix share work.
+    """
+    privkey = root_privkey_hex
+    for index in path:
+        privkey = HDWallet(privkey).get_child_privkey(index=index, compressed=False)
 
-    return None
+    return privkey
 
 
 def get_name_privkey(master_privkey_hex, name_index):
@@ -613,25 +713,14 @@ def get_name_privkey(master_privkey_hex, name_index):
     @master_privkey_hex is the wallet master key, e.g. from the Browser.
     @name_index is the ith name to be created from this device.
     """
-    hdwallet = HDWallet(master_privkey_hex)
-    names_privkey = hdwallet.get_child_privkey(index=NAMES_PRIVKEY_NODE, compressed=False)
-
-    hdwallet = HDWallet(names_privkey)
-    names_version_privkey = hdwallet.get_child_privkey(index=NAMES_PRIVKEY_VERSION_NODE, compressed=False)
-
-    hdwallet = HDWallet(names_version_privkey)
-    name_privkey = hdwallet.get_child_privkey(index=name_index, compressed=False)
-
-    return name_privkey
+    return derive_privkey_path(master_privkey_hex, [NAMES_PRIVKEY_NODE, NAMES_PRIVKEY_VERSION_NODE, name_index])
 
 
 def get_app_root_privkey(name_privkey):
     """
     Make the device-specific app private key from the device-specific name owner private key
     """
-    hdwallet = HDWallet(name_privkey)
-    app_privkey = hdwallet.get_child_privkey(index=APP_PRIVKEY_NODE, compressed=False)
-    return app_privkey
+    return derive_privkey_path(name_privkey, [APP_PRIVKEY_NODE])
 
 
 def get_app_privkey_index(full_application_name):
@@ -652,26 +741,18 @@ def get_app_privkey(app_root_privkey, full_application_name):
     """
     Make the app-specific, device-specific private key from the app root private key
     """
-    hdwallet = HDWallet(app_root_privkey)
-    app_index = get_app_privkey_index(full_application_name)
-    app_privkey = hdwallet.get_child_privkey(index=app_index, compressed=False)
-    return app_privkey
+    return derive_privkey_path(app_root_privkey, [get_app_privkey_index(full_application_name)])
 
 
 def get_signing_privkey(name_privkey):
     """
     Make the device-specific signing private key from the device-specific name owner private key
     """
-    hdwallet = HDWallet(name_privkey)
-    signing_privkey = hdwallet.get_child_privkey(index=SIGNING_PRIVKEY_NODE, compressed=False)
-    return signing_privkey
+    return derive_privkey_path(name_privkey, [SIGNING_PRIVKEY_NODE])
 
 
 def get_encryption_privkey(name_privkey):
     """
     Make the device-specific encryption private key from the device-specific name owner private key
     """
-    hdwallet = HDWallet(name_privkey)
-    encryption_privkey = hdwallet.get_child_privkey(index=ENCRYPTION_PRIVKEY_NODE, compressed=False)
-    return encryption_privkey
-
+    return derive_privkey_path(name_privkey, [ENCRYPTION_PRIVKEY_NODE])
@@ -21,7 +21,12 @@
     along with Blockstack-client.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import os
 import re
+import ast
+import json
+import hashlib
+import importlib
 
 import config
 import constants
@@ -29,6 +34,134 @@ import constants
 log = config.get_logger('blockstack-client')
 
 
+ARG_TYPES = {
+    'str': str,
+    'int': int,
+}
+
+
+def parse_method_docstring(method_name, docstr):
+    """
+    Parse a CLI method's docstring (see parse_methods() for the format).
+    Argument types are given by name, so the result can be serialized.
+
+    Returns a dict of
+    {
+        'command': command
+        'help': help
+        'args': [{'name': name, 'type': type name, 'help': help}]
+        'opts': [{'name': name, 'type': type name, 'help': help}]
+        'pragmas': ['pragma', 'pragma', ...]
+    }
+
+    Raise an exception if we fail to parse the docstring.
+    """
+
+    command_pattern = re.compile(r'^command:[ \t]+([^ \t]+)[ ]*(.*)[ ]*$')
+    help_pattern = re.compile(r'^help:[ \t]+(.+)$')
+
+    # NOTE: pattern must be defined using double-quotes
+    arg_opt_pattern = r"^{}[ \t]+([^ \t]+)[ \t]+\((.+)\)[ \t]+'([^']+)'$"
+    arg_pattern = re.compile(arg_opt_pattern.format('arg:'))
+    opt_pattern = re.compile(arg_opt_pattern.format('opt:'))
+
+    error_msg = 'Method {}: {} string "{}"'
+
+    supported_pragmas = ['', 'rpc', 'advanced', 'check_storage', 'raw']
+
+    doclines = [l.strip() for l in docstr.split('\n') if l.strip()]
+
+    # first line: command name
+    command_line = doclines[0]
+    if not command_line.startswith('command:'):
+        raise ValueError(error_msg.format(method_name, 'invalid command', command_line))
+
+    # first line must be 'help:'
+    help_line = doclines[1]
+    if not help_line.startswith('help:'):
+        raise ValueError(error_msg.format(method_name, 'invalid help', command_line))
+
+    arg_lines = doclines[2:]
+    # following lines must be 'arg:' or 'opt:'
+    for l in arg_lines:
+        if not l.startswith('arg:') and not l.startswith('opt:'):
+            raise ValueError(error_msg.format(method_name, 'invalid arg', command_line))
+
+    # parse command and help
+    try:
+        command_parts = re.findall(command_pattern, command_line)[0]
+        command = command_parts[0]
+        command_pragmas = command_parts[1].split(' ')
+
+        unsupported_pragmas = list(set(command_pragmas) - set(supported_pragmas))
+        if unsupported_pragmas:
+            log.error('Unsupported pragmas: {}'.format(unsupported_pragmas))
+            raise ValueError("Unsupported pragmas: {}".format(unsupported_pragmas))
+
+        command_help = re.findall(help_pattern, help_line)[0]
+    except Exception as e:
+        log.exception(e)
+        raise ValueError(error_msg.format(method_name, 'invalid command and/or help', ''))
+
+    args, opts = [], []
+
+    # parse args
+    for l in arg_lines:
+        arg_parts, required = None, False
+
+        if l.startswith('arg:'):
+            arg_parts = re.findall(arg_pattern, l)
+            required = True
+        elif l.startswith('opt:'):
+            arg_parts = re.findall(opt_pattern, l)
+            required = False
+
+        try:
+            assert len(arg_parts) == 1, "len(arg_parts) = {}".format(len(arg_parts))
+            arg_name, arg_type, arg_help = arg_parts[0]
+            assert arg_type in ARG_TYPES, "arg_type is {}".format(arg_type)
+        except AssertionError as ae:
+            if constants.BLOCKSTACK_DEBUG:
+                log.exception(ae)
+
+            raise ValueError(error_msg.format(method_name, 'failed to parse arg', l))
+
+        name_type = {'name': arg_name, 'type': arg_type, 'help': arg_help}
+        if required:
+            args.append(name_type)
+        else:
+            opts.append(name_type)
+
+    return {
+        'command': command,
+        'help': command_help,
+        'args': args,
+        'opts': opts,
+        'pragmas': command_pragmas
+    }
+
+
+def make_method_info(method, method_doc):
+    """
+    Combine a method (or LazyMethod) with its parsed docstring
+    into the method information used to build and dispatch commands.
+    """
+    method_info = {
+        'method': method,
+        'command': method_doc['command'],
+        'help': method_doc['help'],
+        'args': [],
+        'opts': [],
+        'pragmas': method_doc['pragmas'],
+    }
+
+    for key in ['args', 'opts']:
+        for arg in method_doc[key]:
+            method_info[key].append({'name': arg['name'], 'type': ARG_TYPES[arg['type']], 'help': arg['help']})
+
+    return method_info
+
+
 def parse_methods(method_list):
     """
     Given a list of methods, parse their docstring metadata for linking information.
@@ -62,96 +195,118 @@ def parse_methods(method_list):
     """
 
     ret = []
+    for method in method_list:
+        method_doc = parse_method_docstring(method.__name__, method.__doc__)
+        ret.append(make_method_info(method, method_doc))
 
-    command_pattern = re.compile(r'^command:[ \t]+([^ \t]+)[ ]*(.*)[ ]*$')
-    help_pattern = re.compile(r'^help:[ \t]+(.+)$')
+    return ret
 
-    # NOTE: pattern must be defined using double-quotes
-    arg_opt_pattern = r"^{}[ \t]+([^ \t]+)[ \t]+\((.+)\)[ \t]+'([^']+)'$"
-    arg_pattern = re.compile(arg_opt_pattern.format('arg:'))
-    opt_pattern = re.compile(arg_opt_pattern.format('opt:'))
 
-    error_msg = 'Method {}: {} string "{}"'
+class LazyMethod(object):
+    """
+    Stand-in for a CLI method that is described by a method manifest.
+    The module that implements it is imported on the first call.
+    """
+    def __init__(self, module_name, method_name):
+        self.module_name = module_name
+        self.__name__ = method_name
+        self.method = None
 
-    supported_pragmas = ['', 'rpc', 'advanced', 'check_storage', 'raw']
+    def load(self):
+        """
+        Import and return the implementation
+        """
+        if self.method is None:
+            module = importlib.import_module(self.module_name)
+            self.method = getattr(module, self.__name__)
 
-    for method in method_list:
-        method_name = method.__name__
-        docstr = method.__doc__
-        doclines = [l.strip() for l in docstr.split('\n') if l.strip()]
-
-        # first line: command name
-        command_line = doclines[0]
-        if not command_line.startswith('command:'):
-            raise ValueError(error_msg.format(method_name, 'invalid command', command_line))
-
-        # first line must be 'help:'
-        help_line = doclines[1]
-        if not help_line.startswith('help:'):
-            raise ValueError(error_msg.format(method_name, 'invalid help', command_line))
-
-        arg_lines = doclines[2:]
-        # following lines must be 'arg:' or 'opt:'
-        for l in arg_lines:
-            if not l.startswith('arg:') and not l.startswith('opt:'):
-                raise ValueError(error_msg.format(method_name, 'invalid arg', command_line))
-
-        # parse command and help
+        return self.method
+
+    def __call__(self, *args, **kw):
+        return self.load()(*args, **kw)
+
+
+def build_method_manifest(module_name, source_path, prefix):
+    """
+    Build the method manifest for a module's CLI methods (the top-level
+    functions whose names start with @prefix), by parsing its source.
+    The module itself is not imported.
+
+    Return {'module': ..., 'source_hash': ..., 'methods': [...]}, where each method
+    is a parse_method_docstring() dict with its 'function' name.
+
+    Raise on error.
+    """
+    with open(source_path, 'r') as f:
+        source = f.read()
+
+    methods = []
+    tree = ast.parse(source, source_path)
+    for node in tree.body:
+        if not isinstance(node, ast.FunctionDef) or not node.name.startswith(prefix):
+            continue
+
+        docstr = ast.get_docstring(node, clean=False)
+        if docstr is None:
+            raise ValueError('Method {} has no docstring'.format(node.name))
+
+        method_doc = parse_method_docstring(node.name, docstr)
+        method_doc['function'] = node.name
+        methods.append(method_doc)
+
+    # same order as dir(module)
+    methods.sort(key=lambda m: m['function'])
+
+    return {
+        'module': module_name,
+        'source_hash': hashlib.sha256(source).hexdigest(),
+        'methods': methods,
+    }
+
+
+def load_method_manifest(manifest_path, module_name, source_path, prefix):
+    """
+    Load method information for a module's CLI methods from its manifest,
+    without importing the module.  Each method is a LazyMethod.
+
+    If the manifest is missing or was built from a different version of
+    the module's source, rebuild it and try to store it.  If the source
+    is not available, trust the manifest.
+
+    Return the list of method infos, in the same format as parse_methods()
+    Raise on error
+    """
+    manifest = None
+    source_hash = None
+
+    if os.path.exists(source_path):
+        with open(source_path, 'r') as f:
+            source_hash = hashlib.sha256(f.read()).hexdigest()
+
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.loads(f.read())
+
+        if manifest['module'] != module_name or (source_hash is not None and manifest['source_hash'] != source_hash):
+            log.debug('Method manifest {} is stale'.format(manifest_path))
+            manifest = None
+
+    except (IOError, OSError, ValueError, KeyError) as e:
+        log.debug('Failed to load method manifest {}: {}'.format(manifest_path, e))
+        manifest = None
+
+    if manifest is None:
+        manifest = build_method_manifest(module_name, source_path, prefix)
         try:
-            command_parts = re.findall(command_pattern, command_line)[0]
-            command = command_parts[0]
-            command_pragmas = command_parts[1].split(' ')
-
-            unsupported_pragmas = list(set(command_pragmas) - set(supported_pragmas))
-            if unsupported_pragmas:
-                log.error('Unsupported pragmas: {}'.format(unsupported_pragmas))
-                raise ValueError("Unsupported pragmas: {}".format(unsupported_pragmas))
-
-            command_help = re.findall(help_pattern, help_line)[0]
-        except Exception as e:
-            log.exception(e)
-            raise ValueError(error_msg.format(method_name, 'invalid command and/or help', ''))
-
-        args, opts = [], []
-
-        # parse args
-        for l in arg_lines:
-            arg_parts, required = None, False
-
-            if l.startswith('arg:'):
-                arg_parts = re.findall(arg_pattern, l)
-                required = True
-            elif l.startswith('opt:'):
-                arg_parts = re.findall(opt_pattern, l)
-                required = False
-
-            try:
-                assert len(arg_parts) == 1, "len(arg_parts) = {}".format(len(arg_parts))
-                arg_name, arg_type, arg_help = arg_parts[0]
-                assert arg_type in ['str', 'int'], "arg_type is {}".format(arg_type)
-                arg_type = eval(arg_type)
-            except AssertionError as ae:
-                if constants.BLOCKSTACK_DEBUG:
-                    log.exception(ae)
-
-                raise ValueError(error_msg.format(method_name, 'failed to parse arg', l))
-
-            name_type = {'name': arg_name, 'type': arg_type, 'help': arg_help}
-            if required:
-                args.append(name_type)
-            else:
-                opts.append(name_type)
-
-        ret.append({
-            'method': method,
-            'command': command,
-            'help': command_help,
-            'args': args,
-            'opts': opts,
-            'pragmas': command_pragmas
-        })
+            tmp_path = '{}.tmp.{}'.format(manifest_path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                f.write(json.dumps(manifest, indent=4, sort_keys=True, separators=(',', ': ')) + '\n')
 
-    return ret
+            os.rename(tmp_path, manifest_path)
+        except (IOError, OSError) as e:
+            log.debug('Failed to store method manifest {}: {}'.format(manifest_path, e))
+
+    return [make_method_info(LazyMethod(module_name, m['function']), m) for m in manifest['methods']]
 
 
 def build_method_subparsers(subparsers, method_infos, include_args=True, include_opts=True):
@@ -24,6 +24,8 @@
 import json
 import time
 import copy
+import threading
+import Queue
 import blockstack_profiles
 import httplib
 import virtualchain
@@ -34,7 +36,7 @@ import keylib
 
 from .proxy import (
     json_is_error, get_name_blockchain_history, get_name_blockchain_record,
-    get_default_proxy)
+    get_name_blockchain_records, get_zonefiles, get_default_proxy)
 
 from blockstack_client import storage, subdomains
 from blockstack_client import user as user_db
@@ -42,7 +44,7 @@ from blockstack_client import user as user_db
 from .logger import get_logger
 from .constants import USER_ZONEFILE_TTL, CONFIG_PATH, BLOCKSTACK_TEST, BLOCKSTACK_DEBUG
 
-from .zonefile import get_name_zonefile
+from .zonefile import get_name_zonefile, decode_name_zonefile
 from .keys import get_data_privkey_info
 from .schemas import PROFILE_ACCOUNT_SCHEMA
 from .config import get_config
@@ -359,6 +361,91 @@ def get_profile(name, zonefile_storage_drivers=None, profile_storage_drivers=Non
     return ret
 
 
+def get_profiles(names, proxy=None, max_workers=10, **kw):
+    """
+    Batch version of get_profile().
+    Look up all of the names' records with one RPC, fetch all of their
+    zonefiles with one get_zonefiles() call, and then fetch the profiles
+    concurrently with at most max_workers threads.
+
+    Subdomains, and names whose zonefiles could not be fetched in bulk,
+    fall back to get_profile()'s one-at-a-time lookups.
+    Extra keyword arguments are passed to get_profile().
+
+    Returns {name: get_profile() result}
+    """
+    proxy = get_default_proxy() if proxy is None else proxy
+    names = list(set(names))
+
+    name_records = {}
+    zonefiles = {}
+
+    onchain_names = filter(lambda n: not subdomains.is_address_subdomain(str(n)), names)
+    if len(onchain_names) > 0:
+        res = get_name_blockchain_records(onchain_names, proxy=proxy)
+        if 'error' in res:
+            log.warning('Failed to look up name records in bulk ({}); falling back to one-at-a-time lookups'.format(res['error']))
+        else:
+            name_records = res['records']
+
+    zonefile_hashes = {}
+    for name, name_record in name_records.items():
+        value_hash = name_record.get('value_hash', None)
+        if value_hash not in [None, 'null', '']:
+            zonefile_hashes[name] = str(value_hash)
+
+    if len(zonefile_hashes) > 0:
+        hostport = '{}:{}'.format(proxy.conf['server'], proxy.conf['port'])
+        hashes = list(set(zonefile_hashes.values()))
+        raw_zonefiles = {}
+
+        for i in xrange(0, len(hashes), 100):
+            res = get_zonefiles(hostport, hashes[i:i+100], proxy=proxy)
+            if 'error' in res:
+                log.warning('Failed to fetch zonefiles in bulk from {}: {}'.format(hostport, res['error']))
+                continue
+
+            raw_zonefiles.update(res['zonefiles'])
+
+        for name, zonefile_hash in zonefile_hashes.items():
+            if zonefile_hash not in raw_zonefiles:
+                continue
+
+            user_zonefile = decode_name_zonefile(name, raw_zonefiles[zonefile_hash], allow_legacy=True)
+            if user_zonefile is not None:
+                zonefiles[name] = user_zonefile
+
+    results = {}
+    work = Queue.Queue()
+    for name in names:
+        work.put(name)
+
+    def _profile_worker():
+        while True:
+            try:
+                name = work.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                res = get_profile(name, proxy=proxy, user_zonefile=zonefiles.get(name, None),
+                                  name_record=name_records.get(name, None), **kw)
+            except Exception as e:
+                log.exception(e)
+                res = {'error': 'Failed to load profile for {}'.format(name)}
+
+            results[name] = res
+
+    workers = [threading.Thread(target=_profile_worker) for _ in xrange(0, min(max_workers, len(names)))]
+    for t in workers:
+        t.start()
+
+    for t in workers:
+        t.join()
+
+    return results
+
+
 def _get_person_profile(name, proxy=None):
     """
     Get the person's zonefile and profile.
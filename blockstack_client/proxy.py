@@ -70,7 +70,8 @@ from .schemas import (
     OP_TXID_PATTERN,
     OP_HISTORY_SCHEMA,
     NAMESPACE_SCHEMA_PROPERTIES,
-    NAMESPACE_SCHEMA_REQUIRED
+    NAMESPACE_SCHEMA_REQUIRED,
+    OP_HEX_PATTERN
 )
 
 log = get_logger('blockstack-client')
@@ -459,6 +460,148 @@ def getinfo(proxy=None, hostport=None):
     return resp
 
 
+def get_indexing_profile(start_block=None, end_block=None, proxy=None, hostport=None):
+    """
+    Get a report on where a node's indexer spent its time
+    in the recently-indexed blocks between start_block and end_block.
+    Returns {'status': True, 'profile': {...}} on success
+    Returns {'error': ...} on error
+    """
+
+    profile_schema = {
+        'type': 'object',
+        'properties': {
+            'profile': {
+                'type': 'object',
+                'properties': {
+                    'num_blocks': {
+                        'type': 'integer',
+                        'minimum': 0,
+                    },
+                    'block': {
+                        'type': 'object',
+                    },
+                    'hooks': {
+                        'type': 'object',
+                    },
+                    'opcodes': {
+                        'type': 'object',
+                    },
+                },
+                'required': [
+                    'num_blocks',
+                    'block',
+                    'hooks',
+                    'opcodes'
+                ],
+            },
+        },
+        'required': [
+            'profile'
+        ],
+    }
+
+    resp_schema = json_response_schema( profile_schema )
+
+    if proxy is None:
+        if hostport is None:
+            proxy = get_default_proxy()
+        else:
+            host, port = url_to_host_port(hostport)
+            assert host is not None and port is not None
+            proxy = BlockstackRPCClient(host, port, protocol='http')
+
+    resp = {}
+    try:
+        resp = proxy.get_indexing_profile(start_block, end_block)
+        resp = json_validate(resp_schema, resp)
+        if json_is_error(resp):
+            return resp
+
+    except ValidationError as e:
+        if BLOCKSTACK_DEBUG:
+            log.exception(e)
+
+        resp = json_traceback(resp.get('error'))
+        return resp
+
+    except Exception as ee:
+        if BLOCKSTACK_DEBUG:
+            log.exception(ee)
+
+        log.error("Caught exception while connecting to Blockstack node: {}".format(ee))
+        resp = {'error': 'Failed to contact Blockstack node.  Try again with `--debug`.'}
+        return resp
+
+    return resp
+
+
+def get_indexing_trace(start_block, end_block, proxy=None, hostport=None):
+    """
+    Get a timeline of what a node's indexer did in the blocks
+    between start_block and end_block, in Chrome's trace event format.
+    Returns {'status': True, 'trace': {'traceEvents': [...], ...}} on success
+    Returns {'error': ...} on error
+    """
+
+    trace_schema = {
+        'type': 'object',
+        'properties': {
+            'trace': {
+                'type': 'object',
+                'properties': {
+                    'traceEvents': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                        },
+                    },
+                },
+                'required': [
+                    'traceEvents'
+                ],
+            },
+        },
+        'required': [
+            'trace'
+        ],
+    }
+
+    resp_schema = json_response_schema( trace_schema )
+
+    if proxy is None:
+        if hostport is None:
+            proxy = get_default_proxy()
+        else:
+            host, port = url_to_host_port(hostport)
+            assert host is not None and port is not None
+            proxy = BlockstackRPCClient(host, port, protocol='http')
+
+    resp = {}
+    try:
+        resp = proxy.get_indexing_trace(start_block, end_block)
+        resp = json_validate(resp_schema, resp)
+        if json_is_error(resp):
+            return resp
+
+    except ValidationError as e:
+        if BLOCKSTACK_DEBUG:
+            log.exception(e)
+
+        resp = json_traceback(resp.get('error'))
+        return resp
+
+    except Exception as ee:
+        if BLOCKSTACK_DEBUG:
+            log.exception(ee)
+
+        log.error("Caught exception while connecting to Blockstack node: {}".format(ee))
+        resp = {'error': 'Failed to contact Blockstack node.  Try again with `--debug`.'}
+        return resp
+
+    return resp
+
+
 def ping(proxy=None):
     """
     ping
@@ -554,6 +697,86 @@ def get_name_cost(name, proxy=None):
     return resp
 
 
+def get_name_costs(names, proxy=None):
+    """
+    Get the costs of a list of names in one RPC.
+    Names in unknown namespaces map to {'error': ...}
+    Return {'status': True, 'costs': {name: {'satoshis': ...}}, 'lastblock': ...} on success
+    Return {'error': ...} on error
+    """
+
+    cost_schema = {
+        'type': 'object',
+        'properties': {
+            'satoshis': {
+                'type': 'integer',
+                'minimum': 0,
+            },
+        },
+        'required': [
+            'satoshis'
+        ],
+    }
+
+    error_schema = {
+        'type': 'object',
+        'properties': {
+            'error': {
+                'type': 'string'
+            },
+        },
+        'required': [
+            'error'
+        ],
+    }
+
+    costs_schema = {
+        'type': 'object',
+        'properties': {
+            'costs': {
+                'type': 'object',
+                'additionalProperties': {
+                    'anyOf': [
+                        cost_schema,
+                        error_schema,
+                    ],
+                },
+            },
+        },
+        'required': [
+            'costs'
+        ],
+    }
+
+    resp_schema = json_response_schema( costs_schema )
+
+    proxy = get_default_proxy() if proxy is None else proxy
+
+    resp = {}
+    try:
+        resp = proxy.get_name_costs(names)
+        resp = json_validate(resp_schema, resp)
+        if json_is_error(resp):
+            return resp
+
+    except ValidationError as e:
+        if BLOCKSTACK_DEBUG:
+            log.exception(e)
+
+        resp = json_traceback(resp.get('error'))
+        return resp
+
+    except Exception as ee:
+        if BLOCKSTACK_DEBUG:
+            log.exception(ee)
+
+        log.error("Caught exception while connecting to Blockstack node: {}".format(ee))
+        resp = {'error': 'Failed to contact Blockstack node.  Try again with `--debug`.'}
+        return resp
+
+    return resp
+
+
 def get_namespace_cost(namespace_id, proxy=None):
     """
     namespace_cost
@@ -2085,6 +2308,79 @@ def get_name_blockchain_record(name, include_expired=True, include_grace=True, p
 
 
 
+def get_name_blockchain_records(names, proxy=None):
+    """
+    Get the blockchain-extracted information for a list of names in one RPC.
+    Names that are not registered map to {'error': 'Not found.'}
+    Return {'status': True, 'records': {name: record}, 'lastblock': ...} on success
+    Return {'error': ...} on error
+    """
+
+    nameop_schema = {
+        'type': 'object',
+        'properties': NAMEOP_SCHEMA_PROPERTIES,
+        'required': NAMEOP_SCHEMA_REQUIRED + ['history']
+    }
+
+    error_schema = {
+        'type': 'object',
+        'properties': {
+            'error': {
+                'type': 'string'
+            },
+        },
+        'required': [
+            'error'
+        ],
+    }
+
+    recs_schema = {
+        'type': 'object',
+        'properties': {
+            'records': {
+                'type': 'object',
+                'additionalProperties': {
+                    'anyOf': [
+                        nameop_schema,
+                        error_schema,
+                    ],
+                },
+            },
+        },
+        'required': [
+            'records'
+        ],
+    }
+
+    resp_schema = json_response_schema( recs_schema )
+
+    proxy = get_default_proxy() if proxy is None else proxy
+
+    resp = {}
+    try:
+        resp = proxy.get_name_blockchain_records(names)
+        resp = json_validate(resp_schema, resp)
+        if json_is_error(resp):
+            return resp
+
+    except ValidationError as e:
+        if BLOCKSTACK_DEBUG:
+            log.exception(e)
+
+        resp = json_traceback(resp.get('error'))
+        return resp
+
+    except Exception as ee:
+        if BLOCKSTACK_DEBUG:
+            log.exception(ee)
+
+        log.error("Caught exception while connecting to Blockstack node: {}".format(ee))
+        resp = {'error': 'Failed to contact Blockstack node.  Try again with `--debug`.'}
+        return resp
+
+    return resp
+
+
 def get_namespace_blockchain_record(namespace_id, proxy=None):
     """
     get_namespace_blockchain_record
@@ -2318,6 +2614,82 @@ def get_zonefile_inventory(hostport, bit_offset, bit_count, timeout=30, my_hostp
     return zf_inv
 
 
+def get_zonefile_inventory_delta(hostport, inv_id, version, timeout=30, my_hostport=None, proxy=None):
+    """
+    Get the changes to an atlas peer's zonefile inventory since
+    the given version of it, as run-length encoded bit lists.
+    Return {'status': True, 'inv_id': ..., 'version': ..., 'set': [...], 'clear': [...]} on success.
+    Return {'status': True, 'inv_id': ..., 'version': ..., 'resync': True} if the whole inventory must be fetched again.
+    Return {'error': ...} on error
+    """
+
+    runs_schema = {
+        'type': 'array',
+        'items': {
+            'type': 'integer',
+            'minimum': 0,
+        },
+    }
+
+    delta_schema = {
+        'type': 'object',
+        'properties': {
+            'inv_id': {
+                'type': 'string',
+                'pattern': OP_HEX_PATTERN,
+            },
+            'version': {
+                'type': 'integer',
+                'minimum': 0,
+            },
+            'set': runs_schema,
+            'clear': runs_schema,
+            'resync': {
+                'type': 'boolean',
+            },
+        },
+        'required': [
+            'inv_id',
+            'version',
+        ]
+    }
+
+    schema = json_response_schema( delta_schema )
+
+    if proxy is None:
+        host, port = url_to_host_port(hostport)
+        assert host is not None and port is not None
+        proxy = BlockstackRPCClient(host, port, timeout=timeout, src=my_hostport, protocol = 'http')
+
+    zf_delta = None
+    try:
+        zf_delta = proxy.get_zonefile_inventory_delta(inv_id, version)
+        zf_delta = json_validate(schema, zf_delta)
+        if json_is_error(zf_delta):
+            return zf_delta
+
+        # a delta must either be complete, or ask for a resync
+        if not zf_delta.get('resync', False):
+            assert 'set' in zf_delta and 'clear' in zf_delta, 'Missing inventory delta'
+            assert len(zf_delta['set']) % 2 == 0 and len(zf_delta['clear']) % 2 == 0, 'Malformed inventory delta runs'
+
+    except (ValidationError, AssertionError) as e:
+        if BLOCKSTACK_DEBUG:
+            log.exception(e)
+
+        zf_delta = {'error': 'Failed to fetch and parse zonefile inventory delta'}
+
+    except Exception as ee:
+        if BLOCKSTACK_DEBUG:
+            log.exception(ee)
+
+        log.error("Caught exception while connecting to Blockstack node: {}".format(ee))
+        resp = {'error': 'Failed to contact Blockstack node.  Try again with `--debug`.'}
+        return resp
+
+    return zf_delta
+
+
 def get_atlas_peers(hostport, timeout=30, my_hostport=None, proxy=None):
     """
     Get an atlas peer's neighbors.
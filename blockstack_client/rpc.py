@@ -90,7 +90,8 @@ from .constants import (
     BLOCKSTACK_DEBUG, BLOCKSTACK_TEST, RPC_MAX_ZONEFILE_LEN, CONFIG_PATH,
     WALLET_FILENAME, TX_MIN_CONFIRMATIONS, DEFAULT_API_PORT, SERIES_VERSION,
     DEFAULT_SESSION_LIFETIME, FIRST_BLOCK_MAINNET,
-    TX_MAX_FEE, set_secret, get_secret, DEFAULT_TIMEOUT)
+    TX_MAX_FEE, set_secret, get_secret, DEFAULT_TIMEOUT,
+    DATASTORE_CHUNK_SIZE, DATASTORE_CHUNK_CONCURRENCY)
 from .method_parser import parse_methods
 from .wallet import make_wallet
 import app
@@ -1449,30 +1450,175 @@ class BlockstackAPIEndpointHandler(SimpleHTTPRequestHandler):
             return self._reply_json({'error': 'Missing signed datastore info', 'errno': errno.EINVAL}, status_code=401)
 
 
-    def _get_request_range(self):
+    def _get_request_ranges(self, size):
         """
-        Get the request's HTTP Range: header values
-        TODO: does not yet support multi-range
+        Get the request's HTTP Range: header values, for a resource of @size bytes.
+        Supports multiple ranges, suffix ranges (bytes=-N) and open ranges (bytes=N-).
 
-        Returns (start, end), or (None, None)
+        Returns a list of inclusive (start, end) pairs, clamped to the resource size
+        Returns None if there is no (parseable) Range: header
+        Returns [] if no range can be satisfied
         """
         range_header = self.headers.get('range', None)
         if range_header is None:
-            return (None, None)
-        
+            return None
+
         range_header = range_header.strip()
-        ranges = re.match("^bytes=([0-9]+)-([0-9]+)$", range_header)
-        if not ranges:
-            return (None, None)
+        if not range_header.startswith('bytes='):
+            return None
+
+        ranges = []
+        for range_spec in range_header[len('bytes='):].split(','):
+            m = re.match("^([0-9]*)-([0-9]*)$", range_spec.strip())
+            if not m or m.groups() == ('', ''):
+                return None
+
+            start, end = m.groups()
+            if start == '':
+                # last N bytes
+                start = max(size - int(end), 0)
+                end = size - 1
+
+            else:
+                start = int(start)
+                end = int(end) if end != '' else size - 1
+
+            if start >= size:
+                # unsatisfiable
+                continue
+
+            if start > end:
+                return None
+
+            ranges.append((start, min(end, size - 1)))
+
+        return ranges
+
+
+    def _read_first_part(self, start, end, read_func):
+        """
+        Read the first few chunks' worth of the bytes [start, end] with @read_func(),
+        so a storage failure can still be reported before any headers are sent.
+
+        Returns {'status': True, 'data': the bytes read, 'next': offset of the rest} on success
+        Returns {'error': ..., 'errno': ...} on failure
+        """
+        part_end = min(end, (start / DATASTORE_CHUNK_SIZE + DATASTORE_CHUNK_CONCURRENCY) * DATASTORE_CHUNK_SIZE - 1)
+        parts = []
+        res = read_func(start, part_end, parts.append)
+        if 'error' in res:
+            return {'error': res['error'], 'errno': res.get('errno', errno.EIO)}
+
+        return {'status': True, 'data': ''.join(parts), 'next': part_end + 1}
+
+
+    def _reply_ranges(self, size, ranges, read_func):
+        """
+        Reply the given byte ranges of a resource with @size bytes.
+        @read_func(start, end, write_func) writes the bytes [start, end] with write_func().
+        Replies 206 with one range, 206 with multipart/byteranges with many,
+        416 if no range can be satisfied, and 503 if the first range can't be read.
+
+        Returns {'status': True} on success
+        Returns {'error': ...} on failure
+        """
+        if len(ranges) == 0:
+            self._send_headers(status_code=416, content_type='application/octet-stream', more_headers={'content-range': 'bytes */{}'.format(size)})
+            return {'status': True}
+
+        first_start, first_end = ranges[0]
+        first_part = self._read_first_part(first_start, first_end, read_func)
+        if 'error' in first_part:
+            self._reply_json(first_part, status_code=503)
+            return first_part
+
+        if len(ranges) == 1:
+            more_headers = {
+                'content-length': first_end+1-first_start,
+                'content-range': 'bytes {}-{}/{}'.format(first_start, first_end, size)
+            }
+
+            self._send_headers(status_code=206, content_type='application/octet-stream', more_headers=more_headers)
+            self.wfile.write(first_part['data'])
+            if first_part['next'] <= first_end:
+                return read_func(first_part['next'], first_end, self.wfile.write)
+
+            return {'status': True}
+
+        boundary = base64.b16encode(os.urandom(16))
+        self._send_headers(status_code=206, content_type='multipart/byteranges; boundary={}'.format(boundary))
+        for (i, (start, end)) in enumerate(ranges):
+            self.wfile.write('\r\n--{}\r\ncontent-type: application/octet-stream\r\ncontent-range: bytes {}-{}/{}\r\n\r\n'.format(boundary, start, end, size))
+            if i == 0:
+                self.wfile.write(first_part['data'])
+                start = first_part['next']
+
+            if start <= end:
+                res = read_func(start, end, self.wfile.write)
+                if 'error' in res:
+                    return res
+
+        self.wfile.write('\r\n--{}--\r\n'.format(boundary))
+        return {'status': True}
+
+
+    def _reply_file_data(self, blockchain_id, datastore_id, inode, device_ids, app_public_keys):
+        """
+        Send back a file's data, honoring the Range: header.
+        Chunked files are streamed, and only the chunks in the requested ranges are fetched.
+
+        Returns {'status': True} on success
+        Returns {'error': ...} on failure
+        """
+        if not inode.get('chunked', False):
+            file_data = inode['idata']
+            size = len(file_data)
+
+            def read_func(start, end, write_func):
+                write_func(file_data[start:end+1])
+                return {'status': True}
+
+        else:
+            manifest = data.parse_file_chunk_manifest(inode['idata'])
+            if manifest is None:
+                err = {'error': 'Invalid chunk manifest', 'errno': errno.EIO}
+                self._reply_json(err, status_code=503)
+                return err
 
-        start, end = ranges.groups()
-        start = int(start)
-        end = int(end)
+            device_ids = device_ids.split(',')
+            data_pubkeys = [{'device_id': dev_id, 'public_key': pubkey} for (dev_id, pubkey) in zip(device_ids, app_public_keys.split(','))]
+            datastore_info = data.get_datastore(blockchain_id if blockchain_id else None, datastore_id, device_ids, config_path=self.server.config_path)
+            if 'error' in datastore_info:
+                err = {'error': datastore_info['error'], 'errno': datastore_info['errno']}
+                self._reply_json(err, status_code=503)
+                return err
+
+            drivers = datastore_info['datastore']['drivers']
+            size = manifest['size']
+
+            def read_func(start, end, write_func):
+                return data.datastore_file_read(datastore_id, manifest, drivers, data_pubkeys, write_func, start=start, end=end, config_path=self.server.config_path)
+
+        ranges = self._get_request_ranges(size)
+        if ranges is not None:
+            return self._reply_ranges(size, ranges, read_func)
+
+        if inode.get('chunked', False):
+            # make sure the first chunks are available before committing to a 200
+            first_part = self._read_first_part(0, size - 1, read_func)
+            if 'error' in first_part:
+                self._reply_json(first_part, status_code=503)
+                return first_part
+
+            self._send_headers(status_code=200, content_type='application/octet-stream', more_headers={'content-length': size})
+            self.wfile.write(first_part['data'])
+            if first_part['next'] < size:
+                return read_func(first_part['next'], size - 1, self.wfile.write)
 
-        if start >= end:
-            return (None, None)
+            return {'status': True}
 
-        return (start, end)
+        self._send_headers(status_code=200, content_type='application/octet-stream')
+        return read_func(0, size - 1, self.wfile.write)
 
 
     def GET_store_item( self, ses, path_info, datastore_id, inode_type ):
@@ -1486,12 +1632,15 @@ class BlockstackAPIEndpointHandler(SimpleHTTPRequestHandler):
         * device_ids (list)
         * device_pubkeys (list)
         
-        Honors Range: headers for files, if given 
+        Honors Range: headers for files, if given (including multiple ranges).
+        Only the chunks of a chunked file that the ranges touch are fetched.
 
         Reply 200 on succes, with the raw data (as application/octet-stream for files, and as application/json for directories and inodes)
+        Reply 206 on success, if given a Range: header
         Reply 401 if no path is given
         Reply 403 on invalid user ID
         Reply 404 if the file/directory/datastore does not exist
+        Reply 416 if the Range: header cannot be satisfied
         Reply 500 if we fail to load the datastore record for some other reason than the above
         Reply 503 on failure to load data from storage providers
         """
@@ -1553,8 +1702,10 @@ class BlockstackAPIEndpointHandler(SimpleHTTPRequestHandler):
 
         if inode_type == 'files':
             if path is not None:
+                # always get the inode, so we can serve chunked files piecemeal (but reassemble them for extended replies)
                 log.debug("Will run cli_datastore_getfile()")
-                res = internal.cli_datastore_getfile(blockchain_id, datastore_id, path, include_extended, force, device_ids, app_public_keys, config_path=self.server.config_path)
+                manifest = '1' if include_extended == '0' else '0'
+                res = internal.cli_datastore_getfile(blockchain_id, datastore_id, path, '1', force, device_ids, app_public_keys, manifest, config_path=self.server.config_path)
 
                 if 'error' not in res:
                     # base64-encode the result, if we're returning extended information
@@ -1594,31 +1745,15 @@ class BlockstackAPIEndpointHandler(SimpleHTTPRequestHandler):
 
         if inode_type == 'files':
 
-            if include_extended == '0':
-                bytes_range = self._get_request_range()
-                if bytes_range == (None, None):
-                    # no bytes range
-                    self._send_headers(status_code=200, content_type='application/octet-stream')
-                    self.wfile.write(res)
-
-                else:
-                    # serve back only the parts we want
-                    start, end = bytes_range
-                    res_len = len(res)
-                    if len(res) < start:
-                        res = ""
-                    elif len(res) < end+1:
-                        res = res[start:]
-                    else:
-                        res = res[start:end+1]
-
-                    more_headers = {
-                        'content-length': end+1-start,
-                        'content-range': 'bytes {}-{}/{}'.format(start, end, res_len)
-                    }
+            if include_extended == '0' and path is None:
+                # raw inode data
+                self._send_headers(status_code=200, content_type='application/octet-stream')
+                self.wfile.write(res)
 
-                    self._send_headers(status_code=206, content_type='application/octet-stream', more_headers=more_headers)
-                    self.wfile.write(res)
+            elif include_extended == '0':
+                res = self._reply_file_data(blockchain_id, datastore_id, res['inode_info']['inode'], device_ids, app_public_keys)
+                if 'error' in res:
+                    log.error("Failed to send {}: {}".format(path, res['error']))
 
             else:
                 if BLOCKSTACK_TEST:
@@ -1662,6 +1797,80 @@ class BlockstackAPIEndpointHandler(SimpleHTTPRequestHandler):
         return self._create_or_update_store_item( ses, path_info, store_id, inode_type, create=False )
 
 
+    def PUT_store_chunks(self, ses, path_info, datastore_id ):
+        """
+        Store a batch of file chunks, ahead of the putfile that refers to them.
+        Only works with the session's user ID.
+        The payload is {'datastore_str': ..., 'datastore_sig': ..., 'chunks': [base64-encoded chunks]}
+        Reply 200 with {'status': True, 'chunk_hashes': [...], 'stored': ..., 'duplicates': ...} on success
+        Reply 401 on invalid request
+        Reply 403 on invalid user ID
+        Reply 503 on failure to upload data to storage providers
+        """
+        if datastore_id != ses['app_user_id']:
+            log.debug("Invalid datastore ID : {} != {}".format(ses['app_user_id'], datastore_id))
+            return self._reply_json({'error': 'Invalid datastore ID'}, status_code=403)
+
+        request_schema = {
+            'type': 'object',
+            'properties': {
+                'datastore_str': {
+                    'type': 'string',
+                },
+                'datastore_sig': {
+                    'type': 'string',
+                    'pattern': OP_BASE64_PATTERN,
+                },
+                'chunks': {
+                    'type': 'array',
+                    'items': {
+                        'type': 'string',
+                        'pattern': OP_BASE64_PATTERN,
+                    },
+                    'maxItems': DATASTORE_CHUNK_CONCURRENCY,
+                },
+            },
+            'additionalProperties': False,
+            'required': [
+                'datastore_str',
+                'datastore_sig',
+                'chunks',
+            ],
+        }
+
+        # base64 grows data by 4/3
+        request = self._read_json(schema=request_schema, maxlen=(DATASTORE_CHUNK_SIZE * DATASTORE_CHUNK_CONCURRENCY * 4) / 3 + JSONRPC_MAX_SIZE)
+        if request is None or 'error' in request:
+            return self._reply_json({'error': 'Invalid request'}, status_code=401)
+
+        datastore_str = str(request['datastore_str'])
+        datastore_sig = str(request['datastore_sig'])
+        datastore_pubkey = app.app_get_datastore_pubkey( ses )
+        res = verify_raw_data(datastore_str, datastore_pubkey, datastore_sig)
+        if not res:
+            return self._reply_json({'error': 'Invalid request: invalid datastore signature'}, status_code=401)
+
+        datastore = None
+        try:
+            datastore = json.loads(datastore_str)
+        except ValueError:
+            return self._reply_json({'error': 'Invalid request: invalid datastore'}, status_code=401)
+
+        if keylib.key_formatting.decompress(datastore['pubkey']) != keylib.key_formatting.decompress(datastore_pubkey):
+            log.error("{} != {}".format(datastore['pubkey'], datastore_pubkey))
+            return self._reply_json({'error': 'Invalid datastore in request: wrong pubkey'}, status_code=401)
+
+        chunks = [base64.b64decode(c) for c in request['chunks']]
+        if max([0] + [len(c) for c in chunks]) > DATASTORE_CHUNK_SIZE:
+            return self._reply_json({'error': 'Invalid request: chunks may be at most {} bytes'.format(DATASTORE_CHUNK_SIZE)}, status_code=401)
+
+        res = data.put_file_chunks(datastore, chunks, config_path=self.server.config_path)
+        if 'error' in res:
+            return self._reply_json({'error': res['error'], 'errno': res['errno']}, status_code=503)
+
+        return self._reply_json(res)
+
+
     def _patch_from_signed_inodes( self, ses, path_info, operation, data_path, inode_info, create=False, exist=False ):
         """
         Given signed inode information, store it and act on it.
@@ -2491,6 +2700,20 @@ class BlockstackAPIEndpointHandler(SimpleHTTPRequestHandler):
         return self._reply_json(res)
 
 
+    def GET_registrar_metrics( self, ses, path_info ):
+        """
+        Handle GET /v1/node/registrar/metrics
+        Get the registrar's per-stage backlog and latency
+        Return 200 on success
+        Return 503 if the registrar is not running
+        """
+        res = backend.registrar.metrics()
+        if 'error' in res:
+            return self._reply_json(res, status_code=503)
+
+        return self._reply_json(res)
+
+
     def POST_reboot( self, ses, path_info ):
         """
         Reboot the node.
@@ -2630,6 +2853,19 @@ class BlockstackAPIEndpointHandler(SimpleHTTPRequestHandler):
         return
 
 
+    def GET_node_cache_stats( self, ses, path_info ):
+        """
+        Get hit, miss, eviction, and usage statistics for the datastore metadata cache,
+        the derived key cache, and the config file cache, and path resolution latencies.
+        Return 200 on success
+        """
+        cache_stats = data.GLOBAL_CACHE.get_stats()
+        cache_stats['path_resolution'] = data.get_path_resolve_stats()
+        cache_stats['derived_keys'] = keys.get_derived_key_stats()
+        cache_stats['config'] = blockstack_config.get_config_stats()
+        return self._reply_json(cache_stats)
+
+
     def GET_node_storage_driver_config( self, ses, path_info, driver_name ):
         """
         Get the system-wide storage driver config and routing information (i.e. index URLs) for one or more drivers.
@@ -3547,6 +3783,20 @@ class BlockstackAPIEndpointHandler(SimpleHTTPRequestHandler):
                     },
                 },
             },
+            r'^/v1/node/registrar/metrics$': {
+                'routes': {
+                    'GET': self.GET_registrar_metrics,
+                },
+                'whitelist': {
+                    'GET': {
+                        'name': '',
+                        'desc': 'Get registrar stage metrics',
+                        'auth_session': False,
+                        'auth_pass': True,
+                        'need_data_key': False,
+                    },
+                },
+            },
             r'^/v1/node/reboot$': {
                 'routes': {
                     'POST': self.POST_reboot,
@@ -3633,6 +3883,20 @@ class BlockstackAPIEndpointHandler(SimpleHTTPRequestHandler):
                     },
                 },
             },
+            r'^/v1/node/cache$': {
+                'routes': {
+                    'GET': self.GET_node_cache_stats,
+                },
+                'whitelist': {
+                    'GET': {
+                        'name': '',
+                        'desc': 'Get datastore metadata cache statistics',
+                        'auth_session': False,
+                        'auth_pass': True,
+                        'need_data_key': False,
+                    },
+                },
+            },
             r'^/v1/node/drivers/storage/({})$'.format(URLENCODING_CLASS): {
                 'routes': {
                     'GET': self.GET_node_storage_driver_config,
@@ -3831,6 +4095,20 @@ class BlockstackAPIEndpointHandler(SimpleHTTPRequestHandler):
                     },
                 },
             },
+            r'^/v1/stores/({})/chunks$'.format(URLENCODING_CLASS): {
+                'routes': {
+                    'PUT': self.PUT_store_chunks,
+                },
+                'whitelist': {
+                    'PUT': {
+                        'name': 'store_write',
+                        'desc': 'upload file chunks to the app user\'s data store',
+                        'auth_session': True,
+                        'auth_pass': True,
+                        'need_data_key': True,
+                    },
+                },
+            },
             r'^/v1/resources/({})/({})$'.format(NAME_CLASS, URLENCODING_CLASS): {
                 'routes': {
                     'GET': self.GET_app_resource,
@@ -4185,6 +4463,11 @@ class BlockstackAPIEndpoint(SocketServer.ThreadingMixIn, SocketServer.TCPServer)
         conf = blockstack_config.get_config(path=config_path)
         assert conf
 
+        # if our API password came from the config file, follow changes to it
+        self.api_pass_from_config = (api_pass is not None and api_pass == conf.get('api_password'))
+        if server:
+            blockstack_config.config_add_listener(self.config_changed)
+
         if wallet_keys is not None:
             assert wallet_keys.has_key('data_privkey')
 
@@ -4197,6 +4480,19 @@ class BlockstackAPIEndpoint(SocketServer.ThreadingMixIn, SocketServer.TCPServer)
         self.register_api_functions(config_path)
 
 
+    def config_changed(self, config_path, snapshot):
+        """
+        Config listener: pick up a new API password
+        """
+        if config_path != self.config_path or not self.api_pass_from_config:
+            return
+
+        new_api_pass = snapshot['blockstack-client'].get('api_password')
+        if new_api_pass and new_api_pass != self.api_pass:
+            log.debug("API password changed in {}".format(config_path))
+            self.api_pass = new_api_pass
+
+
 class BlockstackAPIEndpointClient(object):
     """
     Client for blockstack's local API endpoint.
@@ -4906,6 +5202,34 @@ class BlockstackAPIEndpointClient(object):
             return self.get_response(req)
 
 
+    def backend_datastore_putchunks(self, datastore_str, datastore_sig, chunks ):
+        """
+        Store a batch of file chunks, ahead of a putfile of a chunked file.
+        Return {'status': True, 'chunk_hashes': [...], 'stored': ..., 'duplicates': ...} on success
+        Return {'error': ..., 'errno': ...} on failure
+        """
+        if is_api_server(self.config_dir):
+            # store the chunks directly
+            datastore = json.loads(datastore_str)
+            return data.put_file_chunks( datastore, chunks, config_path=self.config_path )
+
+        else:
+            res = self.check_version()
+            if 'error' in res:
+                return res
+
+            # ask the API server
+            headers = self.make_request_headers(need_session=True)
+            request = {
+                'datastore_str': datastore_str,
+                'datastore_sig': datastore_sig,
+                'chunks': [base64.b64encode(c) for c in chunks],
+            }
+            datastore_id = data.datastore_get_id(json.loads(datastore_str)['pubkey'])
+            req = self.requests_put( 'http://{}:{}/v1/stores/{}/chunks'.format(self.server, self.port, datastore_id), data=json.dumps(request), timeout=self.timeout, headers=headers )
+            return self.get_response(req)
+
+
     def backend_datastore_rmdir(self, datastore_str, datastore_sig, path, inodes, payloads, signatures, tombstones ):
         """
         Send signed inodes, payloads, and tombstones for a rmdir.
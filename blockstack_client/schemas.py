@@ -560,8 +560,15 @@ MUTABLE_DATUM_SCHEMA_BASE_PROPERTIES = {
         'type': 'integer',
         'minimum': 1,
     },
+    'chunked': {
+        # if True, this file's payload is a chunk manifest (MUTABLE_DATUM_FILE_CHUNKS_SCHEMA)
+        'type': 'boolean',
+    },
 }
 
+# optional inode properties
+MUTABLE_DATUM_SCHEMA_OPTIONAL_PROPERTIES = ['reader_pubkeys', 'chunked']
+
 # header contains hash of payload
 MUTABLE_DATUM_SCHEMA_HEADER_PROPERTIES = MUTABLE_DATUM_SCHEMA_BASE_PROPERTIES.copy()
 MUTABLE_DATUM_SCHEMA_HEADER_PROPERTIES.update({
@@ -579,7 +586,7 @@ MUTABLE_DATUM_INODE_HEADER_SCHEMA = {
     'type': 'object',
     'properties': MUTABLE_DATUM_SCHEMA_HEADER_PROPERTIES,
     'additionalProperties': False,
-    'required': list(set(MUTABLE_DATUM_SCHEMA_HEADER_PROPERTIES.keys()) - set(['reader_pubkeys']))  # headers only include reader pubkey hashes
+    'required': list(set(MUTABLE_DATUM_SCHEMA_HEADER_PROPERTIES.keys()) - set(MUTABLE_DATUM_SCHEMA_OPTIONAL_PROPERTIES))  # headers only include reader pubkey hashes
 }
 
 MUTABLE_DATUM_DIRENT_SCHEMA = {
@@ -636,6 +643,35 @@ MUTABLE_DATUM_FILE_SCHEMA_PROPERTIES.update({
     'idata': MUTABLE_DATUM_FILE_IDATA_SCHEMA
 })
 
+# payload of a chunked file: its size, and the hashes of its fixed-size chunks, in order.
+# it is signed by way of the file's inode header, which covers its hash.
+MUTABLE_DATUM_FILE_CHUNKS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'size': {
+            'type': 'integer',
+            'minimum': 0,
+        },
+        'chunk_size': {
+            'type': 'integer',
+            'minimum': 1,
+        },
+        'chunks': {
+            'type': 'array',
+            'items': {
+                'type': 'string',
+                'pattern': OP_HEX_PATTERN,
+            },
+        },
+    },
+    'additionalProperties': False,
+    'required': [
+        'size',
+        'chunk_size',
+        'chunks',
+    ],
+}
+
 MUTABLE_DATUM_DIR_SCHEMA_PROPERTIES.update({
     'idata': MUTABLE_DATUM_DIR_IDATA_SCHEMA
 })
@@ -644,7 +680,7 @@ MUTABLE_DATUM_INODE_SCHEMA = {
     'type': 'object',
     'properties': MUTABLE_DATUM_SCHEMA_BASE_PROPERTIES,
     'additionalProperties': False,
-    'required': list(set(MUTABLE_DATUM_SCHEMA_BASE_PROPERTIES.keys()) - set(['reader_pubkeys']))    # public keys are loaded at runtime, not stored
+    'required': list(set(MUTABLE_DATUM_SCHEMA_BASE_PROPERTIES.keys()) - set(MUTABLE_DATUM_SCHEMA_OPTIONAL_PROPERTIES))    # public keys are loaded at runtime, not stored
 }
 
 
@@ -652,14 +688,14 @@ MUTABLE_DATUM_FILE_SCHEMA = {
     'type': 'object',
     'properties': MUTABLE_DATUM_FILE_SCHEMA_PROPERTIES,
     'additionalProperties': False,
-    'required': list(set(MUTABLE_DATUM_FILE_SCHEMA_PROPERTIES.keys()) - set(['reader_pubkeys']))    # public keys are loaded at runtime, not stored
+    'required': list(set(MUTABLE_DATUM_FILE_SCHEMA_PROPERTIES.keys()) - set(MUTABLE_DATUM_SCHEMA_OPTIONAL_PROPERTIES))    # public keys are loaded at runtime, not stored
 }
 
 MUTABLE_DATUM_DIR_SCHEMA = {
     'type': 'object',
     'properties': MUTABLE_DATUM_DIR_SCHEMA_PROPERTIES,
     'additionalProperties': False,
-    'required': list(set(MUTABLE_DATUM_DIR_SCHEMA_PROPERTIES.keys()) - set(['reader_pubkeys']))     # public keys are loaded at runtime, not stored
+    'required': list(set(MUTABLE_DATUM_DIR_SCHEMA_PROPERTIES.keys()) - set(MUTABLE_DATUM_SCHEMA_OPTIONAL_PROPERTIES))     # public keys are loaded at runtime, not stored
 }
 
 # replicated datastore
@@ -23,6 +23,8 @@
 import simplejson
 import random
 import time
+import os
+import sqlite3
 
 from .backend.blockchain import get_bitcoind_client
 
@@ -39,13 +41,137 @@ from .logger import get_logger
 from .constants import (
     FIRST_BLOCK_MAINNET, NAME_OPCODES,
     OPFIELDS, BLOCKCHAIN_ID_MAGIC, NAME_PREORDER,
-    NAME_TRANSFER, NAMESPACE_PREORDER
+    NAME_TRANSFER, NAMESPACE_PREORDER, SNV_DB_FILENAME
 )
 
 import json
 
 log = get_logger()
 
+# most consensus hashes a blockstackd node will return per get_consensus_hashes() call
+SNV_CONSENSUS_HASH_BATCH = 32
+
+
+class SNVConsensusDB(object):
+    """
+    Persistent store of the SNV steps that earlier lookups have verified.
+
+    A step is the preimage of a block's consensus hash: the block's
+    ops hash and the prior consensus hashes that went into it.
+    Steps are keyed by (block ID, consensus hash), so which trust root
+    a step was verified from does not matter--a lookup only uses a stored
+    step for a consensus hash it has already proven, and only after
+    re-hashing the preimage and getting that consensus hash back.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS snv_steps( block_id INTEGER NOT NULL, consensus_hash TEXT NOT NULL, " +
+                          "ops_hash TEXT NOT NULL, prev_consensus_hashes TEXT NOT NULL, PRIMARY KEY(block_id, consensus_hash) );")
+
+    def get_step(self, block_id, consensus_hash):
+        """
+        Get the stored preimage of a consensus hash.
+        The caller must re-hash it before trusting it.
+        Returns (ops_hash, [prev consensus hash]) if we have it
+        Returns None if not
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT ops_hash, prev_consensus_hashes FROM snv_steps WHERE block_id = ? AND consensus_hash = ?;", (block_id, consensus_hash))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+
+        ops_hash, prev_consensus_hashes = row
+        prev_consensus_hashes = [str(ch) for ch in prev_consensus_hashes.split(',') if len(ch) > 0]
+        return (str(ops_hash), prev_consensus_hashes)
+
+    def put_steps(self, steps):
+        """
+        Atomically record verified steps.
+        @steps is {(block_id, consensus_hash): (ops_hash, [prev consensus hash])}
+        """
+        rows = [(block_id, consensus_hash, ops_hash, ",".join(prev_consensus_hashes))
+                for ((block_id, consensus_hash), (ops_hash, prev_consensus_hashes)) in steps.items()]
+
+        cursor = self.conn.cursor()
+        cursor.execute("BEGIN;")
+        cursor.executemany("INSERT OR REPLACE INTO snv_steps (block_id, consensus_hash, ops_hash, prev_consensus_hashes) VALUES (?, ?, ?, ?);", rows)
+        cursor.execute("COMMIT;")
+
+    def close(self):
+        self.conn.close()
+
+
+def get_snv_db_path(config_path):
+    """
+    Where the SNV store lives, given the client config path
+    """
+    return os.path.join(os.path.dirname(config_path), SNV_DB_FILENAME)
+
+
+def snv_consensus_block_ids(block_id):
+    """
+    Get the prior blocks whose consensus hashes (along with the block's
+    ops hash) go into the given block's consensus hash:
+    block_id - 1, block_id - 3, block_id - 7, ...
+    """
+    i = 0
+    ch_block_ids = []
+    while block_id - (2 ** (i + 1) - 1) >= FIRST_BLOCK_MAINNET:
+        i += 1
+        ch_block_ids.append(block_id - (2 ** i - 1))
+
+    return ch_block_ids
+
+
+def snv_walk_block_ids(current_block_id, block_id):
+    """
+    Predict the set of blocks whose consensus hashes a SNV walk
+    from current_block_id back to block_id will need, assuming
+    every block in the range has a consensus hash.
+    """
+    needed = set()
+    known = set([current_block_id])
+    next_block_id = current_block_id
+
+    while next_block_id >= block_id:
+        ch_block_ids = snv_consensus_block_ids(next_block_id)
+        needed.update(ch_block_ids)
+        known.update(ch_block_ids)
+
+        candidates = filter(lambda b: b >= block_id and b < next_block_id, known)
+        if len(candidates) == 0:
+            break
+
+        next_block_id = min(candidates)
+
+    return needed
+
+
+def snv_fetch_consensus_hashes(block_ids, proxy=None):
+    """
+    Fetch (untrusted) consensus hashes for a set of blocks, in as few RPCs as possible.
+    Return {block_id: consensus_hash or None} on success
+    Return {'error': ...} on error
+    """
+    block_ids = sorted(block_ids, reverse=True)
+    ret = {}
+    for i in xrange(0, len(block_ids), SNV_CONSENSUS_HASH_BATCH):
+        batch = block_ids[i:i+SNV_CONSENSUS_HASH_BATCH]
+        chs = get_consensus_hashes(batch, proxy=proxy)
+        if 'error' in chs:
+            msg = 'Failed to get consensus hashes for {}: {}'
+            log.error(msg.format(batch, chs['error']))
+            return {'error': 'Failed to get consensus hashes'}
+
+        ret.update(chs)
+
+    return ret
+
 
 def txid_to_block_data(txid, bitcoind_proxy, proxy=None):
     """
@@ -276,12 +402,16 @@ def get_consensus_hash_from_tx(tx):
     return None
 
 
-def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, consensus_hash, proxy=None):
+def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, consensus_hash, proxy=None, snv_db=None):
     """
     Simple name verification (snv) lookup:
     Use a known-good "current" consensus hash and block ID to
     look up a set of name operations from the past, given the previous
     point in time's untrusted block ID and consensus hash.
+
+    If @snv_db is given, steps verified by earlier lookups are reused
+    for the consensus hashes this walk has already proven (after
+    re-hashing them), and the steps this walk verifies are added to it.
     """
 
     log.debug('verify {}-{} to {}-{}'.format(
@@ -299,83 +429,128 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
         next_block_id: current_consensus_hash
     }
 
+    # untrusted consensus hashes fetched ahead of the walk.
+    # they only become trusted once a step verifies them.
+    prefetched_consensus_hashes = {}
+
+    # steps verified over the network, to remember in snv_db
+    # {(block_id, consensus_hash): (ops_hash, [prev consensus hash])}
+    new_steps = {}
+
+    first_step = True
+
     # print 'next_block_id = {}, block_id = {}'.format(next_block_id, block_id)
     while next_block_id >= block_id:
-        # get nameops_at[ next_block_id ], and all consensus_hash[ next_block_id - 2^i ]
-        # such that block_id - 2*i > block_id (start at i = 1)
-        i = 0
-        nameops_hash = None
+        # find out which consensus hashes we'll need
+        ch_block_ids = snv_consensus_block_ids(next_block_id)
+        expected_ch = prev_consensus_hashes[next_block_id]
 
-        if next_block_id in prev_nameops_hashes:
-            nameops_hash = prev_nameops_hashes[next_block_id]
-        else:
-            nameops_resp = get_nameops_hash_at(next_block_id, proxy=proxy)
+        # did an earlier lookup verify this step?
+        stored_step = None
+        if snv_db is not None:
+            stored_step = snv_db.get_step(next_block_id, expected_ch)
+
+        if stored_step is not None:
+            nameops_hash, prev_consensus_hashes_list = stored_step
+            ch = virtualchain.StateEngine.make_snapshot_from_ops_hash(
+                nameops_hash, prev_consensus_hashes_list
+            )
 
-            if 'error' in nameops_resp:
-                log.error('get_nameops_hash_at: {}'.format(nameops_resp['error']))
-                return {'error': 'Failed to get nameops: {}'.format(nameops_resp['error'])}
+            if ch != expected_ch or len(prev_consensus_hashes_list) > len(ch_block_ids):
+                log.warning('Ignoring corrupt SNV step at {}-{}'.format(next_block_id, expected_ch))
+                stored_step = None
 
-            nameops_hash = str(nameops_resp)
+        if stored_step is not None:
+            log.debug('step at {} already verified'.format(next_block_id))
             prev_nameops_hashes[next_block_id] = nameops_hash
+            for b, prev_ch in zip(ch_block_ids, prev_consensus_hashes_list):
+                prev_consensus_hashes[b] = prev_ch
 
-        log.debug('nameops hash at {}: {}'.format(next_block_id, nameops_hash))
-
-        # find out which consensus hashes we'll need
-        to_fetch = []
-        ch_block_ids = []
-        while next_block_id - (2 ** (i + 1) - 1) >= FIRST_BLOCK_MAINNET:
-            i += 1
-            prev_block_id = next_block_id - (2 ** i - 1)
-            ch_block_ids.append(prev_block_id)
-
-            if prev_block_id not in prev_consensus_hashes:
-                to_fetch.append(prev_block_id)
-
-        # get the consensus hashes
-        chs = {}
-        if to_fetch:
-            chs = get_consensus_hashes(to_fetch, proxy=proxy)
-            if 'error' in chs:
-                msg = 'Failed to get consensus hashes for {}: {}'
-                log.error(msg.format(to_fetch, chs['error']))
-                return {'error': 'Failed to get consensus hashes'}
-
-        prev_consensus_block_ids = []
-        for b in ch_block_ids:
-            # NOTE: we process to_fetch *in decreasing order* so we know when we're missing data
-            if b not in chs and b not in prev_consensus_hashes:
-                msg = 'Missing consensus hash response for {} (chs={}, prev_chs={})'
-                log.error(msg.format(b, chs, prev_consensus_hashes))
-                return {'error': 'Server did not reply valid data'}
-
-            prev_consensus_block_ids.append(b)
-            if b in prev_consensus_hashes:
-                # already got this one
-                continue
+        else:
+            # get nameops_at[ next_block_id ], and all consensus_hash[ next_block_id - 2^i ]
+            # such that block_id - 2*i > block_id (start at i = 1)
+            nameops_hash = None
 
-            ch = chs[b]
-            if ch is not None:
-                prev_consensus_hashes[b] = str(ch)
+            if next_block_id in prev_nameops_hashes:
+                nameops_hash = prev_nameops_hashes[next_block_id]
             else:
-                # no consensus hash for this block and all future blocks
-                prev_consensus_block_ids.pop()
-                break
-
-        # prev_consensus_hashes_list = [ prev_consensus_hashes[b] for b in ch_block_ids ]
-        prev_consensus_hashes_list = [
-            prev_consensus_hashes[b] for b in prev_consensus_block_ids
-        ]
-
-        # calculate the snapshot, and see if it matches
-        ch = virtualchain.StateEngine.make_snapshot_from_ops_hash(
-            nameops_hash, prev_consensus_hashes_list
-        )
+                nameops_resp = get_nameops_hash_at(next_block_id, proxy=proxy)
+
+                if 'error' in nameops_resp:
+                    log.error('get_nameops_hash_at: {}'.format(nameops_resp['error']))
+                    return {'error': 'Failed to get nameops: {}'.format(nameops_resp['error'])}
+
+                nameops_hash = str(nameops_resp)
+                prev_nameops_hashes[next_block_id] = nameops_hash
+
+            log.debug('nameops hash at {}: {}'.format(next_block_id, nameops_hash))
+
+            chs = {}
+            to_fetch = filter(lambda b: b not in prev_consensus_hashes, ch_block_ids)
+
+            for b in to_fetch:
+                if b in prefetched_consensus_hashes:
+                    chs[b] = prefetched_consensus_hashes[b]
+
+            to_fetch = filter(lambda b: b not in chs, to_fetch)
+
+            # get the consensus hashes
+            if to_fetch:
+                fetch_block_ids = set(to_fetch)
+                if not first_step:
+                    # fetch the rest of the walk's consensus hashes in bulk, rather than one step at a time
+                    walk_block_ids = snv_walk_block_ids(next_block_id, block_id)
+                    walk_block_ids = filter(lambda b: b not in prev_consensus_hashes and b not in prefetched_consensus_hashes, walk_block_ids)
+                    fetch_block_ids.update(walk_block_ids)
+
+                fetched = snv_fetch_consensus_hashes(fetch_block_ids, proxy=proxy)
+                if 'error' in fetched:
+                    return fetched
+
+                prefetched_consensus_hashes.update(fetched)
+                for b in to_fetch:
+                    if b in fetched:
+                        chs[b] = fetched[b]
+
+            prev_consensus_block_ids = []
+            for b in ch_block_ids:
+                # NOTE: we process to_fetch *in decreasing order* so we know when we're missing data
+                if b not in chs and b not in prev_consensus_hashes:
+                    msg = 'Missing consensus hash response for {} (chs={}, prev_chs={})'
+                    log.error(msg.format(b, chs, prev_consensus_hashes))
+                    return {'error': 'Server did not reply valid data'}
+
+                prev_consensus_block_ids.append(b)
+                if b in prev_consensus_hashes:
+                    # already got this one
+                    continue
+
+                ch = chs[b]
+                if ch is not None:
+                    prev_consensus_hashes[b] = str(ch)
+                else:
+                    # no consensus hash for this block and all future blocks
+                    prev_consensus_block_ids.pop()
+                    break
+
+            # prev_consensus_hashes_list = [ prev_consensus_hashes[b] for b in ch_block_ids ]
+            prev_consensus_hashes_list = [
+                prev_consensus_hashes[b] for b in prev_consensus_block_ids
+            ]
+
+            # calculate the snapshot, and see if it matches
+            ch = virtualchain.StateEngine.make_snapshot_from_ops_hash(
+                nameops_hash, prev_consensus_hashes_list
+            )
 
-        expected_ch = prev_consensus_hashes[next_block_id]
-        if ch != expected_ch:
-            msg = 'Consensus hash mismatch at {}: expected {}, got {} (from {}, {})'
-            log.error(msg.format(next_block_id, expected_ch, ch, nameops_hash, prev_consensus_hashes))
-            return {'error': 'Consensus hash mismatch'}
+            if ch != expected_ch:
+                msg = 'Consensus hash mismatch at {}: expected {}, got {} (from {}, {})'
+                log.error(msg.format(next_block_id, expected_ch, ch, nameops_hash, prev_consensus_hashes))
+                return {'error': 'Consensus hash mismatch'}
+
+            new_steps[(next_block_id, expected_ch)] = (nameops_hash, prev_consensus_hashes_list)
+
+        first_step = False
 
         # advance!
         # find the smallest known consensus hash whose block is greater than block_id
@@ -430,6 +605,10 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
 
     log.debug('{} nameops at {}'.format(len(historic_nameops), block_id))
 
+    if snv_db is not None and len(new_steps) > 0:
+        # remember the steps we verified
+        snv_db.put_steps(new_steps)
+
     # strip history
     for hn in historic_nameops:
         if 'history' in hn.keys():
@@ -439,7 +618,7 @@ def snv_get_nameops_at(current_block_id, current_consensus_hash, block_id, conse
 
 
 def snv_name_verify(name, current_block_id, current_consensus_hash, block_id,
-                    consensus_hash, trusted_txid=None, trusted_txindex=None, proxy=None):
+                    consensus_hash, trusted_txid=None, trusted_txindex=None, proxy=None, snv_db=None):
     """
     Use SNV to verify that a name existed at a particular block ID in the past,
     given a later known-good block ID and consensus hash (as well as the previous
@@ -455,7 +634,7 @@ def snv_name_verify(name, current_block_id, current_consensus_hash, block_id,
 
     historic_nameops = snv_get_nameops_at(
         current_block_id, current_consensus_hash,
-        block_id, consensus_hash, proxy=proxy
+        block_id, consensus_hash, proxy=proxy, snv_db=snv_db
     )
 
     if 'error' in historic_nameops:
@@ -491,7 +670,7 @@ def snv_name_verify(name, current_block_id, current_consensus_hash, block_id,
 
 
 def snv_lookup(verify_name, verify_block_id,
-               trusted_serial_number_or_txid_or_consensus_hash, proxy=None, trusted_txid=None):
+               trusted_serial_number_or_txid_or_consensus_hash, proxy=None, trusted_txid=None, snv_db_path=None):
 
     """
     High-level call to simple name verification:
@@ -523,6 +702,9 @@ def snv_lookup(verify_name, verify_block_id,
 
     NOTE: @trusted_txid is needed for isolating multiple operations in the same name within a single block.
 
+    The SNV steps verified along the way are kept in the SNV store at @snv_db_path
+    (by default, next to the client config file), so later lookups only fetch the steps they are missing.
+
     Return the list of nameops in the given verify_block_id that match.
     """
 
@@ -606,13 +788,21 @@ def snv_lookup(verify_name, verify_block_id,
         msg = 'Trusted block/consensus hash came before the untrusted block/consensus hash'
         return {'error': msg}
 
+    if snv_db_path is None:
+        snv_db_path = get_snv_db_path(proxy.conf['path'])
+
+    snv_db = SNVConsensusDB(snv_db_path)
+
     # go verify the name
     verify_consensus_hash = get_consensus_at(verify_block_id, proxy=proxy)
-    historic_namerecs = snv_name_verify(
-        verify_name, trusted_block_id, trusted_consensus_hash,
-        verify_block_id, verify_consensus_hash,
-        trusted_txid=trusted_txid, trusted_txindex=trusted_tx_index
-    )
+    try:
+        historic_namerecs = snv_name_verify(
+            verify_name, trusted_block_id, trusted_consensus_hash,
+            verify_block_id, verify_consensus_hash,
+            trusted_txid=trusted_txid, trusted_txindex=trusted_tx_index, snv_db=snv_db
+        )
+    finally:
+        snv_db.close()
 
     if 'error' in historic_namerecs:
         return historic_namerecs
@@ -31,8 +31,10 @@ import traceback
 import gc
 import signal
 import time
+from collections import deque
 
 from .config import get_config
+from .constants import SCATTER_GATHER_MAX_WORKERS
 from .logger import get_logger
 
 log = get_logger('blockstack-client')
@@ -345,16 +347,216 @@ class ScatterGatherThread(threading.Thread):
         self.post_result(res)
 
 
+class ScatterGatherTask(object):
+    """
+    A task queued on a TaskExecutor
+    """
+    def __init__(self, rpc_call):
+        self.rpc_call = rpc_call
+        self.result = None
+        self.done = threading.Event()
+
+
+    def run(self):
+        self.result = ScatterGatherThread.do_work(self.rpc_call)
+        self.done.set()
+
+
+class TaskExecutor(object):
+    """
+    Bounded pool of worker threads, shared by scatter/gather runs.
+    Workers are started on demand, up to max_workers, and stay around.
+
+    Threads waiting on their tasks run the ones no worker has started yet,
+    so a task can run its own scatter/gather without starving the pool.
+    They never run other callers' tasks, which would delay their own.
+    """
+    def __init__(self, max_workers=SCATTER_GATHER_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.lock = threading.Condition()
+        self.queue = deque()
+        self.num_workers = 0
+        self.num_idle = 0
+        self.stats = {'tasks': 0, 'inline': 0}
+
+
+    def submit(self, rpc_call):
+        """
+        Queue a task.
+        Return a handle to pass to wait()
+        """
+        task = ScatterGatherTask(rpc_call)
+        with self.lock:
+            self.queue.append(task)
+            self.stats['tasks'] += 1
+
+            if self.num_idle == 0 and self.num_workers < self.max_workers:
+                worker = threading.Thread(target=self._worker_main)
+                worker.daemon = True
+                self.num_workers += 1
+                worker.start()
+
+            else:
+                self.lock.notify()
+
+        return task
+
+
+    def _claim(self, task):
+        """
+        Take a task off the queue, if no worker has started it yet.
+        Return True if the caller should run it
+        """
+        with self.lock:
+            try:
+                self.queue.remove(task)
+            except ValueError:
+                return False
+
+            self.stats['inline'] += 1
+            return True
+
+
+    def wait_all(self, tasks):
+        """
+        Wait for a list of tasks to finish, and get their results (in order).
+        Any of them still queued are run in the calling thread.
+        """
+        for task in tasks:
+            if self._claim(task):
+                task.run()
+
+        for task in tasks:
+            task.done.wait()
+
+        return [task.result for task in tasks]
+
+
+    def wait(self, task):
+        """
+        Wait for a task to finish, and get its result.
+        """
+        return self.wait_all([task])[0]
+
+
+    def _worker_main(self):
+        while True:
+            with self.lock:
+                self.num_idle += 1
+                while len(self.queue) == 0:
+                    self.lock.wait()
+
+                self.num_idle -= 1
+                task = self.queue.popleft()
+
+            task.run()
+
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['workers'] = self.num_workers
+            stats['queued'] = len(self.queue)
+            stats['max_workers'] = self.max_workers
+
+        return stats
+
+
+TASK_EXECUTOR = None
+TASK_EXECUTOR_LOCK = threading.Lock()
+
+def get_task_executor():
+    """
+    Get the process-wide scatter/gather executor
+    """
+    global TASK_EXECUTOR
+    with TASK_EXECUTOR_LOCK:
+        if TASK_EXECUTOR is None:
+            TASK_EXECUTOR = TaskExecutor()
+
+        return TASK_EXECUTOR
+
+
+class SingleFlight(object):
+    """
+    Coalesce identical calls: the first caller of a key makes the call,
+    and concurrent callers of the same key wait for its result.
+    With @memoize, later callers get the result too.
+    Callers share the result object, so they must not modify it.
+    """
+    def __init__(self, memoize=False):
+        self.memoize = memoize
+        self.lock = threading.Lock()
+        self.inflight = {}      # key => {'done': Event, 'result': ..., 'exc': ...}
+        self.results = {}
+        self.stats = {'calls': 0, 'coalesced': 0}
+
+
+    def do(self, key, func, *args, **kw):
+        """
+        Call func(*args, **kw), unless a call for @key is in flight (or memoized).
+        Exceptions are raised to every waiting caller.
+        """
+        leader = False
+        with self.lock:
+            if key in self.results:
+                self.stats['coalesced'] += 1
+                return self.results[key]
+
+            call = self.inflight.get(key, None)
+            if call is not None:
+                self.stats['coalesced'] += 1
+
+            else:
+                call = {'done': threading.Event(), 'result': None, 'exc': None}
+                self.inflight[key] = call
+                self.stats['calls'] += 1
+                leader = True
+
+        if not leader:
+            call['done'].wait()
+            if call['exc'] is not None:
+                raise call['exc']
+
+            return call['result']
+
+        try:
+            call['result'] = func(*args, **kw)
+            return call['result']
+
+        except Exception as e:
+            call['exc'] = e
+            raise
+
+        finally:
+            with self.lock:
+                del self.inflight[key]
+                if self.memoize and call['exc'] is None:
+                    self.results[key] = call['result']
+
+            call['done'].set()
+
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+
 class ScatterGather(object):
     """
     Scatter/gather work pool
     Give it a few tasks, and it will run them
-    in parallel
+    in parallel on a shared, bounded executor.
+
+    Tasks can coalesce identical lookups through
+    the single_flight group, which lasts as long as this object.
     """
-    def __init__(self):
+    def __init__(self, executor=None):
         self.tasks = {}
         self.ran = False
         self.results = {}
+        self.executor = executor
+        self.single_flight = SingleFlight(memoize=True)
 
     def add_task(self, result_name, rpc_call):
         assert result_name not in self.tasks.keys(), "Duplicate task: {}".format(result_name)
@@ -381,19 +583,16 @@ class ScatterGather(object):
         and return the set of results
         """
         if not single_thread:
-            threads = {}
+            executor = self.executor if self.executor is not None else get_task_executor()
+            pending = {}
             for task_name, task_call in self.tasks.items():
                 log.debug("Start task '{}'".format(task_name))
-                thr = ScatterGatherThread(task_call)
-                thr.start()
-
-                threads[task_name] = thr
+                pending[task_name] = executor.submit(task_call)
 
-            for task_name, thr in threads.items():
-                log.debug("Join task '{}'".format(task_name))
-                thr.join()
-                res = thr.get_result()
-                self.results[task_name] = res
+            task_names = pending.keys()
+            log.debug("Join {} task(s)".format(len(task_names)))
+            results = executor.wait_all([pending[task_name] for task_name in task_names])
+            self.results.update(dict(zip(task_names, results)))
                
         else:
             # for testing purposes
@@ -406,3 +605,47 @@ class ScatterGather(object):
         self.ran = True
         return self.results
 
+
+
+class LatencyHistogram(object):
+    """
+    Thread-safe histogram of operation latencies.
+    Bucket bounds are in milliseconds; the last bucket is unbounded.
+    """
+    def __init__(self, buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+
+    def record(self, elapsed):
+        """
+        Record an operation that took @elapsed seconds
+        """
+        elapsed_ms = elapsed * 1000.0
+        i = 0
+        while i < len(self.buckets) and elapsed_ms > self.buckets[i]:
+            i += 1
+
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += elapsed_ms
+            self.max = max(self.max, elapsed_ms)
+
+
+    def get_stats(self):
+        """
+        Get the bucket counts, and the count, mean, and max latency (in ms)
+        """
+        with self.lock:
+            labels = ['<={}ms'.format(b) for b in self.buckets] + ['>{}ms'.format(self.buckets[-1])]
+            return {
+                'buckets': dict(zip(labels, self.counts)),
+                'count': self.count,
+                'mean_ms': (self.total / self.count) if self.count > 0 else 0.0,
+                'max_ms': self.max,
+            }
@@ -830,10 +830,13 @@ def prompt_wallet_password(prompt='Enter wallet password: '):
     return password
 
 
-def load_wallet(password=None, config_path=CONFIG_PATH, wallet_path=None, interactive=True, include_private=False):
+def load_wallet(password=None, config_path=CONFIG_PATH, wallet_path=None, interactive=True, include_private=False, use_agent=False):
     """
     Get a wallet from disk, and unlock it.
     Requries either a password, or interactive=True
+    If use_agent is True and a wallet agent holds this wallet, get it from the agent instead
+    (in which case 'password' is whatever the caller gave).
+
     Return {'status': True, 'migrated': ..., 'wallet': ..., 'password': ...} on success
     Return {'error': ...} on error
     """
@@ -841,6 +844,11 @@ def load_wallet(password=None, config_path=CONFIG_PATH, wallet_path=None, intera
     if wallet_path is None:
         wallet_path = os.path.join(config_dir, WALLET_FILENAME)
 
+    if use_agent and wallet_path == os.path.join(config_dir, WALLET_FILENAME):
+        wallet = get_agent_wallet(config_dir=config_dir)
+        if wallet is not None:
+            return {'status': True, 'migrated': False, 'wallet': wallet, 'password': password}
+
     if password is None:
         password = prompt_wallet_password()
 
@@ -859,6 +867,26 @@ def load_wallet(password=None, config_path=CONFIG_PATH, wallet_path=None, intera
     return res
 
 
+def get_agent_wallet(config_dir=CONFIG_DIR):
+    """
+    Get the unlocked wallet from the wallet agent, if one is running.
+    Return the wallet on success
+    Return None if there is no agent, or it failed
+    """
+    from .wallet_agent import wallet_agent_connect
+
+    agent = wallet_agent_connect(config_dir)
+    if agent is None:
+        return None
+
+    res = agent.get_wallet()
+    if 'error' in res:
+        log.error("Wallet agent: {}".format(res['error']))
+        return None
+
+    return res['wallet']
+
+
 def backup_wallet(wallet_path, tag = "legacy"):
     """
     Given the path to an on-disk wallet, back it up.
@@ -933,15 +961,26 @@ def unlock_wallet(password=None, config_dir=CONFIG_DIR, wallet_path=None):
         return {'status': True}
 
     try:
-        if password is None:
-            password = prompt_wallet_password()
+        wallet_info = None
+        agent_wallet = None
+        if wallet_path == os.path.join(config_dir, WALLET_FILENAME):
+            agent_wallet = get_agent_wallet(config_dir=config_dir)
+
+        if agent_wallet is not None:
+            # already unlocked by the wallet agent
+            wallet_info = {'status': True, 'wallet': agent_wallet, 'migrated': False}
+
+        else:
+            if password is None:
+                password = prompt_wallet_password()
+
+            with open(wallet_path, "r") as f:
+                data = f.read()
+                data = json.loads(data)
 
-        with open(wallet_path, "r") as f:
-            data = f.read()
-            data = json.loads(data)
+            # decrypt...
+            wallet_info = decrypt_wallet( data, password, config_path=config_path )
 
-        # decrypt...
-        wallet_info = decrypt_wallet( data, password, config_path=config_path )
         if 'error' in wallet_info:
             log.error('Failed to decrypt wallet: {}'.format(wallet_info['error']))
             return wallet_info
@@ -0,0 +1,495 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+"""
+Wallet session agent.
+
+Unlocking the wallet runs scrypt over the wallet password, which takes about
+a second.  The agent unlocks the wallet once, holds the decrypted keys in a
+process whose memory is locked (so the keys are not swapped out or dumped),
+and serves key and signing requests to CLI processes over a Unix socket in
+the config directory.  Clients authenticate with a random token that only
+the wallet's owner can read, and must run as the same user.  The agent
+forgets the wallet and exits once it has been idle for a while.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import struct
+import ctypes
+import ctypes.util
+import SocketServer
+
+from binascii import hexlify
+
+from .constants import (
+    CONFIG_DIR, CONFIG_FILENAME, WALLET_FILENAME,
+    WALLET_AGENT_SOCKET_FILENAME, WALLET_AGENT_TOKEN_FILENAME, WALLET_AGENT_IDLE_TIMEOUT
+)
+from .utils import daemonize, streq_constant
+from .logger import get_logger
+
+log = get_logger()
+
+MAX_REQUEST_LEN = 1024 * 1024
+SO_PEERCRED = 17        # Linux
+
+# mlockall(2) and prctl(2) flags (Linux)
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+PR_SET_DUMPABLE = 4
+
+
+def wallet_agent_socket_path(config_dir=CONFIG_DIR):
+    """
+    Where does the agent listen?
+    """
+    return os.path.join(config_dir, WALLET_AGENT_SOCKET_FILENAME)
+
+
+def wallet_agent_token_path(config_dir=CONFIG_DIR):
+    """
+    Where does the agent store its client token?
+    """
+    return os.path.join(config_dir, WALLET_AGENT_TOKEN_FILENAME)
+
+
+def wallet_agent_logfile_path(config_dir=CONFIG_DIR):
+    """
+    Where does the agent log to?
+    """
+    return os.path.join(config_dir, 'wallet_agent.log')
+
+
+def lock_process_memory():
+    """
+    Keep this process's memory out of swap and core dumps,
+    and keep other processes from attaching to it.
+    Best-effort (needs Linux, and a large enough RLIMIT_MEMLOCK).
+
+    Return True if memory is locked
+    Return False if not
+    """
+    libc_path = ctypes.util.find_library('c')
+    if libc_path is None:
+        log.warning("Cannot find libc; wallet agent memory is not locked")
+        return False
+
+    libc = ctypes.CDLL(libc_path, use_errno=True)
+
+    if hasattr(libc, 'prctl') and libc.prctl(PR_SET_DUMPABLE, 0, 0, 0, 0) != 0:
+        log.warning("Failed to make wallet agent non-dumpable: errno {}".format(ctypes.get_errno()))
+
+    if not hasattr(libc, 'mlockall') or libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        log.warning("Failed to lock wallet agent memory: errno {}".format(ctypes.get_errno()))
+        return False
+
+    return True
+
+
+def get_peer_uid(sock):
+    """
+    Get the user ID of the process on the other end of a Unix socket.
+    Return None if we can't tell on this platform.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+
+    creds = sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', creds)
+    return uid
+
+
+class WalletAgentHandler(SocketServer.StreamRequestHandler):
+    """
+    Serve newline-delimited JSON requests on one connection:
+    {'token': ..., 'method': ..., 'args': {...}}
+    """
+    timeout = 10
+
+    def handle(self):
+        peer_uid = get_peer_uid(self.request)
+        if peer_uid is not None and peer_uid != os.getuid():
+            log.warning("Wallet agent: refusing connection from uid {}".format(peer_uid))
+            return
+
+        while self.server.running:
+            try:
+                line = self.rfile.readline(MAX_REQUEST_LEN)
+            except socket.timeout:
+                return
+
+            if not line:
+                return
+
+            try:
+                request = json.loads(line)
+                assert isinstance(request, dict)
+            except (ValueError, AssertionError):
+                self.reply({'error': 'Invalid request'})
+                return
+
+            reply = self.server.dispatch(request)
+            self.reply(reply)
+
+
+    def reply(self, data):
+        self.wfile.write(json.dumps(data) + '\n')
+        self.wfile.flush()
+
+
+class WalletAgent(SocketServer.UnixStreamServer):
+    """
+    Wallet session agent.  Holds an unlocked wallet
+    until it is idle for idle_timeout seconds or is told to lock.
+    """
+    def __init__(self, wallet, config_dir=CONFIG_DIR, idle_timeout=WALLET_AGENT_IDLE_TIMEOUT):
+        self.wallet = wallet
+        self.config_dir = config_dir
+        self.idle_timeout = idle_timeout
+        self.socket_path = wallet_agent_socket_path(config_dir)
+        self.token_path = wallet_agent_token_path(config_dir)
+        self.token = hexlify(os.urandom(32))
+        self.running = True
+        self.last_request = time.time()
+        self.num_requests = 0
+
+        for path in [self.socket_path, self.token_path]:
+            if os.path.exists(path):
+                os.unlink(path)
+
+        old_umask = os.umask(0077)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, self.socket_path, WalletAgentHandler)
+            os.chmod(self.socket_path, 0600)
+
+            fd = os.open(self.token_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.token)
+
+        finally:
+            os.umask(old_umask)
+
+        # poll for idleness
+        self.timeout = 1.0
+
+
+    def dispatch(self, request):
+        """
+        Authenticate and run a request.
+        Return the reply
+        """
+        token = request.get('token')
+        if not isinstance(token, basestring) or not streq_constant(str(token), self.token):
+            return {'error': 'Invalid token'}
+
+        self.last_request = time.time()
+        self.num_requests += 1
+
+        method = request.get('method')
+        args = request.get('args', {})
+        if self.wallet is None:
+            return {'error': 'Wallet is locked'}
+
+        try:
+            if method == 'ping':
+                return {'status': True, 'idle_timeout': self.idle_timeout, 'requests': self.num_requests}
+
+            elif method == 'get_wallet':
+                return {'status': True, 'wallet': self.wallet}
+
+            elif method == 'get_wallet_keys':
+                return {'status': True, 'wallet_keys': self.get_wallet_keys()}
+
+            elif method == 'sign_tx':
+                return self.sign_tx(str(args['tx']), args['prev_outputs'], str(args.get('key', 'payment')))
+
+            elif method == 'sign_data':
+                return self.sign_data(base64.b64decode(args['data']), str(args.get('key', 'data')))
+
+            elif method == 'lock':
+                self.lock()
+                return {'status': True}
+
+            else:
+                return {'error': 'No such method'}
+
+        except (KeyError, TypeError, ValueError) as e:
+            log.exception(e)
+            return {'error': 'Invalid arguments'}
+
+
+    def get_wallet_keys(self):
+        """
+        Get the wallet keys, in the same form
+        the API endpoint serves them.
+        """
+        return {
+            'payment_address': self.wallet['payment_addresses'][0],
+            'owner_address': self.wallet['owner_addresses'][0],
+            'data_pubkey': self.wallet['data_pubkey'],
+            'payment_privkey': self.wallet['payment_privkey'],
+            'owner_privkey': self.wallet['owner_privkey'],
+            'data_privkey': self.wallet['data_privkey'],
+        }
+
+
+    def sign_tx(self, tx_hex, prev_outputs, key_name):
+        """
+        Sign a transaction's unsigned inputs with the payment or owner key
+        """
+        from .tx import sign_tx
+
+        if key_name not in ['payment', 'owner']:
+            return {'error': 'Invalid key'}
+
+        signed_tx = sign_tx(tx_hex, prev_outputs, self.wallet['{}_privkey'.format(key_name)])
+        return {'status': True, 'tx': signed_tx}
+
+
+    def sign_data(self, data, key_name):
+        """
+        Sign raw data with the data key
+        """
+        from virtualchain.lib.ecdsalib import sign_raw_data
+
+        if key_name != 'data':
+            return {'error': 'Invalid key'}
+
+        return {'status': True, 'sigb64': sign_raw_data(data, self.wallet['data_privkey'])}
+
+
+    def lock(self):
+        """
+        Forget the wallet and stop serving
+        """
+        self.wallet = None
+        self.running = False
+
+
+    def serve_until_locked(self):
+        """
+        Serve requests until we're locked or idle
+        """
+        try:
+            while self.running:
+                self.handle_request()
+                if time.time() - self.last_request > self.idle_timeout:
+                    log.debug("Wallet agent idle for {} seconds; locking".format(self.idle_timeout))
+                    self.lock()
+
+        finally:
+            self.lock()
+            self.server_close()
+            for path in [self.socket_path, self.token_path]:
+                if os.path.exists(path):
+                    os.unlink(path)
+
+
+class WalletAgentClient(object):
+    """
+    Client for a running wallet agent
+    """
+    def __init__(self, config_dir=CONFIG_DIR, timeout=10):
+        self.socket_path = wallet_agent_socket_path(config_dir)
+        self.timeout = timeout
+        with open(wallet_agent_token_path(config_dir), 'r') as f:
+            self.token = f.read().strip()
+
+
+    def request(self, method, **args):
+        """
+        Send a request and get the reply.
+        Return {'error': ...} if the agent is not reachable
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps({'token': self.token, 'method': method, 'args': args}) + '\n')
+
+            buf = []
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+
+                buf.append(data)
+                if data.endswith('\n'):
+                    break
+
+            return json.loads(''.join(buf))
+
+        except (socket.error, ValueError) as e:
+            log.debug("Wallet agent request '{}' failed: {}".format(method, e))
+            return {'error': 'Failed to reach wallet agent'}
+
+        finally:
+            sock.close()
+
+
+    def ping(self):
+        return self.request('ping')
+
+    def get_wallet(self):
+        return self.request('get_wallet')
+
+    def get_wallet_keys(self):
+        return self.request('get_wallet_keys')
+
+    def sign_tx(self, tx_hex, prev_outputs, key='payment'):
+        return self.request('sign_tx', tx=tx_hex, prev_outputs=prev_outputs, key=key)
+
+    def sign_data(self, data, key='data'):
+        return self.request('sign_data', data=base64.b64encode(data), key=key)
+
+    def lock(self):
+        return self.request('lock')
+
+
+def wallet_agent_connect(config_dir=CONFIG_DIR):
+    """
+    Connect to the wallet agent for this config directory, if it is running.
+    Return a WalletAgentClient on success
+    Return None if there is no (live) agent
+    """
+    if not os.path.exists(wallet_agent_socket_path(config_dir)) or not os.path.exists(wallet_agent_token_path(config_dir)):
+        return None
+
+    try:
+        client = WalletAgentClient(config_dir=config_dir)
+    except (IOError, OSError) as e:
+        log.debug("Failed to read wallet agent token: {}".format(e))
+        return None
+
+    res = client.ping()
+    if 'error' in res:
+        return None
+
+    return client
+
+
+def wallet_agent_start_wait(config_dir, timeout=60):
+    """
+    Wait for a just-started wallet agent to answer
+    Return True once it does
+    Return False on timeout
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if wallet_agent_connect(config_dir) is not None:
+            return True
+
+        time.sleep(0.1)
+
+    return False
+
+
+def wallet_agent_start(config_dir=CONFIG_DIR, password=None, idle_timeout=WALLET_AGENT_IDLE_TIMEOUT, foreground=False):
+    """
+    Unlock the wallet and start a wallet agent to hold it.
+    Return {'status': True} on success (in the caller)
+    Return {'error': ...} on failure
+    """
+    from .wallet import load_wallet
+
+    # the agent runs from /
+    config_dir = os.path.abspath(config_dir)
+    config_path = os.path.join(config_dir, CONFIG_FILENAME)
+    wallet_path = os.path.join(config_dir, WALLET_FILENAME)
+
+    if wallet_agent_connect(config_dir) is not None:
+        return {'error': 'Wallet agent is already running'}
+
+    if not os.path.exists(wallet_path):
+        return {'error': 'No wallet found at {}'.format(wallet_path)}
+
+    wallet_info = load_wallet(password=password, config_path=config_path, wallet_path=wallet_path, include_private=True)
+    if 'error' in wallet_info:
+        return {'error': 'Failed to load wallet: {}'.format(wallet_info['error'])}
+
+    if wallet_info['migrated']:
+        return {'error': 'Wallet is in legacy format.  Please migrate it first with the `setup_wallet` command.'}
+
+    wallet = wallet_info['wallet']
+    if not foreground:
+        res = daemonize(wallet_agent_logfile_path(config_dir), child_wait=lambda: wallet_agent_start_wait(config_dir))
+        if res < 0:
+            return {'error': 'Wallet agent failed to start'}
+
+        if res > 0:
+            # parent
+            return {'status': True}
+
+    # agent process takes this path
+    lock_process_memory()
+
+    try:
+        agent = WalletAgent(wallet, config_dir=config_dir, idle_timeout=idle_timeout)
+    except socket.error as se:
+        log.exception(se)
+        if not foreground:
+            sys.exit(1)
+
+        return {'error': 'Failed to listen on {}'.format(wallet_agent_socket_path(config_dir))}
+
+    del wallet, wallet_info
+
+    log.debug("Wallet agent listening on {}".format(agent.socket_path))
+    agent.serve_until_locked()
+
+    if not foreground:
+        sys.exit(0)
+
+    return {'status': True}
+
+
+def wallet_agent_stop(config_dir=CONFIG_DIR):
+    """
+    Lock the wallet agent, if it is running
+    Return {'status': True} on success
+    """
+    client = wallet_agent_connect(config_dir)
+    if client is None:
+        return {'status': True}
+
+    return client.lock()
+
+
+def wallet_agent_status(config_dir=CONFIG_DIR):
+    """
+    Is the wallet agent running?
+    Return {'status': True, 'running': True|False, ...}
+    """
+    client = wallet_agent_connect(config_dir)
+    if client is None:
+        return {'status': True, 'running': False}
+
+    res = client.ping()
+    if 'error' in res:
+        return {'status': True, 'running': False}
+
+    return {'status': True, 'running': True, 'idle_timeout': res['idle_timeout'], 'requests': res['requests']}
@@ -243,6 +243,13 @@ class AtlasRPCTestClient(object):
         return self.rpc.get_zonefile_inventory( 'atlas_network', self.src_hostport, self.dest_hostport, bit_offset, bit_len )
 
 
+    def get_zonefile_inventory_delta( self, inv_id, version ):
+        """
+        Get zonefile inventory changes from the given dest hostport, with simulated loss
+        """
+        return self.rpc.get_zonefile_inventory_delta( 'atlas_network', self.src_hostport, self.dest_hostport, inv_id, version )
+
+
     def get_zonefiles( self, zonefile_hashes ):
         """
         Get the list of zonefiles, given the zonefile hashes (with simulated loss)
@@ -430,6 +437,10 @@ class AtlasNetwork( SocketServer.ThreadingMixIn, SimpleXMLRPCServer ):
         self.zonefiles_timeout = network_params.get('zonefiles_timeout', 1 )
         self.push_zonefiles_timeout = network_params.get("push_zonefiles_timeout", 1 )
 
+        # inventory bytes sent, per method, since the last round
+        self.traffic_lock = threading.Lock()
+        self.traffic = {}
+
         # register methods 
         for attr in dir(self):
             if attr.startswith("rpc_"):
@@ -454,6 +465,34 @@ class AtlasNetwork( SocketServer.ThreadingMixIn, SimpleXMLRPCServer ):
             raise se
 
 
+    def count_traffic(self, method, resp):
+        """
+        Count the bytes in a response we forwarded
+        """
+        num_bytes = len(json.dumps(resp))
+        with self.traffic_lock:
+            if method not in self.traffic:
+                self.traffic[method] = {'calls': 0, 'bytes': 0}
+
+            self.traffic[method]['calls'] += 1
+            self.traffic[method]['bytes'] += num_bytes
+
+        return resp
+
+
+    def rpc_get_traffic_stats( self, reset=False ):
+        """
+        Get the number of calls and response bytes per inventory method
+        since the last reset.
+        """
+        with self.traffic_lock:
+            ret = dict([(method, dict(stats)) for (method, stats) in self.traffic.items()])
+            if reset:
+                self.traffic = {}
+
+        return ret
+
+
     def rpc_get_zonefile_inventory( self, src_hostport, dest_hostport, bit_offset, bit_len, **con_info ):
         """
         Get zonefile inventory from the given dest hostport, with simulated loss
@@ -464,7 +503,22 @@ class AtlasNetwork( SocketServer.ThreadingMixIn, SimpleXMLRPCServer ):
         
         dest_host, dest_port = url_to_host_port( dest_hostport )
         rpc = BlockstackRPCClient( dest_host, dest_port, src=src_hostport )
-        return rpc.get_zonefile_inventory( 'atlas_network', src_hostport, dest_hostport, bit_offset, bit_len )
+        resp = rpc.get_zonefile_inventory( 'atlas_network', src_hostport, dest_hostport, bit_offset, bit_len )
+        return self.count_traffic( 'get_zonefile_inventory', resp )
+
+
+    def rpc_get_zonefile_inventory_delta( self, src_hostport, dest_hostport, inv_id, version, **con_info ):
+        """
+        Get zonefile inventory changes from the given dest hostport, with simulated loss
+        """
+        log.debug("atlas network: get_zonefile_inventory_delta(%s,%s)" % (src_hostport, dest_hostport))
+        self.possibly_drop( src_hostport, dest_hostport )
+        time.sleep( self.inv_delay( dest_hostport ) )
+
+        dest_host, dest_port = url_to_host_port( dest_hostport )
+        rpc = BlockstackRPCClient( dest_host, dest_port, src=src_hostport )
+        resp = rpc.get_zonefile_inventory_delta( 'atlas_network', src_hostport, dest_hostport, inv_id, version )
+        return self.count_traffic( 'get_zonefile_inventory_delta', resp )
 
 
     def rpc_get_atlas_peers( self, src_hostport, dest_hostport ):
@@ -768,6 +822,19 @@ def atlas_peer_join( peer_info ):
     return testlib.peer_join(peer_info)
  
 
+def atlas_network_traffic_round( network_des ):
+    """
+    Get the inventory traffic since the last round,
+    and start a new round.
+    Return {method: {'calls': ..., 'bytes': ...}}
+    """
+    srv = network_des['netsrv']
+    if srv is None:
+        return {}
+
+    return srv.network.rpc_get_traffic_stats( reset=True )
+
+
 def atlas_local_peer_info():
     return {
         "proc": None,
@@ -866,6 +933,15 @@ def atlas_print_network_state( network_des ):
         print "%020s (%s): %s" % (node_hostport, node_inv_str, "#" * peer_count.get(str(node_hostport), 0))
 
     print ""
+
+    traffic = atlas_network_traffic_round( network_des )
+    if len(traffic) > 0:
+        print "Inventory traffic this round"
+        for method in sorted(traffic.keys()):
+            print "%030s: %s bytes in %s calls" % (method, traffic[method]['bytes'], traffic[method]['calls'])
+
+        print ""
+
     sys.stdout.flush()
 
 
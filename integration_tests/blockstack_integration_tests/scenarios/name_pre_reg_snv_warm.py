@@ -0,0 +1,127 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+""" 
+
+import testlib
+import blockstack_client
+import json
+import os
+import time
+import tempfile
+
+wallets = [
+    testlib.Wallet( "5JesPiN68qt44Hc2nT8qmyZ1JDwHebfoh9KQ52Lazb1m1LaKNj9", 100000000000 ),
+    testlib.Wallet( "5KHqsiU9qa77frZb6hQy9ocV7Sus9RWJcQGYYBJJBb2Efj1o77e", 100000000000 ),
+    testlib.Wallet( "5Kg5kJbQHvk1B64rJniEmgbD83FpZpbw2RjdAZEzTefs9ihN3Bz", 100000000000 ),
+    testlib.Wallet( "5JuVsoS9NauksSkqEjbUZxWwgGDQbMwPsEfoRBSpLpgDX1RtLX7", 100000000000 ),
+    testlib.Wallet( "5KEpiSRr1BrT8vRD7LKGCEmudokTh1iMHbiThMQpLdwBwhDJB1T", 100000000000 )
+]
+
+consensus = "17ac43c1d8549c3181b200f1bf97eb7d"
+
+register_block_id = None
+snv_consensus = None 
+snv_block_id = None 
+
+def scenario( wallets, **kw ):
+
+    global register_block_id, snv_consensus, snv_block_id 
+
+    testlib.blockstack_namespace_preorder( "test", wallets[1].addr, wallets[0].privkey )
+    testlib.next_block( **kw )
+
+    testlib.blockstack_namespace_reveal( "test", wallets[1].addr, 52595, 250, 4, [6,5,4,3,2,1,0,0,0,0,0,0,0,0,0,0], 10, 10, wallets[0].privkey )
+    testlib.next_block( **kw )
+
+    testlib.blockstack_namespace_ready( "test", wallets[1].privkey )
+    testlib.next_block( **kw )
+
+    testlib.blockstack_name_preorder( "foo.test", wallets[2].privkey, wallets[3].addr )
+    testlib.next_block( **kw )
+
+    testlib.blockstack_name_register( "foo.test", wallets[2].privkey, wallets[3].addr )
+    testlib.next_block( **kw )
+
+    register_block_id = testlib.get_current_block()
+
+    # put some distance between the name and the trust root
+    for i in xrange(0, 40):
+        testlib.next_block( **kw )
+
+    snv_block_id = testlib.get_current_block()
+    snv_consensus = testlib.get_consensus_at( snv_block_id )
+    
+
+def check( state_engine ):
+
+    global register_block_id, snv_block_id, snv_consensus
+
+    name_rec = state_engine.get_name( "foo.test" )
+    if name_rec is None:
+        return False 
+
+    test_proxy = testlib.TestAPIProxy()
+    blockstack_client.set_default_proxy( test_proxy )
+
+    snv_db_path = os.path.join( tempfile.mkdtemp(), "snv.db" )
+
+    # cold: nothing proven yet
+    t0 = time.time()
+    cold_rec = blockstack_client.snv_lookup( "foo.test", register_block_id, snv_consensus, proxy=test_proxy, snv_db_path=snv_db_path )
+    cold_time = time.time() - t0
+    if 'error' in cold_rec:
+        print json.dumps(cold_rec, indent=4 )
+        return False
+
+    # warm: reuse the steps verified by the cold lookup
+    t0 = time.time()
+    warm_rec = blockstack_client.snv_lookup( "foo.test", register_block_id, snv_consensus, proxy=test_proxy, snv_db_path=snv_db_path )
+    warm_time = time.time() - t0
+    if 'error' in warm_rec:
+        print json.dumps(warm_rec, indent=4 )
+        return False
+
+    print "SNV lookup across {} blocks: cold {}s, warm {}s".format( snv_block_id - register_block_id, cold_time, warm_time )
+
+    if cold_rec != warm_rec:
+        print "cold and warm lookups disagree:\n{}\n{}".format( json.dumps(cold_rec, indent=4), json.dumps(warm_rec, indent=4) )
+        return False
+
+    # stored steps are re-hashed before use, so a bogus preimage
+    # for our trust root's consensus hash must be ignored
+    snv_db = blockstack_client.snv.SNVConsensusDB( snv_db_path )
+    snv_db.put_steps( {(snv_block_id, snv_consensus): ("00" * 32, ["11" * 16])} )
+    snv_db.close()
+
+    tampered_rec = blockstack_client.snv_lookup( "foo.test", register_block_id, snv_consensus, proxy=test_proxy, snv_db_path=snv_db_path )
+    if 'error' in tampered_rec or tampered_rec != cold_rec:
+        print "lookup with tampered SNV store failed: {}".format( json.dumps(tampered_rec, indent=4) )
+        return False
+
+    # a different (honest) trust root reuses the steps its walk reaches
+    other_consensus = testlib.get_consensus_at( snv_block_id - 1 )
+    other_rec = blockstack_client.snv_lookup( "foo.test", register_block_id, other_consensus, proxy=test_proxy, snv_db_path=snv_db_path )
+    if 'error' in other_rec or other_rec != cold_rec:
+        print "lookup from another trust root failed: {}".format( json.dumps(other_rec, indent=4) )
+        return False
+
+    return True
@@ -0,0 +1,264 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2014-2015 by Halfmoon Labs, Inc.
+    copyright: (c) 2016 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+""" 
+import os
+os.environ["CLIENT_STORAGE_DRIVERS"] = "disk,test"
+os.environ["CLIENT_STORAGE_DRIVERS_REQUIRED_WRITE"] = "disk,test"
+
+import testlib
+import virtualchain
+import json
+import blockstack_client
+import sys
+import errno
+import keylib
+import time
+
+wallets = [
+    testlib.Wallet( "5JesPiN68qt44Hc2nT8qmyZ1JDwHebfoh9KQ52Lazb1m1LaKNj9", 100000000000 ),
+    testlib.Wallet( "5KHqsiU9qa77frZb6hQy9ocV7Sus9RWJcQGYYBJJBb2Efj1o77e", 100000000000 ),
+    testlib.Wallet( "5Kg5kJbQHvk1B64rJniEmgbD83FpZpbw2RjdAZEzTefs9ihN3Bz", 100000000000 ),
+    testlib.Wallet( "5JuVsoS9NauksSkqEjbUZxWwgGDQbMwPsEfoRBSpLpgDX1RtLX7", 100000000000 ),
+    testlib.Wallet( "5KEpiSRr1BrT8vRD7LKGCEmudokTh1iMHbiThMQpLdwBwhDJB1T", 100000000000 ),
+    testlib.Wallet( "5K5hDuynZ6EQrZ4efrchCwy6DLhdsEzuJtTDAf3hqdsCKbxfoeD", 100000000000 ),
+    testlib.Wallet( "5J39aXEeHh9LwfQ4Gy5Vieo7sbqiUMBXkPH7SaMHixJhSSBpAqz", 100000000000 ),
+    testlib.Wallet( "5K9LmMQskQ9jP1p7dyieLDAeB6vsAj4GK8dmGNJAXS1qHDqnWhP", 100000000000 ),
+    testlib.Wallet( "5KcNen67ERBuvz2f649t9F2o1ddTjC5pVUEqcMtbxNgHqgxG2gZ", 100000000000 )
+]
+
+consensus = "17ac43c1d8549c3181b200f1bf97eb7d"
+wallet_keys = None
+error = False
+index_file_data = "<html><head></head><body>foo.test hello world</body></html>"
+
+def scenario( wallets, **kw ):
+
+    global wallet_keys, error, index_file_data, resource_data
+
+    test_proxy = testlib.TestAPIProxy()
+    blockstack_client.set_default_proxy( test_proxy )
+    wallet_keys = blockstack_client.make_wallet_keys( owner_privkey=wallets[3].privkey, data_privkey=wallets[4].privkey, payment_privkey=wallets[5].privkey )
+    testlib.blockstack_client_set_wallet( "0123456789abcdef", wallet_keys['payment_privkey'], wallet_keys['owner_privkey'], wallet_keys['data_privkey'] )
+
+    testlib.blockstack_namespace_preorder( "test", wallets[1].addr, wallets[0].privkey )
+    testlib.next_block( **kw )
+
+    testlib.blockstack_namespace_reveal( "test", wallets[1].addr, 52595, 250, 4, [6,5,4,3,2,1,0,0,0,0,0,0,0,0,0,0], 10, 10, wallets[0].privkey )
+    testlib.next_block( **kw )
+
+    testlib.blockstack_namespace_ready( "test", wallets[1].privkey )
+    testlib.next_block( **kw )
+
+    testlib.blockstack_name_preorder( "foo.test", wallets[2].privkey, wallets[3].addr )
+    testlib.next_block( **kw )
+    
+    testlib.blockstack_name_register( "foo.test", wallets[2].privkey, wallets[3].addr )
+    testlib.next_block( **kw )
+    
+    # migrate profiles 
+    res = testlib.migrate_profile( "foo.test", proxy=test_proxy, wallet_keys=wallet_keys )
+    if 'error' in res:
+        res['test'] = 'Failed to initialize foo.test profile'
+        print json.dumps(res, indent=4, sort_keys=True)
+        error = True
+        return 
+
+    # tell serialization-checker that value_hash can be ignored here
+    print "BLOCKSTACK_SERIALIZATION_CHECK_IGNORE value_hash"
+    sys.stdout.flush()
+    
+    testlib.next_block( **kw )
+    
+    res = testlib.start_api("0123456789abcdef")
+    if 'error' in res:
+        print 'failed to start API: {}'.format(res)
+        return False
+
+    # sign in and make a token 
+    datastore_pk = keylib.ECPrivateKey(wallets[-1].privkey).to_hex()
+    res = testlib.blockstack_cli_app_signin("foo.test", datastore_pk, 'http://localhost:8888', ['store_read', 'store_write', 'store_admin'])
+    if 'error' in res:
+        print json.dumps(res, indent=4, sort_keys=True)
+        error = True
+        return 
+
+    # export to environment 
+    blockstack_client.set_secret("BLOCKSTACK_API_SESSION", res['token'])
+    ses = res['token']
+    
+    datastore_id_res = testlib.blockstack_cli_datastore_get_id( datastore_pk )
+    datastore_id = datastore_id_res['datastore_id']
+
+    # make datastore on the test driver, which we can slow down
+    res = testlib.blockstack_cli_create_datastore( 'foo.test', datastore_pk, ['test'], ses )
+    if 'error' in res:
+        print "failed to create datastore: {}".format(res['error'])
+        return False
+
+    # make a deep directory tree 
+    dirs = ['/d1', '/d1/d2', '/d1/d2/d3', '/d1/d2/d3/d4', '/d1/d2/d3/d4/d5']
+    for dpath in dirs:
+        print 'mkdir {}'.format(dpath)
+        res = testlib.blockstack_cli_datastore_mkdir( 'foo.test', datastore_pk, dpath, ses )
+        if 'error' in res:
+            print 'failed to mkdir {}: {}'.format(dpath, res['error'])
+            return False
+
+    files = ['/d1/d2/d3/d4/d5/file{}'.format(i) for i in xrange(0, 4)] + ['/d1/d2/file5']
+    for dpath in files:
+        print 'putfile {}'.format(dpath)
+        res = testlib.blockstack_cli_datastore_putfile( 'foo.test', datastore_pk, dpath, 'hello {}'.format(dpath), ses )
+        if 'error' in res:
+            print 'failed to putfile {}: {}'.format(dpath, res['error'])
+            return False
+
+    # every storage read now takes 50ms
+    res = testlib.blockstack_test_setenv('BLOCKSTACK_INTEGRATION_TEST_STORAGE_READ_LATENCY', '0.05')
+    if 'error' in res:
+        print 'failed to set read latency: {}'.format(res)
+        return False
+
+    # read each file a few times, so sibling lookups can reuse the inodes along the path
+    for i in xrange(0, 3):
+        for dpath in files:
+            t0 = time.time()
+            res = testlib.blockstack_cli_datastore_getfile( 'foo.test', datastore_id, dpath, ses )
+            elapsed = time.time() - t0
+
+            if 'error' in res:
+                print 'failed to getfile {}: {}'.format(dpath, res['error'])
+                return False
+
+            if res != 'hello {}'.format(dpath):
+                print 'failed to read {}: got {}'.format(dpath, res)
+                return False
+
+            print 'getfile {} (pass {}): {}s'.format(dpath, i, elapsed)
+
+    # stat and listdir should agree with the files we wrote
+    res = testlib.blockstack_cli_datastore_listdir( 'foo.test', datastore_id, '/d1/d2/d3/d4/d5', ses )
+    if 'error' in res:
+        print 'failed to listdir: {}'.format(res['error'])
+        return False
+
+    if sorted(res['children'].keys()) != ['file0', 'file1', 'file2', 'file3']:
+        print 'invalid directory: {}'.format(res)
+        return False
+
+    # a missing file deep in the tree should fail cleanly
+    res = testlib.blockstack_cli_datastore_getfile( 'foo.test', datastore_id, '/d1/d2/d3/d4/d5/nope', ses )
+    if 'error' not in res or res.get('errno') != errno.ENOENT:
+        print 'accidentally read a missing file: {}'.format(res)
+        return False
+
+    # ...and so should a path through a file
+    res = testlib.blockstack_cli_datastore_getfile( 'foo.test', datastore_id, '/d1/d2/file5/nope', ses )
+    if 'error' not in res or res.get('errno') != errno.ENOTDIR:
+        print 'accidentally read through a file: {}'.format(res)
+        return False
+
+    res = testlib.blockstack_test_setenv('BLOCKSTACK_INTEGRATION_TEST_STORAGE_READ_LATENCY', '0')
+    if 'error' in res:
+        print 'failed to clear read latency: {}'.format(res)
+        return False
+
+    # check path resolution statistics 
+    config_path = os.environ.get("BLOCKSTACK_CLIENT_CONFIG", None)
+    conf = blockstack_client.get_config(config_path)
+    res = testlib.blockstack_REST_call('GET', '/v1/node/cache', None, api_pass=conf['api_password'])
+    if res['http_status'] != 200:
+        print 'failed to get cache stats: {}'.format(res)
+        return False
+
+    print json.dumps(res['response'], indent=4, sort_keys=True)
+
+    resolve_stats = res['response']['path_resolution']
+    if resolve_stats['latency']['depth_6']['count'] < 12:
+        print 'missing path resolution latencies: {}'.format(resolve_stats)
+        return False
+
+    if resolve_stats['speculation']['hits'] == 0:
+        print 'never reused a path hint: {}'.format(resolve_stats)
+        return False
+
+    # delete datastore 
+    print 'delete datastore'
+    res = testlib.blockstack_cli_delete_datastore( 'foo.test', datastore_pk, ses )
+    if 'error' in res:
+        print 'failed to delete datastore'
+        print json.dumps(res)
+        return False
+
+    testlib.next_block( **kw )
+
+def check( state_engine ):
+
+    global wallet_keys, error
+
+    if error:
+        print "Key operation failed."
+        return False
+
+    # not revealed, but ready 
+    ns = state_engine.get_namespace_reveal( "test" )
+    if ns is not None:
+        print "namespace not ready"
+        return False 
+
+    ns = state_engine.get_namespace( "test" )
+    if ns is None:
+        print "no namespace"
+        return False 
+
+    if ns['namespace_id'] != 'test':
+        print "wrong namespace"
+        return False 
+
+    names = ['foo.test']
+    wallet_keys_list = [wallet_keys]
+
+    for i in xrange(0, len(names)):
+        name = names[i]
+        wallet_payer = 3 * (i+1) - 1
+        wallet_owner = 3 * (i+1)
+        wallet_keys = wallet_keys_list[i]
+
+        # not preordered
+        preorder = state_engine.get_name_preorder( name, virtualchain.make_payment_script(wallets[wallet_payer].addr), wallets[wallet_owner].addr )
+        if preorder is not None:
+            print "still have preorder"
+            return False
+    
+        # registered 
+        name_rec = state_engine.get_name( name )
+        if name_rec is None:
+            print "name does not exist"
+            return False 
+
+        # owned 
+        if name_rec['address'] != wallets[wallet_owner].addr or name_rec['sender'] != virtualchain.make_payment_script(wallets[wallet_owner].addr):
+            print "name has wrong owner"
+            return False 
+
+        # try to authenticate
+
+    return True
@@ -41,6 +41,7 @@ setup(
     download_url='https://github.com/blockstack/blockstore/archive/master.zip',
     zip_safe=False,
     include_package_data=True,
+    package_data={'blockstack_client': ['cli_commands.json']},
     install_requires=[
         'virtualchain>=0.17.0',
         'keychain>=0.14.2.0',
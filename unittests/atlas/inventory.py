@@ -0,0 +1,241 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import json
+import base64
+import hashlib
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import blockstack.lib.atlas as atlas
+from blockstack.lib.atlas import ATLASDB_SQL, atlasdb_row_factory, atlasdb_cache_zonefile_info, atlasdb_add_zonefile_info, \
+        atlasdb_set_zonefile_present, atlas_get_zonefile_inventory, atlas_get_zonefile_inventory_delta, \
+        atlas_inventory_encode_runs, atlas_inventory_decode_runs, atlas_inventory_apply_delta, \
+        atlas_inventory_clip_runs, atlas_peer_refresh_zonefile_inventory
+
+NUM_ZONEFILES = 10000
+NUM_ROUNDS = 10
+CHANGES_PER_ROUND = 20
+
+def zonefile_hash(i):
+    return hashlib.sha1('zonefile {}'.format(i)).hexdigest()
+
+
+def txid(i):
+    return hashlib.sha256('tx {}'.format(i)).hexdigest()
+
+
+class ZonefileInventoryDeltaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'atlas.db')
+
+        self.con = sqlite3.connect(self.path, isolation_level=None)
+        self.con.executescript(ATLASDB_SQL)
+        self.con.row_factory = atlasdb_row_factory
+        atlasdb_cache_zonefile_info(con=self.con, path=self.path)
+
+    def tearDown(self):
+        self.con.close()
+        shutil.rmtree(self.tmpdir)
+
+    def add_zonefiles(self, count, present=False):
+        for i in xrange(0, count):
+            atlasdb_add_zonefile_info('name{}.id'.format(i), zonefile_hash(i), txid(i), present, False, 400000 + i, con=self.con, path=self.path)
+
+    def set_present(self, indexes, present=True):
+        for i in indexes:
+            atlasdb_set_zonefile_present(zonefile_hash(i), present, con=self.con, path=self.path)
+
+    def resync(self):
+        """
+        Get the inventory the way a new peer would
+        """
+        delta = atlas_get_zonefile_inventory_delta(None, None)
+        self.assertTrue(delta['resync'])
+        return delta['inv_id'], delta['version'], atlas_get_zonefile_inventory()
+
+    def refresh(self, peer_table, delta=None):
+        """
+        Refresh a peer's inventory, where the peer is us
+        (or serves the given delta)
+        """
+        def get_delta(my_hostport, peer_hostport, inv_id, version, **kw):
+            return delta if delta is not None else atlas_get_zonefile_inventory_delta(inv_id, version)
+
+        def get_range(my_hostport, peer_hostport, bit_offset, bit_count, **kw):
+            return atlas_get_zonefile_inventory(bit_offset / 8, bit_count / 8)
+
+        get_delta_orig = atlas.atlas_peer_get_zonefile_inventory_delta
+        get_range_orig = atlas.atlas_peer_get_zonefile_inventory_range
+        atlas.atlas_peer_get_zonefile_inventory_delta = get_delta
+        atlas.atlas_peer_get_zonefile_inventory_range = get_range
+        try:
+            return atlas_peer_refresh_zonefile_inventory('localhost:1', 'localhost:2', 0, peer_table=peer_table, local_inv=atlas_get_zonefile_inventory())
+        finally:
+            atlas.atlas_peer_get_zonefile_inventory_delta = get_delta_orig
+            atlas.atlas_peer_get_zonefile_inventory_range = get_range_orig
+
+    def test_runs(self):
+        """ Bit indexes run-length encode and decode
+        """
+        self.assertEqual(atlas_inventory_encode_runs([]), [])
+        self.assertEqual(atlas_inventory_encode_runs([9, 1, 2, 3, 5, 10, 2]), [1, 3, 5, 1, 9, 2])
+        self.assertEqual(atlas_inventory_decode_runs([1, 3, 5, 1, 9, 2]), [1, 2, 3, 5, 9, 10])
+
+    def test_clip_runs(self):
+        """ A peer's runs are clipped to our inventory, and malformed runs are rejected
+        """
+        self.assertEqual(atlas_inventory_clip_runs([1, 3, 5, 1, 9, 2], 16), [1, 3, 5, 1, 9, 2])
+        self.assertEqual(atlas_inventory_clip_runs([1, 3, 14, 2**62, 2**62, 1], 16), [1, 3, 14, 2])
+        self.assertIsNone(atlas_inventory_clip_runs([1, 3, 5], 16))
+        self.assertIsNone(atlas_inventory_clip_runs([-1, 3], 16))
+        self.assertIsNone(atlas_inventory_clip_runs([1, -3], 16))
+        self.assertIsNone(atlas_inventory_clip_runs(['1', 3], 16))
+
+    def test_delta(self):
+        """ Applying a delta to a copy of the inventory reproduces the inventory
+        """
+        self.add_zonefiles(100)
+        inv_id, version, peer_inv = self.resync()
+
+        self.set_present([1, 2, 3, 50, 99])
+        self.add_zonefiles(110, present=True)
+        self.set_present([2], present=False)
+
+        delta = atlas_get_zonefile_inventory_delta(inv_id, version)
+        self.assertNotIn('resync', delta)
+        self.assertEqual(delta['inv_id'], inv_id)
+        self.assertEqual(delta['clear'], [2, 1])
+
+        peer_inv = atlas_inventory_apply_delta(peer_inv, delta['set'], delta['clear'])
+        self.assertEqual(peer_inv, atlas_get_zonefile_inventory())
+
+        # nothing changed since
+        delta = atlas_get_zonefile_inventory_delta(inv_id, delta['version'])
+        self.assertEqual((delta['set'], delta['clear']), ([], []))
+
+        # setting a bit that's already set isn't a change
+        self.set_present([1])
+        self.assertEqual(atlas_get_zonefile_inventory_delta(inv_id, delta['version'])['set'], [])
+
+    def test_resync(self):
+        """ Peers with an unknown inventory ID or a forgotten version must fetch the whole inventory
+        """
+        self.add_zonefiles(100)
+        inv_id, version, _ = self.resync()
+
+        self.assertTrue(atlas_get_zonefile_inventory_delta('00' * 16, version)['resync'])
+        self.assertTrue(atlas_get_zonefile_inventory_delta(inv_id, version + 1)['resync'])
+
+        # trimmed change log
+        max_inv_changes = atlas.MAX_INV_CHANGES
+        atlas.MAX_INV_CHANGES = 8
+        try:
+            self.set_present(range(0, 20))
+            self.assertTrue(atlas_get_zonefile_inventory_delta(inv_id, version)['resync'])
+
+            delta = atlas_get_zonefile_inventory_delta(inv_id, atlas.ZONEFILE_INV_MIN_VERSION)
+            self.assertNotIn('resync', delta)
+        finally:
+            atlas.MAX_INV_CHANGES = max_inv_changes
+
+        # restarting starts a new history
+        atlasdb_cache_zonefile_info(con=self.con, path=self.path)
+        self.assertTrue(atlas_get_zonefile_inventory_delta(inv_id, delta['version'])['resync'])
+
+    def test_refresh(self):
+        """ Refreshing a peer applies its delta, fetches the bits for new zonefiles, and rejects bogus deltas
+        """
+        self.add_zonefiles(100)
+        inv_id, version, peer_inv = self.resync()
+        peer_table = {
+            'localhost:2': {
+                'zonefile_inv': peer_inv,
+                'zonefile_inv_id': inv_id,
+                'zonefile_inv_version': version,
+                'zonefile_inv_synced_len': len(peer_inv),
+            }
+        }
+
+        self.set_present([1, 2, 3])
+        self.assertTrue(self.refresh(peer_table))
+        self.assertEqual(peer_table['localhost:2']['zonefile_inv'], atlas_get_zonefile_inventory())
+
+        # our inventory grows
+        for i in xrange(100, 200):
+            atlasdb_add_zonefile_info('name{}.id'.format(i), zonefile_hash(i), txid(i), i % 3 == 0, False, 400000 + i, con=self.con, path=self.path)
+
+        self.set_present([4])
+        self.assertTrue(self.refresh(peer_table))
+        self.assertEqual(peer_table['localhost:2']['zonefile_inv'], atlas_get_zonefile_inventory())
+        self.assertEqual(peer_table['localhost:2']['zonefile_inv_synced_len'], len(atlas_get_zonefile_inventory()))
+
+        # runs past our inventory are clipped
+        maxbits = len(atlas_get_zonefile_inventory()) * 8
+        delta = {'inv_id': inv_id, 'version': peer_table['localhost:2']['zonefile_inv_version'], 'set': [maxbits - 1, 2**62], 'clear': []}
+        self.assertTrue(self.refresh(peer_table, delta=delta))
+        self.assertEqual(len(peer_table['localhost:2']['zonefile_inv']), maxbits / 8)
+
+        # more bits than we have, or malformed runs, fail the refresh and force a resync
+        for bad in [[0, maxbits, 0, maxbits], [0, -1]]:
+            peer_table['localhost:2']['zonefile_inv_id'] = inv_id
+            delta = {'inv_id': inv_id, 'version': version, 'set': bad, 'clear': []}
+            self.assertFalse(self.refresh(peer_table, delta=delta))
+            self.assertIsNone(peer_table['localhost:2']['zonefile_inv_id'])
+
+    def test_traffic(self):
+        """ Benchmark bytes per inventory refresh round with full inventories and with deltas
+        """
+        self.add_zonefiles(NUM_ZONEFILES)
+        self.set_present(range(0, NUM_ZONEFILES, 3))
+        inv_id, version, peer_inv = self.resync()
+
+        full_bytes = 0
+        delta_bytes = 0
+        for r in xrange(0, NUM_ROUNDS):
+            start = NUM_ZONEFILES / 2 + r * CHANGES_PER_ROUND
+            self.set_present(range(start, start + CHANGES_PER_ROUND))
+
+            full_bytes += len(json.dumps({'status': True, 'inv': base64.b64encode(atlas_get_zonefile_inventory())}))
+
+            delta = atlas_get_zonefile_inventory_delta(inv_id, version)
+            delta['status'] = True
+            delta_bytes += len(json.dumps(delta))
+
+            peer_inv = atlas_inventory_apply_delta(peer_inv, delta['set'], delta['clear'])
+            version = delta['version']
+
+        print '\n{} zonefiles, {} new per round: {} bytes/round full inventory, {} bytes/round delta'.format(
+            NUM_ZONEFILES, CHANGES_PER_ROUND, full_bytes / NUM_ROUNDS, delta_bytes / NUM_ROUNDS)
+
+        self.assertEqual(peer_inv, atlas_get_zonefile_inventory())
+        self.assertLess(delta_bytes, full_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import unittest
+
+from blockstack_client import cli
+from blockstack_client.method_parser import parse_methods, build_method_subparsers, load_method_manifest
+
+NUM_RUNS = 5
+
+# build the parser for `blockstack info` the old way (import and parse every method),
+# or the lazy way (load the manifest and build only the command's subparser)
+LEGACY_STARTUP = '''
+parser = argparse.ArgumentParser()
+build_method_subparsers(parser.add_subparsers(dest='action'), parse_methods(cli.get_cli_methods()))
+parser.parse_known_args(args=['info'])
+'''
+
+LAZY_STARTUP = '''
+parser = argparse.ArgumentParser()
+method_infos = cli.get_cli_method_infos()
+build_method_subparsers(parser.add_subparsers(dest='action'), [cli.find_directive(['blockstack', 'info'], method_infos)])
+parser.parse_known_args(args=['info'])
+'''
+
+STARTUP_PRELUDE = '''
+import time, argparse
+t0 = time.time()
+from blockstack_client import cli
+from blockstack_client.method_parser import parse_methods, build_method_subparsers
+'''
+
+TEST_MODULE = '''
+def cli_hello(args, config_path=None):
+    """
+    command: hello
+    help: Say hello
+    arg: name (str) 'Who to greet'
+    opt: times (int) 'How many times'
+    """
+    return {'hello': args.name}
+'''
+
+class CommandManifestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source_path = os.path.join(self.tmpdir, 'lazy_test_actions.py')
+        self.manifest_path = os.path.join(self.tmpdir, 'lazy_test_actions.json')
+
+        with open(self.source_path, 'w') as f:
+            f.write(TEST_MODULE)
+
+        sys.path.insert(0, self.tmpdir)
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        sys.modules.pop('lazy_test_actions', None)
+        shutil.rmtree(self.tmpdir)
+
+    def test_manifest_matches_docstrings(self):
+        """ The shipped manifest describes the same commands as the method docstrings
+        """
+        method_infos = parse_methods(cli.get_cli_methods())
+        manifest_infos = cli.get_cli_method_infos()
+
+        self.assertEqual(len(method_infos), len(manifest_infos))
+        for (method_info, manifest_info) in zip(method_infos, manifest_infos):
+            self.assertEqual(method_info['method'].__name__, manifest_info['method'].__name__)
+            self.assertEqual(method_info['method'], manifest_info['method'].load())
+            for key in ['command', 'help', 'args', 'opts', 'pragmas']:
+                self.assertEqual(method_info[key], manifest_info[key])
+
+    def test_lazy_import(self):
+        """ Commands are loaded from the manifest and imported on first call
+        """
+        method_infos = load_method_manifest(self.manifest_path, 'lazy_test_actions', self.source_path, 'cli_')
+        self.assertTrue(os.path.exists(self.manifest_path))
+        self.assertNotIn('lazy_test_actions', sys.modules)
+
+        self.assertEqual(len(method_infos), 1)
+        self.assertEqual(method_infos[0]['command'], 'hello')
+        self.assertEqual(method_infos[0]['opts'], [{'name': 'times', 'type': int, 'help': 'How many times'}])
+
+        parser = argparse.ArgumentParser()
+        build_method_subparsers(parser.add_subparsers(dest='action'), method_infos)
+        args = parser.parse_args(['hello', 'world'])
+
+        self.assertEqual(method_infos[0]['method'](args), {'hello': 'world'})
+        self.assertIn('lazy_test_actions', sys.modules)
+
+    def test_stale_manifest(self):
+        """ The manifest is rebuilt when the source changes
+        """
+        load_method_manifest(self.manifest_path, 'lazy_test_actions', self.source_path, 'cli_')
+
+        with open(self.source_path, 'a') as f:
+            f.write(TEST_MODULE.replace('hello', 'goodbye'))
+
+        method_infos = load_method_manifest(self.manifest_path, 'lazy_test_actions', self.source_path, 'cli_')
+        self.assertEqual([m['command'] for m in method_infos], ['goodbye', 'hello'])
+
+        with open(self.manifest_path, 'r') as f:
+            self.assertEqual(len(json.loads(f.read())['methods']), 2)
+
+
+class StartupBenchmarkTestCase(unittest.TestCase):
+
+    def cold_startup(self, startup):
+        """
+        Time startup in a new interpreter, including package import.
+        Return (seconds, whether the actions module was imported)
+        """
+        code = STARTUP_PRELUDE + startup + '''
+import sys
+print time.time() - t0, 'blockstack_client.actions' in sys.modules
+'''
+        times = []
+        imported = None
+        for i in xrange(0, NUM_RUNS):
+            out = subprocess.check_output([sys.executable, '-c', code])
+            elapsed, imported = out.strip().split()
+            times.append(float(elapsed))
+
+        return min(times), imported == 'True'
+
+    def warm_startup(self, startup):
+        """
+        Time startup in this interpreter, with everything imported already
+        """
+        times = []
+        for i in xrange(0, NUM_RUNS):
+            t0 = time.time()
+            exec(startup, {'cli': cli, 'argparse': argparse, 'parse_methods': parse_methods, 'build_method_subparsers': build_method_subparsers})
+            times.append(time.time() - t0)
+
+        return min(times)
+
+    def test_startup(self):
+        """ Benchmark cold and warm CLI startup against importing and parsing every command
+        """
+        legacy_cold, legacy_imported = self.cold_startup(LEGACY_STARTUP)
+        lazy_cold, lazy_imported = self.cold_startup(LAZY_STARTUP)
+
+        self.assertTrue(legacy_imported)
+        self.assertFalse(lazy_imported)
+
+        legacy_warm = self.warm_startup(LEGACY_STARTUP)
+        lazy_warm = self.warm_startup(LAZY_STARTUP)
+
+        print '\nCLI startup: cold {:.3f}s -> {:.3f}s, warm {:.4f}s -> {:.4f}s'.format(legacy_cold, lazy_cold, legacy_warm, lazy_warm)
+
+        self.assertLess(lazy_cold, legacy_cold)
+        self.assertLess(lazy_warm, legacy_warm)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from blockstack_client import config
+
+NUM_CALLS = 200
+
+class ConfigCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tmpdir, 'client.ini')
+        config.configure(config_file=self.config_path, force=False, interactive=False)
+
+        self.changes = []
+        self.listener = lambda config_path, snapshot: self.changes.append((config_path, snapshot))
+        config.config_add_listener(self.listener)
+
+    def tearDown(self):
+        config.config_remove_listener(self.listener)
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_once(self):
+        """ Benchmark repeated get_config() calls against parsing each time
+        """
+        t0 = time.time()
+        for i in xrange(0, NUM_CALLS):
+            config.parse_config(config_file=self.config_path, interactive=False)
+
+        parse_time = (time.time() - t0) / NUM_CALLS
+
+        loads = config.get_config_stats()['loads']
+        t0 = time.time()
+        for i in xrange(0, NUM_CALLS):
+            conf = config.get_config(path=self.config_path)
+            self.assertEqual(conf['path'], self.config_path)
+
+        cached_time = (time.time() - t0) / NUM_CALLS
+        stats = config.get_config_stats()
+
+        print '\nget_config: {:.3f}ms per call parsing, {:.3f}ms per call cached'.format(parse_time * 1000, cached_time * 1000)
+
+        self.assertLessEqual(stats['loads'] - loads, 1)
+        self.assertGreaterEqual(stats['hits'], NUM_CALLS - 1)
+        self.assertLess(cached_time, parse_time)
+
+    def test_private_copies(self):
+        """ Callers get copies they can modify; snapshots are read-only
+        """
+        conf = config.get_config(path=self.config_path)
+        conf['server'] = 'example.com'
+        self.assertNotEqual(config.get_config(path=self.config_path)['server'], 'example.com')
+
+        snapshot = config.load_config_snapshot(self.config_path)
+        self.assertRaises(TypeError, snapshot['blockstack-client'].__setitem__, 'server', 'example.com')
+
+    def test_reload_on_change(self):
+        """ Changes to the file are picked up, and listeners are notified
+        """
+        config.get_config(path=self.config_path)
+        self.assertTrue(config.write_config_field(self.config_path, 'blockstack-client', 'poll_interval', '123'))
+
+        conf = config.get_config(path=self.config_path)
+        self.assertEqual(conf['poll_interval'], '123')
+        self.assertEqual(len(self.changes), 1)
+        self.assertEqual(self.changes[0][0], self.config_path)
+        self.assertEqual(self.changes[0][1]['blockstack-client']['poll_interval'], '123')
+
+        # edited by someone else
+        with open(self.config_path, 'r') as f:
+            data = f.read()
+
+        with open(self.config_path + '.new', 'w') as f:
+            f.write(data.replace('poll_interval = 123', 'poll_interval = 456'))
+
+        os.rename(self.config_path + '.new', self.config_path)
+
+        conf = config.get_config(path=self.config_path)
+        self.assertEqual(conf['poll_interval'], '456')
+        self.assertEqual(len(self.changes), 2)
+
+        # unchanged contents don't notify
+        config.invalidate_config(self.config_path)
+        config.get_config(path=self.config_path)
+        self.assertEqual(len(self.changes), 2)
+
+    def test_env_overrides(self):
+        """ Changing an environment override reloads the config
+        """
+        config.get_config(path=self.config_path)
+        os.environ['BLOCKSTACK_CLI_SERVER_HOST'] = 'override.example.com'
+        try:
+            self.assertEqual(config.get_config(path=self.config_path)['server'], 'override.example.com')
+        finally:
+            del os.environ['BLOCKSTACK_CLI_SERVER_HOST']
+
+        self.assertNotEqual(config.get_config(path=self.config_path)['server'], 'override.example.com')
+
+    def test_api_password_listener(self):
+        """ The API endpoint follows its config file's API password; the client keeps its own
+        """
+        from blockstack_client.rpc import BlockstackAPIEndpoint, BlockstackAPIEndpointClient
+
+        self.assertTrue(config.write_config_field(self.config_path, 'blockstack-client', 'api_password', 'old-pass'))
+        endpoint = BlockstackAPIEndpoint('old-pass', None, config_path=self.config_path, server=False)
+        client = BlockstackAPIEndpointClient('localhost', 6270, api_pass='old-pass', config_path=self.config_path)
+
+        self.assertFalse(hasattr(endpoint, 'make_request_headers'))
+        self.assertEqual(client.make_request_headers()['Authorization'], 'bearer old-pass')
+
+        self.assertTrue(config.write_config_field(self.config_path, 'blockstack-client', 'api_password', 'new-pass'))
+        endpoint.config_changed(self.config_path, config.load_config_snapshot(self.config_path))
+
+        self.assertEqual(endpoint.api_pass, 'new-pass')
+        self.assertEqual(client.api_pass, 'old-pass')
+
+
+if __name__ == '__main__':
+    unittest.main()
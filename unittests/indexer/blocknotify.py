@@ -0,0 +1,98 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import time
+import unittest
+
+from blockstack.lib.blocknotify import BlockNotifier, FakeBlockPublisher
+
+BLOCK_HASH = '00' * 32
+
+class BlockNotifierTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.notifier = BlockNotifier(notify_port=0)
+        self.assertTrue(self.notifier.bind())
+        self.notifier.start()
+        self.publisher = FakeBlockPublisher(self.notifier.notify_port)
+
+    def tearDown(self):
+        self.publisher.close()
+        self.notifier.signal_stop()
+        self.notifier.join()
+
+    def test_no_sources(self):
+        """ Without announcement sources, the indexer polls
+        """
+        notifier = BlockNotifier()
+        self.assertFalse(notifier.bind())
+        self.assertEqual(notifier.get_sources(), [])
+
+    def test_wakeup(self):
+        """ An announcement wakes the indexer, and its latency is recorded once the block is visible
+        """
+        self.assertEqual(self.notifier.get_sources(), ['blocknotify'])
+        self.assertFalse(self.notifier.wait_for_block(0.1))
+
+        t0 = time.time()
+        self.publisher.publish(BLOCK_HASH)
+        self.assertTrue(self.notifier.wait_for_block(5.0))
+        wakeup_time = time.time() - t0
+
+        notified_at = self.notifier.begin_indexing()
+        self.assertIsNotNone(notified_at)
+        self.assertFalse(self.notifier.wait_for_block(0.1))
+
+        self.notifier.end_indexing(notified_at)
+        stats = self.notifier.get_stats()
+
+        print '\nindexer woken {:.3f}s after the announcement; block visible after {:.3f}s'.format(wakeup_time, stats['latency_last'])
+
+        self.assertEqual(stats['notifications'], 1)
+        self.assertEqual(stats['latency_samples'], 1)
+        self.assertLess(wakeup_time, 1.0)
+
+    def test_announced_while_indexing(self):
+        """ Blocks announced while indexing trigger another pass, timed from the earliest of them
+        """
+        self.notifier.begin_indexing()
+
+        self.publisher.publish(BLOCK_HASH)
+        self.assertTrue(self.notifier.wait_for_block(5.0))
+        first = self.notifier.notified_at
+
+        self.publisher.publish('11' * 32)
+        deadline = time.time() + 5.0
+        while self.notifier.get_stats()['notifications'] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(self.notifier.begin_indexing(), first)
+        self.assertIsNone(self.notifier.begin_indexing())
+
+        # nothing announced, nothing recorded
+        self.notifier.end_indexing(None)
+        self.assertEqual(self.notifier.get_stats()['latency_samples'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import time
+import hashlib
+import threading
+import unittest
+
+from blockstack.lib.prefetch import BlockPrefetcher, sync_virtualchain_prefetched
+
+FIRST_BLOCK = 500000
+NUM_BLOCKS = 40
+FETCH_LATENCY = 0.03    # seconds to fetch a block from bitcoind
+APPLY_TIME = 0.01       # seconds to apply a block
+
+def make_hash(*parts):
+    return hashlib.sha256(':'.join([str(p) for p in parts])).hexdigest()
+
+
+class SimulatedChain(object):
+    """
+    A chain of blocks, fetched with latency like virtualchain_fetch_block() would.
+    Each block has one virtualchain transaction, tagged with the fork it's on.
+    """
+    def __init__(self, first_block, num_blocks, latency):
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.block_hashes = {}
+        self.blocks = {}
+        self.fail_once = set()
+        self.fork = 0
+        self.make_blocks(first_block, first_block + num_blocks)
+
+    def make_blocks(self, start_block, end_block):
+        for block_id in xrange(start_block, end_block):
+            block_hash = make_hash('block', block_id, self.fork)
+            self.block_hashes[block_id] = block_hash
+            self.blocks[block_id] = {
+                'block_id': block_id,
+                'block_hash': block_hash,
+                'prev_block_hash': self.block_hashes.get(block_id - 1, make_hash('block', block_id - 1, self.fork)),
+                'txs': [{'txid': make_hash('tx', block_id, self.fork), 'txindex': 1, 'nulldata': 'id?{}:{}'.format(block_id, self.fork).encode('hex')}],
+            }
+
+    def reorg(self, start_block, end_block):
+        """
+        Replace the blocks from start_block on with a fork
+        """
+        with self.lock:
+            self.fork += 1
+            self.make_blocks(start_block, end_block)
+
+    def fetch_block(self, block_id):
+        time.sleep(self.latency)
+        with self.lock:
+            if block_id in self.fail_once:
+                self.fail_once.remove(block_id)
+                raise Exception('Injected failure')
+
+            return dict(self.blocks[block_id])
+
+
+class SequentialBlocks(object):
+    """
+    Fetch each block when the indexer asks for it, like virtualchain does
+    """
+    depth = 0
+
+    def __init__(self, fetch_block):
+        self.get_block = fetch_block
+
+
+class FakeStateEngine(object):
+    """
+    Records the blocks it's given, like a virtualchain StateEngine
+    """
+    def __init__(self, lastblock, stop_block=None):
+        self.lastblock = lastblock
+        self.stop_block = stop_block
+        self.consensus_hashes = {}
+        self.processed = []
+
+    def get_consensus_at(self, block_id):
+        return self.consensus_hashes.get(block_id)
+
+    def get_expected_consensus_at(self, block_id):
+        return None
+
+    def parse_block(self, block_id, txs):
+        return [tx['txid'] for tx in txs]
+
+    def process_block(self, block_id, ops, expected_snapshots=None):
+        if block_id == self.stop_block:
+            return None
+
+        time.sleep(APPLY_TIME)
+        self.processed.append((block_id, ops))
+        self.consensus_hashes[block_id] = make_hash('consensus', block_id)
+        self.lastblock = block_id
+        return self.consensus_hashes[block_id]
+
+
+class BlockPrefetcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.chain = SimulatedChain(FIRST_BLOCK, NUM_BLOCKS, FETCH_LATENCY)
+        self.prefetcher = None
+
+    def tearDown(self):
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+
+    def make_prefetcher(self, depth=8, num_workers=4):
+        self.prefetcher = BlockPrefetcher(self.chain.fetch_block, FIRST_BLOCK, FIRST_BLOCK + NUM_BLOCKS - 1, depth=depth, num_workers=num_workers)
+        self.prefetcher.start()
+        return self.prefetcher
+
+    def index(self, get_block, start_block, end_block, apply_time=0):
+        blocks = []
+        for block_id in xrange(start_block, end_block):
+            blocks.append(get_block(block_id))
+            time.sleep(apply_time)
+
+        return blocks
+
+    def chain_hashes(self):
+        return [self.chain.block_hashes[b] for b in xrange(FIRST_BLOCK, FIRST_BLOCK + NUM_BLOCKS)]
+
+    def test_matches_sequential(self):
+        """ Prefetched blocks are the ones we'd fetch one at a time, in order
+        """
+        expected = self.index(self.chain.fetch_block, FIRST_BLOCK, FIRST_BLOCK + NUM_BLOCKS)
+        prefetcher = self.make_prefetcher()
+        blocks = self.index(prefetcher.get_block, FIRST_BLOCK, FIRST_BLOCK + NUM_BLOCKS)
+
+        self.assertEqual(blocks, expected)
+        self.assertEqual(prefetcher.get_stats()['blocks_delivered'], NUM_BLOCKS)
+        self.assertEqual(prefetcher.get_stats()['reorgs'], 0)
+
+    def test_depth_bound(self):
+        """ Workers stay at most depth blocks ahead of the indexer
+        """
+        prefetcher = self.make_prefetcher(depth=4, num_workers=8)
+        self.index(prefetcher.get_block, FIRST_BLOCK, FIRST_BLOCK + NUM_BLOCKS, apply_time=APPLY_TIME * 2)
+
+        stats = prefetcher.get_stats()
+        self.assertLessEqual(stats['max_ready'], 4)
+        self.assertEqual(stats['blocks_fetched'], NUM_BLOCKS)
+
+    def test_fetch_errors(self):
+        """ Blocks that fail to prefetch are fetched again when the indexer needs them
+        """
+        self.chain.fail_once.update([FIRST_BLOCK + 3, FIRST_BLOCK + 10])
+        prefetcher = self.make_prefetcher()
+        blocks = self.index(prefetcher.get_block, FIRST_BLOCK, FIRST_BLOCK + NUM_BLOCKS)
+
+        self.assertEqual([b['block_hash'] for b in blocks], self.chain_hashes())
+        self.assertEqual(prefetcher.get_stats()['fetch_errors'], 2)
+
+    def wait_for_prefetch(self, prefetcher, ready, fetch_errors):
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            stats = prefetcher.get_stats()
+            if stats['fetch_errors'] == fetch_errors and stats['ready'] == ready:
+                break
+
+            time.sleep(0.01)
+
+        self.assertEqual(prefetcher.get_stats()['ready'], ready)
+
+    def test_reorg(self):
+        """ Blocks prefetched from an abandoned fork are thrown away and refetched
+        """
+        depth = 8
+        fork_block = FIRST_BLOCK + 10
+        prefetcher = self.make_prefetcher(depth=depth)
+        blocks = self.index(prefetcher.get_block, FIRST_BLOCK, fork_block)
+
+        # the fork block fails to prefetch, and the ones after it are prefetched from the old fork
+        self.chain.fail_once.add(fork_block)
+        prefetcher.invalidate(fork_block)
+        self.wait_for_prefetch(prefetcher, depth - 1, 1)
+
+        # the chain reorganizes before the indexer gets to the fork block
+        self.chain.reorg(fork_block, FIRST_BLOCK + NUM_BLOCKS)
+        blocks += self.index(prefetcher.get_block, fork_block, FIRST_BLOCK + NUM_BLOCKS)
+
+        self.assertEqual([b['block_hash'] for b in blocks], self.chain_hashes())
+        for prev_block, block in zip(blocks[:-1], blocks[1:]):
+            self.assertEqual(block['prev_block_hash'], prev_block['block_hash'])
+
+        for block in blocks[fork_block - FIRST_BLOCK:]:
+            self.assertTrue(block['txs'][0]['nulldata'].decode('hex').endswith(':1'))
+
+        stats = prefetcher.get_stats()
+        self.assertEqual(stats['reorgs'], 1)
+        self.assertGreaterEqual(stats['blocks_invalidated'], depth - 2)
+
+    def test_reorg_below_indexed_blocks(self):
+        """ A reorg that replaces a block the indexer already has is an error
+        """
+        fork_block = FIRST_BLOCK + 10
+        prefetcher = self.make_prefetcher()
+        self.index(prefetcher.get_block, FIRST_BLOCK, fork_block + 1)
+
+        self.chain.reorg(fork_block, FIRST_BLOCK + NUM_BLOCKS)
+        prefetcher.invalidate(fork_block + 1)
+        self.assertRaises(Exception, prefetcher.get_block, fork_block + 1)
+
+    def test_sync(self):
+        """ Blocks go into the state engine in order, and syncing stops when the state engine says so
+        """
+        prefetcher = self.make_prefetcher()
+        state_engine = FakeStateEngine(FIRST_BLOCK - 1)
+        self.assertTrue(sync_virtualchain_prefetched(FIRST_BLOCK + NUM_BLOCKS - 1, state_engine, prefetcher))
+
+        expected = [(b, [self.chain.blocks[b]['txs'][0]['txid']]) for b in xrange(FIRST_BLOCK, FIRST_BLOCK + NUM_BLOCKS)]
+        self.assertEqual(state_engine.processed, expected)
+        self.assertEqual(state_engine.lastblock, FIRST_BLOCK + NUM_BLOCKS - 1)
+
+        # already up-to-date
+        self.assertTrue(sync_virtualchain_prefetched(FIRST_BLOCK + NUM_BLOCKS - 1, state_engine, prefetcher))
+
+        prefetcher.stop()
+        prefetcher = self.make_prefetcher()
+        state_engine = FakeStateEngine(FIRST_BLOCK - 1, stop_block=FIRST_BLOCK + 5)
+        self.assertFalse(sync_virtualchain_prefetched(FIRST_BLOCK + NUM_BLOCKS - 1, state_engine, prefetcher))
+        self.assertEqual(state_engine.lastblock, FIRST_BLOCK + 4)
+
+    def test_throughput(self):
+        """ Benchmark syncing with and without prefetching, against a bitcoind with latency
+        """
+        t0 = time.time()
+        sync_virtualchain_prefetched(FIRST_BLOCK + NUM_BLOCKS - 1, FakeStateEngine(FIRST_BLOCK - 1), SequentialBlocks(self.chain.fetch_block))
+        sequential_time = time.time() - t0
+
+        prefetcher = self.make_prefetcher(depth=16, num_workers=4)
+        t0 = time.time()
+        sync_virtualchain_prefetched(FIRST_BLOCK + NUM_BLOCKS - 1, FakeStateEngine(FIRST_BLOCK - 1), prefetcher)
+        prefetch_time = time.time() - t0
+
+        stats = prefetcher.get_stats()
+        print '\n{} blocks at {:.0f}ms/fetch: {:.1f} -> {:.1f} blocks/s ({} stalls, {:.3f}s stalled, max {:.3f}s)'.format(
+            NUM_BLOCKS, FETCH_LATENCY * 1000, NUM_BLOCKS / sequential_time, NUM_BLOCKS / prefetch_time,
+            stats['stalls'], stats['stall_time'], stats['max_stall_time'])
+
+        self.assertLess(prefetch_time, sequential_time / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import json
+import time
+import unittest
+
+from blockstack.lib.profiler import IndexingProfiler, summarize
+
+FIRST_BLOCK = 400000
+OPS_PER_BLOCK = 10
+NUM_CALLS = 100000
+
+class FakeIndexer(object):
+    """
+    Hooks shaped like virtualchain_hooks.py's, that
+    run a fixed number of statements per call.
+    """
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.statements = 0
+
+        self.db_parse = profiler.hook( get_opcode=lambda block_id, vtxindex, opcode: opcode )(self.db_parse)
+        self.db_commit = profiler.hook( get_opcode=lambda block_id, op_data: op_data['opcode'] if op_data is not None else None )(self.db_commit)
+        self.db_save = profiler.hook()(self.db_save)
+        self.db_continue = profiler.hook( finish_block=True )(self.db_continue)
+
+    def db_parse(self, block_id, vtxindex, opcode):
+        return {'vtxindex': vtxindex, 'opcode': opcode}
+
+    def db_commit(self, block_id, op_data):
+        self.statements += 2 if op_data is not None else 1
+
+    def db_save(self, block_id):
+        token = self.profiler.begin(block_id)
+        self.statements += 1
+        self.profiler.end('ops_hash', token)
+
+        token = self.profiler.begin(block_id)
+        self.statements += 1
+        time.sleep(0.002)
+        self.profiler.end('commit_block', token)
+
+    def db_continue(self, block_id):
+        return True
+
+    def index_block(self, block_id, num_ops=OPS_PER_BLOCK):
+        ops = [self.db_parse(block_id, i, 'NAME_UPDATE' if i % 2 == 0 else 'NAME_PREORDER') for i in xrange(0, num_ops)]
+        for op in ops:
+            self.db_commit(block_id, op)
+
+        self.db_commit(block_id, None)
+
+        # virtualchain snapshots the block
+        time.sleep(0.005)
+
+        self.db_save(block_id)
+        self.db_continue(block_id)
+
+
+class IndexingProfilerTestCase(unittest.TestCase):
+
+    def make_indexer(self, max_blocks=16, max_events=1024):
+        profiler = IndexingProfiler(max_blocks=max_blocks, max_events=max_events, statement_count=lambda: indexer.statements)
+        indexer = FakeIndexer(profiler)
+        return profiler, indexer
+
+    def test_block_profile(self):
+        """ Each block's hooks, phases, opcodes, and statements are recorded
+        """
+        profiler, indexer = self.make_indexer()
+        indexer.index_block(FIRST_BLOCK)
+
+        blocks = profiler.get_blocks()
+        self.assertEqual(len(blocks), 1)
+
+        block = blocks[0]
+        self.assertEqual(block['block_id'], FIRST_BLOCK)
+        self.assertEqual(block['hooks']['db_parse']['calls'], OPS_PER_BLOCK)
+        self.assertEqual(block['hooks']['db_commit']['calls'], OPS_PER_BLOCK + 1)
+        self.assertEqual(block['hooks']['db_commit']['statements'], 2 * OPS_PER_BLOCK + 1)
+        self.assertEqual(block['hooks']['ops_hash']['statements'], 1)
+        self.assertEqual(block['hooks']['db_save']['statements'], 2)
+        self.assertEqual(block['statements'], 2 * OPS_PER_BLOCK + 3)
+
+        self.assertEqual(block['opcodes']['NAME_UPDATE']['calls'], OPS_PER_BLOCK)
+        self.assertEqual(block['opcodes']['NAME_UPDATE']['statements'], OPS_PER_BLOCK)
+
+        self.assertGreaterEqual(block['hooks']['commit_block']['wall'], 0.002)
+        self.assertGreaterEqual(block['hooks']['db_save']['wall'], block['hooks']['commit_block']['wall'])
+
+        # nested phases don't count twice, so the snapshot shows up as virtualchain's time
+        self.assertGreaterEqual(block['virtualchain'], 0.005)
+        self.assertLess(block['virtualchain'], block['wall'] - 0.002)
+
+    def test_ring_buffer(self):
+        """ Only the most recent blocks are kept, and profiling can be turned off
+        """
+        profiler, indexer = self.make_indexer(max_blocks=4)
+        for block_id in xrange(FIRST_BLOCK, FIRST_BLOCK + 10):
+            indexer.index_block(block_id, num_ops=1)
+
+        self.assertEqual([b['block_id'] for b in profiler.get_blocks()], range(FIRST_BLOCK + 6, FIRST_BLOCK + 10))
+        self.assertEqual([b['block_id'] for b in profiler.get_blocks(start_block=FIRST_BLOCK + 8)], [FIRST_BLOCK + 8, FIRST_BLOCK + 9])
+
+        profiler.configure(2)
+        self.assertEqual([b['block_id'] for b in profiler.get_blocks()], [FIRST_BLOCK + 8, FIRST_BLOCK + 9])
+
+        profiler.configure(0)
+        indexer.index_block(FIRST_BLOCK + 10, num_ops=1)
+        self.assertEqual(profiler.get_blocks(), [])
+        self.assertFalse(profiler.get_report()['enabled'])
+
+    def test_report(self):
+        """ Reports give percentiles per block, counting blocks where a hook or opcode didn't run
+        """
+        self.assertEqual(summarize(range(1, 101)), {'p50': 50, 'p90': 90, 'p99': 99, 'max': 100, 'total': 5050})
+        self.assertEqual(summarize([]), {'p50': None, 'p90': None, 'p99': None, 'max': None, 'total': 0})
+
+        profiler, indexer = self.make_indexer()
+        for i in xrange(0, 4):
+            indexer.index_block(FIRST_BLOCK + i, num_ops=i)
+
+        report = profiler.get_report()
+        self.assertEqual(report['num_blocks'], 4)
+        self.assertEqual((report['first_block'], report['last_block']), (FIRST_BLOCK, FIRST_BLOCK + 3))
+        self.assertEqual(report['block']['statements']['max'], 2 * 3 + 3)
+        self.assertEqual(report['hooks']['db_parse']['calls'], 0 + 1 + 2 + 3)
+        self.assertEqual(report['opcodes']['NAME_PREORDER']['statements']['p50'], 0)
+        self.assertEqual(report['opcodes']['NAME_PREORDER']['statements']['max'], 2)
+        self.assertIsNotNone(report['hooks']['db_commit']['wall_per_call'])
+
+        report = profiler.get_report(start_block=FIRST_BLOCK + 2)
+        self.assertEqual(report['num_blocks'], 2)
+        self.assertEqual(report['hooks']['db_parse']['calls'], 2 + 3)
+
+    def test_trace(self):
+        """ Timelines are in Chrome's trace event format
+        """
+        profiler, indexer = self.make_indexer(max_events=8)
+        for block_id in xrange(FIRST_BLOCK, FIRST_BLOCK + 3):
+            indexer.index_block(block_id)
+
+        trace = json.loads(json.dumps(profiler.get_trace(FIRST_BLOCK + 1, FIRST_BLOCK + 2)))
+        self.assertEqual(trace['otherData'], {'first_block': FIRST_BLOCK + 1, 'last_block': FIRST_BLOCK + 2})
+
+        spans = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+        blocks = [e for e in spans if e['cat'] == 'block']
+        self.assertEqual([e['args']['block_id'] for e in blocks], [FIRST_BLOCK + 1, FIRST_BLOCK + 2])
+        self.assertEqual(len(spans), 2 * (1 + 8))
+
+        for block in blocks:
+            self.assertEqual(block['args']['dropped_events'], 2 * OPS_PER_BLOCK + 5 - 8)
+            for e in spans:
+                if e['cat'] == 'hook' and e['args']['block_id'] == block['args']['block_id']:
+                    self.assertTrue(block['ts'] <= e['ts'] and e['ts'] + e['dur'] <= block['ts'] + block['dur'] + 1)
+
+        self.assertIn('db_parse NAME_UPDATE', [e['name'] for e in spans])
+
+    def test_overhead(self):
+        """ Benchmark the cost of profiling a hook
+        """
+        profiler = IndexingProfiler(max_blocks=16)
+
+        def db_check(block_id, op):
+            return True
+
+        hooked = profiler.hook( get_opcode=lambda block_id, op: op )(db_check)
+
+        def run(hook):
+            t0 = time.time()
+            for i in xrange(0, NUM_CALLS):
+                hook(FIRST_BLOCK + i / 1000, 'NAME_UPDATE')
+
+            return (time.time() - t0) / NUM_CALLS
+
+        bare = run(db_check)
+        profiled = run(hooked)
+
+        profiler.configure(0)
+        disabled = run(hooked)
+
+        print '\n{} hook calls: {:.2f}us bare, {:.2f}us profiled, {:.2f}us with profiling off'.format(
+            NUM_CALLS, bare * 1e6, profiled * 1e6, disabled * 1e6)
+
+        self.assertEqual(len(profiler.get_blocks()), 0)
+        self.assertLess(profiled - bare, 50e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
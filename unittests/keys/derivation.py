@@ -0,0 +1,105 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import unittest
+
+import keylib
+from virtualchain.lib.ecdsalib import get_pubkey_hex
+
+from blockstack_client import keys
+
+MASTER_PRIVKEY = '4f6bba66e24cb3e3bfbfe6dbeb5c1fb55cdc1ab0b7ec12ca27e5e44aa1f34e5c01'
+NUM_SIGNINS = 20
+
+class DerivedKeyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        keys.clear_derived_keys()
+
+    def signin_keys(self, name_address, app_name):
+        """
+        Derive the keys an app sign-in needs
+        """
+        name_index = keys.find_name_index(name_address, MASTER_PRIVKEY)
+        name_privkey = keys.get_name_privkey(MASTER_PRIVKEY, name_index)
+        app_privkey = keys.get_app_privkey(keys.get_app_root_privkey(name_privkey), app_name)
+        return name_index, app_privkey
+
+    def test_signin_latency(self):
+        """ Benchmark sign-in key derivation, cold and cached
+        """
+        name_address = keylib.public_key_to_address(get_pubkey_hex(keys.HDWallet(MASTER_PRIVKEY).get_child_privkey(index=10)))
+        keys.clear_derived_keys()
+
+        t0 = time.time()
+        name_index, app_privkey = self.signin_keys(name_address, 'helloblockstack.com.1')
+        cold = time.time() - t0
+
+        t0 = time.time()
+        for i in xrange(0, NUM_SIGNINS):
+            self.assertEqual(self.signin_keys(name_address, 'helloblockstack.com.1'), (name_index, app_privkey))
+
+        warm = (time.time() - t0) / NUM_SIGNINS
+
+        print '\nsign-in key derivation: cold {:.1f}ms, cached {:.3f}ms'.format(cold * 1000, warm * 1000)
+
+        self.assertEqual(name_index, 10)
+        self.assertLess(warm, cold / 10)
+
+    def test_address_index(self):
+        """ Scanned children are found without deriving keys again
+        """
+        hdwallet = keys.HDWallet(MASTER_PRIVKEY)
+        addresses = [keylib.public_key_to_address(keylib.key_formatting.decompress(get_pubkey_hex(privkey)))
+                     for privkey in hdwallet.get_child_privkeys(0, 5)]
+
+        self.assertEqual(keys.find_name_index(addresses[4], MASTER_PRIVKEY), 4)
+
+        misses = keys.get_derived_key_stats()['keys']['misses']
+        for i in xrange(0, 5):
+            self.assertEqual(keys.find_name_index(addresses[i], MASTER_PRIVKEY), i)
+
+        self.assertEqual(keys.get_derived_key_stats()['keys']['misses'], misses)
+
+        # out of range
+        self.assertIsNone(keys.find_name_index(addresses[4], MASTER_PRIVKEY, max_tries=4))
+        self.assertIsNone(keys.find_name_index('1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2', MASTER_PRIVKEY))
+
+    def test_paths(self):
+        """ Cached derivation matches step-by-step derivation
+        """
+        name_privkey = keys.get_name_privkey(MASTER_PRIVKEY, 3)
+
+        privkey = MASTER_PRIVKEY
+        for index in [keys.NAMES_PRIVKEY_NODE, keys.NAMES_PRIVKEY_VERSION_NODE, 3]:
+            privkey = keys.HDWallet(privkey).get_priv_keychain(privkey, '\x00' * 32).hardened_child(index).private_key()
+            privkey = keys.set_privkey_compressed(privkey, compressed=False)
+
+        self.assertEqual(name_privkey, privkey)
+        self.assertNotEqual(keys.get_signing_privkey(name_privkey), keys.get_encryption_privkey(name_privkey))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import time
+import unittest
+
+from blockstack.lib import consensus
+from blockstack.lib.config import NAME_UPDATE
+
+BLOCK_ID = 400000
+NUM_OPS = 10000
+NUM_NAMES = 2000
+
+def make_update(name, vtxindex):
+    return {
+        'name': name,
+        'value_hash': '{:040x}'.format(vtxindex),
+        'consensus_hash': '00' * 16,
+        'sender': '76a914' + '00' * 20 + '88ac',
+        'address': '1111111111111111111114oLvT2',
+        'block_number': BLOCK_ID,
+        'op': NAME_UPDATE,
+        'txid': '{:064x}'.format(vtxindex),
+        'vtxindex': vtxindex,
+        'op_fee': None,
+    }
+
+
+def make_block(num_ops, num_names):
+    """
+    A block's worth of updates, spread round-robin over @num_names names
+    and returned out of tx order.
+    """
+    ops = [make_update(u'name{}.id'.format(i % num_names), i) for i in xrange(0, num_ops)]
+    return list(reversed(ops))
+
+
+def quadratic_history_index(prior_recs):
+    """
+    The history index as block_to_virtualchain_ops() used to build it
+    """
+    history_index = {}
+    for i in xrange(0, len(prior_recs)):
+        rec = prior_recs[i]
+
+        if 'name' not in rec.keys():
+            continue
+
+        name = str(rec['name'])
+        if name not in history_index.keys():
+            history_index[name] = { i: 0 }
+
+        else:
+            history_index[name][i] = max( history_index[name].values() ) + 1
+
+    return [history_index[str(rec['name'])][i] for i, rec in enumerate(prior_recs)]
+
+
+class UntrustedDB(object):
+    """
+    Just enough of an untrusted db to restore a block from
+    """
+    def __init__(self, ops):
+        self.ops = ops
+        self.name_lookups = 0
+
+    def get_all_ops_at(self, block_id):
+        return [dict(op) for op in self.ops]
+
+    def sanitize_op(self, op):
+        return op
+
+    def get_name(self, name, include_expired=False):
+        self.name_lookups += 1
+        return {'name': name, 'history': {}}
+
+
+class BlockOpsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.restored = []
+        self.rec_to_virtualchain_op = consensus.rec_to_virtualchain_op
+        consensus.rec_to_virtualchain_op = self.restore_op
+
+    def tearDown(self):
+        consensus.rec_to_virtualchain_op = self.rec_to_virtualchain_op
+
+    def restore_op(self, name_rec, block_number, history_index, working_db, untrusted_db):
+        """
+        Look up the previous version the way the register and transfer restorers do
+        """
+        if 'name' in name_rec:
+            untrusted_db.get_name(name_rec['name'], include_expired=True)
+
+        self.restored.append((name_rec['vtxindex'], name_rec.get('name'), history_index))
+        return name_rec
+
+    def test_history_indexes(self):
+        """ Each record's history index counts the earlier changes to its name in the block
+        """
+        untrusted_db = UntrustedDB(make_block(20, 3) + [{'op': NAME_UPDATE, 'vtxindex': 20, 'txid': '00' * 32}])
+        ops = consensus.block_to_virtualchain_ops(BLOCK_ID, None, untrusted_db)
+
+        self.assertEqual([op['vtxindex'] for op in ops], range(0, 21))
+        self.assertEqual([h for (_, _, h) in self.restored], [i / 3 for i in xrange(0, 20)] + [0])
+
+        # each name's history is loaded once
+        self.assertEqual(untrusted_db.name_lookups, 3)
+
+    def test_large_block(self):
+        """ Benchmark restoring a block with 10,000 operations
+        """
+        untrusted_db = UntrustedDB(make_block(NUM_OPS, NUM_NAMES))
+        prior_recs = sorted(untrusted_db.get_all_ops_at(BLOCK_ID), key=lambda op: op['vtxindex'])
+
+        t0 = time.time()
+        expected = quadratic_history_index(prior_recs)
+        quadratic_time = time.time() - t0
+
+        t0 = time.time()
+        history_indexes = consensus.block_history_indexes(prior_recs)
+        index_time = time.time() - t0
+
+        t0 = time.time()
+        consensus.block_to_virtualchain_ops(BLOCK_ID, None, untrusted_db)
+        restore_time = time.time() - t0
+
+        print '\n{} ops on {} names: history index {:.3f}s -> {:.3f}s; whole block {:.3f}s with {} name lookups'.format(
+            NUM_OPS, NUM_NAMES, quadratic_time, index_time, restore_time, untrusted_db.name_lookups)
+
+        self.assertEqual(history_indexes, expected)
+        self.assertEqual([h for (_, _, h) in self.restored], expected)
+        self.assertEqual(untrusted_db.name_lookups, NUM_NAMES)
+        self.assertLess(index_time, quadratic_time)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import random
+import shutil
+import tempfile
+import unittest
+
+from blockstack.lib.config import NAMESPACE_READY, NAMESPACE_REVEAL, NAMESPACE_LIFE_INFINITE, EPOCH_1_END_BLOCK, EPOCH_2_END_BLOCK, \
+    EPOCHS, EPOCH_NOW
+from blockstack.lib.nameset.db import namedb_create, namedb_get_num_names, namedb_get_all_names, namedb_get_num_names_in_namespace, \
+        namedb_get_names_in_namespace, namedb_get_name, namedb_select_where_unexpired_names, namedb_select_unexpired_names, \
+        namedb_expiry_refresh, namedb_expiry_refresh_epoch, namedb_get_expiry_epoch
+
+NUM_NAMES = 1000000
+NUM_CHECKS = 50
+
+INSERT_NAMESPACE = "INSERT INTO namespaces (namespace_id, preorder_hash, version, sender, sender_pubkey, address, recipient, recipient_address, block_number, " + \
+                   "reveal_block, op, op_fee, txid, vtxindex, lifetime, coeff, base, buckets, nonalpha_discount, no_vowel_discount, ready_block) " + \
+                   "VALUES (?, '00', 1, '00', NULL, NULL, '00', NULL, ?, ?, ?, 0, '00', 0, ?, 4, 4, '[]', 10, 10, ?);"
+
+INSERT_NAME = "INSERT INTO name_records (name, preorder_hash, name_hash128, namespace_id, namespace_block_number, value_hash, sender, sender_pubkey, address, " + \
+              "block_number, preorder_block_number, first_registered, last_renewed, revoked, op, txid, vtxindex, op_fee, importer, importer_address, " + \
+              "consensus_hash, transfer_send_block_id, last_creation_op) " + \
+              "VALUES (?, '00', '00', ?, ?, NULL, '00', NULL, NULL, ?, ?, ?, ?, 0, ':', '00', 0, 0, NULL, NULL, NULL, NULL, ':');"
+
+def make_namespaces():
+    """
+    (namespace_id, reveal_block, op, lifetime, ready_block) for each namespace
+    """
+    return [
+        ('id', 373601, NAMESPACE_READY, 52595, 373602),
+        ('short', 430000, NAMESPACE_READY, 1000, 430010),
+        ('forever', 440000, NAMESPACE_READY, NAMESPACE_LIFE_INFINITE, 440005),
+        ('importing', 480000, NAMESPACE_REVEAL, 52595, 0),
+    ]
+
+
+def make_name_rows(num_names, namespaces, seed=0):
+    r = random.Random(seed)
+    for i in xrange(0, num_names):
+        namespace_id, reveal_block, _, _, _ = namespaces[i % len(namespaces)]
+        first_registered = reveal_block + r.randint(1, 100000)
+        last_renewed = first_registered + r.randint(0, 100000)
+        yield ('name{}.{}'.format(i, namespace_id), namespace_id, reveal_block, first_registered, first_registered, first_registered, last_renewed)
+
+
+class NameExpiryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db = namedb_create(os.path.join(self.tmpdir, 'blockstack-server.db'))
+        self.namespaces = make_namespaces()
+
+        self.db.execute('BEGIN;')
+        for (namespace_id, reveal_block, op, lifetime, ready_block) in self.namespaces:
+            self.db.execute(INSERT_NAMESPACE, (namespace_id, reveal_block, reveal_block, op, lifetime, ready_block))
+
+        self.db.execute('COMMIT;')
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmpdir)
+
+    def add_names(self, num_names):
+        self.db.execute('BEGIN;')
+        self.db.executemany(INSERT_NAME, make_name_rows(num_names, self.namespaces))
+        self.db.execute('COMMIT;')
+
+    def udf_unexpired_names(self, block_id):
+        query_fragment, query_args = namedb_select_where_unexpired_names(block_id)
+        rows = self.db.execute("SELECT name_records.name FROM name_records JOIN namespaces ON name_records.namespace_id = namespaces.namespace_id " +
+                               "WHERE " + query_fragment + ";", query_args)
+
+        return [r['name'] for r in rows]
+
+    def udf_unexpired_names_in(self, block_id, namespace_id):
+        return sorted([n for n in self.udf_unexpired_names(block_id) if n.endswith('.' + namespace_id)])
+
+    def test_matches_udf_query(self):
+        """ Materialized expiry selects the same names as the per-row functions, in every epoch
+        """
+        self.add_names(5000)
+        cur = self.db.cursor()
+
+        # get_epoch_number() aborts past the last configured epoch
+        last_block = EPOCH_2_END_BLOCK + 200000
+        if EPOCHS[-1]['end_block'] != EPOCH_NOW:
+            last_block = min(last_block, EPOCHS[-1]['end_block'])
+
+        r = random.Random(1)
+        for epoch_block in [EPOCH_1_END_BLOCK, EPOCH_2_END_BLOCK, EPOCH_2_END_BLOCK + 1]:
+            namedb_expiry_refresh_epoch(self.db, epoch_block)
+
+            for i in xrange(0, NUM_CHECKS):
+                block_id = r.randint(373601, last_block)
+                expected = self.udf_unexpired_names(block_id)
+
+                self.assertEqual(sorted(namedb_get_all_names(cur, block_id)), sorted(expected))
+                self.assertEqual(namedb_get_num_names(cur, block_id), len(expected))
+                self.assertEqual(namedb_get_num_names_in_namespace(cur, 'short', block_id), len([n for n in expected if n.endswith('.short')]))
+
+    def test_refresh(self):
+        """ Renewals, namespace changes and epoch changes are reflected
+        """
+        self.add_names(100)
+        cur = self.db.cursor()
+
+        self.assertEqual(namedb_get_expiry_epoch(cur), (None, None))
+        self.assertTrue(namedb_expiry_refresh_epoch(self.db, EPOCH_2_END_BLOCK))
+        self.assertFalse(namedb_expiry_refresh_epoch(self.db, EPOCH_2_END_BLOCK - 1))
+
+        block_id = EPOCH_2_END_BLOCK - 1
+        self.assertIn('name_expiry', namedb_select_unexpired_names(cur, block_id)[0])
+        self.assertNotIn('name_expiry', namedb_select_unexpired_names(cur, EPOCH_2_END_BLOCK + 1)[0])
+
+        # renew an expired name
+        registered = [r['name'] for r in self.db.execute("SELECT name FROM name_records WHERE namespace_id = 'short' AND first_registered <= ?;", (block_id,))]
+        expired = sorted(set(registered) - set(namedb_get_all_names(cur, block_id)))
+        self.assertTrue(len(expired) > 0)
+
+        self.assertIsNone(namedb_get_name(cur, expired[0], block_id))
+        self.db.execute("UPDATE name_records SET last_renewed = ? WHERE name = ?;", (block_id, expired[0]))
+        namedb_expiry_refresh(cur, name=expired[0])
+        self.assertIsNotNone(namedb_get_name(cur, expired[0], block_id))
+
+        # ready a namespace
+        self.db.execute("UPDATE namespaces SET op = ?, ready_block = ? WHERE namespace_id = ?;", (NAMESPACE_READY, 480000 + 1000, 'importing'))
+        namedb_expiry_refresh(cur, namespace_id='importing')
+        self.assertEqual(namedb_get_names_in_namespace(cur, 'importing', block_id), self.udf_unexpired_names_in(block_id, 'importing'))
+
+        # change epochs
+        self.assertTrue(namedb_expiry_refresh_epoch(self.db, EPOCH_2_END_BLOCK + 1))
+        self.assertEqual(sorted(namedb_get_all_names(cur, EPOCH_2_END_BLOCK + 1)), sorted(self.udf_unexpired_names(EPOCH_2_END_BLOCK + 1)))
+
+    def test_million_names(self):
+        """ Benchmark counting and listing names with and without materialized expiry
+        """
+        self.add_names(NUM_NAMES)
+        cur = self.db.cursor()
+        block_id = EPOCH_2_END_BLOCK - 1
+
+        t0 = time.time()
+        udf_count = namedb_get_num_names(cur, block_id)
+        udf_count_time = time.time() - t0
+
+        t0 = time.time()
+        udf_names = namedb_get_names_in_namespace(cur, 'id', block_id, offset=NUM_NAMES / 8, count=100)
+        udf_list_time = time.time() - t0
+
+        t0 = time.time()
+        namedb_expiry_refresh_epoch(self.db, block_id)
+        build_time = time.time() - t0
+
+        t0 = time.time()
+        count = namedb_get_num_names(cur, block_id)
+        count_time = time.time() - t0
+
+        t0 = time.time()
+        names = namedb_get_names_in_namespace(cur, 'id', block_id, offset=NUM_NAMES / 8, count=100)
+        list_time = time.time() - t0
+
+        print '\n{} names: count {:.3f}s -> {:.3f}s, list {:.3f}s -> {:.3f}s (one-time build {:.1f}s)'.format(
+            NUM_NAMES, udf_count_time, count_time, udf_list_time, list_time, build_time)
+
+        self.assertEqual(count, udf_count)
+        self.assertEqual(names, udf_names)
+        self.assertLess(count_time, udf_count_time)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import virtualchain
+
+from blockstack.lib import nameset as blockstack_state_engine
+from blockstack.lib.config import NAME_PREORDER, NAMESPACE_PREORDER
+from blockstack.lib.nameset.db import namedb_create, namedb_open, namedb_query_execute
+from blockstack.lib.nameset.namedb import BlockstackDB, DISPOSITION_RW
+
+BLOCK_ID = 400000
+
+def make_preorder(block_id, vtxindex, op=NAME_PREORDER):
+    return {
+        'preorder_hash': '{:040x}'.format(block_id * 1000 + vtxindex),
+        'consensus_hash': '00' * 16,
+        'sender': '76a914' + '00' * 20 + '88ac',
+        'sender_pubkey': None,
+        'address': '1111111111111111111114oLvT2',
+        'block_number': block_id,
+        'op': op,
+        'opcode': 'NAME_PREORDER' if op == NAME_PREORDER else 'NAMESPACE_PREORDER',
+        'txid': '{:064x}'.format(block_id * 1000 + vtxindex),
+        'vtxindex': vtxindex,
+        'op_fee': 6400000,
+        'burn_address': '1111111111111111111114oLvT2',
+    }
+
+
+def restored_ops_hash(ops):
+    """
+    Hash ops the way calculate_block_ops_hash() does
+    """
+    ops = sorted(ops, key=lambda op: op['vtxindex'])
+    serialized_ops = [virtualchain.StateEngine.serialize_op(str(op['op'][0]), op, BlockstackDB.make_opfields(), verbose=True) for op in ops]
+    return virtualchain.StateEngine.make_ops_snapshot(serialized_ops)
+
+
+class NameDB(BlockstackDB):
+    """
+    Just the sqlite side of the state engine,
+    so we can commit operations without a blockchain.
+    """
+    def __init__(self, db_filename):
+        if os.path.exists(db_filename):
+            self.db = namedb_open(db_filename)
+        else:
+            self.db = namedb_create(db_filename)
+
+        self.db_filename = db_filename
+        self.disposition = DISPOSITION_RW
+        self.block_atomic_writes = True
+        self.block_txn = None
+        self.collisions = {}
+        self.ops_hash_accumulator = None
+
+    def apply_block(self, block_id, nameops):
+        """
+        Commit a block's operations and save its ops hash, the way db_save() does
+        """
+        for nameop in nameops:
+            self.commit_operation(nameop, block_id)
+
+        self.store_block_ops_hash(block_id, self.get_accumulated_ops_hash(block_id))
+        self.commit_finished(block_id)
+        self.commit_block(block_id)
+
+
+class OpsHashTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # calculate_block_ops_hash() restores records through get_db_state(),
+        # so point the state engine at our db
+        self.tmpdir = tempfile.mkdtemp(prefix='blockstack-opshash-')
+        blockstack_state_engine.working_dir = self.tmpdir
+        virtualchain.setup_virtualchain(impl=blockstack_state_engine)
+
+        with open(virtualchain.get_lastblock_filename(), 'w') as f:
+            f.write('{}'.format(BLOCK_ID))
+
+        with open(virtualchain.get_snapshots_filename(), 'w') as f:
+            f.write(json.dumps({'snapshots': {}}))
+
+        self.db = NameDB(virtualchain.get_db_filename())
+
+    def tearDown(self):
+        self.db.db.close()
+        blockstack_state_engine.working_dir = None
+        shutil.rmtree(self.tmpdir)
+
+    def test_accumulated_ops_hash(self):
+        """ Ops committed in any order hash like the block's restored records
+        """
+        ops = [make_preorder(BLOCK_ID, i) for i in [5, 1, 9, 3]]
+        db = self.db
+
+        db.accumulate_ops(BLOCK_ID, ops[:2])
+        db.accumulate_ops(BLOCK_ID, ops[2:])
+        self.assertEqual(db.get_accumulated_ops_hash(BLOCK_ID), restored_ops_hash(ops))
+
+        # reset for the next block, which had no ops
+        self.assertIsNone(db.ops_hash_accumulator)
+        self.assertEqual(db.get_accumulated_ops_hash(BLOCK_ID + 1), restored_ops_hash([]))
+
+        # a stale accumulator isn't reused
+        db.accumulate_ops(BLOCK_ID + 2, ops[:1])
+        db.accumulate_ops(BLOCK_ID + 3, ops[1:2])
+        self.assertEqual(db.get_accumulated_ops_hash(BLOCK_ID + 3), restored_ops_hash(ops[1:2]))
+
+    def test_verify_block_ops_hashes(self):
+        """ Ops hashes accumulated by commit_operation() match the ones restored from the db
+        """
+        # out-of-order name and namespace preorders, and an empty block
+        blocks = {
+            BLOCK_ID: [make_preorder(BLOCK_ID, i) for i in [3, 0, 2]],
+            BLOCK_ID + 1: [make_preorder(BLOCK_ID + 1, 1, op=NAMESPACE_PREORDER), make_preorder(BLOCK_ID + 1, 0)],
+            BLOCK_ID + 2: [],
+            BLOCK_ID + 3: [make_preorder(BLOCK_ID + 3, i) for i in xrange(0, 10)],
+        }
+        for block_id in sorted(blocks.keys()):
+            self.db.apply_block(block_id, blocks[block_id])
+
+        self.assertEqual(self.db.verify_block_ops_hashes(BLOCK_ID, BLOCK_ID + 4), [])
+        self.assertEqual(self.db.get_block_ops_hash(BLOCK_ID + 2), restored_ops_hash([]))
+
+        # a wrong stored hash is reported
+        cur = self.db.db.cursor()
+        namedb_query_execute(cur, "UPDATE ops_hashes SET ops_hash = ? WHERE block_id = ?;", (self.db.get_block_ops_hash(BLOCK_ID), BLOCK_ID + 1))
+        self.db.db.commit()
+        self.assertEqual(self.db.verify_block_ops_hashes(BLOCK_ID, BLOCK_ID + 4), [BLOCK_ID + 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from blockstack.lib.nameset.db import namedb_create, namedb_open, namedb_preorder_insert, namedb_get_block_ops_hash
+from blockstack.lib.nameset.namedb import BlockstackDB, DISPOSITION_RW
+
+FIRST_BLOCK = 400000
+NUM_BLOCKS = 50
+OPS_PER_BLOCK = 5
+
+def make_preorder(block_id, vtxindex):
+    return {
+        'preorder_hash': '{:040x}'.format(block_id * 1000 + vtxindex),
+        'consensus_hash': '00' * 16,
+        'sender': '76a914' + '00' * 20 + '88ac',
+        'sender_pubkey': None,
+        'address': '1111111111111111111114oLvT2',
+        'block_number': block_id,
+        'op': '?',
+        'op_fee': 6400000,
+        'txid': '{:064x}'.format(block_id * 1000 + vtxindex),
+        'vtxindex': vtxindex,
+        'burn_address': '1111111111111111111114oLvT2',
+    }
+
+
+class NameDB(BlockstackDB):
+    """
+    Just the sqlite side of the state engine,
+    so we can drive the block write path without a blockchain.
+    """
+    def __init__(self, db_filename, block_atomic_writes):
+        if os.path.exists(db_filename):
+            self.db = namedb_open(db_filename)
+        else:
+            self.db = namedb_create(db_filename)
+
+        self.db_filename = db_filename
+        self.disposition = DISPOSITION_RW
+        self.block_atomic_writes = block_atomic_writes
+        self.block_txn = None
+        self.collisions = {}
+
+    def apply_block(self, block_id, num_ops, crash_after=None):
+        """
+        Commit a block's preorders and ops hash the way
+        commit_state_preorder() and db_save() do.
+        Exit without saving after @crash_after ops.
+        """
+        for i in xrange(0, num_ops):
+            if crash_after is not None and i == crash_after:
+                os._exit(0)
+
+            self.begin_block(block_id)
+            namedb_preorder_insert(self.db.cursor(), make_preorder(block_id, i))
+            self.flush_writes()
+
+        self.commit_finished(block_id)
+        self.store_block_ops_hash(block_id, '11' * 32)
+        self.commit_finished(block_id)
+        self.commit_block(block_id)
+
+
+class BlockTransactionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmpdir, 'blockstack-server.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def count_preorders(self, block_id):
+        db = namedb_open(self.db_path)
+        rows = db.execute('SELECT COUNT(*) FROM preorders WHERE block_number = ?;', (block_id,)).fetchall()
+        db.close()
+        return rows[0]['COUNT(*)']
+
+    def crash_during_block(self, block_atomic_writes):
+        """
+        Apply one block, then die partway through the next.
+        Return the number of the second block's preorders that survive.
+        """
+        db = NameDB(self.db_path, block_atomic_writes)
+        db.apply_block(FIRST_BLOCK, OPS_PER_BLOCK)
+        db.db.close()
+
+        pid = os.fork()
+        if pid == 0:
+            db = NameDB(self.db_path, block_atomic_writes)
+            db.apply_block(FIRST_BLOCK + 1, OPS_PER_BLOCK, crash_after=OPS_PER_BLOCK - 1)
+
+        os.waitpid(pid, 0)
+
+        db = NameDB(self.db_path, block_atomic_writes)
+        self.assertIsNotNone(namedb_get_block_ops_hash(db.db.cursor(), FIRST_BLOCK))
+        self.assertIsNone(namedb_get_block_ops_hash(db.db.cursor(), FIRST_BLOCK + 1))
+        db.close()
+
+        self.assertEqual(self.count_preorders(FIRST_BLOCK), OPS_PER_BLOCK)
+        return self.count_preorders(FIRST_BLOCK + 1)
+
+    def test_crash_recovery(self):
+        """ A block interrupted by a crash is rolled back
+        """
+        self.assertEqual(self.crash_during_block(True), 0)
+
+    def test_crash_without_block_transactions(self):
+        """ Without block transactions, a crash leaves a partial block behind
+        """
+        self.assertEqual(self.crash_during_block(False), OPS_PER_BLOCK - 1)
+
+    def test_isolation(self):
+        """ Other connections don't see a block until it's committed
+        """
+        db = NameDB(self.db_path, True)
+        db.begin_block(FIRST_BLOCK)
+        namedb_preorder_insert(db.db.cursor(), make_preorder(FIRST_BLOCK, 0))
+        db.commit_finished(FIRST_BLOCK)
+
+        self.assertEqual(self.count_preorders(FIRST_BLOCK), 0)
+
+        db.commit_block(FIRST_BLOCK)
+        self.assertEqual(self.count_preorders(FIRST_BLOCK), 1)
+
+        # closing mid-block discards the block
+        db.begin_block(FIRST_BLOCK + 1)
+        namedb_preorder_insert(db.db.cursor(), make_preorder(FIRST_BLOCK + 1, 0))
+        db.close()
+
+        self.assertEqual(self.count_preorders(FIRST_BLOCK + 1), 0)
+
+    def sync(self, block_atomic_writes):
+        """
+        Apply NUM_BLOCKS blocks to a new db.
+        Return blocks per second.
+        """
+        db_path = os.path.join(self.tmpdir, 'sync-{}.db'.format(block_atomic_writes))
+        db = NameDB(db_path, block_atomic_writes)
+
+        t0 = time.time()
+        for block_id in xrange(FIRST_BLOCK, FIRST_BLOCK + NUM_BLOCKS):
+            db.apply_block(block_id, OPS_PER_BLOCK)
+
+        elapsed = time.time() - t0
+        db.close()
+        return NUM_BLOCKS / elapsed
+
+    def test_sync_throughput(self):
+        """ Benchmark blocks per second with and without block transactions
+        """
+        autocommit_rate = self.sync(False)
+        block_rate = self.sync(True)
+
+        print '\n{} blocks of {} ops: {:.1f} blocks/s autocommit, {:.1f} blocks/s with block transactions'.format(
+            NUM_BLOCKS, OPS_PER_BLOCK, autocommit_rate, block_rate)
+
+        self.assertGreater(block_rate, autocommit_rate)
+
+
+if __name__ == '__main__':
+    unittest.main()
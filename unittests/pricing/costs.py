@@ -0,0 +1,153 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import time
+import random
+import unittest
+
+from blockstack.lib.config import EPOCH_1_END_BLOCK, EPOCH_2_END_BLOCK
+from blockstack.lib.scripts import price_name, NamespacePricing, NamePricer, get_name_from_fq_name
+
+NUM_NAMES = 100000
+NAME_CHARS = 'abcdefghijklmnopqrstuvwxyz0123456789-_'
+
+def make_namespace(namespace_id, base=4, coeff=250, buckets=[6, 5, 4, 3, 2, 1] + [0] * 10, nonalpha_discount=10, no_vowel_discount=10):
+    return {
+        'namespace_id': namespace_id,
+        'base': base,
+        'coeff': coeff,
+        'buckets': buckets,
+        'nonalpha_discount': nonalpha_discount,
+        'no_vowel_discount': no_vowel_discount,
+    }
+
+
+def make_names(num_names, namespace_ids, seed=0):
+    r = random.Random(seed)
+    names = []
+    for i in xrange(0, num_names):
+        name = ''.join(r.choice(NAME_CHARS) for _ in xrange(0, r.randint(1, 20)))
+        names.append('{}.{}'.format(name, r.choice(namespace_ids)))
+
+    return names
+
+
+class NamespaceDB(object):
+    """
+    Just enough of a db to price names from
+    """
+    def __init__(self, namespaces, revealed, lastblock):
+        self.namespaces = namespaces
+        self.revealed = revealed
+        self.lastblock = lastblock
+        self.lookups = 0
+
+    def get_namespace(self, namespace_id):
+        self.lookups += 1
+        return self.namespaces.get(namespace_id)
+
+    def get_namespace_reveal(self, namespace_id):
+        self.lookups += 1
+        return self.revealed.get(namespace_id)
+
+
+class NamePricingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.namespaces = {
+            'id': make_namespace('id'),
+            'flat': make_namespace('flat', base=1, coeff=1, buckets=[1] * 16, nonalpha_discount=1, no_vowel_discount=1),
+            'cheap': make_namespace('cheap', base=2, coeff=3, buckets=[15, 8, 1] + [0] * 13, nonalpha_discount=3, no_vowel_discount=7),
+        }
+        self.revealed = {
+            'importing': make_namespace('importing', base=16, coeff=255, buckets=[15] * 16, nonalpha_discount=15, no_vowel_discount=15),
+        }
+
+    def test_same_prices(self):
+        """ Cached pricing gives exactly the same prices as price_name()
+        """
+        names = make_names(10000, ['id', 'flat', 'cheap', 'importing'])
+        namespaces = dict(self.namespaces.items() + self.revealed.items())
+
+        for block_height in [EPOCH_1_END_BLOCK, EPOCH_2_END_BLOCK, EPOCH_2_END_BLOCK + 1]:
+            db = NamespaceDB(self.namespaces, self.revealed, block_height)
+            pricer = NamePricer()
+
+            for name in names:
+                namespace = namespaces[name.split('.')[-1]]
+                expected = price_name(get_name_from_fq_name(name), namespace, block_height)
+                self.assertEqual(pricer.price_name(db, name), expected)
+
+            pricing = NamespacePricing(namespaces['id'], block_height)
+            for name in ['a', 'b', '0', 'ab0', 'a' * 30]:
+                self.assertEqual(pricing.price_name(name), price_name(name, namespaces['id'], block_height))
+
+    def test_cached_per_block(self):
+        """ Namespaces are looked up once per block
+        """
+        db = NamespaceDB(self.namespaces, self.revealed, EPOCH_2_END_BLOCK)
+        pricer = NamePricer()
+
+        names = make_names(100, ['id', 'importing'])
+        for name in names:
+            self.assertIsNotNone(pricer.price_name(db, name))
+
+        # 'importing' is looked up as a ready namespace first
+        self.assertEqual(db.lookups, 3)
+
+        # unknown namespaces are remembered too
+        self.assertIsNone(pricer.price_name(db, 'foo.nope'))
+        self.assertIsNone(pricer.price_name(db, 'bar.nope'))
+        self.assertEqual(db.lookups, 5)
+
+        # next block
+        db.lastblock += 1
+        db.namespaces['nope'] = make_namespace('nope')
+        self.assertIsNotNone(pricer.price_name(db, 'foo.nope'))
+
+    def test_names_per_second(self):
+        """ Benchmark names priced per second
+        """
+        names = make_names(NUM_NAMES, ['id', 'flat', 'cheap'])
+        db = NamespaceDB(self.namespaces, self.revealed, EPOCH_2_END_BLOCK)
+
+        t0 = time.time()
+        for name in names:
+            namespace = db.get_namespace(name.split('.')[-1])
+            price_name(get_name_from_fq_name(name), namespace, db.lastblock)
+
+        uncached_rate = NUM_NAMES / (time.time() - t0)
+
+        pricer = NamePricer()
+        t0 = time.time()
+        for name in names:
+            pricer.price_name(db, name)
+
+        cached_rate = NUM_NAMES / (time.time() - t0)
+
+        print '\n{} names: {:.0f} names/s uncached, {:.0f} names/s cached'.format(NUM_NAMES, uncached_rate, cached_rate)
+        self.assertGreater(cached_rate, uncached_rate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import threading
+import unittest
+
+from blockstack_client.backend.scheduler import RegistrarScheduler
+
+NUM_NAMES = 20
+BLOCK_TIME = 0.05
+TX_TIME = 0.02
+REPLICATION_TIME = 0.1
+
+class MockChain(object):
+    """
+    Local chain and registrar queues.
+    Operations confirm one block after they are enqueued.
+    Blocks are mined by the thread that drives the scheduler,
+    so queue scans see a consistent height.
+    """
+    def __init__(self, names, replication_failures=0):
+        self.lock = threading.Lock()
+        self.height = 0
+        self.last_block = time.time()
+        self.queues = {'preorder': {}, 'register': {}, 'update': {}}
+        self.replicated = set()
+        self.done = set()
+        self.active = {}
+        self.violations = []
+        self.replication_failures = dict([(name, replication_failures) for name in names[::5]])
+
+        for name in names:
+            self.queues['preorder'][name] = self.height
+
+    def get_block_height(self):
+        return self.height
+
+    def mine(self):
+        if time.time() - self.last_block >= BLOCK_TIME:
+            self.height += 1
+            self.last_block = time.time()
+
+    def finder(self, queue_id):
+        def _find():
+            with self.lock:
+                return [{'fqu': name, 'type': queue_id, 'tx_hash': '{}-{}'.format(queue_id, height)}
+                        for (name, height) in self.queues[queue_id].items() if self.height > height]
+
+        return _find
+
+    def op(self, stage_func, delay):
+        """
+        Run a stage, and check that no name is in two stages at once
+        """
+        def _process(entry):
+            with self.lock:
+                if entry['fqu'] not in self.queues[entry['type']]:
+                    # already done; found by a scan that raced with it
+                    return {'status': True}
+
+                if entry['fqu'] in self.active:
+                    self.violations.append((entry['fqu'], self.active[entry['fqu']], stage_func.__name__))
+
+                self.active[entry['fqu']] = stage_func.__name__
+
+            time.sleep(delay)
+            with self.lock:
+                del self.active[entry['fqu']]
+                if entry['fqu'] not in self.queues[entry['type']]:
+                    return {'status': True}
+
+                return stage_func(entry['fqu'])
+
+        return _process
+
+    def register(self, name):
+        del self.queues['preorder'][name]
+        self.queues['register'][name] = self.height
+        return {'status': True}
+
+    def update(self, name):
+        del self.queues['register'][name]
+        self.queues['update'][name] = self.height
+        return {'status': True}
+
+    def replicate(self, name):
+        if self.replication_failures.get(name, 0) > 0:
+            self.replication_failures[name] -= 1
+            return {'error': 'Atlas peers unreachable'}
+
+        self.replicated.add(name)
+        return {'status': True}
+
+    def transfer(self, name):
+        if name not in self.replicated:
+            self.violations.append((name, 'transfer before replication'))
+
+        del self.queues['update'][name]
+        self.done.add(name)
+        return {'status': True}
+
+
+class RegistrarSchedulerTestCase(unittest.TestCase):
+
+    def run_pipeline(self, serial, replication_failures=0):
+        """
+        Run names from preorder through transfer.
+        Return (chain, scheduler, elapsed seconds)
+        """
+        names = ['name{}.test'.format(i) for i in xrange(0, NUM_NAMES)]
+        chain = MockChain(names, replication_failures=replication_failures)
+
+        scheduler = RegistrarScheduler(num_workers=1 if serial else None, poll_interval=1.0, block_check_interval=0.01,
+                                       retry_delay=0.05, get_block_height=chain.get_block_height)
+
+        scheduler.add_stage('preorders', chain.finder('preorder'), chain.op(chain.register, TX_TIME), concurrency=1)
+        scheduler.add_stage('registers', chain.finder('register'), chain.op(chain.update, TX_TIME), concurrency=1)
+        scheduler.add_stage('replicate_updates', chain.finder('update'), chain.op(chain.replicate, REPLICATION_TIME), concurrency=1 if serial else 4)
+        scheduler.add_stage('transfers', chain.finder('update'), chain.op(chain.transfer, TX_TIME), concurrency=1)
+
+        sweeps = []
+        scheduler.add_sweep('clear_confirmed', lambda: sweeps.append(chain.height) or {'status': True})
+
+        scheduler.start()
+        t0 = time.time()
+        try:
+            while len(chain.done) < NUM_NAMES and time.time() - t0 < 60:
+                scheduler.run_once(timeout=0.01)
+                chain.mine()
+
+        finally:
+            scheduler.stop()
+
+        elapsed = time.time() - t0
+        self.assertEqual(chain.done, set(names))
+        self.assertEqual(chain.violations, [])
+        self.assertGreater(len(sweeps), 0)
+        return chain, scheduler, elapsed
+
+    def test_throughput(self):
+        """ Benchmark serial against concurrent stage scheduling
+        """
+        _, serial_scheduler, serial_time = self.run_pipeline(True)
+        _, scheduler, concurrent_time = self.run_pipeline(False)
+
+        print '\n{} names: serial {:.2f}s ({:.1f} names/s), concurrent {:.2f}s ({:.1f} names/s)'.format(
+            NUM_NAMES, serial_time, NUM_NAMES / serial_time, concurrent_time, NUM_NAMES / concurrent_time)
+
+        self.assertLess(concurrent_time, serial_time)
+
+        metrics = scheduler.get_metrics()
+        for stage_id in ['preorders', 'registers', 'replicate_updates', 'transfers']:
+            self.assertEqual(metrics['stages'][stage_id]['backlog'], 0)
+            self.assertGreaterEqual(metrics['stages'][stage_id]['processed'], NUM_NAMES)
+            self.assertGreater(metrics['stages'][stage_id]['latency']['count'], 0)
+
+        self.assertGreater(metrics['blocks'], 0)
+
+    def test_failed_names_wait(self):
+        """ Names that fail replication are retried, and not transferred until they succeed
+        """
+        chain, scheduler, _ = self.run_pipeline(False, replication_failures=2)
+        metrics = scheduler.get_metrics()
+        self.assertEqual(metrics['stages']['replicate_updates']['failed'], 2 * len(range(0, NUM_NAMES, 5)))
+        self.assertEqual(metrics['backing_off'], 0)
+
+    def test_wakeup(self):
+        """ Enqueue events trigger a scan before the poll interval
+        """
+        scans = []
+        scheduler = RegistrarScheduler(poll_interval=60)
+        scheduler.add_stage('preorders', lambda: scans.append(time.time()) or [], lambda entry: {'status': True})
+
+        scheduler.run_once(timeout=0)
+        self.assertEqual(len(scans), 1)
+
+        threading.Timer(0.1, scheduler.wakeup, args=('preorder', 'foo.test')).start()
+        t0 = time.time()
+        scheduler.run_once(timeout=5)
+        self.assertEqual(len(scans), 2)
+        self.assertLess(time.time() - t0, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
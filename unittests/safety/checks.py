@@ -0,0 +1,231 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from virtualchain.lib.ecdsalib import ecdsa_private_key
+
+from blockstack_client import config
+from blockstack_client.backend import safety
+from blockstack_client.utils import ScatterGather, SingleFlight, TaskExecutor
+
+RPC_TIME = 0.02
+FQU = 'coalesce.test'
+
+class CountingProxy(object):
+    """
+    Blockstack RPC proxy that counts calls
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def __getattr__(self, name):
+        def _call(*args):
+            with self.lock:
+                self.calls[(name, args)] = self.calls.get((name, args), 0) + 1
+
+            time.sleep(RPC_TIME)
+            if name == 'getinfo':
+                return {'last_block_seen': 600, 'last_block_processed': 600, 'consensus': '00' * 16,
+                        'server_version': '0.14.5', 'server_alive': True, 'zonefile_count': 0}
+
+            if name == 'get_names_owned_by_address':
+                return {'names': []}
+
+            return {'error': 'Not found.'}
+
+        return _call
+
+
+class CountingUTXOClient(object):
+    """
+    UTXO client that counts calls
+    """
+    def __init__(self, min_confirmations=6):
+        self.min_confirmations = min_confirmations
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def get_unspents(self, address):
+        with self.lock:
+            self.calls[address] = self.calls.get(address, 0) + 1
+
+        time.sleep(RPC_TIME)
+        return []
+
+
+class ExecutorTestCase(unittest.TestCase):
+
+    def test_bounded(self):
+        executor = TaskExecutor(max_workers=4)
+        sg = ScatterGather(executor=executor)
+        for i in xrange(0, 40):
+            sg.add_task('task-{}'.format(i), lambda i=i: time.sleep(0.01) or {'status': True, 'i': i})
+
+        results = sg.run_tasks()
+        self.assertEqual(sorted([r['i'] for r in results.values()]), range(0, 40))
+        self.assertLessEqual(executor.get_stats()['workers'], 4)
+
+    def test_nested(self):
+        """ Tasks that run their own scatter/gather don't deadlock the pool
+        """
+        executor = TaskExecutor(max_workers=2)
+
+        def _outer(i):
+            inner = ScatterGather(executor=executor)
+            for j in xrange(0, 4):
+                inner.add_task(j, lambda j=j: {'status': True, 'value': i * 10 + j})
+
+            return {'status': True, 'total': sum([r['value'] for r in inner.run_tasks().values()])}
+
+        sg = ScatterGather(executor=executor)
+        for i in xrange(0, 8):
+            sg.add_task(i, lambda i=i: _outer(i))
+
+        results = sg.run_tasks()
+        self.assertEqual(results[3]['total'], 126)
+
+    def test_no_inversion(self):
+        """ Waiting on a running task doesn't run another caller's queued task in the meantime
+        """
+        executor = TaskExecutor(max_workers=1)
+        ran = []
+
+        mine = executor.submit(lambda: time.sleep(0.2) or {'status': True})
+        time.sleep(0.05)
+
+        theirs = executor.submit(lambda: ran.append(threading.current_thread()) or {'status': True})
+        self.assertEqual(executor.wait(mine), {'status': True})
+        self.assertNotIn(threading.current_thread(), ran)
+        executor.wait(theirs)
+
+        # our own queued tasks still run in the waiting thread
+        blocker = executor.submit(lambda: time.sleep(0.2) or {'status': True})
+        time.sleep(0.05)
+
+        del ran[:]
+        own = executor.submit(lambda: ran.append(threading.current_thread()) or {'status': True})
+        executor.wait_all([blocker, own])
+        self.assertEqual(ran, [threading.current_thread()])
+
+    def test_single_flight(self):
+        calls = []
+        def _lookup():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'status': True}
+
+        sf = SingleFlight()
+        threads = [threading.Thread(target=sf.do, args=('key', _lookup)) for i in xrange(0, 10)]
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sf.get_stats(), {'calls': 1, 'coalesced': 9})
+
+        # not memoized
+        sf.do('key', _lookup)
+        self.assertEqual(len(calls), 2)
+
+
+class RegisterUpdateCheckTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tmpdir, 'client.ini')
+        config.configure(config_file=self.config_path, force=False, interactive=False)
+
+        self.payment_privkey = ecdsa_private_key().to_hex()
+        self.owner_privkey = ecdsa_private_key().to_hex()
+
+        self.patched = dict([(name, getattr(safety, name)) for name in ['get_utxo_provider_client', 'single_flight_proxy', 'single_flight_utxo_client']])
+
+    def tearDown(self):
+        for (name, func) in self.patched.items():
+            setattr(safety, name, func)
+
+        shutil.rmtree(self.tmpdir)
+
+    def run_check(self, coalesce):
+        """
+        Check a register and update of one name.
+        Return (proxy, utxo client, elapsed time)
+        """
+        proxy = CountingProxy()
+        utxo_client = CountingUTXOClient()
+
+        for (name, func) in self.patched.items():
+            setattr(safety, name, func)
+
+        safety.get_utxo_provider_client = lambda *args, **kw: utxo_client
+        if not coalesce:
+            safety.single_flight_proxy = lambda p, sg: p
+            safety.single_flight_utxo_client = lambda sg, **kw: utxo_client
+
+        required_checks = ['is_name_available', 'register_can_change_zonefile_hash', 'owner_can_receive', 'is_name_registered',
+                           'is_owner_address_usable', 'is_name_owner', 'is_name_outside_grace_period']
+
+        t0 = time.time()
+        sg = ScatterGather()
+        res = safety.operation_sanity_checks(FQU, ['register', 'update'], sg, self.payment_privkey, self.owner_privkey, 10,
+                                             required_checks=required_checks, zonefile_hash='11' * 20,
+                                             config_path=self.config_path, proxy=proxy)
+        self.assertNotIn('error', res)
+        sg.run_tasks()
+
+        return proxy, utxo_client, time.time() - t0
+
+    def test_upstream_calls(self):
+        """ Benchmark upstream calls and wall time with and without coalescing
+        """
+        proxy, utxo_client, elapsed = self.run_check(False)
+        proxy_calls = sum(proxy.calls.values())
+        utxo_calls = sum(utxo_client.calls.values())
+
+        sf_proxy, sf_utxo_client, sf_elapsed = self.run_check(True)
+        sf_proxy_calls = sum(sf_proxy.calls.values())
+        sf_utxo_calls = sum(sf_utxo_client.calls.values())
+
+        print '\nregister+update check: {} RPCs, {} UTXO queries, {:.3f}s; coalesced: {} RPCs, {} UTXO queries, {:.3f}s'.format(
+            proxy_calls, utxo_calls, elapsed, sf_proxy_calls, sf_utxo_calls, sf_elapsed)
+
+        # every distinct lookup is made exactly once
+        self.assertEqual(set(sf_proxy.calls.values()), set([1]))
+        self.assertEqual(set(sf_utxo_client.calls.values()), set([1]))
+        self.assertEqual(set(sf_proxy.calls.keys()), set(proxy.calls.keys()))
+
+        self.assertLess(sf_proxy_calls + sf_utxo_calls, proxy_calls + utxo_calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
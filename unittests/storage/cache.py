@@ -0,0 +1,104 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import time
+import unittest
+
+from blockstack_client.cache import LRUTTLCache
+
+class LRUTTLCacheTestCase(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = LRUTTLCache(3, 1024 * 1024)
+        for i in xrange(0, 3):
+            cache.put(i, 'value {}'.format(i), 60)
+
+        # touch 0, so 1 is the least-recently-used
+        self.assertEqual(cache.get(0)[0], 'value 0')
+        cache.put(3, 'value 3', 60)
+
+        self.assertEqual(cache.get(1), (None, None))
+        self.assertEqual(cache.get(0)[0], 'value 0')
+        self.assertEqual(cache.get_stats()['evicted'], 1)
+
+    def test_byte_bound(self):
+        cache = LRUTTLCache(1000, 1000)
+        for i in xrange(0, 10):
+            cache.put(i, 'x' * 200, 60)
+
+        stats = cache.get_stats()
+        self.assertLessEqual(stats['bytes'], 1000)
+        self.assertEqual(stats['entries'], 4)
+
+        # too big to cache at all
+        cache.put('huge', 'x' * 2000, 60)
+        self.assertNotIn('huge', cache)
+
+    def test_ttl(self):
+        cache = LRUTTLCache(10, 1024)
+        cache.put('a', 1, 0.05)
+        cache.put('b', 2, 60)
+        self.assertEqual(cache.get('a')[0], 1)
+
+        time.sleep(0.1)
+        self.assertEqual(cache.get('a'), (None, None))
+        self.assertEqual(cache.get('b')[0], 2)
+
+        stats = cache.get_stats()
+        self.assertEqual(stats['expired'], 1)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_group_invalidation(self):
+        evicted = []
+        cache = LRUTTLCache(100, 1024 * 1024, on_evict=lambda k, v: evicted.append(k))
+        for i in xrange(0, 5):
+            cache.put(('ds1', i), i, 60, group='ds1')
+            cache.put(('ds2', i), i, 60, group='ds2')
+
+        cache.evict_group('ds1')
+        self.assertEqual(sorted(evicted), [('ds1', i) for i in xrange(0, 5)])
+        self.assertEqual(cache.get_stats()['entries'], 5)
+        self.assertEqual(cache.get(('ds2', 0))[0], 0)
+
+    def test_scaling(self):
+        """ Puts and gets stay fast when the cache is full
+        """
+        num_ops = 20000
+        cache = LRUTTLCache(1000, 1024 * 1024 * 1024)
+
+        t0 = time.time()
+        for i in xrange(0, num_ops):
+            cache.put(i, i, 60 + (i % 100))
+            cache.get(i / 2)
+
+        elapsed = time.time() - t0
+        print '\n{} puts and gets on a full cache: {:.3f}s'.format(num_ops, elapsed)
+
+        self.assertEqual(cache.get_stats()['entries'], 1000)
+        self.assertLess(elapsed, 5.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
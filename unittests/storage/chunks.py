@@ -0,0 +1,178 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+import blockstack_client
+from blockstack_client import data, storage, config
+from blockstack_client.constants import DATASTORE_CHUNK_SIZE
+
+FILE_SIZE = 16 * DATASTORE_CHUNK_SIZE
+DEVICE_ID = 'chunk-test-device'
+
+class ChunkedFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tmpdir, 'client.ini')
+
+        config.configure(config_file=self.config_path, force=False, interactive=False)
+        config.write_config_file({'disk': {'root': os.path.join(self.tmpdir, 'disk')}}, self.config_path)
+
+        conf = config.get_config(self.config_path)
+        self.assertTrue(blockstack_client.register_storage(blockstack_client.load_storage('disk'), conf))
+
+        self.datastore = {
+            'pubkey': '04' + '11' * 64,
+            'device_ids': [DEVICE_ID],
+            'drivers': ['disk'],
+        }
+        self.datastore_id = data.datastore_get_id(self.datastore['pubkey'])
+        self.data_pubkeys = [{'device_id': DEVICE_ID, 'public_key': self.datastore['pubkey']}]
+        self.file_data = os.urandom(FILE_SIZE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def put_chunked(self, file_data):
+        manifest_info = data.make_file_chunk_manifest(file_data)
+        res = data.put_file_chunks(self.datastore, list(data.iter_file_chunks(file_data)), config_path=self.config_path)
+        self.assertNotIn('error', res)
+        return manifest_info, res
+
+    def read_chunked(self, manifest, start=0, end=None):
+        parts = []
+        res = data.datastore_file_read(self.datastore_id, manifest, ['disk'], self.data_pubkeys, parts.append,
+                                       start=start, end=end, config_path=self.config_path)
+        self.assertNotIn('error', res)
+        return ''.join(parts)
+
+    def test_throughput(self):
+        """ Benchmark whole-blob reads and writes against chunked ones
+        """
+        file_hash = storage.hash_data_payload(self.file_data)
+        fq_data_id = storage.make_fq_data_id(DEVICE_ID, '{}.whole'.format(self.datastore_id))
+
+        t0 = time.time()
+        res = data.put_mutable(fq_data_id, self.file_data, None, None, 1, raw=True, storage_drivers=['disk'],
+                               storage_drivers_exclusive=True, config_path=self.config_path)
+        self.assertNotIn('error', res)
+        whole_put = time.time() - t0
+
+        t0 = time.time()
+        res = data.get_mutable('{}.whole'.format(self.datastore_id), [DEVICE_ID], raw=True, data_hash=file_hash,
+                               storage_drivers=['disk'], force=True, config_path=self.config_path)
+        self.assertNotIn('error', res)
+        whole_get = time.time() - t0
+
+        t0 = time.time()
+        manifest_info, res = self.put_chunked(self.file_data)
+        chunked_put = time.time() - t0
+
+        t0 = time.time()
+        self.assertEqual(self.read_chunked(manifest_info['manifest']), self.file_data)
+        chunked_get = time.time() - t0
+
+        mb = float(FILE_SIZE) / (1024 * 1024)
+        print '\n{:.0f}MB file: whole put {:.1f}MB/s, get {:.1f}MB/s; chunked put {:.1f}MB/s, get {:.1f}MB/s'.format(
+            mb, mb / whole_put, mb / whole_get, mb / chunked_put, mb / chunked_get)
+
+        self.assertEqual(res['stored'], FILE_SIZE / DATASTORE_CHUNK_SIZE)
+
+    def test_dedup(self):
+        """ Unchanged chunks are not uploaded again
+        """
+        manifest_info, res = self.put_chunked(self.file_data)
+        self.assertEqual(res['duplicates'], 0)
+
+        # change one chunk
+        new_data = self.file_data[:DATASTORE_CHUNK_SIZE] + os.urandom(DATASTORE_CHUNK_SIZE) + self.file_data[2 * DATASTORE_CHUNK_SIZE:]
+        new_manifest_info, res = self.put_chunked(new_data)
+        self.assertEqual(res['stored'], 1)
+        self.assertEqual(res['duplicates'], FILE_SIZE / DATASTORE_CHUNK_SIZE - 1)
+        self.assertEqual(self.read_chunked(new_manifest_info['manifest']), new_data)
+
+    def test_manifest(self):
+        manifest_info = data.make_file_chunk_manifest(self.file_data)
+        manifest = data.parse_file_chunk_manifest(manifest_info['manifest_str'])
+        self.assertEqual(manifest, manifest_info['manifest'])
+        self.assertEqual(manifest['size'], FILE_SIZE)
+
+        # truncated chunk list
+        manifest['chunks'].pop()
+        self.assertIsNone(data.parse_file_chunk_manifest(json.dumps(manifest)))
+
+    def test_ranges(self):
+        """ Ranged reads only fetch the chunks they touch
+        """
+        manifest_info, _ = self.put_chunked(self.file_data)
+        manifest = manifest_info['manifest']
+
+        for (start, end) in [(0, 0), (DATASTORE_CHUNK_SIZE - 10, DATASTORE_CHUNK_SIZE + 10), (FILE_SIZE - 100, None)]:
+            expected = self.file_data[start:(end + 1 if end is not None else None)]
+            self.assertEqual(self.read_chunked(manifest, start=start, end=end), expected)
+
+        # one chunk, even though the file has many
+        fetched = []
+        get_file_chunks = data.get_file_chunks
+        def _get_file_chunks(datastore_id, chunk_hashes, *args, **kw):
+            fetched.extend(chunk_hashes)
+            return get_file_chunks(datastore_id, chunk_hashes, *args, **kw)
+
+        data.get_file_chunks = _get_file_chunks
+        try:
+            self.read_chunked(manifest, start=5 * DATASTORE_CHUNK_SIZE + 1, end=5 * DATASTORE_CHUNK_SIZE + 100)
+        finally:
+            data.get_file_chunks = get_file_chunks
+
+        self.assertEqual(fetched, [manifest['chunks'][5]])
+
+    def test_getfile(self):
+        """ Chunked files are reassembled for plain and extended reads, unless the manifest is asked for
+        """
+        manifest_info, _ = self.put_chunked(self.file_data)
+        datastore = dict(self.datastore)
+
+        class APIClient(object):
+            def backend_datastore_lookup(self, blockchain_id, datastore, inode_type, data_path, data_pubkeys, **kw):
+                inode = {'type': data.MUTABLE_DATUM_FILE_TYPE, 'chunked': True, 'idata': manifest_info['manifest_str']}
+                return {'status': True, 'inode_info': {'inode': inode}, 'path_info': {}}
+
+        res = data.datastore_getfile(APIClient(), None, datastore, '/big', self.data_pubkeys, config_path=self.config_path)
+        self.assertEqual(res['data'], self.file_data)
+
+        res = data.datastore_getfile(APIClient(), None, datastore, '/big', self.data_pubkeys, extended=True, config_path=self.config_path)
+        self.assertEqual(res['inode_info']['inode']['idata'], self.file_data)
+
+        res = data.datastore_getfile(APIClient(), None, datastore, '/big', self.data_pubkeys, extended=True, manifest=True, config_path=self.config_path)
+        self.assertEqual(res['inode_info']['inode']['idata'], manifest_info['manifest_str'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from blockstack_client.backend.drivers import common
+
+NUM_FILES = 2000
+
+class FakeDiskDriver(object):
+    """
+    Disk-backed storage driver that counts
+    how many index bytes each write costs
+    """
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.index_puts = 0
+        self.index_bytes = 0
+        self.data_bytes = 0
+
+    def put_chunk(self, dvconf, chunk_buf, path):
+        diskpath = os.path.join(self.root, path.strip('/'))
+        if not os.path.exists(os.path.dirname(diskpath)):
+            os.makedirs(os.path.dirname(diskpath))
+
+        with open(diskpath, 'w') as f:
+            f.write(chunk_buf)
+
+        with self.lock:
+            if path.startswith('/index/'):
+                self.index_puts += 1
+                self.index_bytes += len(chunk_buf)
+            else:
+                self.data_bytes += len(chunk_buf)
+
+        return 'test://{}'.format(path)
+
+    def get_chunk(self, dvconf, path):
+        diskpath = os.path.join(self.root, path.strip('/'))
+        if not os.path.exists(diskpath):
+            return None
+
+        with open(diskpath, 'r') as f:
+            return f.read()
+
+    def delete_chunk(self, dvconf, path):
+        os.unlink(os.path.join(self.root, path.strip('/')))
+        return True
+
+
+class IndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.count = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_driver(self, legacy=False, **kw):
+        """
+        Make a fake driver with a fresh index.
+        With @legacy, lay the index out the way older clients did.
+        """
+        self.count += 1
+        driver_name = 'index-test-{}-{}'.format(id(self), self.count)
+        root = os.path.join(self.tmpdir, driver_name)
+        driver = FakeDiskDriver(root)
+        dvconf = common.driver_config(driver_name, os.path.join(root, 'client.ini'), driver.get_chunk,
+                                      driver.put_chunk, driver.delete_chunk, index_stem='/index', **kw)
+
+        if legacy:
+            manifest = {}
+            for bucket_id in common.get_index_bucket_names():
+                path = common.index_get_bucket_path(bucket_id, '/index')
+                manifest[path] = driver.put_chunk(dvconf, common.serialize_index_page({}), path)
+
+            url = driver.put_chunk(dvconf, common.serialize_index_page(manifest), '/index/index.manifest')
+            common.index_settings_set_index_manifest_url(driver_name, dvconf['config_path'], url)
+
+        else:
+            self.assertTrue(common.index_setup(dvconf))
+
+        driver.index_puts = 0
+        driver.index_bytes = 0
+        return driver, dvconf
+
+    def write_files(self, dvconf, num_files, num_threads=1):
+        def _write(names):
+            for name in names:
+                self.assertTrue(common.put_indexed_data(dvconf, name, 'data for {}'.format(name)))
+
+        names = ['file-{}'.format(i) for i in xrange(0, num_files)]
+        threads = [threading.Thread(target=_write, args=(names[i::num_threads],)) for i in xrange(0, num_threads)]
+        for t in threads:
+            t.start()
+
+        for t in threads:
+            t.join()
+
+        return names
+
+    def check_lookups(self, dvconf, names):
+        for name in names:
+            url, _ = common.index_lookup(dvconf, None, None, name, index_stem='/index')
+            self.assertEqual(url, 'test://{}'.format(name))
+
+    def test_write_amplification(self):
+        """ Benchmark index bytes uploaded per file write
+        """
+        results = []
+        for (label, legacy, kw, threads) in [('legacy 16 pages', True, {}, 1),
+                                             ('256 pages', False, {}, 1),
+                                             ('256 pages, 8 writers', False, {}, 8),
+                                             ('256 pages, deferred', False, {'index_flush_interval': 3600}, 1)]:
+
+            driver, dvconf = self.make_driver(legacy=legacy, **kw)
+            names = self.write_files(dvconf, NUM_FILES, num_threads=threads)
+            self.assertTrue(common.index_flush(dvconf))
+
+            results.append((label, driver))
+            self.check_lookups(dvconf, names)
+
+        print ''
+        for (label, driver) in results:
+            print '{}: {} files, {} index puts, {:.1f} index bytes per file'.format(
+                label, NUM_FILES, driver.index_puts, float(driver.index_bytes) / NUM_FILES)
+
+        legacy_bytes = results[0][1].index_bytes
+        self.assertLess(results[1][1].index_bytes, legacy_bytes)
+        self.assertLess(results[3][1].index_bytes, legacy_bytes / 10)
+        self.assertLessEqual(results[3][1].index_puts, 16 ** common.INDEX_BUCKET_DIGITS + 1)
+
+    def test_legacy_layout(self):
+        """ Indexes made by older clients keep their 16-page layout
+        """
+        driver, dvconf = self.make_driver(legacy=True)
+        names = self.write_files(dvconf, 50)
+
+        manifest = common.parse_index_page(driver.get_chunk(dvconf, '/index/index.manifest'))
+        self.assertEqual(len(manifest), 16)
+        self.check_lookups(dvconf, names)
+
+    def test_remove(self):
+        driver, dvconf = self.make_driver()
+        names = self.write_files(dvconf, 20)
+        for name in names[:10]:
+            self.assertTrue(common.delete_indexed_data(dvconf, name))
+
+        for name in names[:10]:
+            url, _ = common.index_lookup(dvconf, None, None, name, index_stem='/index')
+            self.assertIsNone(url)
+
+        self.check_lookups(dvconf, names[10:])
+
+
+if __name__ == '__main__':
+    unittest.main()
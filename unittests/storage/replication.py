@@ -0,0 +1,204 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from blockstack_client.backend.queue import queue_append, queuedb_count
+from blockstack.lib.storage.replication import ReplicationEngine
+
+NUM_ENTRIES = 20
+
+class FakeDriver(object):
+    """
+    Storage driver that takes @latency seconds per push,
+    and fails the first @failures pushes of each key
+    """
+    def __init__(self, latency=0.0, failures=0):
+        self.latency = latency
+        self.failures = failures
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.stored = {}
+        self.inflight = 0
+        self.max_inflight = 0
+
+    def put(self, entry):
+        key = entry['fqu']
+        with self.lock:
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            attempt = self.attempts[key]
+
+        time.sleep(self.latency)
+
+        with self.lock:
+            self.inflight -= 1
+            if attempt <= self.failures:
+                return False
+
+            self.stored[key] = entry['profile']
+            return True
+
+
+class ReplicationEngineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.queue_path = os.path.join(self.tmpdir, 'queues.db')
+        self.enqueue()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def enqueue(self, start=0, count=NUM_ENTRIES):
+        for i in xrange(start, start + count):
+            queue_append('push-profile', 'name{}.id'.format(i), '00' * 32, block_height=0,
+                         profile='profile {}'.format(i), path=self.queue_path)
+
+    def drain(self, engine, timeout=30):
+        """
+        Run the engine until its queue is empty.
+        Return the most entries it had in flight at once.
+        """
+        max_entries = 0
+        deadline = time.time() + timeout
+        while not engine.is_idle():
+            self.assertLess(time.time(), deadline)
+            engine.run_once(timeout=0.05)
+            max_entries = max(max_entries, engine.get_metrics()['queues']['push-profile']['inflight'])
+
+        return max_entries
+
+    def run_engine(self, drivers, timeout=30, **kw):
+        """
+        Replicate the queue to the given fake drivers until it is empty
+        """
+        engine = ReplicationEngine(self.queue_path, poll_interval=0.05, **kw)
+        engine.add_queue('push-profile', drivers.keys(), lambda driver, entry: drivers[driver].put(entry))
+        engine.start()
+        try:
+            engine.max_entries = self.drain(engine, timeout=timeout)
+        finally:
+            engine.stop()
+
+        return engine
+
+    def test_parallel_drivers(self):
+        """ Benchmark one-at-a-time replication against the worker pool
+        """
+        drivers = {'fast': FakeDriver(latency=0.01), 'slow': FakeDriver(latency=0.1)}
+
+        t0 = time.time()
+        self.run_engine(drivers, num_workers=1, driver_concurrency=1, batch_size=1)
+        serial_time = time.time() - t0
+
+        self.enqueue()
+
+        drivers = {'fast': FakeDriver(latency=0.01), 'slow': FakeDriver(latency=0.1)}
+
+        t0 = time.time()
+        engine = self.run_engine(drivers, num_workers=8, driver_concurrency=4, batch_size=32)
+        parallel_time = time.time() - t0
+
+        print '\n{} entries, 2 drivers: serial {:.3f}s, parallel {:.3f}s'.format(NUM_ENTRIES, serial_time, parallel_time)
+
+        self.assertLess(parallel_time, serial_time / 2)
+        self.assertEqual(len(drivers['fast'].stored), NUM_ENTRIES)
+        self.assertEqual(len(drivers['slow'].stored), NUM_ENTRIES)
+        self.assertLessEqual(drivers['slow'].max_inflight, 4)
+        self.assertEqual(queuedb_count('push-profile', path=self.queue_path), 0)
+
+        metrics = engine.get_metrics()
+        self.assertEqual(metrics['replicated'], NUM_ENTRIES)
+        self.assertEqual(metrics['drivers']['slow']['pushes'], NUM_ENTRIES)
+        self.assertEqual(metrics['queues']['push-profile']['depth'], 0)
+
+    def test_retry(self):
+        """ Failed pushes are retried with backoff until they succeed
+        """
+        drivers = {'flaky': FakeDriver(failures=2), 'ok': FakeDriver()}
+        engine = self.run_engine(drivers, max_retries=3, retry_delay=0.01)
+
+        self.assertEqual(len(drivers['flaky'].stored), NUM_ENTRIES)
+        metrics = engine.get_metrics()
+        self.assertEqual(metrics['replicated'], NUM_ENTRIES)
+        self.assertEqual(metrics['drivers']['flaky']['retries'], 2 * NUM_ENTRIES)
+        self.assertEqual(metrics['drivers']['ok']['retries'], 0)
+
+    def test_give_up(self):
+        """ Entries are dropped once a driver runs out of retries
+        """
+        drivers = {'broken': FakeDriver(failures=100), 'ok': FakeDriver()}
+        engine = self.run_engine(drivers, max_retries=2, retry_delay=0.01)
+
+        self.assertEqual(len(drivers['broken'].stored), 0)
+        self.assertEqual(len(drivers['ok'].stored), NUM_ENTRIES)
+        self.assertEqual(queuedb_count('push-profile', path=self.queue_path), 0)
+
+        metrics = engine.get_metrics()
+        self.assertEqual(metrics['partial'], NUM_ENTRIES)
+        self.assertEqual(metrics['drivers']['broken']['pushes'], 3 * NUM_ENTRIES)
+
+    def test_max_inflight(self):
+        """ No more than max_inflight entries are dequeued at once
+        """
+        drivers = {'slow': FakeDriver(latency=0.02)}
+        engine = self.run_engine(drivers, num_workers=8, driver_concurrency=8, batch_size=32, max_inflight=5)
+
+        self.assertEqual(len(drivers['slow'].stored), NUM_ENTRIES)
+        self.assertLessEqual(engine.max_entries, 5)
+        self.assertLessEqual(drivers['slow'].max_inflight, 5)
+
+    def test_requeue(self):
+        """ Entries queued after the queue drains are replicated, even if they reuse removed rows' rowids
+        """
+        drivers = {'ok': FakeDriver()}
+        engine = ReplicationEngine(self.queue_path, poll_interval=0.05, batch_size=4)
+        engine.add_queue('push-profile', drivers.keys(), lambda driver, entry: drivers[driver].put(entry))
+        engine.start()
+        try:
+            self.drain(engine)
+            self.enqueue(start=NUM_ENTRIES)
+            self.drain(engine)
+        finally:
+            engine.stop()
+
+        self.assertEqual(len(drivers['ok'].stored), 2 * NUM_ENTRIES)
+
+    def test_oldest_age(self):
+        """ Queue age is measured from when the oldest entry was queued
+        """
+        engine = ReplicationEngine(self.queue_path)
+        engine.add_queue('push-profile', ['ok'], lambda driver, entry: True)
+
+        time.sleep(0.2)
+        self.assertGreaterEqual(engine.get_metrics()['queues']['push-profile']['oldest_age'], 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
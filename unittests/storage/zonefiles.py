@@ -0,0 +1,137 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack
+    ~~~~~
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack
+
+    Blockstack is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+    You should have received a copy of the GNU General Public License
+    along with Blockstack. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from blockstack_client import get_zonefile_data_hash
+from blockstack.lib.storage.crawl import get_cached_zonefile_data, store_cached_zonefile_data, remove_cached_zonefile_data, \
+        is_zonefile_cached, cached_zonefile_path, zonefile_cache_configure, zonefile_cache_get_stats
+
+NUM_ZONEFILES = 100
+NUM_READS = 20000
+
+def make_zonefile(i):
+    return '$ORIGIN name{}.id\n$TTL 3600\n_http._tcp URI 10 1 "https://example.com/{}/profile.json"\n'.format(i, i) + ('; padding\n' * 100)
+
+
+class ZonefileCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.zonefile_dir = tempfile.mkdtemp()
+        zonefile_cache_configure(1024 * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.zonefile_dir)
+
+    def store(self, i):
+        zonefile_data = make_zonefile(i)
+        self.assertTrue(store_cached_zonefile_data(zonefile_data, zonefile_dir=self.zonefile_dir))
+        return zonefile_data, get_zonefile_data_hash(zonefile_data)
+
+    def test_hits(self):
+        """ Stored and read zonefiles are served from RAM and counted
+        """
+        zonefile_data, zonefile_hash = self.store(0)
+
+        # stored zonefiles are cached right away
+        self.assertEqual(get_cached_zonefile_data(zonefile_hash, zonefile_dir=self.zonefile_dir), zonefile_data)
+        self.assertTrue(is_zonefile_cached(zonefile_hash, zonefile_dir=self.zonefile_dir, validate=True))
+
+        # zonefiles read from disk are cached too
+        zonefile_cache_configure(1024 * 1024)
+        for i in xrange(0, 3):
+            self.assertEqual(get_cached_zonefile_data(zonefile_hash, zonefile_dir=self.zonefile_dir), zonefile_data)
+
+        stats = zonefile_cache_get_stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['bytes_served'], 2 * len(zonefile_data))
+        self.assertAlmostEqual(stats['hit_rate'], 2.0 / 3)
+
+    def test_corrupt_zonefile(self):
+        """ Zonefiles that don't match their hashes are not cached
+        """
+        zonefile_data, zonefile_hash = self.store(0)
+        zonefile_cache_configure(1024 * 1024)
+
+        with open(cached_zonefile_path(self.zonefile_dir, zonefile_hash), 'w') as f:
+            f.write(zonefile_data + 'corrupt')
+
+        self.assertIsNone(get_cached_zonefile_data(zonefile_hash, zonefile_dir=self.zonefile_dir))
+        self.assertEqual(zonefile_cache_get_stats()['entries'], 0)
+
+    def test_remove(self):
+        """ Removing a zonefile invalidates it
+        """
+        zonefile_data, zonefile_hash = self.store(0)
+        self.assertTrue(remove_cached_zonefile_data(zonefile_hash, zonefile_dir=self.zonefile_dir))
+
+        self.assertFalse(os.path.exists(cached_zonefile_path(self.zonefile_dir, zonefile_hash)))
+        self.assertIsNone(get_cached_zonefile_data(zonefile_hash, zonefile_dir=self.zonefile_dir))
+        self.assertFalse(is_zonefile_cached(zonefile_hash, zonefile_dir=self.zonefile_dir))
+
+    def test_byte_bound(self):
+        """ The cache holds no more than its byte limit
+        """
+        zonefile_cache_configure(5 * len(make_zonefile(0)))
+        zonefiles = [self.store(i) for i in xrange(0, 10)]
+
+        stats = zonefile_cache_get_stats()
+        self.assertLessEqual(stats['bytes'], stats['max_bytes'])
+        self.assertTrue(stats['evicted'] > 0)
+
+        # evicted zonefiles are still on disk
+        zonefile_data, zonefile_hash = zonefiles[0]
+        self.assertEqual(get_cached_zonefile_data(zonefile_hash, zonefile_dir=self.zonefile_dir), zonefile_data)
+
+    def test_read_throughput(self):
+        """ Benchmark popular-zonefile reads with and without the cache
+        """
+        zonefile_hashes = [self.store(i)[1] for i in xrange(0, NUM_ZONEFILES)]
+
+        def read_all():
+            t0 = time.time()
+            for i in xrange(0, NUM_READS):
+                assert get_cached_zonefile_data(zonefile_hashes[i % NUM_ZONEFILES], zonefile_dir=self.zonefile_dir) is not None
+
+            return NUM_READS / (time.time() - t0)
+
+        zonefile_cache_configure(0)
+        uncached_rate = read_all()
+
+        zonefile_cache_configure(1024 * 1024)
+        cached_rate = read_all()
+
+        stats = zonefile_cache_get_stats()
+        print '\n{} reads of {} zonefiles: {:.0f} reads/s uncached, {:.0f} reads/s cached (hit rate {:.3f}, {} bytes served)'.format(
+            NUM_READS, NUM_ZONEFILES, uncached_rate, cached_rate, stats['hit_rate'], stats['bytes_served'])
+
+        self.assertGreater(cached_rate, uncached_rate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+"""
+    Blockstack-client
+    ~~~~~
+
+    copyright: (c) 2017 by Blockstack.org
+
+    This file is part of Blockstack-client.
+
+    Blockstack-client is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Blockstack-client is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Blockstack-client. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from virtualchain.lib.ecdsalib import verify_raw_data
+
+from blockstack_client import config
+from blockstack_client.constants import CONFIG_FILENAME, WALLET_FILENAME
+from blockstack_client.wallet import make_wallet, write_wallet, load_wallet
+from blockstack_client.wallet_agent import WalletAgent, WalletAgentClient, wallet_agent_connect, wallet_agent_stop
+
+PASSWORD = '0123456789abcdef'
+NUM_COMMANDS = 10
+
+class WalletAgentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.config_dir, CONFIG_FILENAME)
+        self.wallet_path = os.path.join(self.config_dir, WALLET_FILENAME)
+        config.configure(config_file=self.config_path, force=False, interactive=False)
+
+        encrypted_wallet = make_wallet(PASSWORD)
+        self.assertNotIn('error', encrypted_wallet)
+        self.assertNotIn('error', write_wallet(encrypted_wallet, path=self.wallet_path, config_path=self.config_path))
+
+        self.agent = None
+        self.agent_thread = None
+
+    def tearDown(self):
+        if self.agent_thread is not None:
+            wallet_agent_stop(self.config_dir)
+            self.agent_thread.join()
+
+        shutil.rmtree(self.config_dir)
+
+    def start_agent(self, idle_timeout=60):
+        wallet_info = load_wallet(password=PASSWORD, config_path=self.config_path, include_private=True)
+        self.assertNotIn('error', wallet_info)
+
+        self.agent = WalletAgent(wallet_info['wallet'], config_dir=self.config_dir, idle_timeout=idle_timeout)
+        self.agent_thread = threading.Thread(target=self.agent.serve_until_locked)
+        self.agent_thread.start()
+        return wallet_info['wallet']
+
+    def test_batch_throughput(self):
+        """ Benchmark a batch of wallet-using commands with and without the agent
+        """
+        t0 = time.time()
+        for i in xrange(0, NUM_COMMANDS):
+            res = load_wallet(password=PASSWORD, config_path=self.config_path, include_private=True, use_agent=True)
+            self.assertNotIn('error', res)
+
+        direct_time = time.time() - t0
+
+        wallet = self.start_agent()
+
+        t0 = time.time()
+        for i in xrange(0, NUM_COMMANDS):
+            res = load_wallet(password=PASSWORD, config_path=self.config_path, include_private=True, use_agent=True)
+            self.assertNotIn('error', res)
+            self.assertEqual(res['wallet']['payment_privkey'], wallet['payment_privkey'])
+
+        agent_time = time.time() - t0
+
+        print '\n{} commands: {:.1f} commands/s unlocking each time, {:.1f} commands/s with the wallet agent'.format(
+            NUM_COMMANDS, NUM_COMMANDS / direct_time, NUM_COMMANDS / agent_time)
+
+        self.assertLess(agent_time, direct_time)
+
+    def test_authentication(self):
+        """ Requests need the agent's token
+        """
+        self.start_agent()
+        self.assertEqual(oct(os.stat(self.agent.token_path).st_mode & 0777), '0600')
+        self.assertEqual(oct(os.stat(self.agent.socket_path).st_mode & 0777), '0600')
+
+        client = WalletAgentClient(config_dir=self.config_dir)
+        client.token = '00' * 32
+        self.assertIn('error', client.get_wallet())
+
+    def test_signing(self):
+        """ The agent signs with the wallet's keys
+        """
+        wallet = self.start_agent()
+        client = wallet_agent_connect(self.config_dir)
+
+        res = client.sign_data('hello world')
+        self.assertNotIn('error', res)
+        self.assertTrue(verify_raw_data('hello world', wallet['data_pubkey'], str(res['sigb64'])))
+
+        self.assertIn('error', client.sign_data('hello world', key='payment'))
+
+    def test_idle_timeout(self):
+        """ The agent forgets the wallet once idle
+        """
+        self.start_agent(idle_timeout=1)
+        self.agent_thread.join(5)
+
+        self.assertFalse(self.agent_thread.is_alive())
+        self.assertIsNone(self.agent.wallet)
+        self.assertIsNone(wallet_agent_connect(self.config_dir))
+        self.assertFalse(os.path.exists(self.agent.token_path))
+
+
+if __name__ == '__main__':
+    unittest.main()